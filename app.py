@@ -45,6 +45,9 @@ from app_logic.models import (
     load_user_callback,
 )  # Hàm để LoginManager tải thông tin user từ ID
 from app_logic.utils import slugify  # Hàm tạo slug (dùng trong context processor)
+from app_logic.pagination import page_url  # Tạo URL phân trang (dùng trong context processor)
+from app_logic.db import init_db  # Đăng ký trả kết nối CSDL về pool sau mỗi request
+from app_logic.query_stats import init_query_stats  # Đo số lượng/thời gian truy vấn mỗi request
 
 # --- 4. Khởi tạo ứng dụng Flask ---
 # =========================================================
@@ -78,6 +81,13 @@ ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif", "webp"}
 app.config["AVATAR_FOLDER"] = AVATAR_FOLDER  # Thêm dòng này
 app.config["COVER_FOLDER"] = COVER_FOLDER    # Thêm dòng này
 app.config["ALLOWED_EXTENSIONS"] = ALLOWED_EXTENSIONS
+# Cấu hình đo lường truy vấn (xem app_logic/query_stats.py):
+# - QUERY_STATS_ENABLED: Bật header Server-Timing và endpoint /api/debug/queries.
+# - QUERY_COUNT_THRESHOLD: Cảnh báo request chạy nhiều truy vấn hơn ngưỡng này.
+# - QUERY_REPEAT_THRESHOLD: Cảnh báo N+1 khi cùng một truy vấn lặp lại từ ngần này lần.
+app.config["QUERY_STATS_ENABLED"] = os.getenv("QUERY_STATS_ENABLED", "1") == "1"
+app.config["QUERY_COUNT_THRESHOLD"] = int(os.getenv("QUERY_COUNT_THRESHOLD", "6"))
+app.config["QUERY_REPEAT_THRESHOLD"] = int(os.getenv("QUERY_REPEAT_THRESHOLD", "3"))
 # (Có thể thêm các cấu hình khác nếu cần, ví dụ: database URI nếu dùng SQLAlchemy)
 
 # --- 6. Khởi tạo các Extension ---
@@ -87,6 +97,8 @@ app.config["ALLOWED_EXTENSIONS"] = ALLOWED_EXTENSIONS
 csrf = CSRFProtect(app)  # Bật tính năng bảo vệ CSRF cho toàn bộ ứng dụng
 login_manager = LoginManager()  # Tạo đối tượng quản lý đăng nhập
 login_manager.init_app(app)  # Liên kết LoginManager với ứng dụng
+init_db(app)  # Trả kết nối CSDL của request về connection pool khi request kết thúc
+init_query_stats(app)  # Ghi nhận truy vấn của từng request (Server-Timing, cảnh báo N+1)
 
 # --- 7. Cấu hình LoginManager ---
 # =========================================================
@@ -117,13 +129,14 @@ def load_user(user_id):
 # =========================================================
 # Context processors làm cho các biến hoặc hàm có sẵn trong tất cả các template Jinja2
 # mà không cần truyền chúng một cách tường minh trong mỗi hàm render_template.
-# Ở đây, hàm slugify được đưa vào context để có thể dùng trong các template (vd: tạo URL thân thiện).
+# Ở đây, hàm slugify được đưa vào context để có thể dùng trong các template (vd: tạo URL thân thiện),
+# và hàm page_url để tạo link phân trang (giữ nguyên bộ lọc, thay con trỏ trang).
 # =========================================================
 @app.context_processor
 def utility_processor():
-    """Làm cho hàm slugify có sẵn trong mọi template."""
+    """Làm cho hàm slugify và page_url có sẵn trong mọi template."""
     return dict(
-        slugify=slugify
+        slugify=slugify, page_url=page_url
     )  # Trả về một dict, key là tên biến trong template, value là hàm/biến Python
 
 
@@ -17,6 +17,8 @@ from flask import (
     flash,
     jsonify,
     current_app,  # Import current_app để truy cập config của ứng dụng Flask hiện tại
+    Response,  # Trả về tiến độ nhập file dạng stream
+    stream_with_context,  # Giữ request context trong lúc stream
 )
 from flask_login import (
     login_required,
@@ -35,9 +37,26 @@ from app_logic.utils import (
     allowed_file,  # Hàm kiểm tra đuôi file hợp lệ
 )
 from app_logic.db import get_db_connection  # Hàm lấy kết nối CSDL
+from app_logic.db import retry_on_deadlock, should_retry  # Chạy lại transaction khi deadlock
+from app_logic.search import build_book_search, SearchClause  # Tìm kiếm sách (FULLTEXT/LIKE)
+from app_logic.search_index import book_index  # Chỉ mục live search (cập nhật khi sách thay đổi)
+from app_logic.related import related_index  # Chỉ mục sách liên quan (cập nhật khi sách thay đổi)
+from app_logic.book_detail import invalidate_book_detail, load_comments, comment_count  # Cache trang chi tiết sách, bình luận
+from app_logic import shelves as home_shelves  # Kệ sách trang chủ (xóa cache khi sách/lượt mượn thay đổi)
+from app_logic import reference  # Danh mục tác giả/thể loại cho dropdown (có cache)
+from app_logic.pagination import KeysetPaginator, cached_count  # Phân trang theo khóa
+from app_logic import stats as loan_stats  # Bảng thống kê tổng hợp cho dashboard
+from app_logic.parallel import run_parallel, fetch_all, fetch_one, fetch_value  # Chạy song song truy vấn đọc
+from app_logic.models import User  # Để xóa cache người dùng khi thông tin thay đổi
+from app_logic import settings as system_settings  # Cài đặt hệ thống (CaiDat) đã cache
+from app_logic import importer  # Nhập danh mục sách hàng loạt (CSV/JSON Lines)
+from app_logic import export  # Xuất dữ liệu dạng stream (CSV/JSON Lines)
+from app_logic import circulation  # Nghiệp vụ mượn sách (mượn nhiều sách trong một transaction)
+import codecs  # Đọc file upload dạng văn bản theo từng dòng
+import json  # Tuần tự hóa tiến độ nhập file (NDJSON)
+import tempfile  # Lưu tạm file upload trong lúc stream tiến độ
 import datetime  # Để xử lý ngày tháng
 import uuid  # Để tạo tên file duy nhất
-import math  # Để tính toán phân trang
 import os  # Để thao tác với đường dẫn file và thư mục
 import mysql.connector  # Để xử lý lỗi CSDL MySQL
 import re  # Để sử dụng biểu thức chính quy (vd: chuẩn hóa khoảng trắng)
@@ -61,154 +80,86 @@ def admin_dashboard():
     Bao gồm các thống kê tổng quan (số sách, thành viên, sách đang mượn, quá hạn, chờ duyệt, tiền phạt),
     danh sách top (sách mượn nhiều, độc giả tích cực, thể loại phổ biến),
     danh sách sách sắp hết hàng, và biểu đồ lượt mượn theo tháng.
+    Các truy vấn không phụ thuộc nhau nên được chạy song song (xem app_logic/parallel.py).
     """
-    conn = get_db_connection()
-    cursor = conn.cursor(
-        dictionary=True
-    )  # Sử dụng dictionary=True để kết quả trả về dạng dict
-
-    # Khởi tạo các biến thống kê
-    total_sach = 0
-    total_thanh_vien = 0
-    sach_dang_muon = 0
-    sach_qua_han = 0
-    sach_cho_duyet = 0
-    total_phat = 0
-
-    try:
-        # Lấy các số liệu thống kê tổng quan từ CSDL
-        cursor.execute(
+    tasks = {
+        # Các số liệu thống kê tổng quan
+        "total_sach": fetch_value(
             "SELECT SUM(so_luong) AS total FROM Sach WHERE trang_thai = 'hoat_dong'"
-        )
-        total_sach = (result := cursor.fetchone()) and result.get("total") or 0
-
-        cursor.execute(
+        ),
+        "total_thanh_vien": fetch_value(
             "SELECT COUNT(*) AS total FROM ThanhVien WHERE trang_thai = 'hoat_dong'"
-        )
-        total_thanh_vien = (result := cursor.fetchone()) and result.get("total") or 0
-
-        cursor.execute(
+        ),
+        "sach_dang_muon": fetch_value(
             "SELECT SUM(so_luong) AS total FROM MuonTra WHERE trang_thai = 'Đang mượn'"
-        )
-        sach_dang_muon = (result := cursor.fetchone()) and result.get("total") or 0
-
-        cursor.execute(
+        ),
+        "sach_qua_han": fetch_value(
             "SELECT SUM(so_luong) AS total FROM MuonTra WHERE trang_thai = 'Đang mượn' AND ngay_hen_tra < CURDATE()"
-        )
-        sach_qua_han = (result := cursor.fetchone()) and result.get("total") or 0
-
-        cursor.execute(
+        ),
+        "sach_cho_duyet": fetch_value(
             "SELECT COUNT(id_muon_tra) AS total FROM MuonTra WHERE trang_thai = 'Đang chờ'"
-        )
-        sach_cho_duyet = (result := cursor.fetchone()) and result.get("total") or 0
-
-        cursor.execute("SELECT SUM(tien_phat) AS total FROM MuonTra")
-        total_phat = (result := cursor.fetchone()) and result.get("total") or 0.0
-
-    except mysql.connector.Error as err:
-        flash(f"Lỗi khi tải thống kê dashboard: {err}", "danger")
-        # Đặt lại giá trị về 0 nếu có lỗi
-        total_sach = total_thanh_vien = sach_dang_muon = sach_qua_han = (
-            sach_cho_duyet
-        ) = 0
-        total_phat = 0.0
-
-    # Gom các thống kê vào dict để truyền cho template
-    stats = {
-        "total_sach": total_sach,
-        "total_thanh_vien": total_thanh_vien,
-        "sach_dang_muon": sach_dang_muon,
-        "sach_qua_han": sach_qua_han,
-        "sach_cho_duyet": sach_cho_duyet,
-        "total_phat": total_phat,
-    }
-
-    # Lấy dữ liệu cho các danh sách Top 5
-    try:
-        # Top 5 sách mượn nhiều nhất (chỉ tính lượt đã mượn hoặc đã trả)
-        query_top_books = """
-        SELECT s.tieu_de, SUM(mt.so_luong) AS total_borrows
-        FROM MuonTra mt JOIN Sach s ON mt.id_sach = s.id_sach
-        WHERE mt.trang_thai IN ('Đang mượn', 'Đã trả')
-        GROUP BY s.id_sach, s.tieu_de ORDER BY total_borrows DESC LIMIT 5
-        """
-        cursor.execute(query_top_books)
-        top_books = cursor.fetchall()
-
-        # Top 5 độc giả mượn nhiều nhất
-        query_top_users = """
-        SELECT tv.ho_ten, SUM(mt.so_luong) AS total_borrows
-        FROM MuonTra mt JOIN ThanhVien tv ON mt.id_thanh_vien = tv.id_thanh_vien
-        WHERE mt.trang_thai IN ('Đang mượn', 'Đã trả')
-        GROUP BY tv.id_thanh_vien, tv.ho_ten ORDER BY total_borrows DESC LIMIT 5
-        """
-        cursor.execute(query_top_users)
-        top_users = cursor.fetchall()
-
-        # Top 5 thể loại phổ biến nhất
-        query_top_genres = """
-        SELECT tl.ten_the_loai, SUM(mt.so_luong) AS total_borrows
-        FROM MuonTra mt JOIN Sach s ON mt.id_sach = s.id_sach JOIN TheLoai tl ON s.id_the_loai = tl.id_the_loai
-        WHERE mt.trang_thai IN ('Đang mượn', 'Đã trả')
-        GROUP BY tl.id_the_loai, tl.ten_the_loai ORDER BY total_borrows DESC LIMIT 5
-        """
-        cursor.execute(query_top_genres)
-        top_genres = cursor.fetchall()
-
+        ),
+        # Tổng tiền phạt, các danh sách Top 5 và biểu đồ: đọc từ bảng thống kê
+        # tổng hợp (xem app_logic/stats.py) thay vì GROUP BY toàn bộ MuonTra
+        "rollups": loan_stats.dashboard_rollups,
         # Sách sắp hết hàng (số lượng thực tế còn 1-4 cuốn)
         # Số lượng thực tế = số lượng trong kho - số lượng đang chờ lấy
-        query_low_stock = """
-        SELECT s.tieu_de,
-               (s.so_luong - COALESCE(SUM(CASE WHEN mt.trang_thai = 'Đang chờ' THEN mt.so_luong ELSE 0 END), 0)) AS so_luong_thuc_te
-        FROM Sach s LEFT JOIN MuonTra mt ON s.id_sach = mt.id_sach AND mt.trang_thai = 'Đang chờ'
-        WHERE s.trang_thai = 'hoat_dong'
-        GROUP BY s.id_sach, s.tieu_de, s.so_luong
-        HAVING so_luong_thuc_te BETWEEN 1 AND 4
-        ORDER BY so_luong_thuc_te ASC LIMIT 5
-        """
-        cursor.execute(query_low_stock)
-        low_stock_books = cursor.fetchall()
-
-        # Lấy dữ liệu lượt mượn trong 6 tháng gần nhất cho biểu đồ
-        query_chart_data = """
-        SELECT DATE_FORMAT(ngay_muon, '%Y-%m') AS month, SUM(so_luong) AS total_borrows
-        FROM MuonTra mt
-        WHERE ngay_muon >= DATE_SUB(CURDATE(), INTERVAL 6 MONTH) AND ngay_muon <= CURDATE()
-          AND mt.trang_thai IN ('Đang mượn', 'Đã trả')
-        GROUP BY month ORDER BY month ASC;
-        """
-        cursor.execute(query_chart_data)
-        borrow_data = cursor.fetchall()
-
-        # Chuẩn bị dữ liệu labels và values cho Chart.js
-        chart_labels = [row["month"] for row in borrow_data]
-        chart_values = [int(row["total_borrows"]) for row in borrow_data]
+        "low_stock_books": fetch_all(
+            """
+            SELECT s.tieu_de,
+                   (s.so_luong - COALESCE(SUM(CASE WHEN mt.trang_thai = 'Đang chờ' THEN mt.so_luong ELSE 0 END), 0)) AS so_luong_thuc_te
+            FROM Sach s LEFT JOIN MuonTra mt ON s.id_sach = mt.id_sach AND mt.trang_thai = 'Đang chờ'
+            WHERE s.trang_thai = 'hoat_dong'
+            GROUP BY s.id_sach, s.tieu_de, s.so_luong
+            HAVING so_luong_thuc_te BETWEEN 1 AND 4
+            ORDER BY so_luong_thuc_te ASC LIMIT 5
+            """
+        ),
+    }
 
+    try:
+        results = run_parallel(tasks)
+        rollups = results["rollups"]
+        low_stock_books = results["low_stock_books"]
+        # Gom các thống kê vào dict để truyền cho template
+        stats = {
+            "total_sach": results["total_sach"],
+            "total_thanh_vien": results["total_thanh_vien"],
+            "sach_dang_muon": results["sach_dang_muon"],
+            "sach_qua_han": results["sach_qua_han"],
+            "sach_cho_duyet": results["sach_cho_duyet"],
+            "total_phat": rollups["total_phat"],
+        }
     except mysql.connector.Error as err:
-        flash(f"Lỗi khi tải dữ liệu bổ sung cho dashboard: {err}", "danger")
-        (
-            top_books,
-            top_users,
-            top_genres,
-            low_stock_books,
-            chart_labels,
-            chart_values,
-        ) = ([], [], [], [], [], [])
-    finally:
-        # Đóng kết nối CSDL
-        cursor.close()
-        conn.close()
+        flash(f"Lỗi khi tải thống kê dashboard: {err}", "danger")
+        # Đặt lại giá trị về 0 nếu có lỗi
+        stats = {
+            "total_sach": 0,
+            "total_thanh_vien": 0,
+            "sach_dang_muon": 0,
+            "sach_qua_han": 0,
+            "sach_cho_duyet": 0,
+            "total_phat": 0.0,
+        }
+        rollups = {
+            "top_books": [],
+            "top_users": [],
+            "top_genres": [],
+            "chart_labels": [],
+            "chart_values": [],
+        }
+        low_stock_books = []
 
     # Trả về template dashboard với các dữ liệu đã lấy được
     return render_template(
         "admin_dashboard.html",
         stats=stats,
-        top_books=top_books,
-        top_users=top_users,
-        top_genres=top_genres,
+        top_books=rollups["top_books"],
+        top_users=rollups["top_users"],
+        top_genres=rollups["top_genres"],
         low_stock_books=low_stock_books,
-        chart_labels=chart_labels,
-        chart_values=chart_values,
+        chart_labels=rollups["chart_labels"],
+        chart_values=rollups["chart_values"],
     )
 
 
@@ -218,22 +169,22 @@ def admin_dashboard():
 @admin_bp.route("/settings", methods=["GET", "POST"])
 @login_required
 @admin_required
+@retry_on_deadlock
 def admin_settings():
     """
     Hiển thị và xử lý cập nhật các cài đặt chung của hệ thống
     (ví dụ: mức phạt, giới hạn mượn sách, thời hạn gia hạn).
-    Sử dụng bảng `CaiDat` trong CSDL.
+    Sử dụng bảng `CaiDat` trong CSDL (đọc qua app_logic/settings.py).
     """
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-
     if request.method == "POST":
         # Xử lý khi admin submit form cài đặt
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
         try:
             # Lặp qua các cặp key-value trong dữ liệu form gửi lên
             for key, value in request.form.items():
-                if key == "csrf_token":
-                    continue  # Bỏ qua CSRF token
+                if key in ("csrf_token", system_settings.VERSION_KEY):
+                    continue  # Bỏ qua CSRF token và khóa phiên bản nội bộ
 
                 # Validate giá trị: phải là số không âm
                 if not value or not value.isdigit() or int(value) < 0:
@@ -255,11 +206,16 @@ def admin_settings():
                     cursor, f"Đã cập nhật cài đặt: '{key}' = '{value}'"
                 )  # Ghi log
 
+            # Tăng phiên bản để mọi tiến trình tải lại cài đặt
+            system_settings.bump_settings_version(cursor)
             conn.commit()  # Lưu thay đổi
+            system_settings.invalidate_settings()
             flash("Cập nhật cài đặt thành công!", "success")
 
         except mysql.connector.Error as err:
             conn.rollback()  # Hoàn tác nếu có lỗi CSDL
+            if should_retry(err):
+                raise  # retry_on_deadlock chạy lại cả route
             flash(f"Lỗi cơ sở dữ liệu: {err}", "danger")
         except Exception as e:
             conn.rollback()  # Hoàn tác nếu có lỗi khác
@@ -274,64 +230,40 @@ def admin_settings():
         return redirect(url_for("admin.admin_settings"))
 
     # Xử lý khi request là GET (hiển thị trang cài đặt)
+    # Lấy dict {key: value} của tất cả cài đặt (kiểm tra phiên bản mới nhất trong CSDL)
     try:
-        cursor.execute("SELECT * FROM CaiDat")  # Lấy tất cả cài đặt hiện có
-        settings_list = cursor.fetchall()
-        # Chuyển đổi danh sách kết quả thành dạng dict {key: value} để dễ truy cập trong template
-        settings = {
-            item["setting_key"]: item["setting_value"] for item in settings_list
-        }
+        settings = system_settings.all_settings(force_check=True)
     except mysql.connector.Error as err:
-        flash(f"Lỗi khi tải cài đặt: {err}", "danger")
-        settings = {}  # Trả về dict rỗng nếu có lỗi
-    finally:
-        # Đóng kết nối
-        if cursor:
-            cursor.close()
-        if conn and conn.is_connected():
-            conn.close()
+        flash(f"Lỗi cơ sở dữ liệu khi tải cài đặt: {err}", "danger")
+        settings = {}
 
     # Trả về template cài đặt với dữ liệu cài đặt đã lấy
     return render_template("admin_settings.html", settings=settings)
 
 
 # =========================================================
-# ROUTE: QUẢN LÝ SÁCH (/admin/sach)
+# HÀM NỘI BỘ: TẢI MỘT TRANG DANH SÁCH SÁCH (ADMIN)
+# Dùng chung cho trang HTML (/admin/sach) và API JSON (/admin/sach/data).
 # =========================================================
-@admin_bp.route("/sach")
-@login_required
-@admin_required
-def quan_ly_sach():
+def _dieu_kien_loc_sach(args):
     """
-    Hiển thị trang danh sách sách cho admin.
-    Hỗ trợ tìm kiếm theo tiêu đề/tác giả, lọc theo thể loại, tác giả, trạng thái.
-    Có phân trang.
+    Trả về (search, where_conditions, params) theo bộ lọc trang quản lý sách:
+    từ khóa ('search'), thể loại, tác giả, trạng thái. Dùng chung cho trang
+    danh sách và file xuất (/admin/sach/xuat).
     """
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-
-    # Lấy các tham số từ URL query string
-    search_query = request.args.get("search", "")
-    id_the_loai = request.args.get("id_the_loai", "")
-    id_tac_gia = request.args.get("id_tac_gia", "")
-    trang_thai_filter = request.args.get(
-        "trang_thai", ""
-    )  # Lọc theo trạng thái (hoat_dong/da_an)
-
-    # Xử lý phân trang
-    page = request.args.get("page", 1, type=int)
-    if page < 1:
-        page = 1  # Đảm bảo trang không nhỏ hơn 1
-    limit = 15  # Số sách trên mỗi trang
-    offset = (page - 1) * limit
+    search_query = args.get("search", "")
+    id_the_loai = args.get("id_the_loai", "")
+    id_tac_gia = args.get("id_tac_gia", "")
+    trang_thai_filter = args.get("trang_thai", "")  # Lọc theo trạng thái (hoat_dong/da_an)
 
     # Xây dựng mệnh đề WHERE và danh sách tham số dựa trên bộ lọc
     where_conditions = []
     params = []
-    if search_query:
-        where_conditions.append("(s.tieu_de LIKE %s OR tg.ten_tac_gia LIKE %s)")
-        search_term = f"%{search_query}%"
-        params.extend([search_term, search_term])
+    # Tìm kiếm theo từ khóa (FULLTEXT hoặc LIKE, xem app_logic/search.py)
+    search = build_book_search(search_query) or SearchClause()
+    if search.where:
+        where_conditions.append(search.where)
+        params.extend(search.where_params)
     if id_the_loai:
         where_conditions.append("s.id_the_loai = %s")
         params.append(id_the_loai)
@@ -341,68 +273,145 @@ def quan_ly_sach():
     if trang_thai_filter:  # Thêm điều kiện lọc theo trạng thái
         where_conditions.append("s.trang_thai = %s")
         params.append(trang_thai_filter)
+    return search, where_conditions, params
+
 
-    # Kết hợp các điều kiện thành mệnh đề WHERE hoàn chỉnh
+def _tai_trang_quan_ly_sach(cursor, args, with_count=True):
+    """
+    Đọc bộ lọc/con trỏ từ `args` và trả về dict gồm danh_sach_sach,
+    pager (KeysetPaginator), total_books và các giá trị bộ lọc.
+    """
+    limit = 15  # Số sách trên mỗi trang
+    search, where_conditions, params = _dieu_kien_loc_sach(args)
+
+    # Sắp xếp: sách mới nhất trước (khi tìm bằng FULLTEXT: sách liên quan nhất lên trước)
+    order = [("s.id_sach", "DESC", "id_sach")]
+    if search.order:
+        order.insert(0, ("kq_tim.relevance", "DESC", "relevance"))
+    pager = KeysetPaginator(order, limit).parse(args)
+
+    count_where = "WHERE " + " AND ".join(where_conditions) if where_conditions else ""
+    seek_sql, seek_params = pager.where()
+    if seek_sql:
+        where_conditions.append(seek_sql)
     where_clause = "WHERE " + " AND ".join(where_conditions) if where_conditions else ""
 
-    try:
-        # Đếm tổng số sách phù hợp với bộ lọc (để tính tổng số trang)
+    total_books = None
+    if with_count:
+        # Đếm tổng số sách phù hợp với bộ lọc (được cache)
         count_query = f"""
             SELECT COUNT(s.id_sach) AS total
             FROM Sach s LEFT JOIN TacGia tg ON s.id_tac_gia = tg.id_tac_gia
-            LEFT JOIN TheLoai tl ON s.id_the_loai = tl.id_the_loai {where_clause}
-        """
-        cursor.execute(count_query, tuple(params))
-        total_books = cursor.fetchone()["total"] or 0
-        total_pages = math.ceil(total_books / limit) if total_books > 0 else 1
-
-        # Lấy danh sách sách cho trang hiện tại
-        query = f"""
-        SELECT s.id_sach, s.tieu_de, tg.ten_tac_gia, tl.ten_the_loai,
-               s.so_luong, s.trang_thai, s.anh_bia, s.so_trang, s.nam_xuat_ban
-        FROM Sach s LEFT JOIN TacGia tg ON s.id_tac_gia = tg.id_tac_gia
-        LEFT JOIN TheLoai tl ON s.id_the_loai = tl.id_the_loai {where_clause}
-        ORDER BY s.id_sach DESC LIMIT %s OFFSET %s
+            LEFT JOIN TheLoai tl ON s.id_the_loai = tl.id_the_loai {search.join} {count_where}
         """
-        params_paginated = params + [
-            limit,
-            offset,
-        ]  # Thêm limit và offset vào danh sách tham số
-        cursor.execute(query, tuple(params_paginated))
-        danh_sach_sach = cursor.fetchall()
+        total_books = cached_count(cursor, count_query, search.join_params + params)
+
+    # Lấy danh sách sách cho trang hiện tại
+    relevance_field = ", kq_tim.relevance" if search.is_fulltext else ""
+    query = f"""
+    SELECT s.id_sach, s.tieu_de, tg.ten_tac_gia, tl.ten_the_loai,
+           s.so_luong, s.trang_thai, s.anh_bia, s.so_trang, s.nam_xuat_ban{relevance_field}
+    FROM Sach s LEFT JOIN TacGia tg ON s.id_tac_gia = tg.id_tac_gia
+    LEFT JOIN TheLoai tl ON s.id_the_loai = tl.id_the_loai {search.join} {where_clause}
+    ORDER BY {pager.order_by()} LIMIT {pager.limit}
+    """
+    cursor.execute(query, tuple(search.join_params + params + seek_params))
+    danh_sach_sach = pager.paginate(cursor.fetchall())
 
-        # Lấy danh sách tất cả tác giả và thể loại để hiển thị trong dropdown bộ lọc
-        cursor.execute(
-            "SELECT id_tac_gia, ten_tac_gia FROM TacGia ORDER BY ten_tac_gia"
-        )
-        all_tac_gia = cursor.fetchall()
-        cursor.execute(
-            "SELECT id_the_loai, ten_the_loai FROM TheLoai ORDER BY ten_the_loai"
+    return dict(
+        danh_sach_sach=danh_sach_sach,
+        pager=pager,
+        total_books=total_books,
+        search_query=args.get("search", ""),
+        selected_tac_gia=args.get("id_tac_gia", ""),
+        selected_the_loai=args.get("id_the_loai", ""),
+        selected_trang_thai=args.get("trang_thai", ""),
+    )
+
+
+# =========================================================
+# ROUTE: QUẢN LÝ SÁCH (/admin/sach)
+# =========================================================
+@admin_bp.route("/sach")
+@login_required
+@admin_required
+def quan_ly_sach():
+    """
+    Hiển thị trang danh sách sách cho admin.
+    Hỗ trợ tìm kiếm theo tiêu đề/tác giả, lọc theo thể loại, tác giả, trạng thái.
+    Phân trang theo con trỏ (tham số 'after' / 'before').
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+
+    try:
+        trang = _tai_trang_quan_ly_sach(cursor, request.args)
+
+        # Dropdown bộ lọc: tất cả thể loại và tác giả đang chọn (cache danh mục;
+        # các tác giả khác được gợi ý qua /api/tac-gia khi gõ)
+        all_the_loai = reference.get_genres(cursor)
+        tac_gia_da_chon = reference.find_by_id(
+            cursor, "tac_gia", request.args.get("id_tac_gia")
         )
-        all_the_loai = cursor.fetchall()
 
     except mysql.connector.Error as err:
         flash(f"Lỗi khi tải danh sách sách: {err}", "danger")
-        danh_sach_sach, all_tac_gia, all_the_loai, total_pages = [], [], [], 0
+        trang = dict(
+            danh_sach_sach=[],
+            pager=None,
+            total_books=0,
+            search_query=request.args.get("search", ""),
+            selected_tac_gia=request.args.get("id_tac_gia", ""),
+            selected_the_loai=request.args.get("id_the_loai", ""),
+            selected_trang_thai=request.args.get("trang_thai", ""),
+        )
+        tac_gia_da_chon, all_the_loai = None, []
     finally:
         cursor.close()
         conn.close()
 
+    pager = trang.pop("pager")
     # Trả về template quản lý sách với dữ liệu đã lấy
     return render_template(
         "admin_sach.html",
-        danh_sach_sach=danh_sach_sach,
-        current_page=page,
-        total_pages=total_pages,
-        search_query=search_query,
-        all_tac_gia=all_tac_gia,
+        prev_cursor=pager.prev_cursor if pager else None,
+        next_cursor=pager.next_cursor if pager else None,
+        tac_gia_da_chon=tac_gia_da_chon,
         all_the_loai=all_the_loai,
-        selected_tac_gia=id_tac_gia,
-        selected_the_loai=id_the_loai,
-        selected_trang_thai=trang_thai_filter,
+        **trang,
     )
 
 
+# =========================================================
+# API: DANH SÁCH SÁCH ADMIN DẠNG JSON (/admin/sach/data)
+# =========================================================
+@admin_bp.route("/sach/data")
+@login_required
+@admin_required
+def quan_ly_sach_json():
+    """
+    Phiên bản JSON của trang quản lý sách (cùng tham số lọc).
+    Phân trang bằng con trỏ 'after' / 'before'; tổng số chỉ trả về khi có '?with_count=1'.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        trang = _tai_trang_quan_ly_sach(
+            cursor, request.args, with_count=request.args.get("with_count") == "1"
+        )
+        return jsonify(
+            items=trang["danh_sach_sach"],
+            total=trang["total_books"],
+            **trang["pager"].to_dict(),
+        )
+    except mysql.connector.Error as err:
+        print(f"!!! Lỗi DB khi tải danh sách sách admin (JSON): {err}")
+        return jsonify(success=False, error=f"Lỗi CSDL: {err}"), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+
 # =========================================================
 # ROUTE: THÊM SÁCH MỚI (/admin/sach/them)
 # =========================================================
@@ -445,11 +454,12 @@ def them_sach():
                 )
 
             # Lấy ID tác giả và thể loại (tạo mới nếu chưa có)
+            danh_muc_moi = set()  # Bảng danh mục có dòng mới -> xóa cache sau commit
             id_tac_gia = get_or_create(
-                cursor, "TacGia", "id_tac_gia", "ten_tac_gia", ten_tac_gia
+                cursor, "TacGia", "id_tac_gia", "ten_tac_gia", ten_tac_gia, danh_muc_moi
             )
             id_the_loai = get_or_create(
-                cursor, "TheLoai", "id_the_loai", "ten_the_loai", ten_the_loai
+                cursor, "TheLoai", "id_the_loai", "ten_the_loai", ten_the_loai, danh_muc_moi
             )
 
             # Kiểm tra sách đã tồn tại dựa trên 4 trường chính
@@ -506,6 +516,7 @@ def them_sach():
                             os.remove(old_path)
 
                 # Cập nhật bản ghi sách hiện có
+                id_sach_thay_doi = existing_sach["id_sach"]
                 cursor.execute(
                     """UPDATE Sach SET so_luong = %s, so_trang = %s, anh_bia = %s, trang_thai = 'hoat_dong', mo_ta = %s
                        WHERE id_sach = %s""",
@@ -543,12 +554,19 @@ def them_sach():
                         mo_ta,
                     ),
                 )
+                id_sach_thay_doi = cursor.lastrowid
                 message = "Thêm sách mới thành công!"
                 ghi_nhat_ky_admin(
                     cursor, f"Đã thêm sách mới '{tieu_de}' (SL: {so_luong_them})"
                 )
 
             conn.commit()  # Lưu thay đổi vào CSDL
+            for table in danh_muc_moi:
+                reference.invalidate_reference(table)  # Tác giả/thể loại mới (sau commit)
+            book_index.refresh_book(id_sach_thay_doi)  # Cập nhật chỉ mục live search
+            related_index.refresh_book(id_sach_thay_doi)  # Cập nhật tác giả/thể loại cho sách liên quan
+            invalidate_book_detail(id_sach_thay_doi)  # Xóa cache trang chi tiết sách
+            home_shelves.invalidate_shelves()  # Tính lại kệ sách trang chủ
             # Trả về JSON thành công
             return jsonify(
                 {"success": True, "message": message, "newImage": anh_bia_filename}
@@ -570,18 +588,12 @@ def them_sach():
 
     # Xử lý request GET (hiển thị form)
     try:
-        # Lấy danh sách tác giả và thể loại để hiển thị trong dropdown
-        cursor.execute(
-            "SELECT id_tac_gia, ten_tac_gia FROM TacGia ORDER BY ten_tac_gia"
-        )
-        danh_sach_tac_gia = cursor.fetchall()
-        cursor.execute(
-            "SELECT id_the_loai, ten_the_loai FROM TheLoai ORDER BY ten_the_loai"
-        )
-        danh_sach_the_loai = cursor.fetchall()
+        # Lấy danh sách thể loại để hiển thị trong dropdown (có cache);
+        # tác giả được gợi ý qua /api/tac-gia khi gõ
+        danh_sach_the_loai = reference.get_genres(cursor)
     except mysql.connector.Error as err:
-        flash(f"Lỗi khi tải danh sách tác giả/thể loại: {err}", "danger")
-        danh_sach_tac_gia, danh_sach_the_loai = [], []
+        flash(f"Lỗi khi tải danh sách thể loại: {err}", "danger")
+        danh_sach_the_loai = []
     finally:
         if cursor:
             cursor.close()
@@ -591,11 +603,65 @@ def them_sach():
     # Trả về template thêm sách
     return render_template(
         "admin_them_sach.html",
-        danh_sach_tac_gia=danh_sach_tac_gia,
         danh_sach_the_loai=danh_sach_the_loai,
     )
 
 
+# =========================================================
+# ROUTE: NHẬP DANH MỤC SÁCH TỪ FILE (/admin/sach/nhap)
+# =========================================================
+@admin_bp.route("/sach/nhap", methods=["GET", "POST"])
+@login_required
+@admin_required
+def nhap_sach():
+    """
+    GET: Hiển thị form upload file danh mục sách (CSV/JSON Lines).
+    POST: Nhập file theo lô (xem app_logic/importer.py) và stream tiến độ dạng
+    NDJSON: mỗi lô một dòng thống kê, dòng cuối có "xong": true (và "error" nếu lỗi).
+    """
+    if request.method == "GET":
+        return render_template("admin_nhap_sach.html", chunk_size=importer.CHUNK_SIZE)
+
+    file = request.files.get("file")
+    if not file or not file.filename:
+        return jsonify(success=False, error="Vui lòng chọn file cần nhập."), 400
+    try:
+        fmt = importer.detect_format(file.filename)
+    except ValueError as err:
+        return jsonify(success=False, error=str(err)), 400
+    dry_run = request.form.get("dry_run") == "1"
+    id_admin = current_user.id
+    # File upload bị đóng khi request kết thúc -> chép ra file tạm (trên đĩa) để đọc trong lúc stream
+    upload = tempfile.TemporaryFile()
+    file.save(upload)
+    upload.seek(0)
+
+    def generate():
+        conn = get_db_connection()
+        # Đọc file từng dòng (utf-8-sig: bỏ qua BOM của CSV xuất từ Excel)
+        lines = codecs.getreader("utf-8-sig")(upload)
+        stats = None
+        try:
+            for stats in importer.iter_import(conn, lines, fmt, dry_run=dry_run, id_admin=id_admin):
+                if stats["xong"] and not dry_run and (stats["them_moi"] or stats["cong_don"]):
+                    # Xây lại chỉ mục trong bộ nhớ một lần thay vì cập nhật từng sách
+                    try:
+                        book_index.rebuild()
+                        related_index.rebuild()
+                    except mysql.connector.Error as err:
+                        print(f"!!! Lỗi DB khi xây lại chỉ mục sau khi nhập sách: {err}")
+                yield json.dumps(stats, ensure_ascii=False) + "\n"
+        except (mysql.connector.Error, ValueError) as err:
+            print(f"!!! Lỗi khi nhập danh mục sách: {err}")
+            yield json.dumps(dict(stats or {}, xong=True, error=f"Lỗi: {err}"), ensure_ascii=False) + "\n"
+        finally:
+            upload.close()
+            if conn and conn.is_connected():
+                conn.close()
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
 # =========================================================
 # ROUTE: SỬA THÔNG TIN SÁCH (/admin/sach/sua/<id>)
 # =========================================================
@@ -618,11 +684,12 @@ def sua_sach(id_sach):
             ten_tac_gia = request.form.get("ten_tac_gia", "").strip()
             ten_the_loai = request.form.get("ten_the_loai", "").strip()
             # Lấy ID hoặc tạo mới tác giả/thể loại
+            danh_muc_moi = set()  # Bảng danh mục có dòng mới -> xóa cache sau commit
             id_tac_gia = get_or_create(
-                cursor, "TacGia", "id_tac_gia", "ten_tac_gia", ten_tac_gia
+                cursor, "TacGia", "id_tac_gia", "ten_tac_gia", ten_tac_gia, danh_muc_moi
             )
             id_the_loai = get_or_create(
-                cursor, "TheLoai", "id_the_loai", "ten_the_loai", ten_the_loai
+                cursor, "TheLoai", "id_the_loai", "ten_the_loai", ten_the_loai, danh_muc_moi
             )
 
             if (
@@ -700,6 +767,12 @@ def sua_sach(id_sach):
                 cursor, f"Đã sửa thông tin sách '{tieu_de}' (ID: {id_sach})"
             )
             conn.commit()  # Lưu thay đổi
+            for table in danh_muc_moi:
+                reference.invalidate_reference(table)  # Tác giả/thể loại mới (sau commit)
+            book_index.refresh_book(id_sach)  # Cập nhật chỉ mục live search
+            related_index.refresh_book(id_sach)  # Cập nhật tác giả/thể loại cho sách liên quan
+            invalidate_book_detail(id_sach)  # Xóa cache trang chi tiết sách
+            home_shelves.invalidate_shelves()  # Tính lại kệ sách trang chủ
 
             # Trả về JSON thành công
             return jsonify(
@@ -742,15 +815,8 @@ def sua_sach(id_sach):
             flash("Không tìm thấy sách này.", "danger")
             return redirect(url_for("admin.quan_ly_sach"))
 
-        # Lấy danh sách tác giả và thể loại cho dropdown
-        cursor.execute(
-            "SELECT id_tac_gia, ten_tac_gia FROM TacGia ORDER BY ten_tac_gia"
-        )
-        danh_sach_tac_gia = cursor.fetchall()
-        cursor.execute(
-            "SELECT id_the_loai, ten_the_loai FROM TheLoai ORDER BY ten_the_loai"
-        )
-        danh_sach_the_loai = cursor.fetchall()
+        # Lấy danh sách thể loại cho dropdown (có cache); tác giả được gợi ý qua /api/tac-gia
+        danh_sach_the_loai = reference.get_genres(cursor)
     except mysql.connector.Error as err:
         flash(f"Lỗi khi tải thông tin sách để sửa: {err}", "danger")
         return redirect(url_for("admin.quan_ly_sach"))  # Chuyển hướng nếu lỗi
@@ -764,7 +830,6 @@ def sua_sach(id_sach):
     return render_template(
         "admin_sua_sach.html",
         sach=sach,
-        danh_sach_tac_gia=danh_sach_tac_gia,
         danh_sach_the_loai=danh_sach_the_loai,
     )
 
@@ -786,11 +851,18 @@ def xoa_binh_luan(id_binh_luan):
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
+        # Lấy sách của bình luận để xóa cache trang chi tiết sách đó
+        cursor.execute(
+            "SELECT id_sach FROM BinhLuan WHERE id_binh_luan = %s", (id_binh_luan,)
+        )
+        binh_luan = cursor.fetchone()
         cursor.execute(
             "DELETE FROM BinhLuan WHERE id_binh_luan = %s", (id_binh_luan,)
         )  # Xóa bình luận
         ghi_nhat_ky_admin(cursor, f"Đã xóa bình luận ID: {id_binh_luan}")  # Ghi log
         conn.commit()
+        if binh_luan:
+            invalidate_book_detail(binh_luan[0])  # Bình luận không còn hiển thị
         # Trả về JSON thành công
         return jsonify({"success": True, "message": "Xóa bình luận thành công"}), 200
     except mysql.connector.Error as err:
@@ -821,6 +893,80 @@ def xoa_binh_luan(id_binh_luan):
     return redirect(url_for("admin.admin_dashboard"))
 
 
+# =========================================================
+# HÀM NỘI BỘ: LỊCH SỬ MƯỢN CỦA MỘT SÁCH (PHÂN TRANG)
+# Dùng chung cho trang chi tiết sách admin và API JSON ("/sach/chitiet/<id>/lichsu").
+# =========================================================
+# Thứ tự hiển thị: các lượt có ngày mượn (ngay_muon, id giảm dần), sau cùng là
+# các lượt ngay_muon NULL (id giảm dần). Mỗi phần là một truy vấn riêng trên cột
+# gốc để MySQL đọc thẳng theo chỉ mục idx_muontra_sach_ngaymuon (migration 0007)
+# thay vì đọc và sắp xếp toàn bộ lượt mượn của sách theo một biểu thức COALESCE.
+_LICH_SU_TRANG_THAI = ("Đang chờ", "Đang mượn", "Đã trả", "Đã hủy")  # Bộ lọc hợp lệ
+_LICH_SU_ORDER = [
+    ("mt.ngay_muon", "DESC", "ngay_muon"),
+    ("mt.id_muon_tra", "DESC", "id_muon_tra"),
+]
+_LICH_SU_SQL = """
+    SELECT mt.id_muon_tra, tv.ho_ten, mt.ngay_muon, mt.ngay_hen_tra, mt.ngay_tra_thuc, mt.trang_thai,
+           mt.so_luong, mt.id_thanh_vien
+    FROM MuonTra mt JOIN ThanhVien tv ON mt.id_thanh_vien = tv.id_thanh_vien
+    WHERE {where}
+    ORDER BY {order_by} LIMIT {limit}
+"""
+
+
+def _lich_su_branches(pager):
+    """
+    Các nhánh truy vấn (điều kiện, tham số, ORDER BY) theo thứ tự cần đọc từ vị
+    trí con trỏ: tiến thì phần có ngày trước rồi phần NULL, lùi thì ngược lại.
+    Con trỏ có ngay_muon NULL nghĩa là đang ở phần NULL (chỉ còn seek theo id).
+    """
+    in_null = pager.values is not None and pager.values[0] is None
+    id_order = "ASC" if pager.backward else "DESC"
+    null_branch = (
+        ["mt.ngay_muon IS NULL"] + ([f"mt.id_muon_tra {'>' if pager.backward else '<'} %s"] if in_null else []),
+        [pager.values[1]] if in_null else [],
+        f"mt.id_muon_tra {id_order}",
+    )
+    if in_null:
+        dated_branch = (["mt.ngay_muon IS NOT NULL"], [], pager.order_by())
+        return [null_branch, dated_branch] if pager.backward else [null_branch]
+    seek_sql, seek_params = pager.where()
+    dated_branch = (["mt.ngay_muon IS NOT NULL"] + ([seek_sql] if seek_sql else []), seek_params, pager.order_by())
+    return [dated_branch] if pager.backward else [dated_branch, null_branch]
+
+
+def _tai_lich_su_muon_sach(cursor, id_sach, args, per_page=20):
+    """
+    Đọc bộ lọc 'trang_thai' và con trỏ từ `args`, trả về (rows, pager, trang_thai)
+    là một trang lịch sử mượn của sách (mới nhất trước). Không dùng OFFSET.
+    """
+    trang_thai = args.get("trang_thai", "")
+    if trang_thai not in _LICH_SU_TRANG_THAI:
+        trang_thai = ""
+    pager = KeysetPaginator(_LICH_SU_ORDER, per_page).parse(args)
+
+    base_conditions = ["mt.id_sach = %s"]
+    base_params = [id_sach]
+    if trang_thai:
+        base_conditions.append("mt.trang_thai = %s")
+        base_params.append(trang_thai)
+
+    rows = []
+    for conditions, params, order_by in _lich_su_branches(pager):
+        remaining = pager.limit - len(rows)
+        if remaining <= 0:
+            break
+        cursor.execute(
+            _LICH_SU_SQL.format(
+                where=" AND ".join(base_conditions + conditions), order_by=order_by, limit=remaining
+            ),
+            tuple(base_params + params),
+        )
+        rows.extend(cursor.fetchall())
+    return pager.paginate(rows), pager, trang_thai
+
+
 # =========================================================
 # ROUTE: CHI TIẾT SÁCH (ADMIN) (/admin/sach/chitiet/<id>)
 # =========================================================
@@ -832,57 +978,64 @@ def admin_chi_tiet_sach(id_sach):
     Hiển thị trang chi tiết sách cho admin.
     Bao gồm thông tin sách, thống kê admin (số lượng kho, đang mượn, chờ duyệt),
     lịch sử mượn của sách đó, và danh sách bình luận (có nút xóa).
+    Các truy vấn chỉ phụ thuộc id_sach nên được chạy song song.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
     sach = None
     stats = {}
     lich_su_muon = []
     binh_luan = []
+    binh_luan_next = None  # Con trỏ trang bình luận kế tiếp
+    lich_su_next = None  # Con trỏ trang lịch sử mượn kế tiếp
+    loc_trang_thai = ""  # Bộ lọc trạng thái của lịch sử mượn
+    request_args = request.args.to_dict()  # Các tác vụ chạy ở thread khác, không có request
+    so_binh_luan = 0
     today_date = datetime.date.today()
 
+    tasks = {
+        # Thông tin cơ bản của sách
+        "sach": fetch_one(
+            """
+            SELECT s.*, tg.ten_tac_gia, tl.ten_the_loai FROM Sach s
+            LEFT JOIN TacGia tg ON s.id_tac_gia = tg.id_tac_gia
+            LEFT JOIN TheLoai tl ON s.id_the_loai = tl.id_the_loai WHERE s.id_sach = %s
+            """,
+            (id_sach,),
+        ),
+        # Thống kê theo trạng thái: một truy vấn gom nhóm (chỉ đọc chỉ mục
+        # MuonTra(id_sach, trang_thai, so_luong)) thay cho 4 truy vấn COUNT/SUM
+        "theo_trang_thai": fetch_all(
+            """
+            SELECT trang_thai, COUNT(*) AS so_luot, SUM(so_luong) AS so_cuon
+            FROM MuonTra WHERE id_sach = %s GROUP BY trang_thai
+            """,
+            (id_sach,),
+        ),
+        # Trang đầu của lịch sử mượn (các trang sau/bộ lọc tải qua JSON)
+        "lich_su_muon": lambda cursor: _tai_lich_su_muon_sach(cursor, id_sach, request_args),
+        # Trang bình luận đầu tiên của sách này (các trang sau tải qua JSON khi cuộn)
+        "binh_luan": lambda cursor: load_comments(cursor, id_sach),
+        "so_binh_luan": lambda cursor: comment_count(cursor, id_sach),
+    }
+
     try:
-        # Lấy thông tin cơ bản của sách
-        query_sach = """
-        SELECT s.*, tg.ten_tac_gia, tl.ten_the_loai FROM Sach s
-        LEFT JOIN TacGia tg ON s.id_tac_gia = tg.id_tac_gia
-        LEFT JOIN TheLoai tl ON s.id_the_loai = tl.id_the_loai WHERE s.id_sach = %s
-        """
-        cursor.execute(query_sach, (id_sach,))
-        sach = cursor.fetchone()
+        results = run_parallel(tasks)
+        sach = results["sach"]
 
         if not sach:
             flash("Không tìm thấy sách này.", "danger")
             return redirect(url_for("admin.quan_ly_sach"))  # Dùng tên blueprint
 
-        # Lấy các thống kê liên quan đến sách này
         sach_trong_kho = sach.get(
             "so_luong", 0
         )  # Số lượng ghi trong bảng Sach (chưa trừ sách chờ)
-        cursor.execute(
-            "SELECT SUM(so_luong) as total FROM MuonTra WHERE id_sach = %s AND trang_thai = 'Đang mượn'",
-            (id_sach,),
-        )
-        sach_dang_muon_sum = (result := cursor.fetchone()) and result.get("total") or 0
-        cursor.execute(
-            "SELECT COUNT(*) as total FROM MuonTra WHERE id_sach = %s AND trang_thai IN ('Đang mượn', 'Đã trả')",
-            (id_sach,),
-        )
-        tong_luot_muon_thuc = (result := cursor.fetchone()) and result.get("total") or 0
-        cursor.execute(
-            "SELECT COUNT(id_muon_tra) as total FROM MuonTra WHERE id_sach = %s AND trang_thai = 'Đang chờ'",
-            (id_sach,),
-        )
-        sach_cho_duyet_count = (
-            (result := cursor.fetchone()) and result.get("total") or 0
-        )  # Số lượt đặt chờ
-        cursor.execute(
-            "SELECT SUM(so_luong) as total FROM MuonTra WHERE id_sach = %s AND trang_thai = 'Đang chờ'",
-            (id_sach,),
-        )
-        sach_cho_duyet_sum = (
-            (result := cursor.fetchone()) and result.get("total") or 0
-        )  # Tổng số cuốn đang chờ
+        theo_trang_thai = {row["trang_thai"]: row for row in results["theo_trang_thai"]}
+
+        def tong(trang_thai, cot):
+            row = theo_trang_thai.get(trang_thai)
+            return int((row and row[cot]) or 0)
+
+        sach_dang_muon_sum = tong("Đang mượn", "so_cuon")
+        sach_cho_duyet_sum = tong("Đang chờ", "so_cuon")
 
         # Tổng số bản sao mà thư viện có = trong kho + đang mượn + đang chờ
         tong_so_ban_sao = sach_trong_kho + sach_dang_muon_sum + sach_cho_duyet_sum
@@ -891,29 +1044,16 @@ def admin_chi_tiet_sach(id_sach):
         stats = {
             "sach_trong_kho": sach_trong_kho,
             "sach_dang_muon_sum": sach_dang_muon_sum,
-            "sach_cho_duyet_count": sach_cho_duyet_count,
+            "sach_cho_duyet_count": tong("Đang chờ", "so_luot"),
             "sach_cho_duyet_sum": sach_cho_duyet_sum,
             "tong_so_ban_sao": tong_so_ban_sao,
-            "tong_luot_muon_thuc": tong_luot_muon_thuc,
+            "tong_luot_muon_thuc": tong("Đang mượn", "so_luot") + tong("Đã trả", "so_luot"),
         }
-
-        # Lấy lịch sử mượn của sách này
-        query_history = """
-        SELECT tv.ho_ten, mt.ngay_muon, mt.ngay_hen_tra, mt.ngay_tra_thuc, mt.trang_thai, mt.so_luong, mt.id_thanh_vien
-        FROM MuonTra mt JOIN ThanhVien tv ON mt.id_thanh_vien = tv.id_thanh_vien
-        WHERE mt.id_sach = %s ORDER BY mt.ngay_muon DESC
-        """
-        cursor.execute(query_history, (id_sach,))
-        lich_su_muon = cursor.fetchall()
-
-        # Lấy danh sách bình luận của sách này
-        query_comments = """
-        SELECT bl.id_binh_luan, bl.noi_dung, bl.ngay_dang, tv.ho_ten, tv.id_thanh_vien
-        FROM BinhLuan bl JOIN ThanhVien tv ON bl.id_thanh_vien = tv.id_thanh_vien
-        WHERE bl.id_sach = %s ORDER BY bl.ngay_dang DESC
-        """
-        cursor.execute(query_comments, (id_sach,))
-        binh_luan = cursor.fetchall()
+        lich_su_muon, lich_su_pager, loc_trang_thai = results["lich_su_muon"]
+        lich_su_next = lich_su_pager.next_cursor
+        binh_luan, comment_pager = results["binh_luan"]
+        binh_luan_next = comment_pager.next_cursor
+        so_binh_luan = results["so_binh_luan"]
 
     except mysql.connector.Error as err:
         flash(f"Lỗi khi tải chi tiết sách: {err}", "danger")
@@ -922,11 +1062,6 @@ def admin_chi_tiet_sach(id_sach):
         stats = stats or {}
         lich_su_muon = lich_su_muon or []
         binh_luan = binh_luan or []
-    finally:
-        if cursor:
-            cursor.close()
-        if conn and conn.is_connected():
-            conn.close()
 
     # Trả về template chi tiết sách admin
     return render_template(
@@ -934,11 +1069,65 @@ def admin_chi_tiet_sach(id_sach):
         sach=sach,
         stats=stats,
         lich_su_muon=lich_su_muon,
+        lich_su_next=lich_su_next,
+        loc_trang_thai=loc_trang_thai,
+        trang_thai_lich_su=_LICH_SU_TRANG_THAI,
         binh_luan=binh_luan,
+        binh_luan_next=binh_luan_next,
+        so_binh_luan=so_binh_luan,
         today_date=today_date,
     )
 
 
+# =========================================================
+# ROUTE: LỊCH SỬ MƯỢN CỦA SÁCH (JSON) (/admin/sach/chitiet/<id>/lichsu)
+# =========================================================
+@admin_bp.route("/sach/chitiet/<int:id_sach>/lichsu")
+@login_required
+@admin_required
+def lich_su_muon_sach_json(id_sach):
+    """
+    Trả về một trang lịch sử mượn của sách cho bảng ở trang chi tiết admin.
+    Tham số: 'trang_thai' (lọc), con trỏ 'after' / 'before'.
+    Ngày tháng được định dạng sẵn như trong template.
+    """
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        rows, pager, trang_thai = _tai_lich_su_muon_sach(cursor, id_sach, request.args)
+        today_date = datetime.date.today()
+        items = [
+            {
+                "id_muon_tra": item["id_muon_tra"],
+                "ho_ten": item["ho_ten"],
+                "so_luong": item["so_luong"],
+                "ngay_muon": item["ngay_muon"].strftime("%d-%m-%Y") if item["ngay_muon"] else "N/A",
+                "ngay_hen_tra": item["ngay_hen_tra"].strftime("%d-%m-%Y") if item["ngay_hen_tra"] else "N/A",
+                "ngay_tra_thuc": (
+                    item["ngay_tra_thuc"].strftime("%d-%m-%Y %H:%M") if item["ngay_tra_thuc"] else "Chưa trả"
+                ),
+                "trang_thai": item["trang_thai"],
+                "qua_han": bool(
+                    item["trang_thai"] == "Đang mượn"
+                    and item["ngay_hen_tra"]
+                    and item["ngay_hen_tra"] < today_date
+                ),
+            }
+            for item in rows
+        ]
+        return jsonify(items=items, trang_thai=trang_thai, **pager.to_dict())
+    except mysql.connector.Error as err:
+        print(f"!!! Lỗi DB khi tải lịch sử mượn sách {id_sach} (JSON): {err}")
+        return jsonify(success=False, error="Lỗi máy chủ"), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn and conn.is_connected():
+            conn.close()
+
+
 # =========================================================
 # ROUTE: ẨN SÁCH (/admin/sach/an/<id>) - AJAX
 # =========================================================
@@ -962,6 +1151,10 @@ def an_sach(id_sach):
         )
         ghi_nhat_ky_admin(cursor, f"Đã ẩn sách ID: {id_sach}")  # Ghi log
         conn.commit()
+        book_index.remove_book(id_sach)  # Sách ẩn không còn xuất hiện trong live search
+        related_index.remove_book(id_sach)  # Sách ẩn không còn là sách liên quan
+        invalidate_book_detail(id_sach)  # Xóa cache trang chi tiết sách
+        home_shelves.invalidate_shelves()  # Tính lại kệ sách trang chủ
         return jsonify(success=True, message="Ẩn sách thành công.")  # Trả về thành công
     except mysql.connector.Error as err:
         if conn:
@@ -1004,6 +1197,10 @@ def khoi_phuc_sach(id_sach):
         )
         ghi_nhat_ky_admin(cursor, f"Đã khôi phục sách ID: {id_sach}")  # Ghi log
         conn.commit()
+        book_index.refresh_book(id_sach)  # Đưa sách trở lại chỉ mục live search
+        related_index.refresh_book(id_sach)  # Đưa sách trở lại danh sách sách liên quan
+        invalidate_book_detail(id_sach)  # Xóa cache trang chi tiết sách
+        home_shelves.invalidate_shelves()  # Tính lại kệ sách trang chủ
         return jsonify(
             success=True, message="Khôi phục sách thành công."
         )  # Trả về thành công
@@ -1025,29 +1222,17 @@ def khoi_phuc_sach(id_sach):
 
 
 # =========================================================
-# ROUTE: QUẢN LÝ THÀNH VIÊN (/admin/thanhvien)
+# HÀM NỘI BỘ: TẢI MỘT TRANG DANH SÁCH THÀNH VIÊN
+# Dùng chung cho trang HTML (/admin/thanhvien) và API JSON (/admin/thanhvien/data).
 # =========================================================
-@admin_bp.route("/thanhvien")
-@login_required
-@admin_required
-def quan_ly_thanhvien():
+def _dieu_kien_loc_thanh_vien(args):
     """
-    Hiển thị trang danh sách thành viên cho admin.
-    Hỗ trợ tìm kiếm theo tên/email, lọc theo vai trò, trạng thái.
-    Có phân trang.
+    Trả về (where_conditions, params) theo bộ lọc trang thành viên: tên/email
+    ('search'), vai trò, trạng thái. Dùng chung cho trang danh sách và file xuất.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-
-    # Lấy tham số từ URL cho phân trang và bộ lọc
-    page = request.args.get("page", 1, type=int)
-    if page < 1:
-        page = 1  # Trang tối thiểu là 1
-    limit = 20  # Số lượng thành viên mỗi trang
-    offset = (page - 1) * limit
-    search_query = request.args.get("search", "")
-    selected_vai_tro = request.args.get("vai_tro", "")
-    selected_trang_thai = request.args.get("trang_thai", "")
+    search_query = args.get("search", "")
+    selected_vai_tro = args.get("vai_tro", "")
+    selected_trang_thai = args.get("trang_thai", "")
 
     # Xây dựng mệnh đề WHERE dựa trên bộ lọc
     where_conditions = []
@@ -1063,47 +1248,123 @@ def quan_ly_thanhvien():
     if selected_trang_thai:
         where_conditions.append("trang_thai = %s")  # Lọc theo trạng thái
         params.append(selected_trang_thai)
+    return where_conditions, params
+
+
+def _tai_trang_thanh_vien(cursor, args, with_count=True):
+    """
+    Đọc bộ lọc/con trỏ từ `args` và trả về dict gồm danh_sach_thanh_vien,
+    pager (KeysetPaginator), total_members và các giá trị bộ lọc.
+    """
+    limit = 20  # Số lượng thành viên mỗi trang
+    where_conditions, params = _dieu_kien_loc_thanh_vien(args)
+
+    pager = KeysetPaginator([("id_thanh_vien", "ASC", "id_thanh_vien")], limit).parse(args)
+    count_where = "WHERE " + " AND ".join(where_conditions) if where_conditions else ""
+    seek_sql, seek_params = pager.where()
+    if seek_sql:
+        where_conditions.append(seek_sql)
     where_clause = (
         "WHERE " + " AND ".join(where_conditions) if where_conditions else ""
     )  # Ghép các điều kiện
 
-    danh_sach_thanh_vien = []
-    total_pages = 1
-    try:
-        # Đếm tổng số thành viên phù hợp
-        count_query = (
-            f"SELECT COUNT(id_thanh_vien) AS total FROM ThanhVien {where_clause}"
+    total_members = None
+    if with_count:
+        # Đếm tổng số thành viên phù hợp (được cache)
+        total_members = cached_count(
+            cursor,
+            f"SELECT COUNT(id_thanh_vien) AS total FROM ThanhVien {count_where}",
+            params,
         )
-        cursor.execute(count_query, tuple(params))
-        total_members = cursor.fetchone()["total"] or 0
-        total_pages = math.ceil(total_members / limit) if total_members > 0 else 1
-
-        # Lấy danh sách thành viên cho trang hiện tại
-        query = f""" SELECT id_thanh_vien, ho_ten, email, vai_tro, ngay_dang_ky, trang_thai
-                     FROM ThanhVien {where_clause} ORDER BY id_thanh_vien LIMIT %s OFFSET %s """
-        params.extend([limit, offset])  # Thêm limit và offset
-        cursor.execute(query, tuple(params))
-        danh_sach_thanh_vien = cursor.fetchall()
 
+    # Lấy danh sách thành viên cho trang hiện tại
+    query = f""" SELECT id_thanh_vien, ho_ten, email, vai_tro, ngay_dang_ky, trang_thai
+                 FROM ThanhVien {where_clause} ORDER BY {pager.order_by()} LIMIT {pager.limit} """
+    cursor.execute(query, tuple(params + seek_params))
+    danh_sach_thanh_vien = pager.paginate(cursor.fetchall())
+
+    return dict(
+        danh_sach_thanh_vien=danh_sach_thanh_vien,
+        pager=pager,
+        total_members=total_members,
+        search_query=args.get("search", ""),
+        selected_vai_tro=args.get("vai_tro", ""),
+        selected_trang_thai=args.get("trang_thai", ""),
+    )
+
+
+# =========================================================
+# ROUTE: QUẢN LÝ THÀNH VIÊN (/admin/thanhvien)
+# =========================================================
+@admin_bp.route("/thanhvien")
+@login_required
+@admin_required
+def quan_ly_thanhvien():
+    """
+    Hiển thị trang danh sách thành viên cho admin.
+    Hỗ trợ tìm kiếm theo tên/email, lọc theo vai trò, trạng thái.
+    Phân trang theo con trỏ (tham số 'after' / 'before').
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+
+    try:
+        trang = _tai_trang_thanh_vien(cursor, request.args)
     except mysql.connector.Error as err:
         flash(f"Lỗi khi tải danh sách thành viên: {err}", "danger")
+        trang = dict(
+            danh_sach_thanh_vien=[],
+            pager=None,
+            total_members=0,
+            search_query=request.args.get("search", ""),
+            selected_vai_tro=request.args.get("vai_tro", ""),
+            selected_trang_thai=request.args.get("trang_thai", ""),
+        )
     finally:
         # Đóng kết nối
         cursor.close()
         conn.close()
 
+    pager = trang.pop("pager")
     # Trả về template hiển thị danh sách
     return render_template(
         "admin_thanhvien.html",
-        danh_sach_thanh_vien=danh_sach_thanh_vien,
-        current_page=page,
-        total_pages=total_pages,
-        search_query=search_query,
-        selected_vai_tro=selected_vai_tro,
-        selected_trang_thai=selected_trang_thai,
+        prev_cursor=pager.prev_cursor if pager else None,
+        next_cursor=pager.next_cursor if pager else None,
+        **trang,
     )
 
 
+# =========================================================
+# API: DANH SÁCH THÀNH VIÊN DẠNG JSON (/admin/thanhvien/data)
+# =========================================================
+@admin_bp.route("/thanhvien/data")
+@login_required
+@admin_required
+def quan_ly_thanhvien_json():
+    """
+    Phiên bản JSON của trang quản lý thành viên (cùng tham số lọc).
+    Phân trang bằng con trỏ 'after' / 'before'; tổng số chỉ trả về khi có '?with_count=1'.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        trang = _tai_trang_thanh_vien(
+            cursor, request.args, with_count=request.args.get("with_count") == "1"
+        )
+        return jsonify(
+            items=trang["danh_sach_thanh_vien"],
+            total=trang["total_members"],
+            **trang["pager"].to_dict(),
+        )
+    except mysql.connector.Error as err:
+        print(f"!!! Lỗi DB khi tải danh sách thành viên (JSON): {err}")
+        return jsonify(success=False, error=f"Lỗi CSDL: {err}"), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+
 # =========================================================
 # ROUTE: SỬA THÔNG TIN THÀNH VIÊN (/admin/thanhvien/sua/<id>)
 # =========================================================
@@ -1171,6 +1432,7 @@ def sua_thanhvien(id_thanh_vien):
                 f"Đã cập nhật thông tin thành viên '{ho_ten}' (ID: {id_thanh_vien})",
             )
             conn.commit()
+            User.invalidate(id_thanh_vien)  # Xóa cache để lần tải sau đọc dữ liệu mới
             flash("Cập nhật thông tin thành viên thành công!", "success")
             return redirect(url_for("admin.quan_ly_thanhvien"))  # Quay về danh sách
 
@@ -1247,6 +1509,7 @@ def xoa_thanhvien(id_thanh_vien):
         )
         ghi_nhat_ky_admin(cursor, f"Đã khóa thành viên ID: {id_thanh_vien}")  # Ghi log
         conn.commit()
+        User.invalidate(id_thanh_vien)  # Xóa cache để trạng thái khóa có hiệu lực ngay
         return jsonify(
             success=True, message="Khóa tài khoản thành công."
         )  # Trả về thành công
@@ -1293,6 +1556,7 @@ def mo_khoa_thanhvien(id_thanh_vien):
             cursor, f"Đã mở khóa thành viên ID: {id_thanh_vien}"
         )  # Ghi log
         conn.commit()
+        User.invalidate(id_thanh_vien)  # Xóa cache để trạng thái mới có hiệu lực ngay
         return jsonify(
             success=True, message="Mở khóa tài khoản thành công."
         )  # Trả về thành công
@@ -1427,6 +1691,7 @@ def reset_matkhau(id_thanh_vien):
             cursor, f"Đã reset mật khẩu cho thành viên ID: {id_thanh_vien}"
         )  # Ghi log
         conn.commit()  # Lưu thay đổi
+        User.invalidate(id_thanh_vien)  # Xóa cache người dùng
         return jsonify(
             success=True, message="Đặt lại mật khẩu thành công!"
         )  # Trả về thành công
@@ -1449,98 +1714,175 @@ def reset_matkhau(id_thanh_vien):
 
 
 # =========================================================
-# ROUTE: QUẢN LÝ MƯỢN/TRẢ (/admin/muontra)
+# CẤU HÌNH CÁC TAB TRANG MƯỢN/TRẢ
+# Mỗi tab: điều kiện trạng thái, các cột lấy thêm, thứ tự sắp xếp
+# (dùng cho phân trang theo khóa) và tên tham số con trỏ riêng.
+# Các cột ngày có thể NULL được bọc COALESCE để so sánh con trỏ được.
 # =========================================================
-@admin_bp.route("/muontra")
-@login_required
-@admin_required
-def quan_ly_muontra():
+_MUONTRA_TABS = {
+    "cho": {
+        "where": "mt.trang_thai = 'Đang chờ'",
+        "fields": "mt.ngay_hen_tra, COALESCE(mt.ngay_muon, DATE('1000-01-01')) AS sort_ngay_muon",
+        "order": [
+            ("COALESCE(mt.ngay_muon, DATE('1000-01-01'))", "ASC", "sort_ngay_muon"),
+            ("mt.id_muon_tra", "ASC", "id_muon_tra"),
+        ],
+        "params": ("after_cho", "before_cho"),
+    },
+    "muon": {
+        "where": "mt.trang_thai = 'Đang mượn'",
+        "fields": "mt.ngay_hen_tra",
+        "order": [
+            ("mt.ngay_hen_tra", "ASC", "ngay_hen_tra"),
+            ("mt.id_muon_tra", "ASC", "id_muon_tra"),
+        ],
+        "params": ("after_muon", "before_muon"),
+    },
+    "su": {
+        "where": "mt.trang_thai IN ('Đã trả', 'Đã hủy')",
+        "fields": (
+            "mt.ngay_tra_thuc, mt.trang_thai, mt.tien_phat,"
+            " COALESCE(mt.ngay_tra_thuc, TIMESTAMP('1000-01-01 00:00:00')) AS sort_ngay_tra,"
+            " COALESCE(mt.ngay_muon, DATE('1000-01-01')) AS sort_ngay_muon"
+        ),
+        "order": [
+            ("COALESCE(mt.ngay_tra_thuc, TIMESTAMP('1000-01-01 00:00:00'))", "DESC", "sort_ngay_tra"),
+            ("COALESCE(mt.ngay_muon, DATE('1000-01-01'))", "DESC", "sort_ngay_muon"),
+            ("mt.id_muon_tra", "DESC", "id_muon_tra"),
+        ],
+        "params": ("after_su", "before_su"),
+    },
+}
+
+
+# =========================================================
+# HÀM NỘI BỘ: ĐIỀU KIỆN LỌC MƯỢN/TRẢ
+# Dùng chung cho các tab trang mượn/trả và file xuất (/admin/muontra/xuat).
+# =========================================================
+def _parse_ngay(value):
+    """Chuỗi 'YYYY-MM-DD' (ô input type=date) -> date, không hợp lệ -> None."""
+    try:
+        return datetime.date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def _dieu_kien_loc_muontra(args):
     """
-    Hiển thị trang quản lý mượn/trả sách với 3 tab: Đang chờ, Đang mượn, Lịch sử.
-    Hỗ trợ tìm kiếm theo ID đơn, tên sách, tên người mượn.
-    Mỗi tab có phân trang riêng.
+    Trả về (sql, params): các điều kiện ' AND ...' theo tham số 'search'
+    (ID đơn, tên sách, tên người mượn) và khoảng ngày mượn 'tu_ngay' / 'den_ngay'.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    today_date = datetime.date.today()  # Lấy ngày hiện tại để so sánh hạn trả
-
-    # Cài đặt phân trang
-    PER_PAGE = 15  # Số mục trên mỗi trang
-    page_cho = request.args.get("page_cho", 1, type=int)
-    page_muon = request.args.get("page_muon", 1, type=int)
-    page_su = request.args.get("page_su", 1, type=int)
-    # Tính offset cho từng tab
-    offset_cho = (max(1, page_cho) - 1) * PER_PAGE
-    offset_muon = (max(1, page_muon) - 1) * PER_PAGE
-    offset_su = (max(1, page_su) - 1) * PER_PAGE
+    conditions = []
+    params = []
 
     # Xử lý tìm kiếm
-    search_query = request.args.get("search", "")
-    search_where_clause = ""
-    search_params = []
+    search_query = args.get("search", "")
     if search_query:
         search_term = f"%{search_query}%"
         search_conditions = [
             "s.tieu_de LIKE %s",
             "tv.ho_ten LIKE %s",
         ]  # Tìm theo tên sách hoặc tên người mượn
-        search_params.extend([search_term, search_term])
+        params.extend([search_term, search_term])
         if search_query.isdigit():  # Nếu nhập số, tìm thêm theo ID đơn mượn
             search_conditions.append("mt.id_muon_tra = %s")
-            search_params.append(int(search_query))
-        # Tạo mệnh đề WHERE cho tìm kiếm
-        search_where_clause = " AND (" + " OR ".join(search_conditions) + ")"
+            params.append(int(search_query))
+        conditions.append("(" + " OR ".join(search_conditions) + ")")
+
+    # Lọc theo khoảng ngày mượn (bỏ qua giá trị ngày không hợp lệ)
+    tu_ngay = _parse_ngay(args.get("tu_ngay"))
+    den_ngay = _parse_ngay(args.get("den_ngay"))
+    if tu_ngay:
+        conditions.append("mt.ngay_muon >= %s")
+        params.append(tu_ngay)
+    if den_ngay:
+        conditions.append("mt.ngay_muon <= %s")
+        params.append(den_ngay)
+
+    sql = "".join(f" AND {condition}" for condition in conditions)
+    return sql, params
+
+
+# =========================================================
+# HÀM NỘI BỘ: TẢI MỘT TRANG CỦA MỘT TAB MƯỢN/TRẢ
+# Dùng chung cho trang HTML (/admin/muontra) và API JSON (/admin/muontra/data/<tab>).
+# =========================================================
+def _tai_tab_muontra(cursor, tab, args, per_page=15, with_count=False):
+    """
+    Trả về (danh_sach, pager, total) của tab `tab` ("cho", "muon", "su").
+    Hỗ trợ tìm kiếm theo ID đơn, tên sách, tên người mượn (tham số 'search')
+    và lọc theo khoảng ngày mượn ('tu_ngay' / 'den_ngay').
+    `total` chỉ được đếm (có cache) khi `with_count=True`, ngược lại là None.
+    """
+    config = _MUONTRA_TABS[tab]
+
+    # Điều kiện tìm kiếm / khoảng ngày (chung cho mọi tab)
+    search_where_clause, search_params = _dieu_kien_loc_muontra(args)
+
+    # Phần JOIN chung cho các truy vấn lấy dữ liệu mượn trả
+    base_join = """ FROM MuonTra mt JOIN Sach s ON mt.id_sach = s.id_sach JOIN ThanhVien tv ON mt.id_thanh_vien = tv.id_thanh_vien """
+
+    total = None
+    if with_count:
+        total = cached_count(
+            cursor,
+            f"SELECT COUNT(mt.id_muon_tra) AS total {base_join} WHERE {config['where']} {search_where_clause}",
+            search_params,
+        )
+
+    after_param, before_param = config["params"]
+    pager = KeysetPaginator(
+        config["order"], per_page, after_param=after_param, before_param=before_param
+    ).parse(args)
+    seek_sql, seek_params = pager.where()
+    seek_clause = f" AND {seek_sql}" if seek_sql else ""
+
+    query = f""" SELECT mt.id_muon_tra, s.tieu_de, tv.ho_ten, mt.ngay_muon, mt.so_luong, {config['fields']} {base_join}
+                 WHERE {config['where']} {search_where_clause}{seek_clause}
+                 ORDER BY {pager.order_by()} LIMIT {pager.limit} """
+    cursor.execute(query, tuple(search_params + seek_params))
+    danh_sach = pager.paginate(cursor.fetchall())
+    return danh_sach, pager, total
+
+
+# =========================================================
+# ROUTE: QUẢN LÝ MƯỢN/TRẢ (/admin/muontra)
+# =========================================================
+@admin_bp.route("/muontra")
+@login_required
+@admin_required
+def quan_ly_muontra():
+    """
+    Hiển thị trang quản lý mượn/trả sách với 3 tab: Đang chờ, Đang mượn, Lịch sử.
+    Hỗ trợ tìm kiếm theo ID đơn, tên sách, tên người mượn và lọc theo khoảng ngày mượn.
+    Mỗi tab có con trỏ phân trang riêng (after_cho/before_cho, after_muon/..., after_su/...).
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    today_date = datetime.date.today()  # Lấy ngày hiện tại để so sánh hạn trả
+    search_query = request.args.get("search", "")
 
     # Khởi tạo các biến chứa dữ liệu và thông tin phân trang
     danh_sach_cho, danh_sach_muon, lich_su_muon = [], [], []
-    total_pages_cho, total_pages_muon, total_pages_su = 1, 1, 1
+    pager_cho = pager_muon = pager_su = None
     total_cho, total_muon = 0, 0
 
     try:
-        # Phần JOIN chung cho các truy vấn lấy dữ liệu mượn trả
-        base_join = """ FROM MuonTra mt JOIN Sach s ON mt.id_sach = s.id_sach JOIN ThanhVien tv ON mt.id_thanh_vien = tv.id_thanh_vien """
-
-        # --- Lấy dữ liệu cho Tab "Đang chờ" ---
-        # Đếm tổng số lượt đang chờ
-        query_count_cho = f"SELECT COUNT(mt.id_muon_tra) AS total {base_join} WHERE mt.trang_thai = 'Đang chờ' {search_where_clause}"
-        cursor.execute(query_count_cho, tuple(search_params))
-        total_cho = cursor.fetchone()["total"] or 0
-        total_pages_cho = math.ceil(total_cho / PER_PAGE) if total_cho > 0 else 1
-        # Lấy danh sách lượt đang chờ cho trang hiện tại
-        query_dang_cho = f""" SELECT mt.id_muon_tra, s.tieu_de, tv.ho_ten, mt.ngay_muon, mt.ngay_hen_tra, mt.so_luong {base_join}
-                             WHERE mt.trang_thai = 'Đang chờ' {search_where_clause} ORDER BY mt.ngay_muon ASC LIMIT %s OFFSET %s """
-        cursor.execute(query_dang_cho, tuple(search_params + [PER_PAGE, offset_cho]))
-        danh_sach_cho = cursor.fetchall()
-
-        # --- Lấy dữ liệu cho Tab "Đang mượn" ---
-        # Đếm tổng số lượt đang mượn
-        query_count_muon = f"SELECT COUNT(mt.id_muon_tra) AS total {base_join} WHERE mt.trang_thai = 'Đang mượn' {search_where_clause}"
-        cursor.execute(query_count_muon, tuple(search_params))
-        total_muon = cursor.fetchone()["total"] or 0
-        total_pages_muon = math.ceil(total_muon / PER_PAGE) if total_muon > 0 else 1
-        # Lấy danh sách lượt đang mượn cho trang hiện tại
-        query_dang_muon = f""" SELECT mt.id_muon_tra, s.tieu_de, tv.ho_ten, mt.ngay_muon, mt.ngay_hen_tra, mt.so_luong {base_join}
-                              WHERE mt.trang_thai = 'Đang mượn' {search_where_clause} ORDER BY mt.ngay_hen_tra ASC LIMIT %s OFFSET %s """
-        cursor.execute(query_dang_muon, tuple(search_params + [PER_PAGE, offset_muon]))
-        danh_sach_muon = cursor.fetchall()
-
-        # --- Lấy dữ liệu cho Tab "Lịch sử" ---
-        # Đếm tổng số lượt đã trả/hủy
-        query_count_su = f"SELECT COUNT(mt.id_muon_tra) AS total {base_join} WHERE mt.trang_thai IN ('Đã trả', 'Đã hủy') {search_where_clause}"
-        cursor.execute(query_count_su, tuple(search_params))
-        total_su = cursor.fetchone()["total"] or 0
-        total_pages_su = math.ceil(total_su / PER_PAGE) if total_su > 0 else 1
-        # Lấy danh sách lịch sử cho trang hiện tại
-        query_lich_su = f""" SELECT mt.id_muon_tra, s.tieu_de, tv.ho_ten, mt.ngay_muon, mt.ngay_tra_thuc, mt.trang_thai, mt.tien_phat, mt.so_luong {base_join}
-                             WHERE mt.trang_thai IN ('Đã trả', 'Đã hủy') {search_where_clause} ORDER BY mt.ngay_tra_thuc DESC, mt.ngay_muon DESC LIMIT %s OFFSET %s """
-        cursor.execute(query_lich_su, tuple(search_params + [PER_PAGE, offset_su]))
-        lich_su_muon = cursor.fetchall()
+        # --- Tab "Đang chờ" và "Đang mượn" (kèm tổng số để hiển thị trên tab) ---
+        danh_sach_cho, pager_cho, total_cho = _tai_tab_muontra(
+            cursor, "cho", request.args, with_count=True
+        )
+        danh_sach_muon, pager_muon, total_muon = _tai_tab_muontra(
+            cursor, "muon", request.args, with_count=True
+        )
+        # --- Tab "Lịch sử" (không cần đếm tổng) ---
+        lich_su_muon, pager_su, _ = _tai_tab_muontra(cursor, "su", request.args)
 
     except mysql.connector.Error as err:
         flash(f"Lỗi cơ sở dữ liệu khi tải trang mượn trả: {err}", "danger")
         # Gán giá trị mặc định nếu có lỗi
         danh_sach_cho, danh_sach_muon, lich_su_muon = [], [], []
-        total_pages_cho, total_pages_muon, total_pages_su = 1, 1, 1
+        pager_cho = pager_muon = pager_su = None
         total_cho, total_muon = 0, 0
 
     finally:
@@ -1554,29 +1896,205 @@ def quan_ly_muontra():
         today_date=today_date,
         # Dữ liệu tab chờ
         danh_sach_cho=danh_sach_cho,
-        current_page_cho=page_cho,
-        total_pages_cho=total_pages_cho,
+        prev_cursor_cho=pager_cho.prev_cursor if pager_cho else None,
+        next_cursor_cho=pager_cho.next_cursor if pager_cho else None,
         total_cho=total_cho,
         # Dữ liệu tab mượn
         danh_sach_muon=danh_sach_muon,
-        current_page_muon=page_muon,
-        total_pages_muon=total_pages_muon,
+        prev_cursor_muon=pager_muon.prev_cursor if pager_muon else None,
+        next_cursor_muon=pager_muon.next_cursor if pager_muon else None,
         total_muon=total_muon,
         # Dữ liệu tab lịch sử
         lich_su_muon=lich_su_muon,
-        current_page_su=page_su,
-        total_pages_su=total_pages_su,
-        # Dữ liệu tìm kiếm
+        prev_cursor_su=pager_su.prev_cursor if pager_su else None,
+        next_cursor_su=pager_su.next_cursor if pager_su else None,
+        # Dữ liệu tìm kiếm / lọc theo ngày mượn
         search_query=search_query,
+        tu_ngay=request.args.get("tu_ngay", ""),
+        den_ngay=request.args.get("den_ngay", ""),
     )
 
 
+# =========================================================
+# API: MỘT TAB MƯỢN/TRẢ DẠNG JSON (/admin/muontra/data/<tab>)
+# =========================================================
+@admin_bp.route("/muontra/data/<tab>")
+@login_required
+@admin_required
+def quan_ly_muontra_json(tab):
+    """
+    Phiên bản JSON của một tab trang mượn/trả (`tab`: cho, muon, su).
+    Dùng con trỏ 'after' / 'before'; tổng số chỉ trả về khi có '?with_count=1'.
+    """
+    if tab not in _MUONTRA_TABS:
+        return jsonify(success=False, error="Tab không hợp lệ."), 404
+
+    # Endpoint JSON dùng tên tham số con trỏ chung 'after' / 'before'
+    args = request.args.to_dict()
+    after_param, before_param = _MUONTRA_TABS[tab]["params"]
+    for generic, specific in (("after", after_param), ("before", before_param)):
+        if generic in args:
+            args[specific] = args.pop(generic)
+
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        danh_sach, pager, total = _tai_tab_muontra(
+            cursor, tab, args, with_count=request.args.get("with_count") == "1"
+        )
+        return jsonify(items=danh_sach, total=total, **pager.to_dict())
+    except mysql.connector.Error as err:
+        print(f"!!! Lỗi DB khi tải tab mượn trả '{tab}' (JSON): {err}")
+        return jsonify(success=False, error=f"Lỗi CSDL: {err}"), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+
+# =========================================================
+# XUẤT FILE CSV / JSON LINES (/admin/.../xuat?format=csv|ndjson)
+# Áp dụng cùng bộ lọc với trang danh sách tương ứng (bỏ qua con trỏ phân trang).
+# Dữ liệu được stream bằng cursor không buffer (xem app_logic/export.py).
+# =========================================================
+# Các cột xuất: (tên cột trong kết quả truy vấn, tiêu đề cột CSV)
+_COT_XUAT_MUONTRA = [
+    ("id_muon_tra", "ID đơn"),
+    ("id_sach", "ID sách"),
+    ("tieu_de", "Tên sách"),
+    ("id_thanh_vien", "ID thành viên"),
+    ("ho_ten", "Người mượn"),
+    ("email", "Email"),
+    ("so_luong", "Số lượng"),
+    ("ngay_muon", "Ngày mượn"),
+    ("ngay_hen_tra", "Hạn trả"),
+    ("ngay_tra_thuc", "Ngày trả"),
+    ("trang_thai", "Trạng thái"),
+    ("tien_phat", "Tiền phạt"),
+]
+_COT_XUAT_THANH_VIEN = [
+    ("id_thanh_vien", "ID"),
+    ("ho_ten", "Họ tên"),
+    ("email", "Email"),
+    ("so_dien_thoai", "Số điện thoại"),
+    ("dia_chi", "Địa chỉ"),
+    ("ngay_sinh", "Ngày sinh"),
+    ("vai_tro", "Vai trò"),
+    ("ngay_dang_ky", "Ngày đăng ký"),
+    ("trang_thai", "Trạng thái"),
+]
+_COT_XUAT_SACH = [
+    ("id_sach", "id_sach"),
+    ("tieu_de", "tieu_de"),
+    ("ten_tac_gia", "ten_tac_gia"),
+    ("ten_the_loai", "ten_the_loai"),
+    ("nam_xuat_ban", "nam_xuat_ban"),
+    ("so_luong", "so_luong"),
+    ("so_trang", "so_trang"),
+    ("mo_ta", "mo_ta"),
+    ("trang_thai", "trang_thai"),
+]
+
+
+def _dinh_dang_xuat():
+    """Định dạng file xuất từ tham số 'format' (mặc định csv), không hợp lệ -> None."""
+    fmt = request.args.get("format", "csv")
+    return fmt if fmt in export.FORMATS else None
+
+
+@admin_bp.route("/muontra/xuat")
+@login_required
+@admin_required
+def xuat_muontra():
+    """
+    Xuất danh sách mượn/trả (kèm tên sách, người mượn) theo bộ lọc của trang
+    /admin/muontra: 'search', 'tu_ngay' / 'den_ngay' và 'tab' (cho, muon, su;
+    bỏ trống = mọi trạng thái).
+    """
+    fmt = _dinh_dang_xuat()
+    tab = request.args.get("tab", "")
+    if fmt is None or (tab and tab not in _MUONTRA_TABS):
+        flash("Định dạng hoặc trạng thái xuất file không hợp lệ.", "warning")
+        return redirect(url_for("admin.quan_ly_muontra"))
+
+    where_clause, params = _dieu_kien_loc_muontra(request.args)
+    status_clause = _MUONTRA_TABS[tab]["where"] if tab else "1 = 1"
+    query = f""" SELECT mt.id_muon_tra, mt.id_sach, s.tieu_de, mt.id_thanh_vien, tv.ho_ten, tv.email,
+                        mt.so_luong, mt.ngay_muon, mt.ngay_hen_tra, mt.ngay_tra_thuc, mt.trang_thai, mt.tien_phat
+                 FROM MuonTra mt JOIN Sach s ON mt.id_sach = s.id_sach
+                 JOIN ThanhVien tv ON mt.id_thanh_vien = tv.id_thanh_vien
+                 WHERE {status_clause} {where_clause}
+                 ORDER BY mt.id_muon_tra """
+    return export.export_response(f"muontra_{tab}" if tab else "muontra", query, params, _COT_XUAT_MUONTRA, fmt)
+
+
+@admin_bp.route("/thanhvien/xuat")
+@login_required
+@admin_required
+def xuat_thanhvien():
+    """Xuất danh sách thành viên (không kèm mật khẩu) theo bộ lọc của trang /admin/thanhvien."""
+    fmt = _dinh_dang_xuat()
+    if fmt is None:
+        flash("Định dạng xuất file không hợp lệ.", "warning")
+        return redirect(url_for("admin.quan_ly_thanhvien"))
+
+    where_conditions, params = _dieu_kien_loc_thanh_vien(request.args)
+    where_clause = "WHERE " + " AND ".join(where_conditions) if where_conditions else ""
+    query = f""" SELECT id_thanh_vien, ho_ten, email, so_dien_thoai, dia_chi, ngay_sinh,
+                        vai_tro, ngay_dang_ky, trang_thai
+                 FROM ThanhVien {where_clause} ORDER BY id_thanh_vien """
+    return export.export_response("thanhvien", query, params, _COT_XUAT_THANH_VIEN, fmt)
+
+
+@admin_bp.route("/sach/xuat")
+@login_required
+@admin_required
+def xuat_sach():
+    """
+    Xuất danh mục sách theo bộ lọc của trang /admin/sach. Tiêu đề cột CSV dùng
+    đúng tên cột của chức năng nhập file (xem app_logic/importer.py).
+    """
+    fmt = _dinh_dang_xuat()
+    if fmt is None:
+        flash("Định dạng xuất file không hợp lệ.", "warning")
+        return redirect(url_for("admin.quan_ly_sach"))
+
+    search, where_conditions, params = _dieu_kien_loc_sach(request.args)
+    where_clause = "WHERE " + " AND ".join(where_conditions) if where_conditions else ""
+    query = f""" SELECT s.id_sach, s.tieu_de, tg.ten_tac_gia, tl.ten_the_loai, s.nam_xuat_ban,
+                        s.so_luong, s.so_trang, s.mo_ta, s.trang_thai
+                 FROM Sach s LEFT JOIN TacGia tg ON s.id_tac_gia = tg.id_tac_gia
+                 LEFT JOIN TheLoai tl ON s.id_the_loai = tl.id_the_loai {search.join} {where_clause}
+                 ORDER BY s.id_sach """
+    return export.export_response("sach", query, search.join_params + params, _COT_XUAT_SACH, fmt)
+
+
+# =========================================================
+# HÀM NỘI BỘ: GHI NHẬN MƯỢN (MỘT HOẶC NHIỀU SÁCH) TẠI QUẦY
+# =========================================================
+def _ghi_nhan_muon(conn, cursor, id_thanh_vien, items, ngay_muon, ngay_hen_tra):
+    """
+    Tạo các lượt 'Đang mượn' của một thành viên trong MỘT transaction
+    (xem app_logic/circulation.py), ghi AdminLog và commit.
+    Ném ValueError nếu không hợp lệ (nơi gọi rollback). Trả về list sách đã mượn.
+    """
+    conn.start_transaction()  # Bắt đầu transaction
+    da_muon = circulation.checkout(cursor, id_thanh_vien, items, ngay_muon, ngay_hen_tra)
+    chi_tiet = ", ".join(f"ID: {item['id_sach']} (SL: {item['so_luong']})" for item in da_muon)
+    ghi_nhat_ky_admin(cursor, f"Đã cho mượn sách {chi_tiet} cho user ID: {id_thanh_vien}")
+    conn.commit()  # Lưu thay đổi
+    home_shelves.invalidate_recommendations(id_thanh_vien)  # Gợi ý bỏ sách vừa mượn
+    for item in da_muon:
+        invalidate_book_detail(item["id_sach"])  # Số lượng trong kho và lượt mượn đã thay đổi
+    return da_muon
+
+
 # =========================================================
 # ROUTE: GHI NHẬN MƯỢN SÁCH (THỦ CÔNG) (/admin/muontra/muon)
 # =========================================================
 @admin_bp.route("/muontra/muon", methods=["GET", "POST"])
 @login_required
 @admin_required
+@retry_on_deadlock
 def muon_sach():
     """
     Hiển thị form và xử lý việc admin ghi nhận một lượt mượn sách thủ công.
@@ -1600,44 +2118,11 @@ def muon_sach():
                 ngay_hen_tra_str, "%Y-%m-%d"
             ).date()
 
-            # --- Validation ---
-            if so_luong_muon <= 0:
-                raise ValueError("Số lượng mượn phải lớn hơn 0.")
-            if ngay_hen_tra <= ngay_muon:
-                raise ValueError("Ngày hẹn trả phải sau ngày mượn.")
-
-            conn.start_transaction()  # Bắt đầu transaction
-
-            # Khóa sách để kiểm tra và trừ số lượng
-            cursor.execute(
-                "SELECT so_luong, trang_thai FROM Sach WHERE id_sach = %s FOR UPDATE",
-                (id_sach,),
-            )
-            sach = cursor.fetchone()
-            # Kiểm tra sách có tồn tại, hoạt động và đủ số lượng không
-            if not sach or sach.get("trang_thai") == "da_an":
-                raise ValueError("Sách không có sẵn hoặc đã bị ẩn.")
-            if so_luong_muon > sach.get("so_luong", 0):
-                raise ValueError(
-                    f"Số lượng sách trong kho không đủ (còn {sach.get('so_luong', 0)})."
-                )
-
-            # Thêm bản ghi vào bảng MuonTra với trạng thái 'Đang mượn'
-            cursor.execute(
-                """ INSERT INTO MuonTra (id_sach, id_thanh_vien, ngay_muon, ngay_hen_tra, so_luong, trang_thai)
-                    VALUES (%s, %s, %s, %s, %s, 'Đang mượn') """,
-                (id_sach, id_thanh_vien, ngay_muon, ngay_hen_tra, so_luong_muon),
-            )
-            # Trừ số lượng sách trong bảng Sach
-            cursor.execute(
-                "UPDATE Sach SET so_luong = so_luong - %s WHERE id_sach = %s",
-                (so_luong_muon, id_sach),
-            )
-            ghi_nhat_ky_admin(
-                cursor,
-                f"Đã cho mượn sách ID: {id_sach} (SL: {so_luong_muon}) cho user ID: {id_thanh_vien}",
+            # Kiểm tra giới hạn/kho, thêm lượt mượn, trừ kho, ghi log và commit
+            # (dùng chung với API mượn nhiều sách)
+            _ghi_nhan_muon(
+                conn, cursor, id_thanh_vien, [(id_sach, so_luong_muon)], ngay_muon, ngay_hen_tra
             )
-            conn.commit()  # Lưu thay đổi
 
             flash("Ghi nhận mượn sách thành công!", "success")
             # Chuyển hướng về trang quản lý, focus tab 'Đang mượn'
@@ -1650,6 +2135,8 @@ def muon_sach():
         except mysql.connector.Error as err:  # Lỗi CSDL
             if conn and conn.in_transaction:
                 conn.rollback()
+            if should_retry(err):
+                raise  # retry_on_deadlock chạy lại cả route
             if "FOREIGN KEY constraint fails" in str(
                 err
             ):  # Lỗi khóa ngoại (vd: thành viên không tồn tại/bị khóa)
@@ -1702,12 +2189,60 @@ def muon_sach():
     )
 
 
+# =========================================================
+# API: MƯỢN NHIỀU SÁCH MỘT LẦN (/admin/muontra/muon-nhieu) - AJAX
+# =========================================================
+@admin_bp.route("/muontra/muon-nhieu", methods=["POST"])
+@login_required
+@admin_required
+@retry_on_deadlock
+def muon_nhieu_sach():
+    """
+    Ghi nhận một thành viên mượn nhiều sách tại quầy (giỏ sách), nhận JSON:
+    {id_thanh_vien, ngay_muon, ngay_hen_tra, items: [{id_sach, so_luong}, ...]}.
+    Cả giỏ được ghi trong một transaction: mượn được tất cả hoặc không cuốn nào.
+    Trả về: JSON danh sách sách đã mượn hoặc lỗi (kèm lý do từng sách).
+    """
+    data = request.get_json(silent=True) or {}
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        id_thanh_vien = int(data["id_thanh_vien"])
+        ngay_muon = datetime.datetime.strptime(data["ngay_muon"], "%Y-%m-%d").date()
+        ngay_hen_tra = datetime.datetime.strptime(data["ngay_hen_tra"], "%Y-%m-%d").date()
+        da_muon = _ghi_nhan_muon(
+            conn, cursor, id_thanh_vien, data.get("items"), ngay_muon, ngay_hen_tra
+        )
+        return jsonify(
+            success=True,
+            message=f"Đã ghi nhận mượn {sum(item['so_luong'] for item in da_muon)} cuốn sách.",
+            items=da_muon,
+        )
+    except (ValueError, KeyError, TypeError) as ve:  # Lỗi validation hoặc thiếu key
+        if conn and conn.in_transaction:
+            conn.rollback()
+        return jsonify(success=False, error=f"Dữ liệu không hợp lệ: {ve}"), 400
+    except mysql.connector.Error as err:  # Lỗi CSDL
+        if conn and conn.in_transaction:
+            conn.rollback()
+        if should_retry(err):
+            raise  # retry_on_deadlock chạy lại cả route
+        print(f"!!! Lỗi DB khi admin ghi nhận mượn nhiều sách: {err}")
+        return jsonify(success=False, error=f"Lỗi cơ sở dữ liệu: {err}"), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn and conn.is_connected():
+            conn.close()
+
+
 # =========================================================
 # ROUTE: GHI NHẬN TRẢ SÁCH (/admin/muontra/tra/<id>) - AJAX
 # =========================================================
 @admin_bp.route("/muontra/tra/<int:id_muon_tra>", methods=["POST"])
 @login_required
 @admin_required
+@retry_on_deadlock
 def tra_sach(id_muon_tra):
     """
     Xử lý yêu cầu ghi nhận trả sách từ admin (thường qua AJAX).
@@ -1719,32 +2254,20 @@ def tra_sach(id_muon_tra):
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
     try:
-        conn.start_transaction()  # Bắt đầu transaction
+        # Lấy mức phạt mỗi ngày từ cài đặt (đã cache, không truy vấn trong transaction)
+        muc_phat_moi_ngay = system_settings.muc_phat_tre_hen()
 
-        # Lấy mức phạt mỗi ngày từ bảng CaiDat
-        cursor.execute(
-            "SELECT setting_value FROM CaiDat WHERE setting_key = 'muc_phat_tre_hen'"
-        )
-        muc_phat_row = cursor.fetchone()
-        try:  # Xử lý trường hợp giá trị cài đặt không hợp lệ hoặc thiếu
-            muc_phat_moi_ngay = (
-                float(muc_phat_row["setting_value"]) if muc_phat_row else 0.0
-            )
-        except (ValueError, TypeError):
-            muc_phat_moi_ngay = 0.0
-            print(
-                f"!!! CẢNH BÁO: Giá trị 'muc_phat_tre_hen' không hợp lệ: '{muc_phat_row.get('setting_value')}'"
-            )
+        conn.start_transaction()  # Bắt đầu transaction
 
-        # Lấy thông tin lượt mượn và khóa bản ghi (FOR UPDATE)
-        cursor.execute(
-            "SELECT id_sach, so_luong, ngay_hen_tra FROM MuonTra WHERE id_muon_tra = %s AND trang_thai = 'Đang mượn' FOR UPDATE",
-            (id_muon_tra,),
+        # Khóa lượt mượn, tính tiền phạt, cập nhật trạng thái và cộng lại kho
+        # (dùng chung với API trả nhiều sách, xem app_logic/circulation.py)
+        thoi_gian_tra_thuc = datetime.datetime.now()
+        (ket_qua,) = circulation.return_loans(
+            cursor, [id_muon_tra], muc_phat_moi_ngay, thoi_gian_tra_thuc
         )
-        record = cursor.fetchone()
 
         # Kiểm tra xem lượt mượn có tồn tại và đang ở trạng thái 'Đang mượn' không
-        if not record:
+        if not ket_qua["success"]:
             conn.rollback()
             return (
                 jsonify(
@@ -1754,43 +2277,17 @@ def tra_sach(id_muon_tra):
                 404,
             )
 
-        # Lấy thông tin cần thiết từ bản ghi
-        id_sach = record["id_sach"]
-        so_luong_da_muon = record["so_luong"]
-        ngay_hen_tra = record["ngay_hen_tra"]
-
-        # Xác định thời gian trả và tính tiền phạt (nếu có)
-        thoi_gian_tra_thuc = datetime.datetime.now()
-        ngay_tra_thuc_date = thoi_gian_tra_thuc.date()
-        tien_phat = 0.0
+        tien_phat = ket_qua["tien_phat"]
         message = "Đã ghi nhận trả sách thành công."  # Thông báo mặc định
-        if ngay_tra_thuc_date > ngay_hen_tra:  # Kiểm tra nếu trả trễ
-            so_ngay_tre = (ngay_tra_thuc_date - ngay_hen_tra).days
-            tien_phat = so_ngay_tre * muc_phat_moi_ngay * so_luong_da_muon
+        if ket_qua["so_ngay_tre"] > 0:  # Trả trễ
             tien_phat_formatted = "{:,.0f} VND".format(tien_phat)
-            message = f"Ghi nhận trả sách thành công. Sách trễ {so_ngay_tre} ngày. Tiền phạt: {tien_phat_formatted}."
+            message = f"Ghi nhận trả sách thành công. Sách trễ {ket_qua['so_ngay_tre']} ngày. Tiền phạt: {tien_phat_formatted}."
 
-        # Cập nhật bản ghi MuonTra: trạng thái, ngày trả thực, tiền phạt
-        cursor.execute(
-            """ UPDATE MuonTra SET trang_thai = 'Đã trả', ngay_tra_thuc = %s, tien_phat = %s
-                WHERE id_muon_tra = %s """,
-            (thoi_gian_tra_thuc, tien_phat, id_muon_tra),
-        )
-
-        # Khóa sách để cộng lại số lượng (FOR UPDATE)
-        cursor.execute(
-            "SELECT id_sach FROM Sach WHERE id_sach = %s FOR UPDATE", (id_sach,)
-        )
-        cursor.fetchone()  # Phải fetch để lock có hiệu lực
-        # Cộng lại số lượng sách vào kho
-        cursor.execute(
-            "UPDATE Sach SET so_luong = so_luong + %s WHERE id_sach = %s",
-            (so_luong_da_muon, id_sach),
-        )
         ghi_nhat_ky_admin(
             cursor, f"Đã xác nhận trả sách cho lượt mượn ID: {id_muon_tra}"
         )  # Ghi log
         conn.commit()  # Lưu tất cả thay đổi
+        invalidate_book_detail(ket_qua["id_sach"])  # Số lượng trong kho đã thay đổi
 
         # Chuẩn bị dữ liệu trả về cho client (AJAX)
         ngay_tra_formatted = thoi_gian_tra_thuc.strftime("%d-%m-%Y %H:%M")
@@ -1807,6 +2304,8 @@ def tra_sach(id_muon_tra):
     except mysql.connector.Error as err:
         if conn and conn.in_transaction:
             conn.rollback()  # Hoàn tác nếu lỗi CSDL
+        if should_retry(err):
+            raise  # retry_on_deadlock chạy lại cả route
         print(f"!!! Lỗi DB khi trả sách {id_muon_tra}: {err}")
         return jsonify(success=False, error=f"Lỗi cơ sở dữ liệu: {err}"), 500
     except Exception as e:
@@ -1822,6 +2321,70 @@ def tra_sach(id_muon_tra):
             conn.close()
 
 
+# =========================================================
+# ROUTE/API: TRẢ NHIỀU SÁCH MỘT LẦN (/admin/muontra/tra-nhieu)
+# GET: trang quét mã lượt mượn. POST (JSON {ids: [...]}): trả tất cả trong
+# một transaction, lượt không hợp lệ được bỏ qua và báo lỗi riêng.
+# =========================================================
+@admin_bp.route("/muontra/tra-nhieu", methods=["GET", "POST"])
+@login_required
+@admin_required
+@retry_on_deadlock
+def tra_nhieu_sach():
+    """
+    Ghi nhận trả hàng loạt (vd: sách trả qua hộp trả sách cuối ngày được quét mã vạch).
+    Trả về: JSON {success, message, results}; mỗi kết quả gồm id_muon_tra, success,
+    error hoặc tiền phạt đã tính.
+    """
+    if request.method == "GET":
+        return render_template("admin_tra_sach.html", max_batch=circulation.MAX_RETURN_BATCH)
+
+    data = request.get_json(silent=True) or {}
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        # Lấy mức phạt mỗi ngày từ cài đặt (đã cache, không truy vấn trong transaction)
+        muc_phat_moi_ngay = system_settings.muc_phat_tre_hen()
+
+        conn.start_transaction()  # Một transaction cho cả lô
+        results = circulation.return_loans(cursor, data.get("ids"), muc_phat_moi_ngay)
+        da_tra = [item for item in results if item["success"]]
+        if da_tra:
+            ghi_nhat_ky_admin(
+                cursor,
+                "Đã xác nhận trả sách cho các lượt mượn ID: "
+                + ", ".join(str(item["id_muon_tra"]) for item in da_tra),
+            )
+        conn.commit()  # Lưu tất cả thay đổi
+        for id_sach in {item["id_sach"] for item in da_tra}:
+            invalidate_book_detail(id_sach)  # Số lượng trong kho đã thay đổi
+
+        for item in da_tra:
+            item["tien_phat_formatted"] = "{:,.0f} VND".format(item["tien_phat"])
+        tong_phat = sum(item["tien_phat"] for item in da_tra)
+        return jsonify(
+            success=bool(da_tra),
+            message=f"Đã trả {len(da_tra)}/{len(results)} lượt mượn. Tổng tiền phạt: {tong_phat:,.0f} VND.",
+            results=results,
+        )
+    except ValueError as ve:  # Danh sách ID rỗng/không hợp lệ
+        if conn and conn.in_transaction:
+            conn.rollback()
+        return jsonify(success=False, error=str(ve)), 400
+    except mysql.connector.Error as err:
+        if conn and conn.in_transaction:
+            conn.rollback()  # Hoàn tác cả lô nếu lỗi CSDL
+        if should_retry(err):
+            raise  # retry_on_deadlock chạy lại cả route
+        print(f"!!! Lỗi DB khi trả nhiều sách: {err}")
+        return jsonify(success=False, error=f"Lỗi cơ sở dữ liệu: {err}"), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn and conn.is_connected():
+            conn.close()
+
+
 # =========================================================
 # ROUTE: XEM SÁCH QUÁ HẠN (/admin/muontra/quahan)
 # =========================================================
@@ -1867,6 +2430,7 @@ def sach_qua_han():
 @admin_bp.route("/muontra/xacnhan/<int:id_muon_tra>", methods=["POST"])
 @login_required
 @admin_required
+@retry_on_deadlock
 def xac_nhan_lay_sach(id_muon_tra):
     """
     Xử lý yêu cầu admin xác nhận độc giả đã đến lấy sách (đặt qua web).
@@ -1877,19 +2441,11 @@ def xac_nhan_lay_sach(id_muon_tra):
     cursor = None
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
+        cursor = conn.cursor(dictionary=True)
         conn.start_transaction()  # Bắt đầu transaction
 
-        # Cập nhật trạng thái trong bảng MuonTra, chỉ khi trạng thái hiện tại là 'Đang chờ'
-        cursor.execute(
-            "UPDATE MuonTra SET trang_thai = 'Đang mượn' WHERE id_muon_tra = %s AND trang_thai = 'Đang chờ'",
-            (id_muon_tra,),
-        )
-
-        # Kiểm tra xem có bản ghi nào được cập nhật không
-        if (
-            cursor.rowcount > 0
-        ):  # rowcount trả về số dòng bị ảnh hưởng bởi câu lệnh UPDATE
+        # Chuyển trạng thái (chỉ khi đang là 'Đang chờ') và cập nhật bảng thống kê
+        if circulation.confirm_pickup(cursor, id_muon_tra):
             # Nếu có cập nhật -> thành công
             ghi_nhat_ky_admin(
                 cursor, f"Đã xác nhận lấy sách cho lượt mượn ID: {id_muon_tra}"
@@ -1910,6 +2466,8 @@ def xac_nhan_lay_sach(id_muon_tra):
         # Xử lý lỗi CSDL
         if conn:
             conn.rollback()
+        if should_retry(err):
+            raise  # retry_on_deadlock chạy lại cả route
         print(f"!!! Lỗi DB khi xác nhận lấy sách ID {id_muon_tra}: {err}")
         return (
             jsonify(success=False, error=f"Lỗi cơ sở dữ liệu: {err}"),
@@ -1938,6 +2496,7 @@ def xac_nhan_lay_sach(id_muon_tra):
 @admin_bp.route("/muontra/huy/<int:id_muon_tra>", methods=["POST"])
 @login_required
 @admin_required
+@retry_on_deadlock
 def huy_dat_sach(id_muon_tra):
     """
     Xử lý yêu cầu admin hủy một đơn đặt sách đang ở trạng thái 'Đang chờ'.
@@ -1954,13 +2513,8 @@ def huy_dat_sach(id_muon_tra):
         cursor = conn.cursor(dictionary=True)
         conn.start_transaction()  # Bắt đầu transaction
 
-        # Lấy thông tin lượt đặt và khóa bản ghi (FOR UPDATE)
-        cursor.execute(
-            """ SELECT id_sach, so_luong FROM MuonTra WHERE id_muon_tra = %s
-                AND trang_thai = 'Đang chờ' FOR UPDATE """,  # Bỏ id_thanh_vien nếu là admin hủy
-            (id_muon_tra,),
-        )
-        record = cursor.fetchone()
+        # Hủy lượt đặt (chỉ khi đang 'Đang chờ') và hoàn kho bằng các câu UPDATE có điều kiện
+        record = circulation.cancel_reservation(cursor, id_muon_tra)
 
         # Kiểm tra xem lượt đặt có hợp lệ không
         if not record:
@@ -1974,25 +2528,9 @@ def huy_dat_sach(id_muon_tra):
                 404,
             )
 
-        id_sach = record["id_sach"]
-        so_luong_dat = record["so_luong"]
-
-        cursor.execute(
-            "UPDATE MuonTra SET trang_thai = 'Đã hủy', ngay_tra_thuc = %s WHERE id_muon_tra = %s",
-            (datetime.datetime.now(), id_muon_tra),
-        )
-
-        cursor.execute(
-            "SELECT id_sach FROM Sach WHERE id_sach = %s FOR UPDATE", (id_sach,)
-        )
-        cursor.fetchone()
-        cursor.execute(
-            "UPDATE Sach SET so_luong = so_luong + %s WHERE id_sach = %s",
-            (so_luong_dat, id_sach),
-        )
-
         ghi_nhat_ky_admin(cursor, f"Đã hủy đặt sách cho lượt mượn ID: {id_muon_tra}")
         conn.commit()
+        invalidate_book_detail(record["id_sach"])  # Số lượng trong kho đã thay đổi
         # SỬA: Trả về JSON thành công
         return jsonify(
             success=True, message="Đã hủy đơn đặt và hoàn trả sách về kho thành công."
@@ -2001,6 +2539,8 @@ def huy_dat_sach(id_muon_tra):
     except mysql.connector.Error as err:
         if conn:
             conn.rollback()
+        if should_retry(err):
+            raise  # retry_on_deadlock chạy lại cả route
         print(f"!!! Lỗi DB khi hủy đơn {id_muon_tra}: {err}")
         # SỬA: Trả về JSON lỗi 500
         return (
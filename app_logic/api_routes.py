@@ -9,15 +9,18 @@
 
 import mysql.connector
 import re
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_login import login_required, current_user
 
 # Import các hàm/lớp cần thiết từ các module khác
-from app_logic.db import get_db_connection
+from app_logic.db import get_db_connection, retry_on_deadlock, should_retry
 from app_logic.utils import (
-    slugify,
     admin_required,
-)  # Import hàm slugify và decorator admin_required
+)  # Import decorator admin_required
+from app_logic.query_stats import recent_requests, retry_counts  # Số liệu truy vấn / retry của các request gần nhất
+from app_logic.search_index import book_index  # Chỉ mục tìm kiếm sách trong bộ nhớ
+from app_logic.book_detail import invalidate_book_detail  # Cache trang chi tiết sách (điểm đánh giá)
+from app_logic import reference  # Danh mục tác giả/thể loại (có cache)
 
 # Tạo Blueprint cho API với tiền tố /api
 # Tất cả các route trong file này sẽ có dạng /api/...
@@ -29,6 +32,7 @@ api_bp = Blueprint("api", __name__, url_prefix="/api")
 # =========================================================
 @api_bp.route("/sach/toggle-favorite/<int:id_sach>", methods=["POST"])
 @login_required  # Yêu cầu người dùng đăng nhập
+@retry_on_deadlock
 def toggle_favorite(id_sach):
     """
     API endpoint để thêm hoặc xóa một cuốn sách khỏi danh sách yêu thích của người dùng.
@@ -92,6 +96,8 @@ def toggle_favorite(id_sach):
     except mysql.connector.Error as err:
         if conn:
             conn.rollback()
+        if should_retry(err):
+            raise  # retry_on_deadlock chạy lại cả route
         if err.errno == 1062:  # Xử lý lỗi trùng lặp (vd: click nhanh 2 lần)
             return jsonify(success=False, error="Yêu cầu đang được xử lý."), 409
         print(f"!!! Lỗi DB khi toggle favorite: {err}")
@@ -236,6 +242,7 @@ def check_sach_exists():
 def live_search_sach():
     """
     API endpoint cho chức năng tìm kiếm sách nhanh (live search).
+    Dùng chỉ mục tìm kiếm trong bộ nhớ (không dấu, khớp theo tiền tố).
     Lấy từ khóa 'q' từ query string.
     Trả về: JSON là một danh sách các sách phù hợp (tối đa 7), bao gồm slug, tên tác giả, lượt mượn.
     """
@@ -245,40 +252,45 @@ def live_search_sach():
     if len(search_query) < 2:
         return jsonify([])
 
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    search_term = f"%{search_query}%"  # Chuẩn bị cho LIKE
     try:
-        # Câu lệnh SQL tìm kiếm và sắp xếp
-        query = """
-            SELECT
-                s.id_sach, s.tieu_de, s.anh_bia, tg.ten_tac_gia,
-                COUNT(mt.id_muon_tra) AS luot_muon
-            FROM Sach s
-            LEFT JOIN TacGia tg ON s.id_tac_gia = tg.id_tac_gia
-            LEFT JOIN MuonTra mt ON s.id_sach = mt.id_sach
-            WHERE
-                (LOWER(s.tieu_de) LIKE LOWER(%s) OR LOWER(tg.ten_tac_gia) LIKE LOWER(%s))
-                AND s.trang_thai = 'hoat_dong'
-            GROUP BY s.id_sach, s.tieu_de, s.anh_bia, tg.ten_tac_gia
-            ORDER BY luot_muon DESC, s.tieu_de ASC
-            LIMIT 7
-        """
-        cursor.execute(query, (search_term, search_term))
-        results = cursor.fetchall()
-
-        # Xử lý kết quả: thêm slug, xử lý tác giả NULL
-        processed_results = []
+        # Tra chỉ mục trong bộ nhớ (xem app_logic/search_index.py): không truy vấn CSDL,
+        # kết quả đã có slug và được xếp theo lượt mượn
+        results = book_index.search(search_query, limit=7)
         for sach in results:
-            sach["slug"] = slugify(sach["tieu_de"])  # Tạo slug
-            sach["ten_tac_gia"] = sach.get("ten_tac_gia", "N/A")  # Xử lý NULL
-            processed_results.append(sach)
-
-        return jsonify(processed_results)  # Trả về kết quả
+            sach["ten_tac_gia"] = sach.get("ten_tac_gia") or "N/A"  # Xử lý NULL
+        return jsonify(results)  # Trả về kết quả
 
     except mysql.connector.Error as err:
+        # Chỉ xảy ra khi xây chỉ mục lần đầu thất bại
         print(f"Lỗi API Live Search: {err}")
         return jsonify({"error": "Lỗi máy chủ"}), 500
+
+
+# =========================================================
+# API: GỢI Ý TÁC GIẢ / THỂ LOẠI (TYPEAHEAD CHO DROPDOWN)
+# =========================================================
+@api_bp.route("/tac-gia", defaults={"kind": "tac_gia"})
+@api_bp.route("/the-loai", defaults={"kind": "the_loai"})
+@login_required
+def goi_y_danh_muc(kind):
+    """
+    API gợi ý cho các dropdown lọc/chọn tác giả, thể loại (TomSelect).
+    Tham số: 'q' (từ khóa, không dấu cũng được), 'limit' (mặc định 20, tối đa 50).
+    Trả về: JSON list {id, ten}, đọc từ cache danh mục (xem app_logic/reference.py).
+    """
+    query = request.args.get("q", "")
+    limit = request.args.get("limit", reference.SUGGEST_LIMIT, type=int)
+    limit = max(1, min(limit, reference.SUGGEST_MAX_LIMIT))
+
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        return jsonify(reference.suggest(cursor, kind, query, limit=limit))
+    except mysql.connector.Error as err:
+        print(f"!!! Lỗi API gợi ý danh mục ({kind}): {err}")
+        return jsonify({"error": "Lỗi máy chủ"}), 500
     finally:
         if cursor:
             cursor.close()
@@ -291,6 +303,7 @@ def live_search_sach():
 # =========================================================
 @api_bp.route("/sach/<int:id_sach>/rate", methods=["POST"])
 @login_required
+@retry_on_deadlock
 def rate_sach(id_sach):
     """
     API endpoint để người dùng (độc giả) gửi hoặc cập nhật đánh giá (1-5 sao) cho một cuốn sách.
@@ -390,6 +403,7 @@ def rate_sach(id_sach):
         )
 
         conn.commit()  # Lưu thay đổi
+        invalidate_book_detail(id_sach)  # Điểm trung bình đã thay đổi
 
         # 6. Tính điểm trung bình mới
         new_avg_rating = (
@@ -409,6 +423,8 @@ def rate_sach(id_sach):
     except mysql.connector.Error as err:
         if conn:
             conn.rollback()
+        if should_retry(err):
+            raise  # retry_on_deadlock chạy lại cả route
         # Xử lý các lỗi DB cụ thể
         if err.errno == 1062:
             return jsonify(success=False, error="Lỗi trùng lặp đánh giá."), 409
@@ -426,3 +442,32 @@ def rate_sach(id_sach):
             cursor.close()
         if conn and conn.is_connected():
             conn.close()
+
+
+# =========================================================
+# API: SỐ LIỆU TRUY VẤN CỦA CÁC REQUEST GẦN NHẤT (DEBUG, CHO ADMIN)
+# =========================================================
+@api_bp.route("/debug/queries")
+@login_required
+@admin_required  # Yêu cầu quyền admin
+def debug_queries():
+    """
+    API endpoint kiểu "debug toolbar": trả về số liệu truy vấn của các request gần nhất
+    (số truy vấn, tổng thời gian, các truy vấn gom theo fingerprint, cờ cảnh báo N+1)
+    và tổng số lần retry transaction (deadlock / lock wait timeout) theo route.
+    Tham số: ?flagged=1 để chỉ lấy các request bị cảnh báo, ?endpoint=... để lọc theo route.
+    """
+    if not current_app.config.get("QUERY_STATS_ENABLED", True):
+        return jsonify({"error": "Chức năng đo truy vấn đang tắt."}), 404
+
+    items = recent_requests(flagged_only=request.args.get("flagged") == "1")
+    endpoint = request.args.get("endpoint", "")
+    if endpoint:
+        items = [i for i in items if i["endpoint"] == endpoint]
+    return jsonify(
+        {
+            "query_count_threshold": current_app.config.get("QUERY_COUNT_THRESHOLD"),
+            "retries": retry_counts(),
+            "requests": items,
+        }
+    )
@@ -0,0 +1,163 @@
+# app_logic/book_detail.py
+# =========================================================
+# FILE BOOK DETAIL (Dữ liệu trang chi tiết sách)
+# Trang chi tiết sách được xem (và crawl) rất nhiều. Phần dữ liệu giống
+# nhau với mọi người dùng (thông tin sách, lượt mượn, trang bình luận đầu
+# tiên, sách liên quan) được cache theo từng sách trong
+# BOOK_DETAIL_CACHE_TTL giây;
+# chỉ phần riêng của người dùng (đã yêu thích chưa, điểm mình đã chấm)
+# được truy vấn ở mỗi request, gộp trong một câu lệnh.
+#
+# Cache của một sách bị xóa (invalidate_book_detail) sau khi commit các
+# thay đổi ảnh hưởng tới trang: sửa/ẩn/khôi phục sách, thêm/xóa bình
+# luận, chấm điểm, mượn/trả/đặt/hủy sách.
+#
+# Bình luận được phân trang theo khóa (ngay_dang, id_binh_luan): trang
+# đầu hiển thị ngay trong HTML, các trang sau được tải dần qua JSON
+# (core.binh_luan_json) khi cuộn tới cuối danh sách. Sắp xếp và điều kiện
+# "sau con trỏ" dùng đúng các cột gốc nên MySQL đọc thẳng trên chỉ mục
+# idx_binhluan_sach_ngaydang (id_sach, ngay_dang [, id_binh_luan]) - chỉ
+# per_page + 1 dòng mỗi trang, không sắp xếp toàn bộ bình luận của sách.
+# =========================================================
+
+import os  # Đọc biến môi trường
+from app_logic.cache import get_cache  # Cache dữ liệu theo sách
+from app_logic.pagination import KeysetPaginator  # Phân trang bình luận theo khóa
+from app_logic.related import related_index  # Chỉ mục sách liên quan
+
+BOOK_DETAIL_TTL = float(os.getenv("BOOK_DETAIL_CACHE_TTL", "300"))
+RELATED_LIMIT = 10  # Số sách liên quan hiển thị
+COMMENTS_PER_PAGE = 20  # Số bình luận mỗi lần tải
+
+_detail_cache = get_cache("book_detail", maxsize=2048, ttl=BOOK_DETAIL_TTL)
+_comment_count_cache = get_cache("comment_count", maxsize=4096, ttl=BOOK_DETAIL_TTL)
+
+# Thông tin sách (chỉ sách hoạt động) kèm tổng lượt mượn
+_BOOK_SQL = """
+    SELECT s.*, tg.ten_tac_gia, tl.ten_the_loai,
+           (SELECT COUNT(*) FROM MuonTra mt WHERE mt.id_sach = s.id_sach) AS luot_muon
+    FROM Sach s LEFT JOIN TacGia tg ON s.id_tac_gia = tg.id_tac_gia LEFT JOIN TheLoai tl ON s.id_the_loai = tl.id_the_loai
+    WHERE s.id_sach = %s AND s.trang_thai = 'hoat_dong'
+"""
+
+# Thứ tự bình luận: mới nhất trước (ngay_dang NOT NULL từ migration 0006)
+_COMMENT_ORDER = [
+    ("bl.ngay_dang", "DESC", "ngay_dang"),
+    ("bl.id_binh_luan", "DESC", "id_binh_luan"),
+]
+
+# Một trang bình luận; {seek}, {order_by}, {limit} do KeysetPaginator tạo
+_COMMENTS_SQL = """
+    SELECT bl.id_binh_luan, bl.noi_dung, bl.ngay_dang, tv.ho_ten, tv.id_thanh_vien
+    FROM BinhLuan bl JOIN ThanhVien tv ON bl.id_thanh_vien = tv.id_thanh_vien
+    WHERE bl.id_sach = %s {seek}
+    ORDER BY {order_by} LIMIT {limit}
+"""
+
+
+# =========================================================
+# PHẦN DÙNG CHUNG (CACHE THEO SÁCH)
+# =========================================================
+def _load(cursor, id_sach):
+    cursor.execute(_BOOK_SQL, (id_sach,))
+    sach = cursor.fetchone()
+    if not sach:
+        return None
+    luot_muon = sach.pop("luot_muon") or 0
+    binh_luan, pager = load_comments(cursor, id_sach)
+    sach_lien_quan = related_index.sample(
+        id_sach, sach.get("id_tac_gia"), sach.get("id_the_loai"), limit=RELATED_LIMIT
+    )
+    return {
+        "sach": sach,
+        "luot_muon": luot_muon,
+        "binh_luan": binh_luan,
+        "binh_luan_next": pager.next_cursor,
+        "sach_lien_quan": sach_lien_quan,
+    }
+
+
+def get_book_detail(cursor, id_sach):
+    """
+    Trả về dict {sach, luot_muon, binh_luan (trang đầu), binh_luan_next (con trỏ
+    trang kế tiếp), sach_lien_quan} của sách đang hoạt động (chưa có cờ yêu
+    thích), hoặc None nếu sách không tồn tại/đã ẩn.
+    Không được sửa trực tiếp các giá trị trả về (dùng chung giữa các request).
+    """
+    key = str(id_sach)
+    detail = _detail_cache.get(key)
+    if detail is None:
+        detail = _load(cursor, id_sach)
+        if detail is not None:  # Không cache sách không tồn tại
+            _detail_cache.set(key, detail)
+    return detail
+
+
+def invalidate_book_detail(id_sach):
+    """Xóa cache trang chi tiết của sách `id_sach` (gọi sau khi commit)."""
+    _detail_cache.delete(str(id_sach))
+    _comment_count_cache.delete(str(id_sach))
+
+
+# =========================================================
+# BÌNH LUẬN (PHÂN TRANG THEO KHÓA + ĐẾM CÓ CACHE)
+# =========================================================
+def comment_pager(args=None, per_page=COMMENTS_PER_PAGE):
+    """KeysetPaginator của danh sách bình luận (đọc con trỏ 'after' từ `args` nếu có)."""
+    pager = KeysetPaginator(_COMMENT_ORDER, per_page)
+    return pager.parse(args) if args is not None else pager
+
+
+def load_comments(cursor, id_sach, args=None):
+    """
+    Tải một trang bình luận của sách (cursor dạng dictionary). Trả về
+    (list dict: id_binh_luan, noi_dung, ngay_dang, ho_ten, id_thanh_vien; pager).
+    """
+    pager = comment_pager(args)
+    seek_sql, seek_params = pager.where()
+    cursor.execute(
+        _COMMENTS_SQL.format(
+            seek="AND " + seek_sql if seek_sql else "", order_by=pager.order_by(), limit=pager.limit
+        ),
+        (id_sach, *seek_params),
+    )
+    return pager.paginate(cursor.fetchall()), pager
+
+
+def comment_count(cursor, id_sach):
+    """Tổng số bình luận của sách, cache cùng thời hạn và cùng lúc xóa với trang chi tiết."""
+    key = str(id_sach)
+    total = _comment_count_cache.get(key)
+    if total is None:
+        cursor.execute("SELECT COUNT(*) AS total FROM BinhLuan WHERE id_sach = %s", (id_sach,))
+        row = cursor.fetchone()
+        total = int((row and row["total"]) or 0)
+        _comment_count_cache.set(key, total)
+    return total
+
+
+# =========================================================
+# PHẦN RIÊNG CỦA NGƯỜI DÙNG (MỘT TRUY VẤN)
+# =========================================================
+def get_user_bits(cursor, user_id, id_sach, related_ids=()):
+    """
+    Trả về (tập id_sach người dùng đã yêu thích trong số sách `id_sach` và
+    `related_ids`, điểm người dùng đã chấm cho sách `id_sach` hoặc 0).
+    """
+    ids = [id_sach, *related_ids]
+    placeholders = ", ".join(["%s"] * len(ids))
+    cursor.execute(
+        f""" SELECT yt.id_sach, NULL AS diem_so FROM YeuThich yt
+             WHERE yt.id_thanh_vien = %s AND yt.id_sach IN ({placeholders})
+             UNION ALL
+             SELECT dg.id_sach, dg.diem_so FROM DanhGia dg
+             WHERE dg.id_thanh_vien = %s AND dg.id_sach = %s """,
+        (user_id, *ids, user_id, id_sach),
+    )
+    favorites, user_rating = set(), 0
+    for row in cursor.fetchall():
+        if row["diem_so"] is None:
+            favorites.add(row["id_sach"])
+        else:
+            user_rating = row["diem_so"]
+    return favorites, user_rating
@@ -0,0 +1,174 @@
+# app_logic/cache.py
+# =========================================================
+# FILE CACHE (Bộ nhớ đệm)
+# Cung cấp bộ nhớ đệm có thời hạn (TTL) và giới hạn kích thước (LRU)
+# để giảm số lần truy vấn CSDL cho các dữ liệu đọc nhiều, ít thay đổi
+# (ví dụ: thông tin người dùng mà Flask-Login tải lại ở mỗi request).
+#
+# Có hai backend:
+# - TTLCache: Lưu trong bộ nhớ của tiến trình (mặc định).
+# - RedisCache: Lưu trong Redis (hoặc server tương thích Redis) để
+#   nhiều worker dùng chung và cùng thấy việc xóa cache (invalidate).
+#   Bật bằng biến môi trường CACHE_REDIS_URL (cần cài gói `redis`).
+# =========================================================
+
+import os  # Đọc biến môi trường
+import pickle  # Tuần tự hóa giá trị khi lưu vào Redis
+import threading  # Khóa bảo vệ dữ liệu dùng chung giữa các thread
+import time  # Tính thời điểm hết hạn
+from collections import OrderedDict  # Giữ thứ tự truy cập cho LRU
+
+try:  # Gói `redis` là tùy chọn, chỉ cần khi dùng cache dùng chung
+    import redis
+except ImportError:  # pragma: no cover - tùy môi trường cài đặt
+    redis = None
+
+# --- Cấu hình Cache ---
+# - CACHE_REDIS_URL: URL Redis (vd: redis://localhost:6379/0). Để trống -> cache trong tiến trình.
+# - CACHE_KEY_PREFIX: Tiền tố khóa trong Redis (tránh đụng độ với ứng dụng khác).
+# - USER_CACHE_TTL / USER_CACHE_SIZE: Thời hạn (giây) và số lượng User tối đa được cache.
+cache_config = {
+    "redis_url": os.getenv("CACHE_REDIS_URL", ""),
+    "key_prefix": os.getenv("CACHE_KEY_PREFIX", "lms"),
+    "user_ttl": float(os.getenv("USER_CACHE_TTL", "300")),
+    "user_size": int(os.getenv("USER_CACHE_SIZE", "1024")),
+}
+
+_MISSING = object()  # Giá trị đánh dấu "không có trong cache"
+
+
+# =========================================================
+# CLASS: TTLCache
+# Cache trong bộ nhớ tiến trình, thread-safe, có TTL và LRU.
+# =========================================================
+class TTLCache:
+    """
+    Cache key -> value trong bộ nhớ.
+    - Mỗi mục hết hạn sau `ttl` giây (có thể ghi đè khi `set`).
+    - Khi vượt `maxsize` mục, mục ít được dùng gần đây nhất bị loại bỏ.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Lấy giá trị còn hạn của `key`, trả về `default` nếu không có/đã hết hạn."""
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)  # Đánh dấu vừa được dùng
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Lưu `value` cho `key` trong `ttl` giây (mặc định dùng ttl của cache)."""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)  # Loại mục cũ nhất (LRU)
+
+    def delete(self, key):
+        """Xóa `key` khỏi cache (không lỗi nếu không tồn tại)."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Xóa toàn bộ cache."""
+        with self._lock:
+            self._data.clear()
+
+
+# =========================================================
+# CLASS: RedisCache
+# Cache dùng chung giữa các worker qua Redis. Cùng giao diện
+# với TTLCache; kích thước do chính sách bộ nhớ của Redis quyết định.
+# =========================================================
+class RedisCache:
+    """Cache key -> value lưu trong Redis dưới namespace `<prefix>:<namespace>:`."""
+
+    def __init__(self, client, namespace, ttl=300):
+        self._client = client
+        self._prefix = f"{cache_config['key_prefix']}:{namespace}:"
+        self.ttl = ttl
+
+    def _key(self, key):
+        return f"{self._prefix}{key}"
+
+    def get(self, key, default=None):
+        try:
+            raw = self._client.get(self._key(key))
+        except redis.RedisError as err:
+            print(f"!!! Lỗi Redis khi đọc cache {self._key(key)}: {err}")
+            return default
+        return default if raw is None else pickle.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        seconds = self.ttl if ttl is None else ttl
+        try:
+            self._client.set(self._key(key), pickle.dumps(value), ex=max(1, int(seconds)))
+        except redis.RedisError as err:
+            print(f"!!! Lỗi Redis khi ghi cache {self._key(key)}: {err}")
+
+    def delete(self, key):
+        try:
+            self._client.delete(self._key(key))
+        except redis.RedisError as err:
+            print(f"!!! Lỗi Redis khi xóa cache {self._key(key)}: {err}")
+
+    def clear(self):
+        try:
+            keys = list(self._client.scan_iter(match=f"{self._prefix}*"))
+            if keys:
+                self._client.delete(*keys)
+        except redis.RedisError as err:
+            print(f"!!! Lỗi Redis khi xóa namespace {self._prefix}: {err}")
+
+
+# =========================================================
+# HÀM: GET_CACHE
+# Trả về (và ghi nhớ) cache cho một namespace, chọn backend
+# theo cấu hình.
+# =========================================================
+_caches = {}
+_caches_lock = threading.Lock()
+_redis_client = None
+
+
+def _get_redis_client():
+    """Tạo (một lần) client Redis từ CACHE_REDIS_URL; None nếu không cấu hình/không có gói redis."""
+    global _redis_client
+    if not cache_config["redis_url"]:
+        return None
+    if redis is None:
+        print("!!! CACHE_REDIS_URL được đặt nhưng chưa cài gói 'redis' -> dùng cache trong tiến trình.")
+        cache_config["redis_url"] = ""
+        return None
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(cache_config["redis_url"])
+    return _redis_client
+
+
+def get_cache(namespace, maxsize=1024, ttl=300):
+    """
+    Lấy cache cho `namespace` (vd: "user"). Gọi nhiều lần với cùng namespace
+    trả về cùng một đối tượng cache.
+    """
+    with _caches_lock:
+        cache = _caches.get(namespace)
+        if cache is None:
+            client = _get_redis_client()
+            if client is not None:
+                cache = RedisCache(client, namespace, ttl=ttl)
+            else:
+                cache = TTLCache(maxsize=maxsize, ttl=ttl)
+            _caches[namespace] = cache
+        return cache
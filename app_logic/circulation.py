@@ -0,0 +1,411 @@
+# app_logic/circulation.py
+# =========================================================
+# FILE CIRCULATION (Nghiệp vụ mượn sách)
+# Các thao tác ghi lên MuonTra/Sach dùng chung cho quầy thủ thư (admin)
+# và trang độc giả. Hàm nhận cursor và chạy trong transaction của nơi gọi
+# (nơi gọi start_transaction, ghi AdminLog nếu cần, rồi commit) giống
+# các hàm record_* của app_logic/stats.py.
+#
+# Kho sách (Sach.so_luong) KHÔNG bị khóa bằng SELECT ... FOR UPDATE rồi mới
+# cập nhật (giữ khóa trong suốt đoạn code Python ở giữa). Thay vào đó mỗi
+# thay đổi kho là MỘT câu UPDATE có điều kiện, ví dụ:
+#   UPDATE Sach SET so_luong = so_luong - n
+#   WHERE id_sach = ... AND so_luong >= n AND trang_thai = 'hoat_dong'
+# và kiểm tra rowcount: khóa dòng chỉ được giữ từ câu UPDATE tới commit, nên
+# các sách "hot" (nhiều người đặt cùng lúc) không bị tuần tự hóa quá lâu.
+#
+# Giới hạn max_sach_muon_moi_user cũng vậy: số cuốn đang mượn + đang chờ của
+# mỗi thành viên được giữ sẵn trong bảng ThanhVienQuota (migration 0005) và
+# được kiểm tra + tăng bằng một câu UPDATE có điều kiện trên đúng dòng của
+# thành viên, thay vì SUM(...) FOR UPDATE trên MuonTra (khóa cả một khoảng chỉ
+# mục, chặn INSERT của người khác). Mọi thao tác làm thay đổi số sách đang giữ
+# (mượn/đặt, trả, hủy đặt) đều cập nhật bộ đếm trong cùng transaction;
+# `reconcile_quota` (python manage.py reconcile-quota) tính lại từ MuonTra.
+# Thứ tự khóa: ThanhVienQuota trước Sach ở mọi thao tác.
+#
+# Mượn nhiều sách một lần (checkout) chỉ tốn một transaction:
+# - Kiểm tra giới hạn max_sach_muon_moi_user một lần cho cả giỏ.
+# - Trừ kho của cả giỏ bằng một câu UPDATE có điều kiện; InnoDB khóa các dòng
+#   theo thứ tự khóa chính nên hai giỏ có sách chung không deadlock lẫn nhau.
+# - Thêm tất cả lượt mượn bằng một câu INSERT nhiều dòng.
+#
+# Trả nhiều sách một lần (return_loans, vd: quét mã vạch sách trả cuối ngày)
+# cũng chỉ tốn một transaction: tiền phạt được tính trong một lượt, kho được
+# cộng lại theo từng đầu sách bằng một câu UPDATE, kết quả báo theo từng lượt.
+#
+# Các thao tác cũng cập nhật luôn bảng thống kê (app_logic/stats.py) nên nơi
+# gọi không cần tự gọi các hàm record_*.
+# =========================================================
+
+import datetime  # Thời điểm trả sách, số ngày trễ hạn
+import mysql.connector  # Để xử lý lỗi CSDL MySQL (reconcile_quota)
+
+from app_logic import settings as system_settings  # Giới hạn số sách mượn (đã cache)
+from app_logic import stats as loan_stats  # Bảng thống kê tổng hợp cho dashboard
+
+MAX_CART_LINES = 50  # Số dòng (đầu sách) tối đa của một lần mượn
+MAX_RETURN_BATCH = 1000  # Số lượt mượn tối đa của một lần trả
+
+
+def parse_items(items):
+    """
+    Chuẩn hóa giỏ sách: `items` là list (id_sach, so_luong) hoặc dict
+    {id_sach, so_luong}. Gộp các dòng trùng sách, trả về list (id_sach, so_luong)
+    sắp theo id_sach. Ném ValueError nếu giỏ rỗng hoặc có dòng không hợp lệ.
+    """
+    merged = {}
+    for item in items or []:
+        try:
+            if isinstance(item, dict):
+                id_sach, so_luong = item["id_sach"], item.get("so_luong", 1)
+            else:
+                id_sach, so_luong = item
+            id_sach, so_luong = int(id_sach), int(so_luong)
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("Mỗi dòng phải có id_sach và so_luong là số nguyên.")
+        if so_luong <= 0:
+            raise ValueError("Số lượng mượn phải lớn hơn 0.")
+        merged[id_sach] = merged.get(id_sach, 0) + so_luong
+    if not merged:
+        raise ValueError("Chưa chọn sách nào.")
+    if len(merged) > MAX_CART_LINES:
+        raise ValueError(f"Mỗi lần chỉ được mượn tối đa {MAX_CART_LINES} đầu sách.")
+    return sorted(merged.items())
+
+
+# =========================================================
+# BỘ ĐẾM SÁCH ĐANG GIỮ (ThanhVienQuota)
+# =========================================================
+def reserve_quota(cursor, id_thanh_vien, so_luong_them):
+    """
+    Cộng `so_luong_them` vào số sách đang mượn + đang chờ của thành viên.
+    Câu UPDATE chỉ khớp khi tổng mới không vượt cài đặt 'max_sach_muon_moi_user';
+    nếu vượt thì ném ValueError (nơi gọi rollback).
+    """
+    max_limit = system_settings.max_sach_muon_moi_user()
+    for _ in range(2):
+        cursor.execute(
+            """UPDATE ThanhVienQuota SET so_dang_giu = so_dang_giu + %s
+               WHERE id_thanh_vien = %s AND so_dang_giu + %s <= %s""",
+            (so_luong_them, id_thanh_vien, so_luong_them, max_limit),
+        )
+        if cursor.rowcount:
+            return
+        # Không khớp: thành viên chưa có dòng bộ đếm (tạo rồi thử lại) hoặc đã vượt giới hạn
+        cursor.execute(
+            "INSERT IGNORE INTO ThanhVienQuota (id_thanh_vien, so_dang_giu) VALUES (%s, 0)",
+            (id_thanh_vien,),
+        )
+        if not cursor.rowcount:
+            break
+
+    cursor.execute(
+        "SELECT so_dang_giu FROM ThanhVienQuota WHERE id_thanh_vien = %s", (id_thanh_vien,)
+    )
+    current_borrows = (row := cursor.fetchone()) and row.get("so_dang_giu") or 0
+    raise ValueError(
+        f"Vượt quá giới hạn mượn sách ({max_limit} cuốn, đang mượn/chờ {current_borrows} cuốn)."
+    )
+
+
+def release_quota(cursor, per_member):
+    """
+    Trừ bộ đếm khi lượt mượn/đặt kết thúc (trả sách, hủy đặt).
+    `per_member`: dict {id_thanh_vien: số cuốn}. Một câu UPDATE cho mọi thành viên (theo thứ tự id).
+    """
+    members = sorted(per_member.items())
+    if not members:
+        return
+    cursor.execute(
+        f"""UPDATE ThanhVienQuota
+            SET so_dang_giu = GREATEST(so_dang_giu - CASE id_thanh_vien {" ".join(["WHEN %s THEN %s"] * len(members))} END, 0)
+            WHERE id_thanh_vien IN ({", ".join(["%s"] * len(members))})""",
+        tuple([value for member in members for value in member] + [id_tv for id_tv, _ in members]),
+    )
+
+
+def reconcile_quota(conn):
+    """
+    Tính lại toàn bộ ThanhVienQuota từ MuonTra ('Đang mượn' + 'Đang chờ') trong một
+    transaction (khóa MuonTra trong lúc chạy, nên chạy ngoài giờ cao điểm).
+    Trả về số thành viên có bộ đếm bị lệch đã được sửa.
+    """
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        cursor.execute(
+            """SELECT COUNT(*) FROM (
+                   SELECT q.id_thanh_vien FROM ThanhVienQuota q
+                   LEFT JOIN (
+                       SELECT id_thanh_vien, SUM(so_luong) AS tong FROM MuonTra
+                       WHERE trang_thai IN ('Đang mượn', 'Đang chờ') GROUP BY id_thanh_vien
+                   ) m ON m.id_thanh_vien = q.id_thanh_vien
+                   WHERE q.so_dang_giu <> COALESCE(m.tong, 0)
+                   UNION
+                   SELECT m.id_thanh_vien FROM MuonTra m
+                   LEFT JOIN ThanhVienQuota q ON q.id_thanh_vien = m.id_thanh_vien
+                   WHERE m.trang_thai IN ('Đang mượn', 'Đang chờ') AND q.id_thanh_vien IS NULL
+               ) AS lech"""
+        )
+        mismatched = cursor.fetchone()[0]
+        cursor.execute("UPDATE ThanhVienQuota SET so_dang_giu = 0")
+        cursor.execute(
+            """INSERT INTO ThanhVienQuota (id_thanh_vien, so_dang_giu)
+               SELECT * FROM (
+                   SELECT id_thanh_vien, SUM(so_luong) AS tong FROM MuonTra
+                   WHERE trang_thai IN ('Đang mượn', 'Đang chờ') GROUP BY id_thanh_vien
+               ) AS m
+               ON DUPLICATE KEY UPDATE so_dang_giu = m.tong"""
+        )
+        conn.commit()
+        return mismatched
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def checkout(cursor, id_thanh_vien, items, ngay_muon, ngay_hen_tra, trang_thai="Đang mượn"):
+    """
+    Tạo các lượt mượn cho một thành viên trong transaction hiện tại (cursor dạng dictionary).
+    - `items`: giỏ sách (xem parse_items).
+    - `trang_thai`: 'Đang mượn' (thủ thư giao sách ngay) hoặc 'Đang chờ' (độc giả đặt trước).
+    Trả về list dict {id_sach, tieu_de, so_luong} theo thứ tự id_sach.
+    Ném ValueError (kèm lý do của từng sách) nếu không hợp lệ; nơi gọi rollback.
+    """
+    lines = parse_items(items)
+    if ngay_hen_tra <= ngay_muon:
+        raise ValueError("Ngày hẹn trả phải sau ngày mượn.")
+
+    # Thành viên phải tồn tại và đang hoạt động
+    cursor.execute(
+        "SELECT trang_thai FROM ThanhVien WHERE id_thanh_vien = %s", (id_thanh_vien,)
+    )
+    thanh_vien = cursor.fetchone()
+    if not thanh_vien or thanh_vien.get("trang_thai") != "hoat_dong":
+        raise ValueError("Thành viên không tồn tại hoặc đã bị khóa.")
+
+    # --- Giới hạn mượn: kiểm tra một lần cho cả giỏ ---
+    reserve_quota(cursor, id_thanh_vien, sum(so_luong for _, so_luong in lines))
+
+    # --- Đọc kho (không khóa) để báo lỗi rõ ràng cho từng sách ---
+    ids = [id_sach for id_sach, _ in lines]
+    placeholders = ", ".join(["%s"] * len(ids))
+    cursor.execute(
+        f"SELECT id_sach, tieu_de, so_luong, trang_thai FROM Sach WHERE id_sach IN ({placeholders})",
+        tuple(ids),
+    )
+    kho = {row["id_sach"]: row for row in cursor.fetchall()}
+
+    errors = []
+    for id_sach, so_luong in lines:
+        sach = kho.get(id_sach)
+        if not sach or sach.get("trang_thai") != "hoat_dong":
+            errors.append(f"Sách ID {id_sach} không có sẵn hoặc đã bị ẩn.")
+        elif so_luong > sach.get("so_luong", 0):
+            errors.append(f"'{sach['tieu_de']}': không đủ số lượng trong kho (còn {sach.get('so_luong', 0)}).")
+    if errors:
+        raise ValueError(" ".join(errors))
+
+    # --- Trừ kho của cả giỏ bằng một câu UPDATE có điều kiện ---
+    # Điều kiện so_luong >= n được kiểm tra lại trên dòng đã khóa: nếu người
+    # khác vừa mượn mất (giữa lần đọc ở trên và câu này) thì rowcount thiếu.
+    # Phải trừ kho TRƯỚC khi INSERT MuonTra: INSERT kiểm tra khóa ngoại sẽ giữ
+    # khóa chia sẻ trên dòng Sach, nâng lên khóa ghi sau đó dễ gây deadlock.
+    cases = " ".join(["WHEN %s THEN %s"] * len(lines))
+    params = [value for line in lines for value in line]
+    cursor.execute(
+        f"""UPDATE Sach SET so_luong = so_luong - CASE id_sach {cases} END
+            WHERE id_sach IN ({placeholders}) AND trang_thai = 'hoat_dong'
+              AND so_luong >= CASE id_sach {cases} END""",
+        tuple(params + ids + params),
+    )
+    if cursor.rowcount != len(lines):
+        raise ValueError("Sách vừa được người khác mượn, kho không còn đủ số lượng. Vui lòng thử lại.")
+
+    # --- Thêm tất cả lượt mượn bằng một câu INSERT ---
+    values = []
+    for id_sach, so_luong in lines:
+        values.extend([id_sach, id_thanh_vien, ngay_muon, ngay_hen_tra, so_luong, trang_thai])
+    cursor.execute(
+        "INSERT INTO MuonTra (id_sach, id_thanh_vien, ngay_muon, ngay_hen_tra, so_luong, trang_thai) VALUES "
+        + ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(lines)),
+        tuple(values),
+    )
+
+    if trang_thai == "Đang mượn":
+        loan_stats.record_borrows(
+            cursor, [(id_sach, id_thanh_vien, so_luong, ngay_muon) for id_sach, so_luong in lines]
+        )
+
+    return [
+        {"id_sach": id_sach, "tieu_de": kho[id_sach]["tieu_de"], "so_luong": so_luong}
+        for id_sach, so_luong in lines
+    ]
+
+
+# =========================================================
+# TRẢ SÁCH
+# =========================================================
+def tinh_tien_phat(ngay_hen_tra, ngay_tra, so_luong, muc_phat_moi_ngay):
+    """Trả về (số ngày trễ, tiền phạt) của một lượt mượn trả vào ngày `ngay_tra`."""
+    so_ngay_tre = max((ngay_tra - ngay_hen_tra).days, 0)
+    return so_ngay_tre, so_ngay_tre * muc_phat_moi_ngay * so_luong
+
+
+def parse_loan_ids(ids):
+    """
+    Chuẩn hóa danh sách ID lượt mượn (số hoặc chuỗi, vd: từ máy quét mã vạch),
+    bỏ trùng nhưng giữ thứ tự quét. Ném ValueError nếu rỗng hoặc có ID không hợp lệ.
+    """
+    result = []
+    for value in ids or []:
+        try:
+            id_muon_tra = int(str(value).strip())
+        except ValueError:
+            raise ValueError(f"Mã lượt mượn không hợp lệ: '{value}'.")
+        if id_muon_tra not in result:
+            result.append(id_muon_tra)
+    if not result:
+        raise ValueError("Chưa có lượt mượn nào để trả.")
+    if len(result) > MAX_RETURN_BATCH:
+        raise ValueError(f"Mỗi lần chỉ được trả tối đa {MAX_RETURN_BATCH} lượt mượn.")
+    return result
+
+
+def return_loans(cursor, ids, muc_phat_moi_ngay, thoi_gian_tra=None):
+    """
+    Ghi nhận trả các lượt mượn `ids` trong transaction hiện tại (cursor dạng dictionary).
+    Lượt không tồn tại hoặc không ở trạng thái 'Đang mượn' được bỏ qua và báo lỗi
+    riêng, các lượt hợp lệ vẫn được trả. Trả về list kết quả theo thứ tự `ids`:
+    {id_muon_tra, success, error} hoặc {id_muon_tra, success, id_sach, so_luong, so_ngay_tre, tien_phat}.
+    """
+    ids = parse_loan_ids(ids)
+    thoi_gian_tra = thoi_gian_tra or datetime.datetime.now()
+    ngay_tra = thoi_gian_tra.date()
+
+    # Khóa tất cả lượt mượn cần trả bằng một câu (theo thứ tự khóa chính)
+    placeholders = ", ".join(["%s"] * len(ids))
+    cursor.execute(
+        f"""SELECT id_muon_tra, id_sach, id_thanh_vien, so_luong, ngay_hen_tra, trang_thai FROM MuonTra
+            WHERE id_muon_tra IN ({placeholders}) ORDER BY id_muon_tra FOR UPDATE""",
+        tuple(ids),
+    )
+    loans = {row["id_muon_tra"]: row for row in cursor.fetchall()}
+
+    # Tính tiền phạt và gom số lượng hoàn kho theo từng đầu sách
+    results, returned, per_book, per_member = [], [], {}, {}
+    for id_muon_tra in ids:
+        loan = loans.get(id_muon_tra)
+        if not loan:
+            results.append({"id_muon_tra": id_muon_tra, "success": False, "error": "Không tìm thấy lượt mượn."})
+            continue
+        if loan["trang_thai"] != "Đang mượn":
+            results.append({
+                "id_muon_tra": id_muon_tra, "success": False,
+                "error": f"Lượt mượn đang ở trạng thái '{loan['trang_thai']}'.",
+            })
+            continue
+        so_ngay_tre, tien_phat = tinh_tien_phat(
+            loan["ngay_hen_tra"], ngay_tra, loan["so_luong"], muc_phat_moi_ngay
+        )
+        item = {
+            "id_muon_tra": id_muon_tra, "success": True, "id_sach": loan["id_sach"],
+            "so_luong": loan["so_luong"], "so_ngay_tre": so_ngay_tre, "tien_phat": tien_phat,
+        }
+        results.append(item)
+        returned.append(item)
+        per_book[loan["id_sach"]] = per_book.get(loan["id_sach"], 0) + loan["so_luong"]
+        per_member[loan["id_thanh_vien"]] = per_member.get(loan["id_thanh_vien"], 0) + loan["so_luong"]
+
+    if not returned:
+        return results
+
+    # Cập nhật tất cả lượt mượn bằng một câu (tiền phạt theo từng lượt)
+    returned_ids = [item["id_muon_tra"] for item in returned]
+    fines = [item for item in returned if item["tien_phat"]]
+    fine_sql = "0"
+    fine_params = []
+    if fines:
+        fine_sql = "CASE id_muon_tra " + " ".join(["WHEN %s THEN %s"] * len(fines)) + " ELSE 0 END"
+        fine_params = [value for item in fines for value in (item["id_muon_tra"], item["tien_phat"])]
+    cursor.execute(
+        f"""UPDATE MuonTra SET trang_thai = 'Đã trả', ngay_tra_thuc = %s, tien_phat = {fine_sql}
+            WHERE id_muon_tra IN ({", ".join(["%s"] * len(returned_ids))})""",
+        tuple([thoi_gian_tra] + fine_params + returned_ids),
+    )
+
+    release_quota(cursor, per_member)
+
+    # Cộng lại kho: một câu UPDATE cho mọi đầu sách (theo thứ tự id)
+    books = sorted(per_book.items())
+    cursor.execute(
+        f"""UPDATE Sach SET so_luong = so_luong + CASE id_sach {" ".join(["WHEN %s THEN %s"] * len(books))} END
+            WHERE id_sach IN ({", ".join(["%s"] * len(books))})""",
+        tuple([value for book in books for value in book] + [id_sach for id_sach, _ in books]),
+    )
+
+    loan_stats.record_return(
+        cursor,
+        sum(item["so_luong"] for item in returned),
+        sum(item["tien_phat"] for item in returned),
+        ngay_tra,
+    )
+    return results
+
+
+# =========================================================
+# XÁC NHẬN LẤY SÁCH / HỦY ĐẶT SÁCH
+# =========================================================
+def confirm_pickup(cursor, id_muon_tra):
+    """
+    Lượt đặt 'Đang chờ' -> 'Đang mượn' (độc giả đến lấy sách; kho đã được trừ lúc đặt).
+    Trả về dict {id_sach, id_thanh_vien, so_luong} hoặc None nếu không có lượt đặt hợp lệ.
+    """
+    cursor.execute(
+        "UPDATE MuonTra SET trang_thai = 'Đang mượn' WHERE id_muon_tra = %s AND trang_thai = 'Đang chờ'",
+        (id_muon_tra,),
+    )
+    if cursor.rowcount == 0:
+        return None
+    # Dòng đã được khóa bởi câu UPDATE ở trên
+    cursor.execute(
+        "SELECT id_sach, id_thanh_vien, so_luong, ngay_muon FROM MuonTra WHERE id_muon_tra = %s",
+        (id_muon_tra,),
+    )
+    loan = cursor.fetchone()
+    loan_stats.record_borrow(
+        cursor, loan["id_sach"], loan["id_thanh_vien"], loan["so_luong"], loan["ngay_muon"]
+    )
+    return loan
+
+
+def cancel_reservation(cursor, id_muon_tra, id_thanh_vien=None, thoi_gian_huy=None):
+    """
+    Lượt đặt 'Đang chờ' -> 'Đã hủy' (ngày hủy lưu vào ngay_tra_thuc) và hoàn kho.
+    `id_thanh_vien`: chỉ hủy nếu lượt đặt thuộc thành viên này (độc giả tự hủy).
+    Trả về dict {id_sach, id_thanh_vien, so_luong} hoặc None nếu không có lượt đặt hợp lệ.
+    """
+    thoi_gian_huy = thoi_gian_huy or datetime.datetime.now()
+    owner_sql = " AND id_thanh_vien = %s" if id_thanh_vien is not None else ""
+    owner_params = (id_thanh_vien,) if id_thanh_vien is not None else ()
+    cursor.execute(
+        f"""UPDATE MuonTra SET trang_thai = 'Đã hủy', ngay_tra_thuc = %s
+            WHERE id_muon_tra = %s AND trang_thai = 'Đang chờ'{owner_sql}""",
+        (thoi_gian_huy, id_muon_tra) + owner_params,
+    )
+    if cursor.rowcount == 0:
+        return None
+    cursor.execute(
+        "SELECT id_sach, id_thanh_vien, so_luong FROM MuonTra WHERE id_muon_tra = %s", (id_muon_tra,)
+    )
+    loan = cursor.fetchone()
+    release_quota(cursor, {loan["id_thanh_vien"]: loan["so_luong"]})
+    # Hoàn kho bằng một câu UPDATE (không cần khóa trước bằng SELECT ... FOR UPDATE)
+    cursor.execute(
+        "UPDATE Sach SET so_luong = so_luong + %s WHERE id_sach = %s",
+        (loan["so_luong"], loan["id_sach"]),
+    )
+    loan_stats.record_cancel(cursor, loan["so_luong"], thoi_gian_huy.date())
+    return loan
@@ -14,6 +14,18 @@ from flask_login import (
 )  # Để kiểm tra đăng nhập và lấy thông tin user
 from app_logic.db import get_db_connection  # Hàm lấy kết nối CSDL
 from app_logic.utils import slugify  # Hàm tạo slug
+from app_logic.search import build_book_search, SearchClause  # Tìm kiếm sách (FULLTEXT/LIKE)
+from app_logic.pagination import KeysetPaginator, cached_count  # Phân trang theo khóa
+from app_logic.parallel import run_parallel, fetch_all, fetch_value  # Chạy song song truy vấn đọc
+from app_logic.shelves import home_shelves  # Kệ sách trang chủ (tính sẵn, có cache)
+from app_logic import reference  # Danh mục tác giả/thể loại cho bộ lọc (có cache)
+from app_logic.book_detail import (  # Dữ liệu trang chi tiết sách (có cache)
+    get_book_detail,
+    get_user_bits,
+    invalidate_book_detail,
+    load_comments,
+    comment_count,
+)
 import math  # Để tính toán phân trang
 import datetime  # Để xử lý ngày tháng
 import mysql.connector  # Để xử lý lỗi CSDL
@@ -36,9 +48,6 @@ def index():
       Hiển thị kết quả tìm kiếm/lọc dưới dạng lưới có phân trang.
     Luôn hiển thị form tìm kiếm và các dropdown lọc (Tác giả, Thể loại).
     """
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)  # Dùng dictionary=True để kết quả là dict
-
     # Lấy các tham số tìm kiếm, lọc và phân trang từ URL query string
     search_query = request.args.get("search", "")
     id_the_loai = request.args.get("id_the_loai", "")
@@ -50,25 +59,24 @@ def index():
         search_page = 1  # Đảm bảo trang >= 1
     PER_PAGE_SEARCH = 12  # Số sách trên mỗi trang kết quả tìm kiếm
     search_offset = (search_page - 1) * PER_PAGE_SEARCH
-
-    # Lấy danh sách thể loại và tác giả để hiển thị trong dropdown bộ lọc
-    try:
-        cursor.execute(
-            "SELECT id_the_loai, ten_the_loai FROM TheLoai ORDER BY ten_the_loai"
-        )
-        danh_sach_the_loai = cursor.fetchall()
-        cursor.execute(
-            "SELECT id_tac_gia, ten_tac_gia FROM TacGia ORDER BY ten_tac_gia"
-        )
-        danh_sach_tac_gia = cursor.fetchall()
-    except mysql.connector.Error as err:
-        flash(f"Lỗi khi tải bộ lọc: {err}", "danger")
-        danh_sach_the_loai, danh_sach_tac_gia = [], []
+    # Lấy id trước: các tác vụ chạy ở thread khác, không có current_user
+    user_id = current_user.id
+
+    # Các truy vấn độc lập của trang, chạy song song (xem app_logic/parallel.py)
+    # Dữ liệu dropdown bộ lọc: danh sách thể loại và tác giả đang chọn (đọc từ cache
+    # danh mục; các tác giả khác được gợi ý qua /api/tac-gia khi gõ)
+    tasks = {
+        "danh_muc": lambda cursor: (
+            reference.get_genres(cursor),
+            reference.find_by_id(cursor, "tac_gia", id_tac_gia),
+        ),
+    }
 
     # Xác định xem người dùng có đang thực hiện tìm kiếm/lọc không
     is_searching = bool(search_query or id_the_loai or id_tac_gia)
 
     # Khởi tạo các biến chứa kết quả
+    danh_sach_the_loai, tac_gia_da_chon = [], None  # Dữ liệu bộ lọc
     search_results_paginated = []  # Kết quả tìm kiếm (nếu có)
     search_title = ""  # Tiêu đề cho mục kết quả tìm kiếm
     total_search_pages = 1  # Tổng số trang kết quả tìm kiếm
@@ -83,9 +91,11 @@ def index():
             # Xây dựng mệnh đề WHERE dựa trên các tham số lọc
             where_conditions = ["s.trang_thai = 'hoat_dong'"]  # Chỉ lấy sách hoạt động
             params_where = []  # Tham số cho mệnh đề WHERE
-            if search_query:
-                where_conditions.append("(s.tieu_de LIKE %s OR tg.ten_tac_gia LIKE %s)")
-                params_where.extend([f"%{search_query}%", f"%{search_query}%"])
+            # Tìm theo từ khóa (FULLTEXT hoặc LIKE, xem app_logic/search.py)
+            search = build_book_search(search_query) or SearchClause()
+            if search.where:
+                where_conditions.append(search.where)
+                params_where.extend(search.where_params)
             if id_the_loai:
                 where_conditions.append("s.id_the_loai = %s")
                 params_where.append(id_the_loai)
@@ -97,95 +107,60 @@ def index():
             )
 
             # Đếm tổng số kết quả phù hợp để tính phân trang
-            count_base_from = " FROM Sach s LEFT JOIN TacGia tg ON s.id_tac_gia = tg.id_tac_gia LEFT JOIN TheLoai tl ON s.id_the_loai = tl.id_the_loai "
+            count_base_from = f" FROM Sach s LEFT JOIN TacGia tg ON s.id_tac_gia = tg.id_tac_gia LEFT JOIN TheLoai tl ON s.id_the_loai = tl.id_the_loai {search.join} "
             count_query = (
                 f"SELECT COUNT(s.id_sach) AS total {count_base_from} {where_clause_str}"
             )
-            cursor.execute(count_query, tuple(params_where))
-            total_search_results = cursor.fetchone()["total"] or 0
-            total_search_pages = (
-                math.ceil(total_search_results / PER_PAGE_SEARCH)
-                if total_search_results > 0
-                else 1
+            tasks["total_search_results"] = fetch_value(
+                count_query, search.join_params + params_where
             )
 
-            # Đảm bảo trang hiện tại không vượt quá tổng số trang
-            if search_page > total_search_pages:
-                search_page = total_search_pages
-                search_offset = (search_page - 1) * PER_PAGE_SEARCH
-
-            # Lấy danh sách sách cho trang kết quả tìm kiếm hiện tại
+            # Lấy danh sách sách cho trang kết quả tìm kiếm hiện tại (song song với COUNT)
             select_part = " SELECT s.id_sach, s.tieu_de, s.anh_bia, tg.ten_tac_gia, (CASE WHEN yt.id_thanh_vien IS NOT NULL THEN TRUE ELSE FALSE END) AS is_favorite "
-            from_joins_part = """ FROM Sach s LEFT JOIN TacGia tg ON s.id_tac_gia = tg.id_tac_gia LEFT JOIN TheLoai tl ON s.id_the_loai = tl.id_the_loai
-                                   LEFT JOIN YeuThich yt ON s.id_sach = yt.id_sach AND yt.id_thanh_vien = %s """
-            order_limit_offset_part = " ORDER BY s.tieu_de LIMIT %s OFFSET %s "
+            from_joins_part = f""" FROM Sach s LEFT JOIN TacGia tg ON s.id_tac_gia = tg.id_tac_gia LEFT JOIN TheLoai tl ON s.id_the_loai = tl.id_the_loai
+                                   LEFT JOIN YeuThich yt ON s.id_sach = yt.id_sach AND yt.id_thanh_vien = %s {search.join} """
+            # Sắp xếp theo độ liên quan (nếu tìm bằng FULLTEXT), sau đó theo tiêu đề
+            order_fields = ([search.order] if search.order else []) + ["s.tieu_de"]
+            order_limit_offset_part = f" ORDER BY {', '.join(order_fields)} LIMIT %s OFFSET %s "
             final_search_query = f"{select_part} {from_joins_part} {where_clause_str} {order_limit_offset_part}"
-            # Tham số cuối cùng bao gồm: user_id (cho YeuThich), các tham số lọc, limit, offset
-            final_params = (
-                [current_user.id] + params_where + [PER_PAGE_SEARCH, search_offset]
+            # Tham số cuối cùng bao gồm: user_id (cho YeuThich), tham số FULLTEXT, các tham số lọc, limit, offset
+            base_params = [user_id] + search.join_params + params_where
+            tasks["search_results_paginated"] = fetch_all(
+                final_search_query, base_params + [PER_PAGE_SEARCH, search_offset]
             )
-            cursor.execute(final_search_query, tuple(final_params))
-            search_results_paginated = cursor.fetchall()  # Lấy kết quả
 
         else:
             # --- XỬ LÝ KHI KHÔNG TÌM KIẾM/LỌC (HIỂN THỊ MẶC ĐỊNH) ---
-            # Lấy 10 sách mới nhất
-            cursor.execute(
-                """ SELECT s.id_sach, s.tieu_de, s.anh_bia, tg.ten_tac_gia, (CASE WHEN yt.id_thanh_vien IS NOT NULL THEN TRUE ELSE FALSE END) AS is_favorite
-                    FROM Sach s LEFT JOIN TacGia tg ON s.id_tac_gia = tg.id_tac_gia LEFT JOIN YeuThich yt ON s.id_sach = yt.id_sach AND yt.id_thanh_vien = %s
-                    WHERE s.trang_thai = 'hoat_dong' ORDER BY s.id_sach DESC LIMIT 10 """,
-                (current_user.id,),
-            )
-            sach_moi_nhat = cursor.fetchall()
+            # Các kệ Mới nhất, Gợi ý, Phổ biến được tính sẵn/cache (xem app_logic/shelves.py),
+            # chỉ cờ yêu thích được truy vấn ở mỗi request
+            tasks["home_shelves"] = lambda cursor: home_shelves(cursor, user_id)
 
-            # Lấy thể loại ưa thích của người dùng (dựa trên lịch sử mượn)
-            cursor.execute(
-                """ SELECT s.id_the_loai, COUNT(*) AS so_luong FROM MuonTra mt JOIN Sach s ON mt.id_sach = s.id_sach
-                    WHERE mt.id_thanh_vien = %s GROUP BY s.id_the_loai ORDER BY so_luong DESC LIMIT 1 """,
-                (current_user.id,),
-            )
-            the_loai_ua_thich = cursor.fetchone()
-
-            # Lấy sách gợi ý dựa trên thể loại ưa thích (chưa từng mượn)
-            if the_loai_ua_thich:
-                cursor.execute(
-                    """ SELECT s.id_sach, s.tieu_de, s.anh_bia, tg.ten_tac_gia, (CASE WHEN yt.id_thanh_vien IS NOT NULL THEN TRUE ELSE FALSE END) AS is_favorite
-                        FROM Sach s LEFT JOIN TacGia tg ON s.id_tac_gia = tg.id_tac_gia LEFT JOIN YeuThich yt ON s.id_sach = yt.id_sach AND yt.id_thanh_vien = %s
-                        WHERE s.id_the_loai = %s AND s.trang_thai = 'hoat_dong'
-                          AND s.id_sach NOT IN (SELECT DISTINCT id_sach FROM MuonTra WHERE id_thanh_vien = %s)
-                        LIMIT 10 """,
-                    (
-                        current_user.id,
-                        the_loai_ua_thich["id_the_loai"],
-                        current_user.id,
-                    ),
-                )
-                sach_goi_y = cursor.fetchall()
-
-            # Nếu không có gợi ý theo thể loại, lấy sách mượn nhiều nhất làm gợi ý
-            if not sach_goi_y:
-                cursor.execute(
-                    """ SELECT s.id_sach, s.tieu_de, s.anh_bia, tg.ten_tac_gia, COUNT(mt.id_sach) AS luot_muon,
-                           MAX(CASE WHEN yt.id_thanh_vien IS NOT NULL THEN TRUE ELSE FALSE END) AS is_favorite
-                        FROM Sach s JOIN MuonTra mt ON s.id_sach = mt.id_sach LEFT JOIN TacGia tg ON s.id_tac_gia = tg.id_tac_gia
-                           LEFT JOIN YeuThich yt ON s.id_sach = yt.id_sach AND yt.id_thanh_vien = %s
-                        WHERE s.trang_thai = 'hoat_dong' GROUP BY s.id_sach, s.tieu_de, s.anh_bia, tg.ten_tac_gia
-                        ORDER BY luot_muon DESC LIMIT 10 """,
-                    (current_user.id,),
-                )
-                sach_goi_y = cursor.fetchall()  # Gán sách phổ biến vào gợi ý
-
-            # Lấy 10 sách phổ biến nhất (mượn nhiều nhất)
-            cursor.execute(
-                """ SELECT s.id_sach, s.tieu_de, s.anh_bia, tg.ten_tac_gia, COUNT(mt.id_muon_tra) AS luot_muon,
-                       MAX(CASE WHEN yt.id_thanh_vien IS NOT NULL THEN TRUE ELSE FALSE END) AS is_favorite
-                    FROM Sach s JOIN MuonTra mt ON s.id_sach = mt.id_sach LEFT JOIN TacGia tg ON s.id_tac_gia = tg.id_tac_gia
-                       LEFT JOIN YeuThich yt ON s.id_sach = yt.id_sach AND yt.id_thanh_vien = %s
-                    WHERE s.trang_thai = 'hoat_dong' GROUP BY s.id_sach, s.tieu_de, s.anh_bia, tg.ten_tac_gia
-                    ORDER BY luot_muon DESC LIMIT 10 """,
-                (current_user.id,),
+        results = run_parallel(tasks)
+        danh_sach_the_loai, tac_gia_da_chon = results["danh_muc"]
+
+        if is_searching:
+            total_search_results = results["total_search_results"]
+            total_search_pages = (
+                math.ceil(total_search_results / PER_PAGE_SEARCH)
+                if total_search_results > 0
+                else 1
             )
-            sach_pho_bien = cursor.fetchall()
+            search_results_paginated = results["search_results_paginated"]
+
+            # Đảm bảo trang hiện tại không vượt quá tổng số trang (lấy lại trang cuối)
+            if search_page > total_search_pages:
+                search_page = total_search_pages
+                search_offset = (search_page - 1) * PER_PAGE_SEARCH
+                search_results_paginated = run_parallel(
+                    {
+                        "trang": fetch_all(
+                            final_search_query,
+                            base_params + [PER_PAGE_SEARCH, search_offset],
+                        )
+                    }
+                )["trang"]
+        else:
+            sach_moi_nhat, sach_goi_y, sach_pho_bien = results["home_shelves"]
 
     except mysql.connector.Error as err:
         flash(f"Lỗi cơ sở dữ liệu khi tải trang chủ: {err}", "danger")
@@ -196,17 +171,13 @@ def index():
             [],
             [],
         )
-    finally:
-        # Đóng kết nối CSDL
-        cursor.close()
-        conn.close()
 
     # Trả về template home.html với các dữ liệu đã lấy được
     return render_template(
         "home.html",
         # Dữ liệu cho bộ lọc
         danh_sach_the_loai=danh_sach_the_loai,
-        danh_sach_tac_gia=danh_sach_tac_gia,
+        tac_gia_da_chon=tac_gia_da_chon,
         # Trạng thái tìm kiếm và các giá trị lọc đã chọn
         is_searching=is_searching,
         selected_the_loai=id_the_loai,
@@ -242,23 +213,17 @@ def chi_tiet_sach(id_sach, slug=None):
     cursor = conn.cursor(dictionary=True)
 
     try:
-        # Lấy thông tin chi tiết sách, bao gồm cả trạng thái yêu thích của người dùng hiện tại
-        query_sach = """
-        SELECT s.*, tg.ten_tac_gia, tl.ten_the_loai, (CASE WHEN yt.id_thanh_vien IS NOT NULL THEN TRUE ELSE FALSE END) AS is_favorite
-        FROM Sach s LEFT JOIN TacGia tg ON s.id_tac_gia = tg.id_tac_gia LEFT JOIN TheLoai tl ON s.id_the_loai = tl.id_the_loai
-           LEFT JOIN YeuThich yt ON s.id_sach = yt.id_sach AND yt.id_thanh_vien = %s
-        WHERE s.id_sach = %s AND s.trang_thai = 'hoat_dong' -- Chỉ lấy sách hoạt động
-        """
-        cursor.execute(query_sach, (current_user.id, id_sach))
-        sach = cursor.fetchone()
+        # Phần dữ liệu chung của sách (thông tin, lượt mượn, bình luận, sách liên quan),
+        # được cache theo sách (xem app_logic/book_detail.py)
+        detail = get_book_detail(cursor, id_sach)
 
         # Nếu không tìm thấy sách hoặc sách đã bị ẩn
-        if not sach:
+        if not detail:
             flash("Sách này không tồn tại hoặc đã bị ẩn.", "danger")
             return redirect(url_for("core.danh_sach_sach"))  # Chuyển về trang danh sách
 
         # --- Kiểm tra và Redirect nếu Slug không đúng ---
-        expected_slug = slugify(sach.get("tieu_de"))  # Tạo slug chuẩn từ tiêu đề sách
+        expected_slug = slugify(detail["sach"].get("tieu_de"))  # Tạo slug chuẩn từ tiêu đề sách
         if slug is None or slug != expected_slug:  # Nếu slug bị thiếu hoặc sai
             # Redirect vĩnh viễn (301) đến URL đúng với slug chuẩn
             return redirect(
@@ -266,30 +231,24 @@ def chi_tiet_sach(id_sach, slug=None):
                 code=301,
             )
 
-        # Lấy tổng lượt mượn của sách này
-        cursor.execute(
-            "SELECT COUNT(*) as total FROM MuonTra WHERE id_sach = %s", (id_sach,)
+        # Phần riêng của người dùng hiện tại: trạng thái yêu thích (sách này và
+        # các sách liên quan) và điểm đã đánh giá, lấy bằng một truy vấn
+        favorites, user_rating = get_user_bits(
+            cursor,
+            current_user.id,
+            id_sach,
+            [book["id_sach"] for book in detail["sach_lien_quan"]],
         )
-        luot_muon = cursor.fetchone()["total"] or 0
-
-        # Lấy danh sách bình luận (mới nhất trước)
-        query_comments = """ SELECT bl.noi_dung, bl.ngay_dang, tv.ho_ten FROM BinhLuan bl JOIN ThanhVien tv ON bl.id_thanh_vien = tv.id_thanh_vien
-                             WHERE bl.id_sach = %s ORDER BY bl.ngay_dang DESC """
-        cursor.execute(query_comments, (id_sach,))
-        binh_luan = cursor.fetchall()
-
-        # Lấy danh sách sách liên quan (cùng tác giả hoặc thể loại, trừ sách hiện tại, ngẫu nhiên)
-        query_related = """ SELECT s.id_sach, s.tieu_de, s.anh_bia, tg.ten_tac_gia, (CASE WHEN yt.id_thanh_vien IS NOT NULL THEN TRUE ELSE FALSE END) AS is_favorite
-                            FROM Sach s LEFT JOIN TacGia tg ON s.id_tac_gia = tg.id_tac_gia LEFT JOIN YeuThich yt ON s.id_sach = yt.id_sach AND yt.id_thanh_vien = %s
-                            WHERE (s.id_tac_gia = %s OR s.id_the_loai = %s) AND s.id_sach != %s AND s.trang_thai = 'hoat_dong'
-                            ORDER BY RAND() LIMIT 10 """  # RAND() để lấy ngẫu nhiên
-        # Lấy ID tác giả/thể loại của sách hiện tại, dùng -1 nếu không có để tránh lỗi SQL
-        id_tac_gia = sach.get("id_tac_gia") or -1
-        id_the_loai = sach.get("id_the_loai") or -1
-        cursor.execute(
-            query_related, (current_user.id, id_tac_gia, id_the_loai, id_sach)
-        )
-        sach_lien_quan = cursor.fetchall()
+        # Tạo bản sao trước khi gắn cờ (dữ liệu cache dùng chung giữa các request)
+        sach = dict(detail["sach"], is_favorite=id_sach in favorites)
+        sach_lien_quan = [
+            dict(book, is_favorite=book["id_sach"] in favorites)
+            for book in detail["sach_lien_quan"]
+        ]
+        luot_muon = detail["luot_muon"]
+        binh_luan = detail["binh_luan"]  # Trang bình luận đầu tiên, các trang sau tải qua JSON
+        binh_luan_next = detail["binh_luan_next"]
+        so_binh_luan = comment_count(cursor, id_sach)
 
         # Tính điểm đánh giá trung bình
         avg_rating = 0
@@ -298,16 +257,6 @@ def chi_tiet_sach(id_sach, slug=None):
         if so_luot > 0:
             avg_rating = round(tong_diem / so_luot, 1)  # Làm tròn 1 chữ số thập phân
 
-        # Lấy đánh giá của người dùng hiện tại cho sách này (nếu có)
-        user_rating = 0  # Mặc định là chưa đánh giá
-        cursor.execute(
-            "SELECT diem_so FROM DanhGia WHERE id_sach = %s AND id_thanh_vien = %s",
-            (id_sach, current_user.id),
-        )
-        rating_record = cursor.fetchone()
-        if rating_record:
-            user_rating = rating_record["diem_so"]
-
     except mysql.connector.Error as err:
         flash(f"Lỗi khi tải chi tiết sách: {err}", "danger")
         print(f"!!! Lỗi DB khi xem chi tiết sách {id_sach}: {err}")
@@ -323,6 +272,8 @@ def chi_tiet_sach(id_sach, slug=None):
         sach=sach,
         luot_muon=luot_muon,
         binh_luan=binh_luan,
+        binh_luan_next=binh_luan_next,
+        so_binh_luan=so_binh_luan,
         sach_lien_quan=sach_lien_quan,
         avg_rating=avg_rating,
         user_rating=user_rating,
@@ -330,118 +281,136 @@ def chi_tiet_sach(id_sach, slug=None):
 
 
 # =========================================================
-# ROUTE: DANH SÁCH SÁCH (TRA CỨU) ("/sach")
+# HÀM NỘI BỘ: TẢI MỘT TRANG DANH SÁCH SÁCH (TRA CỨU)
+# Dùng chung cho trang HTML ("/sach") và API JSON ("/sach/data").
 # =========================================================
-@core_bp.route("/sach")
-@login_required  # Yêu cầu đăng nhập
-def danh_sach_sach():
+def _tai_trang_danh_sach_sach(cursor, args, with_count=True):
     """
-    Hiển thị trang tra cứu sách dưới dạng lưới (grid).
-    Hỗ trợ tìm kiếm, lọc theo thể loại/tác giả, lọc sách còn hàng,
-    sắp xếp theo tiêu đề/năm XB (tăng/giảm).
-    Có phân trang.
+    Đọc bộ lọc/sắp xếp/con trỏ từ `args` (request.args) và trả về dict gồm:
+    danh_sach, pager (KeysetPaginator), total_sach và các giá trị bộ lọc.
+    Phân trang theo khóa (keyset): không dùng OFFSET.
     """
-    # Lấy các tham số từ URL query string
-    search_query = request.args.get("search", "")
-    id_the_loai = request.args.get("id_the_loai", "")
-    id_tac_gia = request.args.get("id_tac_gia", "")
-    sort_by = request.args.get("sort_by", "tieu_de")  # Mặc định sắp xếp theo tiêu đề
-    sort_order = request.args.get("sort_order", "asc")  # Mặc định tăng dần
+    search_query = args.get("search", "")
+    id_the_loai = args.get("id_the_loai", "")
+    id_tac_gia = args.get("id_tac_gia", "")
+    # Mặc định: sắp xếp theo độ liên quan khi có từ khóa, ngược lại theo tiêu đề
+    sort_by = args.get("sort_by", "relevance" if search_query else "tieu_de")
+    sort_order = args.get("sort_order", "asc")  # Mặc định tăng dần
     # Chuyển đổi 'available_only=true' thành boolean True
-    available_only = request.args.get(
-        "available_only", type=lambda v: v.lower() == "true"
-    )
-    page = request.args.get("page", 1, type=int)  # Trang hiện tại
+    available_only = args.get("available_only", type=lambda v: v.lower() == "true")
     per_page = 12  # Số sách mỗi trang
 
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-
     # Xây dựng mệnh đề WHERE và danh sách tham số dựa trên bộ lọc
     where_conditions = ["s.trang_thai = 'hoat_dong'"]  # Luôn chỉ lấy sách hoạt động
     filter_params = []  # Danh sách tham số cho câu lệnh SQL
     if available_only:
         where_conditions.append("s.so_luong > 0")  # Lọc sách còn hàng
-    if search_query:
-        where_conditions.append(
-            "(s.tieu_de LIKE %s OR tg.ten_tac_gia LIKE %s)"
-        )  # Tìm kiếm
-        search_term = f"%{search_query}%"
-        filter_params.extend([search_term, search_term])
+    # Tìm kiếm theo từ khóa (FULLTEXT hoặc LIKE, xem app_logic/search.py)
+    search = build_book_search(search_query) or SearchClause()
+    if search.where:
+        where_conditions.append(search.where)
+        filter_params.extend(search.where_params)
     if id_the_loai:
         where_conditions.append("s.id_the_loai = %s")  # Lọc theo thể loại
         filter_params.append(id_the_loai)
     if id_tac_gia:
         where_conditions.append("s.id_tac_gia = %s")  # Lọc theo tác giả
         filter_params.append(id_tac_gia)
-    # Kết hợp các điều kiện
-    where_clause = "WHERE " + " AND ".join(where_conditions) if where_conditions else ""
 
-    total_sach = 0
-    total_pages = 1
-    try:
-        # Đếm tổng số sách phù hợp với bộ lọc
+    # Khóa sắp xếp cho phân trang (cột cuối là id để thứ tự luôn duy nhất)
+    direction = "DESC" if sort_order == "desc" else "ASC"
+    if sort_by == "relevance" and search.order:
+        # Độ liên quan luôn giảm dần, sau đó theo tiêu đề
+        order = [
+            ("kq_tim.relevance", "DESC", "relevance"),
+            ("s.tieu_de COLLATE utf8mb4_vietnamese_ci", "ASC", "tieu_de"),
+            ("s.id_sach", "ASC", "id_sach"),
+        ]
+    elif sort_by == "nam_xb":
+        order = [
+            ("COALESCE(s.nam_xuat_ban, 0)", direction, "sort_nam_xb"),
+            ("s.id_sach", direction, "id_sach"),
+        ]
+    else:  # Mặc định sắp xếp theo tiêu đề (có hỗ trợ tiếng Việt)
+        order = [
+            ("s.tieu_de COLLATE utf8mb4_vietnamese_ci", direction, "tieu_de"),
+            ("s.id_sach", direction, "id_sach"),
+        ]
+    pager = KeysetPaginator(order, per_page).parse(args)
+
+    count_where = "WHERE " + " AND ".join(where_conditions)
+    seek_sql, seek_params = pager.where()
+    if seek_sql:
+        where_conditions.append(seek_sql)
+    where_clause = "WHERE " + " AND ".join(where_conditions)
+
+    total_sach = None
+    if with_count:
+        # Tổng số sách phù hợp (được cache, không chạy lại ở mỗi trang)
         count_query = f""" SELECT COUNT(s.id_sach) AS total FROM Sach s
                            LEFT JOIN TacGia tg ON s.id_tac_gia = tg.id_tac_gia
-                           LEFT JOIN TheLoai tl ON s.id_the_loai = tl.id_the_loai {where_clause} """
-        cursor.execute(count_query, tuple(filter_params))
-        result = cursor.fetchone()
-        if result:
-            total_sach = result["total"] or 0
-        # Tính tổng số trang
-        total_pages = math.ceil(total_sach / per_page) if total_sach > 0 else 1
-    except mysql.connector.Error as err:
-        flash(f"Lỗi khi đếm sách: {err}", "danger")
-        print(f"!!! SQL Error (Count): {err}")
-
-    # Điều chỉnh trang hiện tại nếu vượt quá tổng số trang hoặc nhỏ hơn 1
-    page = max(1, min(page, total_pages))
-    offset = (page - 1) * per_page  # Tính offset cho LIMIT
-
-    # Xây dựng phần SELECT và JOIN của câu lệnh chính
-    select_fields = """ SELECT s.id_sach, s.tieu_de, tg.ten_tac_gia, tl.ten_the_loai, s.so_luong, s.anh_bia, s.nam_xuat_ban,
-                           (CASE WHEN yt.id_thanh_vien IS NOT NULL THEN TRUE ELSE FALSE END) AS is_favorite """
-    from_join_part = """ FROM Sach s LEFT JOIN TacGia tg ON s.id_tac_gia = tg.id_tac_gia
-                         LEFT JOIN TheLoai tl ON s.id_the_loai = tl.id_the_loai
-                         LEFT JOIN YeuThich yt ON s.id_sach = yt.id_sach AND yt.id_thanh_vien = %s """
-
-    # Xây dựng mệnh đề ORDER BY dựa trên tham số sắp xếp
-    order_by_clause = "ORDER BY "
-    if sort_by == "nam_xb":
-        order_by_clause += "s.nam_xuat_ban"
-    else:  # Mặc định sắp xếp theo tiêu đề (có hỗ trợ tiếng Việt)
-        order_by_clause += "s.tieu_de COLLATE utf8mb4_vietnamese_ci"
-    order_by_clause += " DESC" if sort_order == "desc" else " ASC"  # Thứ tự tăng/giảm
+                           LEFT JOIN TheLoai tl ON s.id_the_loai = tl.id_the_loai {search.join} {count_where} """
+        total_sach = cached_count(cursor, count_query, search.join_params + filter_params)
+
+    # Xây dựng câu lệnh chính
+    relevance_field = ", kq_tim.relevance" if search.is_fulltext else ""
+    final_query = f""" SELECT s.id_sach, s.tieu_de, tg.ten_tac_gia, tl.ten_the_loai, s.so_luong, s.anh_bia, s.nam_xuat_ban,
+                           COALESCE(s.nam_xuat_ban, 0) AS sort_nam_xb{relevance_field},
+                           (CASE WHEN yt.id_thanh_vien IS NOT NULL THEN TRUE ELSE FALSE END) AS is_favorite
+                       FROM Sach s LEFT JOIN TacGia tg ON s.id_tac_gia = tg.id_tac_gia
+                       LEFT JOIN TheLoai tl ON s.id_the_loai = tl.id_the_loai
+                       LEFT JOIN YeuThich yt ON s.id_sach = yt.id_sach AND yt.id_thanh_vien = %s {search.join}
+                       {where_clause} ORDER BY {pager.order_by()} LIMIT {pager.limit} """
+    # Tham số: user_id cho JOIN YeuThich, tham số FULLTEXT, các tham số lọc, giá trị con trỏ
+    main_query_params = (
+        [current_user.id] + search.join_params + filter_params + seek_params
+    )
+    cursor.execute(final_query, tuple(main_query_params))
+    danh_sach = pager.paginate(cursor.fetchall())
+
+    return dict(
+        danh_sach=danh_sach,
+        pager=pager,
+        total_sach=total_sach,
+        search_query=search_query,
+        selected_the_loai=id_the_loai,
+        selected_tac_gia=id_tac_gia,
+        sort_by=sort_by,
+        sort_order=sort_order,
+        available_only=available_only,
+    )
 
-    # Mệnh đề LIMIT và OFFSET
-    limit_offset_clause = " LIMIT %s OFFSET %s"
 
-    # Gộp tất cả các phần thành câu lệnh SQL cuối cùng
-    final_query = f"{select_fields} {from_join_part} {where_clause} {order_by_clause} {limit_offset_clause}"
-    # Chuẩn bị danh sách tham số cuối cùng (user_id cho JOIN YeuThich, các tham số lọc, limit, offset)
-    main_query_params = [current_user.id] + filter_params + [per_page, offset]
+# =========================================================
+# ROUTE: DANH SÁCH SÁCH (TRA CỨU) ("/sach")
+# =========================================================
+@core_bp.route("/sach")
+@login_required  # Yêu cầu đăng nhập
+def danh_sach_sach():
+    """
+    Hiển thị trang tra cứu sách dưới dạng lưới (grid).
+    Hỗ trợ tìm kiếm, lọc theo thể loại/tác giả, lọc sách còn hàng,
+    sắp xếp theo tiêu đề/năm XB (tăng/giảm).
+    Phân trang theo con trỏ (tham số 'after' / 'before').
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
 
-    danh_sach = []
+    trang = None
     try:
-        # Thực thi câu lệnh lấy danh sách sách cho trang hiện tại
-        cursor.execute(final_query, tuple(main_query_params))
-        danh_sach = cursor.fetchall()  # Lấy kết quả
+        trang = _tai_trang_danh_sach_sach(cursor, request.args)
     except mysql.connector.Error as err:
         flash(f"Lỗi khi tải danh sách sách: {err}", "danger")
         print(f"!!! SQL Error (Select): {err}")
 
-    # Lấy danh sách thể loại và tác giả để hiển thị trong bộ lọc
+    # Lấy danh sách thể loại và tác giả đang chọn để hiển thị trong bộ lọc (có cache)
     danh_sach_the_loai = []
-    danh_sach_tac_gia = []
+    tac_gia_da_chon = None
     try:
-        cursor.execute(
-            "SELECT id_the_loai, ten_the_loai FROM TheLoai ORDER BY ten_the_loai"
-        )
-        danh_sach_the_loai = cursor.fetchall()
-        cursor.execute(
-            "SELECT id_tac_gia, ten_tac_gia FROM TacGia ORDER BY ten_tac_gia"
+        danh_sach_the_loai = reference.get_genres(cursor)
+        tac_gia_da_chon = reference.find_by_id(
+            cursor, "tac_gia", request.args.get("id_tac_gia")
         )
-        danh_sach_tac_gia = cursor.fetchall()
     except mysql.connector.Error as err:
         flash(f"Lỗi khi tải danh sách bộ lọc: {err}", "danger")
         print(f"!!! SQL Error (Filters): {err}")
@@ -450,25 +419,104 @@ def danh_sach_sach():
         cursor.close()
         conn.close()
 
+    if trang is None:  # Lỗi khi tải sách -> hiển thị trang rỗng, giữ nguyên bộ lọc
+        trang = dict(
+            danh_sach=[],
+            pager=None,
+            total_sach=0,
+            search_query=request.args.get("search", ""),
+            selected_the_loai=request.args.get("id_the_loai", ""),
+            selected_tac_gia=request.args.get("id_tac_gia", ""),
+            sort_by=request.args.get("sort_by", "tieu_de"),
+            sort_order=request.args.get("sort_order", "asc"),
+            available_only=request.args.get(
+                "available_only", type=lambda v: v.lower() == "true"
+            ),
+        )
+    pager = trang.pop("pager")
+
     # Trả về template sach.html với các dữ liệu đã lấy
     return render_template(
         "sach.html",
-        danh_sach=danh_sach,  # Danh sách sách cho trang hiện tại
-        # Thông tin phân trang
-        current_page=page,
-        total_pages=total_pages,
-        # Các giá trị lọc/tìm kiếm/sắp xếp hiện tại (để giữ trạng thái form)
-        search_query=search_query,
+        # Thông tin phân trang (con trỏ trang trước/sau)
+        prev_cursor=pager.prev_cursor if pager else None,
+        next_cursor=pager.next_cursor if pager else None,
         danh_sach_the_loai=danh_sach_the_loai,
-        danh_sach_tac_gia=danh_sach_tac_gia,
-        selected_the_loai=id_the_loai,
-        selected_tac_gia=id_tac_gia,
-        sort_by=sort_by,
-        sort_order=sort_order,
-        available_only=available_only,
+        tac_gia_da_chon=tac_gia_da_chon,
+        # Danh sách sách, tổng số và các giá trị lọc/tìm kiếm/sắp xếp hiện tại
+        **trang,
     )
 
 
+# =========================================================
+# API: DANH SÁCH SÁCH DẠNG JSON ("/sach/data")
+# =========================================================
+@core_bp.route("/sach/data")
+@login_required
+def danh_sach_sach_json():
+    """
+    Phiên bản JSON của trang tra cứu sách (cùng tham số lọc/sắp xếp).
+    Phân trang bằng con trỏ 'after' / 'before'; tổng số chỉ trả về khi có '?with_count=1'.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        trang = _tai_trang_danh_sach_sach(
+            cursor, request.args, with_count=request.args.get("with_count") == "1"
+        )
+        return jsonify(
+            items=trang["danh_sach"],
+            total=trang["total_sach"],
+            **trang["pager"].to_dict(),
+        )
+    except mysql.connector.Error as err:
+        print(f"!!! Lỗi DB khi tải danh sách sách (JSON): {err}")
+        return jsonify(success=False, error="Lỗi máy chủ"), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+
+# =========================================================
+# ROUTE: DANH SÁCH BÌNH LUẬN ("/sach/<id>/comments") - JSON
+# Tải dần bình luận khi cuộn (trang chi tiết sách và trang admin).
+# =========================================================
+@core_bp.route("/sach/<int:id_sach>/comments")
+@login_required
+def binh_luan_json(id_sach):
+    """
+    Trả về một trang bình luận của sách (mới nhất trước).
+    Phân trang bằng con trỏ 'after' / 'before'; tổng số chỉ trả về khi có '?with_count=1'.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        binh_luan, pager = load_comments(cursor, id_sach, request.args)
+        total = (
+            comment_count(cursor, id_sach)
+            if request.args.get("with_count") == "1"
+            else None
+        )
+        items = [
+            {
+                "id_binh_luan": bl["id_binh_luan"],
+                "ho_ten": bl["ho_ten"],
+                "noi_dung": bl["noi_dung"],
+                "ngay_dang": (
+                    bl["ngay_dang"].strftime("%d-%m-%Y %H:%M") if bl["ngay_dang"] else ""
+                ),
+            }
+            for bl in binh_luan
+        ]
+        return jsonify(items=items, total=total, **pager.to_dict())
+    except mysql.connector.Error as err:
+        print(f"!!! Lỗi DB khi tải bình luận sách {id_sach} (JSON): {err}")
+        return jsonify(success=False, error="Lỗi máy chủ"), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+
 # =========================================================
 # ROUTE: THÊM BÌNH LUẬN ("/sach/<id>/comment") - AJAX
 # =========================================================
@@ -503,6 +551,7 @@ def them_binh_luan(id_sach):
             (id_sach, current_user.id, noi_dung_sach, thoi_gian_dang),
         )
         conn.commit()  # Lưu thay đổi
+        invalidate_book_detail(id_sach)  # Trang chi tiết hiển thị bình luận mới
 
         # Trả về JSON thành công cùng thông tin bình luận mới để JavaScript cập nhật UI
         return jsonify(
@@ -1,42 +1,479 @@
-# app_logic/db.py
-# =========================================================
-# FILE DB CONNECTION
-# Chứa cấu hình kết nối đến cơ sở dữ liệu MySQL và cung cấp
-# một hàm (`get_db_connection`) để tạo và trả về một đối tượng kết nối.
-# Cấu hình được lấy từ các biến môi trường để tăng tính bảo mật
-# và linh hoạt khi triển khai.
-# =========================================================
-from dotenv import load_dotenv # Nhập hàm
-load_dotenv() # Tải các biến từ file .env
-import os  # Module thao tác với hệ điều hành (để đọc biến môi trường)
-import mysql.connector  # Thư viện chính thức của MySQL để kết nối Python với MySQL
-
-# --- Cấu hình kết nối Database ---
-# Lấy thông tin kết nối (host, user, password, tên database) từ các biến môi trường.
-# Các biến này thường được định nghĩa trong file .env và được tải bởi thư viện python-dotenv.
-# Việc này giúp giữ thông tin nhạy cảm tách biệt khỏi mã nguồn.
-db_config = {
-    "host": os.getenv(
-        "DB_HOST", "localhost"
-    ),  # Host database (mặc định là localhost nếu không có biến môi trường)
-    "user": os.getenv("DB_USER", "root"),  # Tên người dùng database
-    "password": os.getenv("DB_PASSWORD", "1234"),  # Mật khẩu database
-    "database": os.getenv("DB_NAME", "lms"),  # Tên database
-    # Có thể thêm các cấu hình khác nếu cần, ví dụ: port, charset='utf8mb4'
-}
-
-
-# =========================================================
-# HÀM: GET_DB_CONNECTION
-# Tạo và trả về một kết nối mới đến cơ sở dữ liệu MySQL.
-# =========================================================
-def get_db_connection():
-    """
-    Tạo một kết nối mới đến cơ sở dữ liệu MySQL sử dụng cấu hình trong `db_config`.
-    Trả về: Đối tượng connection của mysql.connector.
-    Lưu ý: Hàm này tạo kết nối mới mỗi khi được gọi. Việc quản lý
-           (đóng) kết nối cần được thực hiện ở nơi gọi hàm này (thường trong khối finally).
-    """
-    # Sử dụng toán tử ** để giải nén dict db_config thành các tham số keyword cho hàm connect
-    conn = mysql.connector.connect(**db_config)
-    return conn  # Trả về đối tượng kết nối
+# app_logic/db.py
+# =========================================================
+# FILE DB CONNECTION
+# Chứa cấu hình kết nối đến cơ sở dữ liệu MySQL và cung cấp
+# một hàm (`get_db_connection`) để lấy một đối tượng kết nối.
+# Cấu hình được lấy từ các biến môi trường để tăng tính bảo mật
+# và linh hoạt khi triển khai.
+#
+# Kết nối được lấy từ một connection pool (ConnectionPool) thay vì
+# mở mới mỗi lần gọi. Trong một request Flask, tất cả các lần gọi
+# `get_db_connection()` dùng chung MỘT kết nối gắn với `g`; kết nối này
+# được trả về pool trong teardown handler (xem `init_db`).
+#
+# Decorator `retry_on_deadlock` chạy lại route ghi dữ liệu khi MySQL hủy
+# transaction do deadlock (1213) hoặc chờ khóa quá lâu (1205).
+# =========================================================
+from dotenv import load_dotenv # Nhập hàm
+load_dotenv() # Tải các biến từ file .env
+import os  # Module thao tác với hệ điều hành (để đọc biến môi trường)
+import functools  # Giữ tên/docstring của route khi bọc bằng decorator
+import random  # Jitter cho thời gian chờ giữa các lần retry
+import queue  # Hàng đợi thread-safe để giữ các kết nối rảnh trong pool
+import threading  # Semaphore/Lock để giới hạn số kết nối đồng thời
+import time  # Đo thời gian rảnh của kết nối (cho health-check)
+import mysql.connector  # Thư viện chính thức của MySQL để kết nối Python với MySQL
+from mysql.connector import errors as mysql_errors  # Các lớp lỗi của mysql.connector
+from mysql.connector import errorcode  # Mã lỗi MySQL (deadlock, lock wait timeout)
+from flask import g, has_app_context, has_request_context, request, session  # Ngữ cảnh request/app của Flask
+from app_logic.query_stats import current_collector, record_retry  # Số liệu truy vấn / retry của request
+
+# --- Cấu hình kết nối Database ---
+# Lấy thông tin kết nối (host, user, password, tên database) từ các biến môi trường.
+# Các biến này thường được định nghĩa trong file .env và được tải bởi thư viện python-dotenv.
+# Việc này giúp giữ thông tin nhạy cảm tách biệt khỏi mã nguồn.
+db_config = {
+    "host": os.getenv(
+        "DB_HOST", "localhost"
+    ),  # Host database (mặc định là localhost nếu không có biến môi trường)
+    "user": os.getenv("DB_USER", "root"),  # Tên người dùng database
+    "password": os.getenv("DB_PASSWORD", "1234"),  # Mật khẩu database
+    "database": os.getenv("DB_NAME", "lms"),  # Tên database
+    # Có thể thêm các cấu hình khác nếu cần, ví dụ: port, charset='utf8mb4'
+}
+
+# --- Cấu hình Connection Pool ---
+# - DB_POOL_SIZE: Số kết nối tối đa được mở đồng thời tới MySQL.
+# - DB_POOL_TIMEOUT: Số giây tối đa chờ khi pool đã hết kết nối rảnh.
+# - DB_POOL_PING_INTERVAL: Kết nối rảnh lâu hơn số giây này sẽ được ping
+#   (health-check) trước khi cho mượn. Đặt 0 để luôn ping.
+pool_config = {
+    "size": int(os.getenv("DB_POOL_SIZE", "10")),
+    "timeout": float(os.getenv("DB_POOL_TIMEOUT", "5")),
+    "ping_interval": float(os.getenv("DB_POOL_PING_INTERVAL", "30")),
+}
+
+# --- Cấu hình retry transaction (xem `retry_on_deadlock`) ---
+# - DB_RETRY_ATTEMPTS: Số lần chạy tối đa (tính cả lần đầu) khi gặp deadlock/lock wait timeout.
+# - DB_RETRY_BACKOFF: Thời gian chờ cơ sở (giây); lần thứ n chờ ngẫu nhiên trong [0, backoff * 2^(n-1)].
+retry_config = {
+    "attempts": max(1, int(os.getenv("DB_RETRY_ATTEMPTS", "3"))),
+    "backoff": float(os.getenv("DB_RETRY_BACKOFF", "0.05")),
+}
+
+# Lỗi tạm thời: MySQL đã hủy (deadlock) hoặc bỏ dở (lock wait timeout) câu lệnh,
+# chạy lại cả transaction thường sẽ thành công
+RETRYABLE_ERRNOS = (errorcode.ER_LOCK_DEADLOCK, errorcode.ER_LOCK_WAIT_TIMEOUT)
+
+
+# =========================================================
+# LỚP LỖI: PoolTimeoutError
+# Kế thừa PoolError của mysql.connector để các khối
+# `except mysql.connector.Error` hiện có vẫn bắt được.
+# =========================================================
+class PoolTimeoutError(mysql_errors.PoolError):
+    """Không lấy được kết nối từ pool trong thời gian cho phép."""
+
+
+# =========================================================
+# CLASS: ConnectionPool
+# Pool kết nối MySQL có giới hạn kích thước, thời gian chờ
+# và kiểm tra sức khỏe kết nối khi cho mượn.
+# =========================================================
+class ConnectionPool:
+    """
+    Quản lý một tập kết nối MySQL dùng lại được.
+    - `acquire()`: Mượn một kết nối (tạo mới nếu chưa đủ `size`), chờ tối đa `timeout` giây.
+    - `release(conn)`: Trả kết nối về pool (rollback phần việc chưa commit).
+    """
+
+    def __init__(self, size, timeout, ping_interval, **connect_args):
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self._connect_args = connect_args
+        # Semaphore giới hạn tổng số kết nối đang được mượn
+        self._slots = threading.BoundedSemaphore(self.size)
+        # LIFO: ưu tiên dùng lại kết nối vừa trả (còn "nóng"), kết nối cũ tự hết hạn
+        self._idle = queue.LifoQueue()
+
+    def _connect(self):
+        """Mở một kết nối vật lý mới tới MySQL."""
+        return mysql.connector.connect(**self._connect_args)
+
+    def _is_healthy(self, conn, idle_since):
+        """Ping kết nối nếu nó đã rảnh quá `ping_interval` giây."""
+        if time.monotonic() - idle_since < self.ping_interval:
+            return True
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except mysql.connector.Error:
+            return False
+
+    def acquire(self, wait=True):
+        """
+        Mượn một kết nối từ pool.
+        Ném PoolTimeoutError nếu không có kết nối nào rảnh sau `timeout` giây.
+        `wait=False`: không chờ, trả về None ngay nếu pool đã hết chỗ.
+        """
+        if not wait:
+            if not self._slots.acquire(blocking=False):
+                return None
+        elif not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeoutError(
+                f"Hết kết nối CSDL trong pool (size={self.size}, timeout={self.timeout}s)."
+            )
+        try:
+            while True:
+                try:
+                    conn, idle_since = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._connect()  # Pool chưa đủ kết nối -> mở mới
+                if self._is_healthy(conn, idle_since):
+                    return conn
+                # Kết nối hỏng (MySQL đã đóng do wait_timeout...) -> bỏ đi, thử cái khác
+                try:
+                    conn.close()
+                except mysql.connector.Error:
+                    pass
+        except Exception:
+            self._slots.release()  # Không giữ chỗ nếu mở kết nối thất bại
+            raise
+
+    def release(self, conn):
+        """Trả kết nối về pool. Phần việc chưa commit sẽ bị rollback."""
+        try:
+            if conn.is_connected():
+                if conn.in_transaction:
+                    conn.rollback()
+                self._idle.put((conn, time.monotonic()))
+            else:
+                conn.close()
+        except mysql.connector.Error:
+            # Kết nối lỗi khi dọn dẹp -> bỏ đi, lần mượn sau sẽ mở kết nối mới
+            try:
+                conn.close()
+            except mysql.connector.Error:
+                pass
+        finally:
+            self._slots.release()
+
+
+# =========================================================
+# CLASS: InstrumentedCursor
+# Lớp bọc cursor: đo thời gian mỗi lệnh execute, đếm số dòng
+# trả về và ghi vào bộ thu thập của request (query_stats).
+# =========================================================
+_READ_ONLY_PREFIXES = ("SELECT", "SHOW", "EXPLAIN", "WITH", "DESCRIBE")
+
+
+class InstrumentedCursor:
+    """Proxy quanh cursor của mysql.connector, ghi nhận từng truy vấn."""
+
+    def __init__(self, cursor, owner, collector):
+        self._cursor = cursor
+        self._owner = owner  # PooledConnection sở hữu cursor (để đánh dấu có lệnh ghi)
+        self._collector = collector
+        self._entry = None  # Bản ghi của truy vấn gần nhất (cập nhật số dòng khi fetch)
+
+    def _track(self, operation, started):
+        head = str(operation).lstrip(" \t\r\n(").upper()
+        if not head.startswith(_READ_ONLY_PREFIXES):
+            self._owner._dirty = True  # Lệnh ghi -> transaction đang có thay đổi chưa commit
+        if self._collector is None:
+            return
+        rows = 0 if getattr(self._cursor, "description", None) else max(self._cursor.rowcount or 0, 0)
+        self._entry = self._collector.record(operation, time.perf_counter() - started, rows)
+
+    def _count_rows(self, n):
+        if self._entry is not None and n:
+            self._entry["rows"] += n
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            self._track(operation, started)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            self._track(operation, started)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        self._count_rows(1 if row is not None else 0)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._count_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._count_rows(len(rows))
+        return rows
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._count_rows(1)
+            yield row
+
+    def __getattr__(self, name):
+        # rowcount, lastrowid, description, close, ... chuyển thẳng cho cursor gốc
+        return getattr(self._cursor, name)
+
+
+# =========================================================
+# CLASS: PooledConnection
+# Lớp bọc (proxy) quanh kết nối mysql.connector được mượn từ pool.
+# Giữ nguyên giao diện cũ (cursor, commit, rollback, close, ...)
+# để các route hiện có không cần thay đổi.
+# =========================================================
+class PooledConnection:
+    """
+    Proxy quanh một kết nối vật lý của pool.
+    - Mỗi lần `get_db_connection()` trả về proxy sẽ tăng bộ đếm sử dụng;
+      mỗi lần `close()` giảm bộ đếm.
+    - Khi bộ đếm về 0: phần việc chưa commit bị rollback (giống hành vi
+      đóng kết nối cũ). Nếu kết nối gắn với request, nó được giữ lại cho
+      các lần gọi sau trong cùng request và chỉ trả về pool ở teardown;
+      ngược lại nó được trả về pool ngay.
+    """
+
+    def __init__(self, pool, raw_conn, request_bound=False, collector=None):
+        self._pool = pool
+        self._conn = raw_conn
+        self._request_bound = request_bound
+        self._collector = collector  # Bộ thu thập query_stats của request (nếu có)
+        self._users = 0  # Số nơi đang "mở" kết nối này
+        self._dirty = False  # Đã có lệnh ghi chưa commit hay chưa
+
+    # --- Các phương thức được bọc lại ---
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(
+            self._conn.cursor(*args, **kwargs), self, self._collector
+        )
+
+    def start_transaction(self, *args, **kwargs):
+        # Kết nối dùng chung có thể còn transaction ngầm định do một lệnh SELECT
+        # trước đó (autocommit tắt). Nếu chưa có lệnh ghi nào thì kết thúc nó để
+        # START TRANSACTION không báo lỗi "Transaction already in progress".
+        if self._conn.in_transaction and not self._dirty:
+            self._conn.rollback()
+        self._dirty = True
+        return self._conn.start_transaction(*args, **kwargs)
+
+    def commit(self):
+        self._conn.commit()
+        self._dirty = False
+
+    def rollback(self):
+        self._conn.rollback()
+        self._dirty = False
+
+    def is_connected(self):
+        """
+        True cho tới khi kết nối được trả về pool, KỂ CẢ khi kết nối vật lý đã bị
+        MySQL đóng (wait_timeout, khởi động lại...). Nhờ vậy mẫu quen thuộc
+        `if conn and conn.is_connected(): conn.close()` luôn trả lại chỗ trong pool;
+        kết nối hỏng được ConnectionPool.release bỏ đi.
+        """
+        return self._conn is not None
+
+    def close(self):
+        """Kết thúc một lượt sử dụng (không đóng kết nối vật lý)."""
+        if self._conn is None:
+            return
+        self._users = max(0, self._users - 1)
+        if self._users > 0:
+            return
+        if self._request_bound:
+            try:
+                if self._conn.in_transaction:
+                    self.rollback()
+            except mysql.connector.Error:
+                pass
+        else:
+            self._release()
+
+    def _release(self):
+        """Trả kết nối vật lý về pool (chỉ gọi một lần)."""
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+    def __getattr__(self, name):
+        # Các thuộc tính/phương thức khác (in_transaction, cmd_query, ...) chuyển thẳng
+        if self._conn is None:
+            raise mysql_errors.OperationalError("Kết nối đã được trả về pool.")
+        return getattr(self._conn, name)
+
+
+# Pool dùng chung cho cả tiến trình, được tạo khi cần lần đầu
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Trả về pool kết nối của tiến trình (tạo lười khi gọi lần đầu)."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(**pool_config, **db_config)
+    return _pool
+
+
+# =========================================================
+# HÀM: GET_POOLED_CONNECTION
+# Mượn một kết nối RIÊNG (không gắn với request) từ pool.
+# =========================================================
+def get_pooled_connection(collector=None, wait=True):
+    """
+    Mượn một kết nối riêng từ pool, không dùng chung với request hiện tại.
+    Dùng cho các tác vụ chạy song song hoặc script chạy ngoài Flask.
+    `collector`: bộ thu thập query_stats cần ghi vào (mặc định: của request
+    hiện tại; truyền vào khi gọi từ thread khác không có ngữ cảnh request).
+    `wait=False`: trả về None ngay nếu pool không còn chỗ trống (thay vì chờ).
+    Nơi gọi PHẢI gọi `close()` đúng một lần (thường trong khối finally) để trả
+    kết nối về pool, kể cả khi kết nối đã hỏng: `close()` luôn trả lại chỗ trong
+    pool và `is_connected()` trả về True cho tới lúc đó (xem PooledConnection).
+    """
+    pool = get_pool()
+    if collector is None:
+        collector = current_collector()
+    raw_conn = pool.acquire(wait=wait)
+    if raw_conn is None:
+        return None
+    conn = PooledConnection(pool, raw_conn, collector=collector)
+    conn._users = 1
+    return conn
+
+
+# =========================================================
+# HÀM: GET_DB_CONNECTION
+# Trả về kết nối CSDL của request hiện tại (lấy từ pool).
+# =========================================================
+def get_db_connection():
+    """
+    Lấy kết nối CSDL.
+    - Trong ngữ cảnh Flask: trả về kết nối gắn với `g` (mượn từ pool ở lần gọi
+      đầu tiên của request), các lần gọi sau trong cùng request dùng lại nó.
+    - Ngoài Flask (script): mượn một kết nối riêng từ pool.
+    Trả về: Đối tượng PooledConnection (giao diện giống kết nối mysql.connector).
+    Lưu ý: Nơi gọi vẫn gọi `conn.close()` trong khối finally như trước; với kết nối
+           gắn request, kết nối vật lý chỉ được trả về pool ở teardown.
+    """
+    if not has_app_context():
+        return get_pooled_connection()
+
+    conn = g.get("db_conn")
+    if conn is None or conn._conn is None:
+        pool = get_pool()
+        conn = PooledConnection(
+            pool, pool.acquire(), request_bound=True, collector=current_collector()
+        )
+        g.db_conn = conn
+    conn._users += 1
+    return conn
+
+
+# =========================================================
+# HÀM: CLOSE_REQUEST_CONNECTION (teardown handler)
+# Trả kết nối của request về pool khi request kết thúc.
+# =========================================================
+def close_request_connection(exception=None):
+    """Teardown handler: rollback phần việc dang dở và trả kết nối về pool."""
+    conn = g.pop("db_conn", None)
+    if conn is not None:
+        conn._release()
+
+
+# =========================================================
+# RETRY TRANSACTION KHI DEADLOCK / LOCK WAIT TIMEOUT
+# Các route ghi dữ liệu tự bắt mysql.connector.Error, rollback rồi trả lỗi.
+# Để được chạy lại, khối except của route gọi `should_retry(err)` và ném
+# lại lỗi nếu kết quả là True:
+#
+#     @admin_bp.route(...)
+#     @login_required
+#     @retry_on_deadlock
+#     def route():
+#         ...
+#         except mysql.connector.Error as err:
+#             if conn:
+#                 conn.rollback()
+#             if should_retry(err):
+#                 raise  # retry_on_deadlock chạy lại cả route
+#             ...  # Xử lý lỗi như cũ (chỉ khi hết lượt thử hoặc lỗi khác)
+#
+# Route được chạy lại từ đầu sau khi khối finally đã đóng cursor/kết nối, nên
+# toàn bộ transaction (kể cả các câu SELECT kiểm tra) được thực hiện lại.
+# =========================================================
+def is_retryable(err):
+    """Lỗi CSDL tạm thời (deadlock / lock wait timeout) có thể chạy lại transaction."""
+    return getattr(err, "errno", None) in RETRYABLE_ERRNOS
+
+
+def should_retry(err):
+    """
+    Gọi trong khối except của route có `@retry_on_deadlock`.
+    True nếu `err` là lỗi tạm thời và còn lượt thử (route nên `raise` lại lỗi);
+    False nếu không phải lỗi tạm thời, đã hết lượt thử hoặc route không có decorator.
+    """
+    state = g.get("db_retry") if has_request_context() else None
+    if state is None or not is_retryable(err):
+        return False
+    if state["attempt"] >= state["attempts"]:
+        record_retry(request.endpoint, "exhausted")
+        print(f"!!! Lỗi CSDL tạm thời sau {state['attempt']} lần thử ({request.endpoint}): {err}")
+        return False
+    return True
+
+
+def retry_on_deadlock(view):
+    """
+    Decorator cho route ghi dữ liệu: chạy lại route (tối đa DB_RETRY_ATTEMPTS lần)
+    khi nó ném lại lỗi deadlock / lock wait timeout, chờ ngẫu nhiên (jitter) tăng
+    dần giữa các lần. Đặt ngay trên hàm route (dưới login_required/admin_required).
+    """
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        state = {"attempt": 1, "attempts": retry_config["attempts"]}
+        previous = g.get("db_retry")
+        g.db_retry = state
+        # Thông báo flash của lần chạy lỗi không được hiển thị lại
+        flashes = list(session.get("_flashes", []))
+        try:
+            while True:
+                try:
+                    return view(*args, **kwargs)
+                except mysql.connector.Error as err:
+                    if not is_retryable(err) or state["attempt"] >= state["attempts"]:
+                        raise
+                    record_retry(request.endpoint, "retry")
+                    delay = random.uniform(0, retry_config["backoff"] * 2 ** (state["attempt"] - 1))
+                    print(
+                        f"!!! Lỗi CSDL tạm thời ({err.errno}) ở {request.endpoint}, "
+                        f"chạy lại lần {state['attempt'] + 1} sau {delay * 1000:.0f} ms"
+                    )
+                    time.sleep(delay)
+                    state["attempt"] += 1
+                    if session.get("_flashes", []) != flashes:
+                        session["_flashes"] = list(flashes)
+        finally:
+            g.db_retry = previous
+
+    return wrapper
+
+
+def init_db(app):
+    """Đăng ký teardown handler trả kết nối CSDL về pool cho ứng dụng Flask."""
+    app.teardown_appcontext(close_request_connection)
@@ -0,0 +1,127 @@
+# app_logic/export.py
+# =========================================================
+# FILE EXPORT (Xuất dữ liệu CSV / JSON Lines)
+# Xuất bảng MuonTra, ThanhVien, Sach ra file cho nhân viên thư viện.
+# Dữ liệu được stream thẳng từ MySQL xuống trình duyệt:
+#
+# - Dùng cursor KHÔNG buffer (server-side): MySQL gửi dòng tới đâu đọc tới đó,
+#   mỗi lần chỉ giữ EXPORT_BATCH_SIZE dòng trong bộ nhớ dù bảng lớn đến đâu.
+# - Response là một generator: kết nối riêng chỉ được mượn từ pool khi bắt đầu
+#   gửi dữ liệu và được trả lại ngay khi gửi xong (hoặc khi client ngắt kết nối),
+#   không dùng kết nối gắn với request.
+# =========================================================
+
+import csv  # Ghi dòng CSV (escape dấu phẩy, dấu nháy, xuống dòng)
+import datetime  # Định dạng cột ngày tháng
+import decimal  # Cột tiền phạt (DECIMAL)
+import io  # Bộ đệm chuỗi cho csv.writer
+import json  # Ghi dòng JSON Lines
+import os  # Đọc biến môi trường
+import mysql.connector  # Để xử lý lỗi CSDL MySQL
+from flask import Response, stream_with_context  # Trả về file dạng stream
+from app_logic.db import get_pooled_connection  # Kết nối riêng cho thời gian stream
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))  # Số dòng đọc (và gửi) mỗi lần
+
+# Định dạng -> (content type, đuôi file)
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson; charset=utf-8", "jsonl"),
+}
+
+# Ký tự đầu ô khiến Excel hiểu là công thức (chống CSV injection)
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _to_text(value):
+    """Giá trị một ô CSV: ngày theo ISO, chuỗi bắt đầu bằng ký tự công thức được thêm dấu nháy."""
+    if value is None:
+        return ""
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _json_default(value):
+    """Kiểu không tuần tự hóa được bằng json (ngày tháng, DECIMAL)."""
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return str(value)
+
+
+def _encode_csv(rows, columns, header=False):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow([title for _, title in columns])
+    for row in rows:
+        writer.writerow([_to_text(row[key]) for key, _ in columns])
+    return buffer.getvalue()
+
+
+def _encode_ndjson(rows, columns):
+    return "".join(
+        json.dumps({key: row[key] for key, _ in columns}, ensure_ascii=False, default=_json_default) + "\n"
+        for row in rows
+    )
+
+
+# =========================================================
+# STREAM DỮ LIỆU
+# =========================================================
+def iter_export(query, params, columns, fmt, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Generator trả về từng đoạn văn bản của file xuất.
+    - `query` / `params`: câu SELECT (nên ORDER BY khóa chính để MySQL không phải sắp xếp).
+    - `columns`: list (tên cột trong kết quả, tiêu đề cột CSV).
+    - `fmt`: 'csv' (có BOM UTF-8 để Excel đọc đúng tiếng Việt) hoặc 'ndjson'.
+    """
+    conn = None
+    cursor = None
+    try:
+        conn = get_pooled_connection()
+        # buffered=False: đọc kết quả theo luồng thay vì tải hết vào bộ nhớ
+        cursor = conn.cursor(dictionary=True, buffered=False)
+        cursor.execute(query, tuple(params))
+        if fmt == "csv":
+            yield "\ufeff" + _encode_csv([], columns, header=True)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield _encode_csv(rows, columns) if fmt == "csv" else _encode_ndjson(rows, columns)
+    except mysql.connector.Error as err:
+        # Header đã gửi đi, không thể đổi mã lỗi. Ném lại để server ngắt response
+        # (không gửi chunk kết thúc): trình duyệt báo tải lỗi thay vì lưu một file
+        # thiếu dòng trông như hoàn chỉnh.
+        print(f"!!! Lỗi CSDL khi xuất dữ liệu: {err}")
+        raise
+    finally:
+        if cursor:
+            try:
+                cursor.close()
+            except mysql.connector.Error:
+                pass  # Còn dòng chưa đọc (client ngắt giữa chừng): kết nối không dùng lại được
+        if conn:
+            # Luôn trả chỗ trong pool; ConnectionPool.release bỏ kết nối còn dở kết quả
+            conn.close()
+
+
+def export_response(filename, query, params, columns, fmt):
+    """Response stream file `filename`.<đuôi> theo định dạng `fmt` (xem FORMATS)."""
+    content_type, extension = FORMATS[fmt]
+    stamp = datetime.date.today().strftime("%Y%m%d")
+    return Response(
+        stream_with_context(iter_export(query, params, columns, fmt)),
+        content_type=content_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}_{stamp}.{extension}"',
+            "X-Accel-Buffering": "no",  # Không để reverse proxy (nginx) gom cả file rồi mới gửi
+        },
+    )
@@ -0,0 +1,309 @@
+# app_logic/importer.py
+# =========================================================
+# FILE IMPORTER (Nhập danh mục sách hàng loạt)
+# Nhập file danh mục của nhà cung cấp (hàng trăm nghìn đầu sách) thay vì
+# thêm từng cuốn qua form `admin.them_sach`:
+#   python manage.py import-books catalog.csv [--dry-run]
+#   hoặc trang /admin/sach/nhap (upload file, xem tiến độ trực tiếp).
+#
+# - Định dạng: CSV (dòng đầu là tên cột) hoặc JSON Lines (mỗi dòng một
+#   object). Các cột giống form thêm sách: tieu_de, ten_tac_gia,
+#   ten_the_loai, nam_xuat_ban, so_luong, so_trang (tùy chọn), mo_ta (tùy chọn).
+# - File được đọc dần từng dòng (không nạp toàn bộ vào bộ nhớ) và xử lý
+#   theo lô IMPORT_CHUNK_SIZE dòng, mỗi lô là một transaction:
+#   1. Tác giả/thể loại của cả lô: `get_or_create_many` (vài truy vấn/lô).
+#   2. Sách trùng được gộp theo đúng 4 trường mà `them_sach` dùng: tiêu đề
+#      (collation utf8mb4_vietnamese_ci), tác giả, thể loại, năm xuất bản.
+#      Sách đã có -> cộng dồn số lượng, cập nhật số trang/mô tả nếu file có.
+#   3. Ghi bằng `executemany` (INSERT nhiều dòng một lần).
+# - Dòng lỗi (thiếu trường, sai kiểu) được bỏ qua và báo lại kèm số dòng.
+# - Chế độ chạy thử (dry_run): xử lý như thật rồi rollback từng lô. Sách
+#   lặp lại ở nhiều lô khác nhau có thể bị đếm là "thêm mới" nhiều lần.
+# =========================================================
+
+import csv  # Đọc file CSV
+import datetime  # Ngày nhập sách
+import json  # Đọc file JSON Lines
+import os  # Đọc biến môi trường
+import re  # Chuẩn hóa khoảng trắng trong tiêu đề
+import unicodedata  # Chuẩn hóa Unicode (NFC) cho tiêu đề/tên
+import mysql.connector  # Để xử lý lỗi CSDL MySQL
+from app_logic.utils import get_or_create_many  # Tra/tạo tác giả, thể loại theo lô
+from app_logic.book_detail import invalidate_book_detail  # Cache trang chi tiết sách
+from app_logic import shelves as home_shelves  # Cache kệ sách trang chủ
+from app_logic.reference import invalidate_reference  # Cache danh mục tác giả/thể loại
+
+# Số dòng mỗi lô (mỗi lô một transaction)
+CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+MAX_REPORTED_ERRORS = 50  # Số dòng lỗi tối đa được liệt kê trong kết quả
+
+# Đuôi file -> định dạng
+FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl", ".json": "jsonl"}
+
+_INSERT_SQL = """
+    INSERT INTO Sach (tieu_de, id_tac_gia, id_the_loai, nam_xuat_ban, so_luong, so_trang, anh_bia, ngay_nhap, trang_thai, mo_ta)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+# Cộng dồn giống `them_sach`: chỉ cập nhật số trang/mô tả khi file có giá trị mới
+_MERGE_SQL = """
+    UPDATE Sach SET so_luong = so_luong + %s,
+                    so_trang = IF(%s > 0, %s, so_trang),
+                    mo_ta = IF(%s <> '', %s, mo_ta),
+                    trang_thai = 'hoat_dong'
+    WHERE id_sach = %s
+"""
+
+
+# =========================================================
+# ĐỌC FILE
+# =========================================================
+def detect_format(filename):
+    """Xác định định dạng ('csv' / 'jsonl') theo đuôi file. Ném ValueError nếu không hỗ trợ."""
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext not in FORMATS:
+        raise ValueError(f"Định dạng file '{ext or filename}' không được hỗ trợ (dùng .csv hoặc .jsonl).")
+    return FORMATS[ext]
+
+
+def read_records(lines, fmt):
+    """
+    Đọc dần các bản ghi từ `lines` (file văn bản hoặc iterable các dòng).
+    Sinh ra (số dòng, dict dữ liệu, thông báo lỗi) - dữ liệu là None nếu dòng lỗi.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+
+    for line_no, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        if line_no == 1 and line.startswith("["):
+            raise ValueError("File JSON phải ở dạng JSON Lines (mỗi dòng một object), không phải một mảng.")
+        try:
+            data = json.loads(line)
+        except ValueError as err:
+            yield line_no, None, f"JSON không hợp lệ: {err}"
+            continue
+        if not isinstance(data, dict):
+            yield line_no, None, "Mỗi dòng phải là một object JSON."
+            continue
+        yield line_no, data, None
+
+
+def _text(record, key):
+    value = record.get(key)
+    return unicodedata.normalize("NFC", str(value)).strip() if value is not None else ""
+
+
+def _number(record, key, default=0):
+    value = record.get(key)
+    if value is None or str(value).strip() == "":
+        return default
+    return int(str(value).strip())
+
+
+def normalize_record(record):
+    """
+    Chuẩn hóa và kiểm tra một bản ghi theo đúng quy tắc của form thêm sách.
+    Trả về dict đã chuẩn hóa; ném ValueError kèm lý do nếu không hợp lệ.
+    """
+    try:
+        so_luong = _number(record, "so_luong")
+        nam_xuat_ban = _number(record, "nam_xuat_ban")
+        so_trang = _number(record, "so_trang")
+    except ValueError:
+        raise ValueError("nam_xuat_ban, so_luong, so_trang phải là số nguyên.")
+    sach = {
+        "tieu_de": re.sub(r"\s+", " ", _text(record, "tieu_de")),
+        "ten_tac_gia": _text(record, "ten_tac_gia"),
+        "ten_the_loai": _text(record, "ten_the_loai"),
+        "nam_xuat_ban": nam_xuat_ban,
+        "so_luong": so_luong,
+        "so_trang": max(so_trang, 0),
+        "mo_ta": _text(record, "mo_ta"),
+    }
+    if not all([sach["tieu_de"], sach["ten_tac_gia"], sach["ten_the_loai"], nam_xuat_ban, so_luong > 0]):
+        raise ValueError("Thiếu thông tin bắt buộc hoặc số lượng không hợp lệ.")
+    return sach
+
+
+# =========================================================
+# XỬ LÝ MỘT LÔ
+# =========================================================
+def _find_existing(cursor, groups):
+    """
+    Tìm sách đã có cho các nhóm trong lô bằng một truy vấn. Tiêu đề được so sánh
+    theo utf8mb4_vietnamese_ci như `them_sach`; FIELD(...) cho biết dòng khớp với
+    tiêu đề nào trong danh sách. Trả về dict {khóa nhóm: id_sach}.
+    """
+    titles = list(dict.fromkeys(key[0] for key in groups))  # Tiêu đề (chữ thường) không trùng
+    spelled = {key[0]: group["tieu_de"] for key, group in groups.items()}
+    title_params = tuple(spelled[t] for t in titles)
+    author_ids = tuple({group["id_tac_gia"] for group in groups.values()})
+
+    title_placeholders = ", ".join(["%s"] * len(title_params))
+    cursor.execute(
+        f"""SELECT id_sach, id_tac_gia, id_the_loai, nam_xuat_ban,
+                   FIELD(tieu_de COLLATE utf8mb4_vietnamese_ci, {title_placeholders}) AS vi_tri
+            FROM Sach
+            WHERE id_tac_gia IN ({", ".join(["%s"] * len(author_ids))})
+              AND tieu_de COLLATE utf8mb4_vietnamese_ci IN ({title_placeholders})
+            ORDER BY id_sach""",
+        title_params + author_ids + title_params,
+    )
+    existing = {}
+    for row in cursor.fetchall():
+        if not row["vi_tri"]:
+            continue
+        key = (titles[row["vi_tri"] - 1], row["id_tac_gia"], row["id_the_loai"], row["nam_xuat_ban"])
+        if key in groups:
+            existing.setdefault(key, row["id_sach"])  # Có nhiều bản trùng sẵn -> lấy sách cũ nhất
+    return existing
+
+
+def _import_chunk(cursor, records, created_tables=None):
+    """
+    Ghi một lô bản ghi đã chuẩn hóa (chưa commit).
+    `created_tables`: set nhận tên bảng danh mục có dòng mới (xem get_or_create_many).
+    Trả về (số sách thêm mới, số sách được cộng dồn, list id_sach được cộng dồn).
+    """
+    tac_gia = get_or_create_many(
+        cursor, "TacGia", "id_tac_gia", "ten_tac_gia", [r["ten_tac_gia"] for r in records],
+        created_tables,
+    )
+    the_loai = get_or_create_many(
+        cursor, "TheLoai", "id_the_loai", "ten_the_loai", [r["ten_the_loai"] for r in records],
+        created_tables,
+    )
+
+    # Gộp các dòng trùng trong lô (cùng khóa 4 trường) thành một nhóm
+    groups = {}
+    for r in records:
+        id_tac_gia, id_the_loai = tac_gia[r["ten_tac_gia"]], the_loai[r["ten_the_loai"]]
+        key = (r["tieu_de"].casefold(), id_tac_gia, id_the_loai, r["nam_xuat_ban"])
+        group = groups.get(key)
+        if group is None:
+            groups[key] = dict(r, id_tac_gia=id_tac_gia, id_the_loai=id_the_loai)
+            continue
+        group["so_luong"] += r["so_luong"]
+        # Dòng sau ghi đè số trang/mô tả (như khi thêm lại sách qua form)
+        if r["so_trang"] > 0:
+            group["so_trang"] = r["so_trang"]
+        if r["mo_ta"]:
+            group["mo_ta"] = r["mo_ta"]
+
+    existing = _find_existing(cursor, groups)
+    merges, inserts = [], []
+    today = datetime.date.today()
+    for key, g in groups.items():
+        if key in existing:
+            merges.append(
+                (g["so_luong"], g["so_trang"], g["so_trang"], g["mo_ta"], g["mo_ta"], existing[key])
+            )
+        else:
+            inserts.append(
+                (g["tieu_de"], g["id_tac_gia"], g["id_the_loai"], g["nam_xuat_ban"], g["so_luong"],
+                 g["so_trang"], "default_cover.jpg", today, "hoat_dong", g["mo_ta"])
+            )
+    if merges:
+        cursor.executemany(_MERGE_SQL, merges)
+    if inserts:
+        cursor.executemany(_INSERT_SQL, inserts)  # Connector gộp thành INSERT nhiều dòng
+    return len(inserts), len(merges), [m[-1] for m in merges]
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# =========================================================
+# HÀM: NHẬP FILE
+# =========================================================
+def iter_import(conn, lines, fmt, chunk_size=CHUNK_SIZE, dry_run=False, id_admin=None):
+    """
+    Nhập các bản ghi từ `lines` theo lô, sinh ra dict thống kê sau mỗi lô (để báo
+    tiến độ) và một lần cuối với `xong=True`:
+    {dong, them_moi, cong_don, loi, chi_tiet_loi: [[số dòng, lý do]], dry_run, xong}.
+    Lỗi CSDL: rollback lô hiện tại và ném lại lỗi (các lô trước đã được commit).
+    `id_admin`: nếu có, ghi một dòng AdminLog tóm tắt khi nhập xong.
+    """
+    stats = {
+        "dong": 0, "them_moi": 0, "cong_don": 0, "loi": 0,
+        "chi_tiet_loi": [], "dry_run": dry_run, "xong": False,
+    }
+    merged_ids = set()
+
+    def valid_records():
+        for line_no, data, error in read_records(lines, fmt):
+            stats["dong"] += 1
+            if data is not None:
+                try:
+                    yield normalize_record(data)
+                    continue
+                except ValueError as err:
+                    error = str(err)
+            stats["loi"] += 1
+            if len(stats["chi_tiet_loi"]) < MAX_REPORTED_ERRORS:
+                stats["chi_tiet_loi"].append([line_no, error])
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        for chunk in _chunks(valid_records(), chunk_size):
+            conn.commit()  # Kết thúc transaction đọc ngầm (nếu có) trước khi bắt đầu lô mới
+            conn.start_transaction()
+            danh_muc_moi = set()
+            try:
+                them_moi, cong_don, ids = _import_chunk(cursor, chunk, danh_muc_moi)
+                if dry_run:
+                    conn.rollback()
+                else:
+                    conn.commit()
+                    merged_ids.update(ids)
+                    for table in danh_muc_moi:
+                        invalidate_reference(table)  # Tác giả/thể loại mới (sau commit)
+            except mysql.connector.Error:
+                conn.rollback()
+                raise
+            stats["them_moi"] += them_moi
+            stats["cong_don"] += cong_don
+            yield dict(stats)
+
+        if not dry_run and (stats["them_moi"] or stats["cong_don"]):
+            if id_admin is not None:
+                cursor.execute(
+                    "INSERT INTO AdminLog (id_admin, hanh_dong) VALUES (%s, %s)",
+                    (id_admin, f"Nhập danh mục: thêm {stats['them_moi']} sách mới, "
+                               f"cộng dồn {stats['cong_don']} sách ({stats['loi']} dòng lỗi)"),
+                )
+                conn.commit()
+            for id_sach in merged_ids:
+                invalidate_book_detail(id_sach)  # Số lượng/mô tả đã đổi
+            home_shelves.invalidate_shelves()  # Kệ "Mới nhất" có sách mới
+    finally:
+        cursor.close()
+
+    stats["xong"] = True
+    yield stats
+
+
+def import_books(conn, lines, fmt, progress=None, **kwargs):
+    """
+    Nhập toàn bộ file (xem iter_import). `progress(stats)` được gọi sau mỗi lô.
+    Trả về dict thống kê cuối cùng.
+    """
+    stats = None
+    for stats in iter_import(conn, lines, fmt, **kwargs):
+        if progress and not stats["xong"]:
+            progress(stats)
+    return stats
@@ -0,0 +1,166 @@
+# app_logic/memory_index.py
+# =========================================================
+# FILE MEMORY INDEX (Khung chung cho chỉ mục sách trong bộ nhớ)
+# Phần dùng chung của search_index.BookSearchIndex và
+# related.RelatedBooksIndex: xây toàn bộ chỉ mục từ CSDL, xây lại định kỳ
+# ở thread nền, cập nhật từng sách sau khi admin sửa, và ghi nhớ các thay
+# đổi phát sinh trong lúc đang xây lại để áp dụng lại.
+#
+# - Chỉ MỘT thread đọc CSDL để xây chỉ mục tại một thời điểm (single-flight):
+#   khi tiến trình vừa khởi động (chưa có chỉ mục), các request đồng thời chờ
+#   lần xây đang chạy thay vì mỗi request tự đọc toàn bộ danh mục sách trên
+#   một kết nối riêng của pool.
+# - Lớp con khai báo BOOK_QUERY, REBUILD_INTERVAL, LABEL và cài đặt
+#   _to_book / _add / _discard / _adopt (abstractmethod: lớp con thiếu một
+#   trong số đó báo TypeError ngay khi khởi tạo, không đợi tới lần xây đầu).
+# =========================================================
+
+import abc  # Lớp cơ sở trừu tượng
+import threading  # Khóa và thread xây lại chỉ mục ở nền
+import time  # Thời điểm xây chỉ mục
+import mysql.connector  # Để xử lý lỗi CSDL MySQL
+from app_logic.db import get_db_connection, get_pooled_connection
+
+
+class InMemoryBookIndex(abc.ABC):
+    """Lớp cơ sở: xây/xây lại/cập nhật từng sách. Mọi thao tác đều thread-safe."""
+
+    BOOK_QUERY = None  # SELECT dữ liệu sách (đã có WHERE, refresh_book nối thêm "AND s.id_sach = %s")
+    REBUILD_INTERVAL = 600.0  # Số giây tối đa giữa hai lần xây lại toàn bộ
+    LABEL = "chỉ mục"  # Tên dùng trong thông báo lỗi
+
+    def __init__(self):
+        self._lock = threading.RLock()  # Bảo vệ dữ liệu chỉ mục
+        self._build_lock = threading.Lock()  # Chỉ một thread xây chỉ mục tại một thời điểm
+        self._built_at = None  # Thời điểm (monotonic) xây xong gần nhất
+        self._rebuilding = False  # Đang xây lại
+        self._pending = []  # Thay đổi phát sinh trong lúc xây lại (áp dụng lại sau)
+
+    # -----------------------------------------------------
+    # Lớp con cài đặt (_add/_discard/_adopt được gọi khi giữ lock)
+    # -----------------------------------------------------
+    @staticmethod
+    @abc.abstractmethod
+    def _to_book(row):
+        """Chuyển một dòng của BOOK_QUERY thành dữ liệu sách của chỉ mục."""
+
+    @abc.abstractmethod
+    def _add(self, book):
+        """Thêm (hoặc thay) một sách trong chỉ mục."""
+
+    @abc.abstractmethod
+    def _discard(self, id_sach):
+        """Bỏ một sách khỏi chỉ mục (không lỗi nếu chưa có)."""
+
+    @abc.abstractmethod
+    def _adopt(self, fresh):
+        """Thay dữ liệu chỉ mục hiện tại bằng dữ liệu của chỉ mục `fresh` vừa xây."""
+
+    def _load(self, rows):
+        """Nạp toàn bộ sách vào chỉ mục mới (lớp con có thể tối ưu cho việc nạp hàng loạt)."""
+        for row in rows:
+            self._add(self._to_book(row))
+
+    # -----------------------------------------------------
+    # Xây toàn bộ chỉ mục
+    # -----------------------------------------------------
+    def rebuild(self):
+        """Đọc toàn bộ sách đang hoạt động và thay thế chỉ mục hiện tại."""
+        with self._build_lock:
+            self._rebuild_locked()
+
+    def _rebuild_locked(self):
+        with self._lock:
+            self._rebuilding = True
+            self._pending = []
+        try:
+            fresh = type(self)()
+            conn = None
+            cursor = None
+            try:
+                # Kết nối riêng: có thể chạy ở thread nền, ngoài request
+                conn = get_pooled_connection()
+                cursor = conn.cursor(dictionary=True)
+                cursor.execute(self.BOOK_QUERY)
+                fresh._load(cursor)
+            finally:
+                if cursor:
+                    cursor.close()
+                if conn and conn.is_connected():
+                    conn.close()
+
+            with self._lock:
+                self._adopt(fresh)
+                # Áp dụng lại các thay đổi xảy ra trong lúc đang đọc CSDL
+                for id_sach, book in self._pending:
+                    if book is None:
+                        self._discard(id_sach)
+                    else:
+                        self._add(book)
+                self._built_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._rebuilding = False
+                self._pending = []
+
+    def _rebuild_in_background(self):
+        try:
+            self.rebuild()
+        except mysql.connector.Error as err:
+            print(f"!!! Lỗi DB khi xây lại {self.LABEL}: {err}")
+
+    def ensure_built(self):
+        """
+        Xây chỉ mục nếu chưa có (đồng bộ; các thread khác chờ lần xây này thay vì
+        tự xây). Nếu chỉ mục đã cũ hơn REBUILD_INTERVAL, xây lại ở thread nền và
+        tạm dùng chỉ mục hiện tại.
+        """
+        with self._lock:
+            built_at = self._built_at
+            if built_at is not None:
+                if self._rebuilding or time.monotonic() - built_at < self.REBUILD_INTERVAL:
+                    return
+                self._rebuilding = True  # Đánh dấu ngay để chỉ một thread khởi động việc xây lại
+        if built_at is None:
+            with self._build_lock:
+                if self._built_at is None:  # Thread khác vừa xây xong trong lúc chờ khóa
+                    self._rebuild_locked()
+        else:
+            threading.Thread(target=self._rebuild_in_background, daemon=True).start()
+
+    # -----------------------------------------------------
+    # Cập nhật từng sách (gọi sau khi commit)
+    # -----------------------------------------------------
+    def refresh_book(self, id_sach):
+        """Đọc lại một sách từ CSDL và cập nhật chỉ mục (xóa khỏi chỉ mục nếu sách đã ẩn)."""
+        conn = None
+        cursor = None
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(f"{self.BOOK_QUERY} AND s.id_sach = %s", (id_sach,))
+            row = cursor.fetchone()
+        except mysql.connector.Error as err:
+            # Không chặn thao tác của admin; lần xây lại định kỳ sẽ đồng bộ
+            print(f"!!! Lỗi DB khi cập nhật {self.LABEL} cho sách {id_sach}: {err}")
+            return
+        finally:
+            if cursor:
+                cursor.close()
+            if conn and conn.is_connected():
+                conn.close()
+        book = self._to_book(row) if row else None
+        with self._lock:
+            if self._rebuilding:
+                self._pending.append((id_sach, book))
+            if book is None:
+                self._discard(id_sach)
+            else:
+                self._add(book)
+
+    def remove_book(self, id_sach):
+        """Xóa một sách khỏi chỉ mục (vd: sách vừa bị ẩn)."""
+        with self._lock:
+            if self._rebuilding:
+                self._pending.append((id_sach, None))
+            self._discard(id_sach)
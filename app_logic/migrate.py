@@ -0,0 +1,171 @@
+# app_logic/migrate.py
+# =========================================================
+# FILE MIGRATE (Chạy migration lược đồ CSDL)
+# Áp dụng các file SQL trong thư mục `migrations/` theo thứ tự phiên bản
+# và ghi lại phiên bản đã áp dụng trong bảng `SchemaMigration`.
+#
+# Quy ước tên file: NNNN_ten_migration.up.sql / NNNN_ten_migration.down.sql
+# (NNNN là số phiên bản, ví dụ 0002_hot_query_indexes.up.sql).
+#
+# - Idempotent: chạy lại `migrate` chỉ áp dụng các phiên bản chưa có trong
+#   SchemaMigration. DDL của MySQL không nằm trong transaction, nên nếu một
+#   migration dừng giữa chừng, lần chạy lại sẽ bỏ qua các chỉ mục đã tồn tại
+#   (hoặc đã bị xóa khi rollback) thay vì báo lỗi.
+# - Dùng qua dòng lệnh: python manage.py migrate | rollback | status
+# =========================================================
+
+import hashlib  # Checksum nội dung file migration
+import os  # Đường dẫn thư mục migrations
+import re  # Phân tích tên file migration
+import mysql.connector  # Để xử lý lỗi CSDL MySQL
+from mysql.connector import errorcode  # Mã lỗi MySQL (chỉ mục đã tồn tại/không tồn tại)
+
+# Thư mục chứa các file migration (cạnh thư mục app_logic)
+MIGRATIONS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations"
+)
+
+_RE_MIGRATION_FILE = re.compile(r"^(\d{4})_([\w\-]+)\.(up|down)\.sql$")
+
+# Lỗi được bỏ qua khi chạy lại một migration đã áp dụng một phần
+_IGNORED_ERRORS = {
+    "up": {errorcode.ER_DUP_KEYNAME},  # Chỉ mục đã tồn tại
+    "down": {errorcode.ER_CANT_DROP_FIELD_OR_KEY},  # Chỉ mục không tồn tại
+}
+
+_CREATE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS SchemaMigration (
+        phien_ban VARCHAR(16) NOT NULL,
+        ten VARCHAR(255) NOT NULL,
+        checksum CHAR(40) NOT NULL,
+        thoi_gian TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (phien_ban)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+
+# =========================================================
+# ĐỌC FILE MIGRATION
+# =========================================================
+def list_migrations(directory=MIGRATIONS_DIR):
+    """
+    Trả về danh sách migration sắp theo phiên bản, mỗi phần tử là dict
+    {version, name, up, down} (up/down là đường dẫn file, down có thể None).
+    """
+    migrations = {}
+    for filename in sorted(os.listdir(directory)):
+        match = _RE_MIGRATION_FILE.match(filename)
+        if not match:
+            continue
+        version, name, direction = match.groups()
+        item = migrations.setdefault(
+            version, {"version": version, "name": name, "up": None, "down": None}
+        )
+        item[direction] = os.path.join(directory, filename)
+    return [m for _, m in sorted(migrations.items()) if m["up"]]
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def split_statements(sql):
+    """Tách nội dung file SQL thành các câu lệnh (bỏ dòng chú thích '--')."""
+    lines = [
+        line for line in sql.splitlines() if not line.strip().startswith("--")
+    ]
+    return [stmt.strip() for stmt in "\n".join(lines).split(";") if stmt.strip()]
+
+
+def _checksum(path):
+    return hashlib.sha1(_read(path).encode("utf-8")).hexdigest()
+
+
+# =========================================================
+# BẢNG SchemaMigration
+# =========================================================
+def _ensure_table(cursor):
+    cursor.execute(_CREATE_TABLE_SQL)
+
+
+def applied_versions(cursor):
+    """Trả về dict {phien_ban: checksum} của các migration đã áp dụng."""
+    _ensure_table(cursor)
+    cursor.execute("SELECT phien_ban, checksum FROM SchemaMigration")
+    return {row[0]: row[1] for row in cursor.fetchall()}
+
+
+def _run_file(cursor, path, direction):
+    for statement in split_statements(_read(path)):
+        try:
+            cursor.execute(statement)
+        except mysql.connector.Error as err:
+            if err.errno not in _IGNORED_ERRORS[direction]:
+                raise
+            print(f"    (bỏ qua) {err.msg}")
+
+
+# =========================================================
+# HÀM: MIGRATE / ROLLBACK / STATUS
+# =========================================================
+def migrate(conn, target=None):
+    """
+    Áp dụng các migration chưa chạy (tới phiên bản `target` nếu có).
+    Trả về danh sách phiên bản vừa áp dụng.
+    """
+    cursor = conn.cursor()
+    done = []
+    try:
+        applied = applied_versions(cursor)
+        for m in list_migrations():
+            if target and m["version"] > target:
+                break
+            checksum = _checksum(m["up"])
+            if m["version"] in applied:
+                if applied[m["version"]] != checksum:
+                    print(f"!!! CẢNH BÁO: File migration {m['version']}_{m['name']} đã bị sửa sau khi áp dụng.")
+                continue
+            print(f"--> Áp dụng {m['version']}_{m['name']}")
+            _run_file(cursor, m["up"], "up")
+            cursor.execute(
+                "INSERT INTO SchemaMigration (phien_ban, ten, checksum) VALUES (%s, %s, %s)",
+                (m["version"], m["name"], checksum),
+            )
+            conn.commit()
+            done.append(m["version"])
+    finally:
+        cursor.close()
+    return done
+
+
+def rollback(conn, steps=1):
+    """Gỡ `steps` migration được áp dụng gần nhất. Trả về danh sách phiên bản đã gỡ."""
+    cursor = conn.cursor()
+    done = []
+    try:
+        applied = applied_versions(cursor)
+        by_version = {m["version"]: m for m in list_migrations()}
+        for version in sorted(applied, reverse=True)[:steps]:
+            m = by_version.get(version)
+            if m is None or not m["down"]:
+                raise RuntimeError(f"Không tìm thấy file .down.sql cho phiên bản {version}.")
+            print(f"<-- Gỡ {m['version']}_{m['name']}")
+            _run_file(cursor, m["down"], "down")
+            cursor.execute("DELETE FROM SchemaMigration WHERE phien_ban = %s", (version,))
+            conn.commit()
+            done.append(version)
+    finally:
+        cursor.close()
+    return done
+
+
+def status(conn):
+    """Trả về list (phien_ban, ten, da_ap_dung) của mọi migration."""
+    cursor = conn.cursor()
+    try:
+        applied = applied_versions(cursor)
+        conn.commit()
+    finally:
+        cursor.close()
+    return [(m["version"], m["name"], m["version"] in applied) for m in list_migrations()]
@@ -11,6 +11,12 @@ from flask_login import (
 )
 import mysql  # Lớp cơ sở (mixin) cung cấp các thuộc tính và phương thức cần thiết cho Flask-Login (is_authenticated, is_active, etc.)
 from app_logic.db import get_db_connection  # Nhập hàm tạo kết nối CSDL
+from app_logic.cache import get_cache, cache_config  # Cache thông tin người dùng
+
+# Cache dữ liệu ThanhVien theo id (dùng bởi User.get / load_user_callback)
+_user_cache = get_cache(
+    "user", maxsize=cache_config["user_size"], ttl=cache_config["user_ttl"]
+)
 
 
 # =========================================================
@@ -41,17 +47,41 @@ class User(UserMixin):
         )
         self.trang_thai = trang_thai  # Trạng thái ('hoat_dong' hoặc 'da_khoa')
 
+    # -----------------------------------------------------
+    # Phương thức tĩnh: from_row
+    # Tạo đối tượng User từ một bản ghi ThanhVien (dict).
+    # -----------------------------------------------------
+    @staticmethod
+    def from_row(user_data):
+        """Tạo đối tượng User từ dict dữ liệu của bảng ThanhVien."""
+        # Xử lý trường hợp avatar là NULL trong CSDL -> dùng ảnh mặc định
+        avatar_path = user_data.get("avatar") or "default_avatar.png"
+        return User(
+            id=user_data["id_thanh_vien"],
+            ho_ten=user_data["ho_ten"],
+            email=user_data["email"],
+            vai_tro=user_data["vai_tro"],
+            avatar=avatar_path,
+            trang_thai=user_data["trang_thai"],
+        )
+
     # -----------------------------------------------------
     # Phương thức tĩnh: get
-    # Lấy thông tin người dùng từ CSDL dựa trên ID.
+    # Lấy thông tin người dùng dựa trên ID (ưu tiên từ cache).
     # Được sử dụng bởi `load_user_callback`.
     # -----------------------------------------------------
     @staticmethod
     def get(user_id):
         """
-        Truy vấn CSDL để lấy thông tin người dùng dựa trên user_id.
+        Lấy thông tin người dùng dựa trên user_id.
+        Dữ liệu được cache theo id (xem `_user_cache`); chỉ truy vấn CSDL khi
+        cache chưa có hoặc đã hết hạn.
         Trả về một đối tượng User nếu tìm thấy, ngược lại trả về None.
         """
+        cached = _user_cache.get(str(user_id))
+        if cached is not None:
+            return User.from_row(cached)
+
         conn = get_db_connection()
         cursor = conn.cursor(
             dictionary=True
@@ -65,18 +95,10 @@ class User(UserMixin):
             user_data = cursor.fetchone()  # Lấy một bản ghi kết quả
 
             if user_data:
-                # Nếu tìm thấy user, tạo và trả về đối tượng User
-                # Xử lý trường hợp avatar là NULL trong CSDL -> dùng ảnh mặc định
-                avatar_path = user_data.get("avatar") or "default_avatar.png"
-                return User(
-                    id=user_data["id_thanh_vien"],
-                    ho_ten=user_data["ho_ten"],
-                    email=user_data["email"],
-                    vai_tro=user_data["vai_tro"],
-                    avatar=avatar_path,
-                    trang_thai=user_data["trang_thai"],
-                )
-            # Nếu không tìm thấy user
+                # Nếu tìm thấy user, lưu vào cache rồi tạo đối tượng User
+                _user_cache.set(str(user_id), user_data)
+                return User.from_row(user_data)
+            # Nếu không tìm thấy user (không cache kết quả rỗng)
             return None
         except mysql.connector.Error as err:  # Bắt lỗi CSDL
             print(f"!!! Lỗi DB khi User.get({user_id}): {err}")
@@ -88,6 +110,16 @@ class User(UserMixin):
             if conn and conn.is_connected():
                 conn.close()
 
+    # -----------------------------------------------------
+    # Phương thức tĩnh: invalidate
+    # Xóa thông tin người dùng khỏi cache sau khi bản ghi
+    # ThanhVien thay đổi (sửa hồ sơ, khóa/mở khóa, đổi mật khẩu...).
+    # -----------------------------------------------------
+    @staticmethod
+    def invalidate(user_id):
+        """Xóa cache của người dùng `user_id` để lần tải sau đọc lại từ CSDL."""
+        _user_cache.delete(str(user_id))
+
     # -----------------------------------------------------
     # Phương thức tĩnh: get_by_email
     # Lấy thông tin người dùng từ CSDL dựa trên địa chỉ email.
@@ -0,0 +1,238 @@
+# app_logic/pagination.py
+# =========================================================
+# FILE PAGINATION (Phân trang theo khóa - keyset/seek)
+# Thay cho `LIMIT ... OFFSET ...`: thay vì bỏ qua N dòng đầu, mỗi trang
+# ghi nhớ khóa sắp xếp (+ id) của dòng đầu/cuối và trang kế tiếp chỉ
+# lấy các dòng "sau" (hoặc "trước") khóa đó. Nhờ vậy trang sâu cũng nhanh
+# như trang đầu (MySQL nhảy thẳng tới vị trí qua chỉ mục).
+#
+# Con trỏ (cursor token) gửi cho client là chuỗi base64 mờ (opaque),
+# chứa giá trị khóa và chữ ký của kiểu sắp xếp; con trỏ không hợp lệ
+# hoặc thuộc kiểu sắp xếp khác sẽ bị bỏ qua (quay về trang đầu).
+#
+# Tổng số dòng (COUNT) không còn bắt buộc cho mỗi trang: dùng
+# `cached_count` để cache kết quả đếm trong COUNT_CACHE_TTL giây.
+# =========================================================
+
+import base64  # Mã hóa con trỏ thành chuỗi an toàn trên URL
+import datetime  # Mã hóa/giải mã giá trị ngày tháng trong con trỏ
+import decimal  # Giá trị DECIMAL trả về từ MySQL
+import hashlib  # Chữ ký kiểu sắp xếp, khóa cache của COUNT
+import json  # Tuần tự hóa giá trị khóa
+import os  # Đọc biến môi trường
+from flask import request, url_for  # Tạo URL phân trang giữ nguyên bộ lọc
+from app_logic.cache import get_cache  # Cache kết quả COUNT
+
+# Số giây cache kết quả đếm tổng số dòng của danh sách
+COUNT_CACHE_TTL = float(os.getenv("COUNT_CACHE_TTL", "60"))
+_count_cache = get_cache("list_count", maxsize=512, ttl=COUNT_CACHE_TTL)
+
+
+# =========================================================
+# MÃ HÓA / GIẢI MÃ CON TRỎ
+# =========================================================
+def _encode_value(value):
+    if isinstance(value, datetime.datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"d": value.isoformat()}
+    if isinstance(value, decimal.Decimal):
+        return {"dec": str(value)}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.datetime.fromisoformat(value["dt"])
+        if "d" in value:
+            return datetime.date.fromisoformat(value["d"])
+        if "dec" in value:
+            return decimal.Decimal(value["dec"])
+        raise ValueError("Giá trị con trỏ không hợp lệ")
+    return value
+
+
+def encode_cursor(signature, values):
+    """Tạo chuỗi con trỏ từ chữ ký sắp xếp và danh sách giá trị khóa."""
+    payload = json.dumps(
+        {"s": signature, "v": [_encode_value(v) for v in values]},
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token, signature):
+    """Giải mã con trỏ. Trả về danh sách giá trị khóa, hoặc None nếu không hợp lệ."""
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if payload.get("s") != signature:
+            return None  # Con trỏ của kiểu sắp xếp/bộ lọc khác
+        return [_decode_value(v) for v in payload["v"]]
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return None
+
+
+# =========================================================
+# CLASS: KeysetPaginator
+# =========================================================
+class KeysetPaginator:
+    """
+    Phân trang theo khóa cho một câu truy vấn.
+    `order`: danh sách (biểu thức SQL, "ASC"/"DESC", tên cột trong kết quả).
+    Cột cuối cùng phải là khóa duy nhất (vd: id) để thứ tự không bị trùng.
+    Các biểu thức có thể NULL nên được bọc COALESCE và SELECT kèm bí danh.
+
+    Cách dùng:
+        pager = KeysetPaginator(order, per_page=15).parse(request.args)
+        seek_sql, seek_params = pager.where()        # Thêm vào WHERE (nếu có)
+        sql = f"... ORDER BY {pager.order_by()} LIMIT {pager.limit}"
+        rows = pager.paginate(cursor.fetchall())      # Cắt dòng thừa, tạo con trỏ
+        pager.next_cursor / pager.prev_cursor
+    """
+
+    def __init__(self, order, per_page, after_param="after", before_param="before"):
+        self.order = order
+        self.per_page = per_page
+        self.after_param = after_param
+        self.before_param = before_param
+        # Chữ ký: con trỏ chỉ dùng được với đúng kiểu sắp xếp này
+        self.signature = hashlib.sha1(
+            "|".join(f"{expr} {direction}" for expr, direction, _ in order).encode("utf-8")
+        ).hexdigest()[:8]
+        self.values = None  # Giá trị khóa của con trỏ hiện tại
+        self.backward = False  # True: đang lùi về trang trước
+        self.next_cursor = None
+        self.prev_cursor = None
+
+    def parse(self, args):
+        """Đọc con trỏ `after`/`before` từ query string (request.args)."""
+        before = decode_cursor(args.get(self.before_param), self.signature)
+        after = decode_cursor(args.get(self.after_param), self.signature)
+        if before is not None and len(before) == len(self.order):
+            self.values, self.backward = before, True
+        elif after is not None and len(after) == len(self.order):
+            self.values, self.backward = after, False
+        return self
+
+    @property
+    def is_first_page(self):
+        return self.values is None
+
+    @property
+    def limit(self):
+        """Số dòng cần lấy: thêm 1 dòng để biết còn trang tiếp theo hay không."""
+        return self.per_page + 1
+
+    def _directions(self):
+        for expr, direction, _ in self.order:
+            desc = direction.upper() == "DESC"
+            if self.backward:
+                desc = not desc  # Lùi trang: đảo chiều sắp xếp rồi đảo lại kết quả
+            yield expr, desc
+
+    def where(self):
+        """
+        Điều kiện "nằm sau con trỏ" theo thứ tự từ điển, ví dụ với (a ASC, id DESC):
+        (a > %s) OR (a = %s AND id < %s). Trả về (sql, params) hoặc (None, []).
+        """
+        if self.values is None:
+            return None, []
+        clauses, params = [], []
+        directions = list(self._directions())
+        for i, (expr, desc) in enumerate(directions):
+            parts, part_params = [], []
+            for j in range(i):
+                parts.append(f"{directions[j][0]} = %s")
+                part_params.append(self.values[j])
+            parts.append(f"{expr} {'<' if desc else '>'} %s")
+            part_params.append(self.values[i])
+            clauses.append("(" + " AND ".join(parts) + ")")
+            params.extend(part_params)
+        return "(" + " OR ".join(clauses) + ")", params
+
+    def order_by(self):
+        """Phần sau ORDER BY (đã đảo chiều nếu đang lùi trang)."""
+        return ", ".join(
+            f"{expr} {'DESC' if desc else 'ASC'}" for expr, desc in self._directions()
+        )
+
+    def _key(self, row):
+        return [row[key] for _, _, key in self.order]
+
+    def paginate(self, rows):
+        """
+        Nhận các dòng đã lấy (tối đa `limit`), trả về đúng các dòng của trang
+        (theo thứ tự hiển thị) và tính `next_cursor` / `prev_cursor`.
+        """
+        rows = list(rows)
+        has_more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+        if self.backward:
+            rows.reverse()
+        if not rows:
+            self.next_cursor = self.prev_cursor = None
+            return rows
+        first = encode_cursor(self.signature, self._key(rows[0]))
+        last = encode_cursor(self.signature, self._key(rows[-1]))
+        if self.backward:
+            self.prev_cursor = first if has_more else None
+            self.next_cursor = last  # Đã lùi từ một trang phía sau -> luôn có trang sau
+        else:
+            self.prev_cursor = None if self.is_first_page else first
+            self.next_cursor = last if has_more else None
+        return rows
+
+    def to_dict(self):
+        """Thông tin phân trang cho các endpoint JSON."""
+        return {
+            "next": self.next_cursor,
+            "prev": self.prev_cursor,
+            "per_page": self.per_page,
+        }
+
+
+# =========================================================
+# HÀM: CACHED_COUNT
+# Đếm số dòng (COUNT) có cache, tránh chạy lại COUNT ở mỗi trang.
+# =========================================================
+def cached_count(cursor, count_sql, params=()):
+    """
+    Chạy `count_sql` (phải trả về một cột tên `total`) và cache kết quả theo
+    câu lệnh + tham số trong COUNT_CACHE_TTL giây.
+    """
+    key = hashlib.sha1(
+        json.dumps([" ".join(count_sql.split()), [_encode_value(p) for p in params]],
+                   default=str, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    total = _count_cache.get(key)
+    if total is None:
+        cursor.execute(count_sql, tuple(params))
+        row = cursor.fetchone()
+        total = (row["total"] if isinstance(row, dict) else row[0]) if row else 0
+        total = int(total or 0)
+        _count_cache.set(key, total)
+    return total
+
+
+# =========================================================
+# HÀM: PAGE_URL (dùng trong template)
+# Tạo URL của trang hiện tại, giữ nguyên các tham số query
+# và thay đổi/xóa một số tham số (vd: con trỏ after/before).
+# =========================================================
+def page_url(changes=None, **kwargs):
+    """
+    Ví dụ trong template: page_url({'after': next_cursor, 'before': None})
+    Tham số có giá trị None sẽ bị xóa khỏi URL.
+    """
+    args = request.args.to_dict()
+    for key, value in dict(changes or {}, **kwargs).items():
+        if value is None:
+            args.pop(key, None)
+        else:
+            args[key] = value
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
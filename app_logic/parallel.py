@@ -0,0 +1,174 @@
+# app_logic/parallel.py
+# =========================================================
+# FILE PARALLEL (Chạy song song các truy vấn đọc độc lập)
+# Một trang (dashboard, chi tiết sách, trang chủ) thường cần nhiều truy
+# vấn đọc không phụ thuộc nhau. Chạy tuần tự trên một cursor thì thời
+# gian trang = TỔNG thời gian các truy vấn; chạy song song trên các kết
+# nối riêng của pool thì thời gian ≈ truy vấn CHẬM NHẤT.
+#
+# - Mỗi tác vụ là một hàm nhận cursor (dictionary=True) và trả về kết quả.
+# - Mỗi request mượn thêm TỐI ĐA DB_FANOUT_WORKERS kết nối từ pool, và chỉ
+#   mượn khi pool còn chỗ trống (không chờ). Mỗi kết nối mượn được chạy trên
+#   một thread; thread của request cũng nhận tác vụ trên kết nối của request.
+#   Khi pool đã hết chỗ (nhiều request đồng thời), các tác vụ chạy tuần tự
+#   trên kết nối của request thay vì chờ DB_POOL_TIMEOUT rồi báo lỗi.
+# - Thread pool có số thread bằng DB_POOL_SIZE: mỗi thread luôn có sẵn kết nối
+#   khi được giao việc, nên tác vụ của trang này không phải xếp hàng sau
+#   tác vụ của request khác.
+# - Chỉ dùng cho truy vấn ĐỌC: mỗi kết nối có snapshot riêng, không nằm
+#   trong transaction của request.
+# - Không gọi run_parallel lồng bên trong một tác vụ.
+# =========================================================
+
+import os  # Đọc biến môi trường
+import queue  # Hàng đợi tác vụ dùng chung giữa các thread của một request
+import threading  # Khóa khởi tạo thread pool
+from concurrent.futures import ThreadPoolExecutor  # Thread pool chạy tác vụ
+from app_logic.db import get_db_connection, get_pooled_connection, pool_config
+from app_logic.query_stats import current_collector  # Ghi truy vấn của thread vào request
+
+# Số kết nối phụ tối đa một request được mượn để chạy song song (0 = chạy tuần tự).
+# Luôn chừa lại ít nhất một nửa pool cho kết nối chính của các request khác.
+FANOUT_MAX_WORKERS = int(os.getenv("DB_FANOUT_WORKERS", "4"))
+if FANOUT_MAX_WORKERS > pool_config["size"] // 2:
+    print(
+        f"!!! CẢNH BÁO: DB_FANOUT_WORKERS={FANOUT_MAX_WORKERS} quá lớn so với "
+        f"DB_POOL_SIZE={pool_config['size']}, giảm xuống {pool_config['size'] // 2}."
+    )
+    FANOUT_MAX_WORKERS = pool_config["size"] // 2
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # Số kết nối phụ đang mượn không bao giờ vượt quá kích thước pool
+                _executor = ThreadPoolExecutor(
+                    max_workers=pool_config["size"], thread_name_prefix="db-fanout"
+                )
+    return _executor
+
+
+# =========================================================
+# CÁC HÀM TẠO TÁC VỤ THƯỜNG DÙNG
+# =========================================================
+def fetch_all(sql, params=()):
+    """Tác vụ: chạy `sql` và trả về toàn bộ các dòng (list dict)."""
+
+    def task(cursor):
+        cursor.execute(sql, tuple(params))
+        return cursor.fetchall()
+
+    return task
+
+
+def fetch_one(sql, params=()):
+    """Tác vụ: chạy `sql` và trả về dòng đầu tiên (dict hoặc None)."""
+
+    def task(cursor):
+        cursor.execute(sql, tuple(params))
+        row = cursor.fetchone()
+        cursor.fetchall()  # Đọc hết phần còn lại để dùng lại được cursor/kết nối
+        return row
+
+    return task
+
+
+def fetch_value(sql, params=(), key="total", default=0):
+    """Tác vụ: trả về cột `key` của dòng đầu tiên (hoặc `default` nếu NULL/không có dòng)."""
+
+    def task(cursor):
+        cursor.execute(sql, tuple(params))
+        row = cursor.fetchone()
+        cursor.fetchall()
+        return (row and row.get(key)) or default
+
+    return task
+
+
+# =========================================================
+# HÀM: RUN_PARALLEL
+# =========================================================
+def _drain(pending, cursor, results, errors):
+    """Lấy và chạy tác vụ từ hàng đợi `pending` cho tới khi hết."""
+    while True:
+        try:
+            name, task = pending.get_nowait()
+        except queue.Empty:
+            return
+        try:
+            results[name] = task(cursor)
+        except Exception as err:  # Ghi nhận, ném lại sau khi mọi tác vụ kết thúc
+            errors.append(err)
+
+
+def _drain_on_connection(conn, pending, results, errors):
+    cursor = None
+    try:
+        cursor = conn.cursor(dictionary=True)
+        _drain(pending, cursor, results, errors)
+    finally:
+        if cursor:
+            cursor.close()
+        conn.close()  # Trả kết nối về pool
+
+
+def _run_sequential(tasks):
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        return {name: task(cursor) for name, task in tasks.items()}
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def run_parallel(tasks):
+    """
+    Chạy các tác vụ `tasks` ({tên: hàm(cursor)}) song song và trả về
+    {tên: kết quả}. Số kết nối phụ tùy theo chỗ trống của pool lúc gọi (có
+    thể là 0: chạy tuần tự trên kết nối của request). Nếu có tác vụ lỗi, chờ
+    các tác vụ còn lại xong (để trả kết nối về pool) rồi ném lại lỗi đầu tiên
+    (thường là mysql.connector.Error).
+    """
+    if FANOUT_MAX_WORKERS <= 0 or len(tasks) <= 1:
+        return _run_sequential(tasks)
+
+    # Mượn kết nối phụ KHÔNG chờ: thread của request cũng chạy một phần tác vụ
+    collector = current_collector()
+    extra_conns = []
+    for _ in range(min(len(tasks) - 1, FANOUT_MAX_WORKERS)):
+        conn = get_pooled_connection(collector=collector, wait=False)
+        if conn is None:
+            break  # Pool hết chỗ -> phần còn lại chạy trên kết nối của request
+        extra_conns.append(conn)
+    if not extra_conns:
+        return _run_sequential(tasks)
+
+    pending = queue.SimpleQueue()
+    for item in tasks.items():
+        pending.put(item)
+    results, errors = {}, []
+    executor = _get_executor()
+    futures = [
+        executor.submit(_drain_on_connection, conn, pending, results, errors)
+        for conn in extra_conns
+    ]
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            _drain(pending, cursor, results, errors)
+        finally:
+            cursor.close()
+            conn.close()
+    finally:
+        for future in futures:
+            future.result()
+    if errors:
+        raise errors[0]
+    return {name: results[name] for name in tasks}
@@ -35,6 +35,12 @@ from werkzeug.utils import secure_filename  # Để làm sạch tên file upload
 
 # Nhập các hàm/lớp cần thiết từ các module khác
 from app_logic.db import get_db_connection  # Hàm lấy kết nối CSDL
+from app_logic.db import retry_on_deadlock, should_retry  # Chạy lại transaction khi deadlock
+from app_logic.models import User  # Để xóa cache người dùng sau khi cập nhật hồ sơ
+from app_logic import settings as system_settings  # Cài đặt hệ thống (CaiDat) đã cache
+from app_logic import circulation  # Nghiệp vụ mượn sách dùng chung với quầy thủ thư
+from app_logic.book_detail import invalidate_book_detail  # Cache trang chi tiết sách
+from app_logic import shelves as home_shelves  # Xóa cache gợi ý trang chủ khi đặt sách
 from app_logic.utils import allowed_file  # Hàm kiểm tra đuôi file avatar
 
 # Tạo Blueprint cho các route liên quan đến hồ sơ người dùng
@@ -252,6 +258,7 @@ def update_profile():
             ),
         )
         conn.commit()  # Lưu thay đổi vào CSDL
+        User.invalidate(current_user.id)  # Xóa cache để header/avatar hiển thị dữ liệu mới
         flash("Cập nhật hồ sơ thành công!", "success")  # Thông báo thành công
 
     except Exception as e:
@@ -377,6 +384,7 @@ def update_password():
     "/muon-sach/<int:id_sach>", methods=["POST"]
 )  # Không có prefix /profile
 @login_required  # Yêu cầu đăng nhập
+@retry_on_deadlock
 def user_muon_sach(id_sach):
     """
     Xử lý yêu cầu độc giả đặt lịch mượn sách (gửi từ modal qua AJAX).
@@ -404,64 +412,22 @@ def user_muon_sach(id_sach):
         ngay_tra = datetime.datetime.strptime(ngay_tra_sach_str, "%Y-%m-%d").date()
 
         # --- Validation phía server ---
-        if so_luong_muon <= 0:
-            raise ValueError("Số lượng mượn phải lớn hơn 0.")
         if ngay_lay < datetime.date.today():
             raise ValueError("Ngày lấy sách không được là ngày trong quá khứ.")
         if ngay_tra <= ngay_lay:
             raise ValueError("Ngày trả sách phải sau ngày lấy sách.")
 
-        # --- Kiểm tra giới hạn mượn sách ---
-        # Lấy giới hạn từ cài đặt
-        cursor.execute(
-            "SELECT setting_value FROM CaiDat WHERE setting_key = 'max_sach_muon_moi_user'"
-        )
-        limit_row = cursor.fetchone()
-        max_limit = (
-            int(limit_row["setting_value"])
-            if limit_row and limit_row.get("setting_value", "").isdigit()
-            else 5
-        )
-        # Đếm số sách đang mượn + chờ (khóa để đảm bảo tính đúng đắn)
-        cursor.execute(
-            "SELECT SUM(so_luong) AS total FROM MuonTra WHERE id_thanh_vien = %s AND trang_thai IN ('Đang mượn', 'Đang chờ') FOR UPDATE",
-            (current_user.id,),
-        )
-        current_borrows = (row := cursor.fetchone()) and row.get("total") or 0
-        # Kiểm tra nếu vượt quá giới hạn
-        if (current_borrows + so_luong_muon) > max_limit:
-            raise ValueError(f"Bạn đã vượt quá giới hạn mượn sách ({max_limit} cuốn).")
-
-        # --- Kiểm tra sách ---
-        # Khóa sách để kiểm tra và trừ số lượng
-        cursor.execute(
-            "SELECT so_luong, trang_thai FROM Sach WHERE id_sach = %s FOR UPDATE",
-            (id_sach,),
-        )
-        sach = cursor.fetchone()
-        # Kiểm tra tồn tại, trạng thái và số lượng
-        if not sach or sach.get("trang_thai") == "da_an":
-            raise ValueError("Sách không có sẵn hoặc đã bị ẩn.")
-        if so_luong_muon > sach.get("so_luong", 0):
-            raise ValueError(
-                f"Số lượng sách trong kho không đủ (còn {sach.get('so_luong', 0)})."
-            )
-
-        # --- Tạo bản ghi mượn trả ---
-        # Thêm bản ghi vào MuonTra với trạng thái 'Đang chờ'
+        # --- Kiểm tra giới hạn mượn, khóa sách, tạo lượt đặt và trừ kho (tạm giữ) ---
+        # Dùng chung nghiệp vụ với quầy thủ thư (app_logic/circulation.py).
         # Lưu ý: ngay_muon lưu ngày hẹn lấy
-        cursor.execute(
-            """ INSERT INTO MuonTra (id_sach, id_thanh_vien, ngay_muon, ngay_hen_tra, so_luong, trang_thai)
-                VALUES (%s, %s, %s, %s, %s, 'Đang chờ') """,
-            (id_sach, current_user.id, ngay_lay, ngay_tra, so_luong_muon),
-        )
-        # Trừ số lượng sách (tạm giữ) trong bảng Sach
-        cursor.execute(
-            "UPDATE Sach SET so_luong = so_luong - %s WHERE id_sach = %s",
-            (so_luong_muon, id_sach),
+        circulation.checkout(
+            cursor, current_user.id, [(id_sach, so_luong_muon)], ngay_lay, ngay_tra,
+            trang_thai="Đang chờ",
         )
 
         conn.commit()  # Lưu thay đổi
+        home_shelves.invalidate_recommendations(current_user.id)  # Gợi ý bỏ sách vừa đặt
+        invalidate_book_detail(id_sach)  # Số lượng trong kho và lượt mượn đã thay đổi
         return jsonify(
             success=True, message="Đặt lịch mượn sách thành công!"
         )  # Trả về thành công
@@ -475,6 +441,8 @@ def user_muon_sach(id_sach):
     except mysql.connector.Error as err:  # Lỗi CSDL
         if conn and conn.in_transaction:
             conn.rollback()
+        if should_retry(err):
+            raise  # retry_on_deadlock chạy lại cả route
         print(f"!!! Lỗi CSDL khi user {current_user.id} mượn sách {id_sach}: {err}")
         return jsonify(success=False, error="Lỗi cơ sở dữ liệu."), 500
     except Exception as e:  # Lỗi không xác định khác
@@ -497,6 +465,7 @@ def user_muon_sach(id_sach):
 # =========================================================
 @profile_bp.route("/profile/muontra/huy/<int:id_muon_tra>", methods=["POST"])
 @login_required  # Yêu cầu đăng nhập
+@retry_on_deadlock
 def user_huy_dat_sach(id_muon_tra):
     """
     Xử lý yêu cầu độc giả hủy đơn đặt sách đang ở trạng thái 'Đang chờ' của chính họ.
@@ -515,14 +484,9 @@ def user_huy_dat_sach(id_muon_tra):
         cursor = conn.cursor(dictionary=True)
         conn.start_transaction()  # Bắt đầu transaction
 
-        # Lấy thông tin lượt đặt và khóa bản ghi (FOR UPDATE)
-        # Chỉ lấy nếu đúng ID, trạng thái 'Đang chờ' VÀ đúng ID của người dùng hiện tại
-        cursor.execute(
-            """ SELECT id_sach, so_luong FROM MuonTra WHERE id_muon_tra = %s AND trang_thai = 'Đang chờ'
-                AND id_thanh_vien = %s FOR UPDATE """,  # Thêm id_thanh_vien vào WHERE
-            (id_muon_tra, current_user.id),
-        )
-        record = cursor.fetchone()
+        # Hủy lượt đặt và hoàn kho bằng các câu UPDATE có điều kiện
+        # Chỉ hủy nếu đúng ID, trạng thái 'Đang chờ' VÀ đúng ID của người dùng hiện tại
+        record = circulation.cancel_reservation(cursor, id_muon_tra, id_thanh_vien=current_user.id)
 
         # Kiểm tra xem có tìm thấy bản ghi hợp lệ không
         if not record:
@@ -532,27 +496,8 @@ def user_huy_dat_sach(id_muon_tra):
                 404,
             )
 
-        id_sach = record["id_sach"]
-        so_luong_dat = record["so_luong"]
-
-        # Cập nhật trạng thái lượt đặt thành 'Đã hủy' và ghi ngày hủy (vào cột ngay_tra_thuc)
-        cursor.execute(
-            "UPDATE MuonTra SET trang_thai = 'Đã hủy', ngay_tra_thuc = %s WHERE id_muon_tra = %s",
-            (datetime.datetime.now(), id_muon_tra),
-        )
-
-        # Khóa sách để cộng lại số lượng (FOR UPDATE)
-        cursor.execute(
-            "SELECT id_sach FROM Sach WHERE id_sach = %s FOR UPDATE", (id_sach,)
-        )
-        cursor.fetchone()  # Phải fetch
-        # Cộng lại số lượng sách vào kho
-        cursor.execute(
-            "UPDATE Sach SET so_luong = so_luong + %s WHERE id_sach = %s",
-            (so_luong_dat, id_sach),
-        )
-
         conn.commit()  # Lưu thay đổi
+        invalidate_book_detail(record["id_sach"])  # Số lượng trong kho đã thay đổi
         return jsonify(
             success=True,
             message="Đã hủy đơn đặt thành công. Sách đã được hoàn trả về kho.",
@@ -561,6 +506,8 @@ def user_huy_dat_sach(id_muon_tra):
     except mysql.connector.Error as err:
         if conn:
             conn.rollback()
+        if should_retry(err):
+            raise  # retry_on_deadlock chạy lại cả route
         print(f"!!! Lỗi DB khi user {current_user.id} hủy đơn {id_muon_tra}: {err}")
         return jsonify(success=False, error=f"Lỗi cơ sở dữ liệu: {err}"), 500
     except Exception as e:
@@ -582,6 +529,7 @@ def user_huy_dat_sach(id_muon_tra):
 # =========================================================
 @profile_bp.route("/profile/muontra/giahan/<int:id_muon_tra>", methods=["POST"])
 @login_required  # Yêu cầu đăng nhập
+@retry_on_deadlock
 def gia_han_sach(id_muon_tra):
     """
     Xử lý yêu cầu độc giả gia hạn sách đang mượn của chính họ.
@@ -629,21 +577,8 @@ def gia_han_sach(id_muon_tra):
                 400,
             )
 
-        # Lấy số ngày gia hạn từ cài đặt
-        cursor.execute(
-            "SELECT setting_value FROM CaiDat WHERE setting_key = 'thoi_han_gia_han'"
-        )
-        setting = cursor.fetchone()
-        try:  # Xử lý nếu cài đặt không hợp lệ hoặc thiếu
-            so_ngay_gia_han = (
-                int(setting["setting_value"])
-                if setting and setting.get("setting_value", "").isdigit()
-                else 7
-            )
-        except (ValueError, TypeError):
-            so_ngay_gia_han = 7
-        if so_ngay_gia_han <= 0:
-            so_ngay_gia_han = 7  # Đảm bảo số ngày > 0
+        # Lấy số ngày gia hạn từ cài đặt (đã cache, luôn > 0)
+        so_ngay_gia_han = system_settings.thoi_han_gia_han()
 
         # Tính ngày hẹn trả mới
         ngay_hen_tra_moi = ngay_hen_tra_hien_tai + datetime.timedelta(
@@ -670,6 +605,8 @@ def gia_han_sach(id_muon_tra):
     except mysql.connector.Error as err:
         if conn:
             conn.rollback()
+        if should_retry(err):
+            raise  # retry_on_deadlock chạy lại cả route
         print(
             f"!!! Lỗi DB khi user {current_user.id} gia hạn sách {id_muon_tra}: {err}"
         )
@@ -0,0 +1,212 @@
+# app_logic/query_stats.py
+# =========================================================
+# FILE QUERY STATS (Đo lường truy vấn)
+# Ghi nhận mọi lệnh `cursor.execute` đi qua app_logic/db.py trong
+# một request: dấu vân tay (fingerprint) câu SQL, thời gian chạy,
+# số dòng trả về và route gọi. Kết quả được:
+# - Gửi về trình duyệt qua header `Server-Timing`.
+# - Lưu vào bộ đệm vòng (các request gần nhất) cho endpoint debug JSON
+#   (/api/debug/queries).
+# - Cảnh báo khi request chạy quá nhiều truy vấn hoặc lặp cùng một
+#   câu truy vấn nhiều lần (dấu hiệu N+1).
+# Ngoài ra còn đếm số lần transaction phải chạy lại do deadlock / hết thời
+# gian chờ khóa (xem `retry_on_deadlock` trong app_logic/db.py).
+# =========================================================
+
+import re  # Chuẩn hóa câu SQL thành fingerprint
+import threading  # Khóa bảo vệ dữ liệu dùng chung giữa các thread
+import time  # Đo thời gian
+import datetime  # Thời điểm ghi nhận request
+from collections import Counter, deque  # Bộ đếm retry, bộ đệm vòng lưu các request gần nhất
+from flask import g, has_request_context, request
+
+# Các biểu thức chính quy dùng để tạo fingerprint
+_RE_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)  # Comment SQL
+_RE_STRING = re.compile(r"'(?:[^'\\]|\\.)*'")  # Chuỗi trong dấu nháy đơn
+_RE_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")  # Số nguyên/thập phân
+_RE_PLACEHOLDER = re.compile(r"%s|%\(\w+\)s")  # Tham số của mysql.connector
+_RE_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")  # IN (?, ?, ?)
+_RE_SPACE = re.compile(r"\s+")
+
+# Bộ đệm các request gần nhất (dùng chung cho cả tiến trình)
+_history = deque(maxlen=100)
+_history_lock = threading.Lock()
+
+# Tổng số lần retry transaction theo (endpoint, kết quả) từ khi tiến trình khởi động
+_retry_totals = Counter()
+
+
+# =========================================================
+# HÀM: FINGERPRINT
+# Chuẩn hóa câu SQL: bỏ comment, thay literal/tham số bằng '?',
+# gộp danh sách IN (...) và khoảng trắng.
+# =========================================================
+def fingerprint(sql):
+    """
+    Trả về dạng chuẩn hóa của câu SQL để gom nhóm các truy vấn giống nhau.
+    Ví dụ: "SELECT * FROM Sach WHERE id_sach IN (1, 2, 3)"
+           -> "select * from sach where id_sach in (...)"
+    """
+    if isinstance(sql, (bytes, bytearray)):
+        sql = sql.decode("utf-8", "replace")
+    sql = _RE_COMMENT.sub(" ", str(sql))
+    sql = _RE_STRING.sub("?", sql)
+    sql = _RE_PLACEHOLDER.sub("?", sql)
+    sql = _RE_NUMBER.sub("?", sql)
+    sql = _RE_IN_LIST.sub("(...)", sql)
+    return _RE_SPACE.sub(" ", sql).strip().lower()
+
+
+# =========================================================
+# CLASS: RequestQueryStats
+# Bộ thu thập số liệu truy vấn của MỘT request.
+# =========================================================
+class RequestQueryStats:
+    """Thu thập các truy vấn đã chạy trong một request (thread-safe)."""
+
+    def __init__(self, endpoint, path, method):
+        self.endpoint = endpoint
+        self.path = path
+        self.method = method
+        self.started_at = time.perf_counter()
+        self.queries = []  # Danh sách dict: fingerprint, duration_ms, rows, endpoint
+        self.retries = 0  # Số lần transaction bị chạy lại (deadlock / chờ khóa quá lâu)
+        self._lock = threading.Lock()
+
+    def record(self, sql, duration, rows):
+        """Ghi nhận một truy vấn. Trả về dict bản ghi để cập nhật số dòng sau khi fetch."""
+        entry = {
+            "fingerprint": fingerprint(sql),
+            "duration_ms": round(duration * 1000, 3),
+            "rows": rows,
+            "endpoint": self.endpoint,
+        }
+        with self._lock:
+            self.queries.append(entry)
+        return entry
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def total_ms(self):
+        return round(sum(q["duration_ms"] for q in self.queries), 3)
+
+    def grouped(self):
+        """Gom các truy vấn theo fingerprint: số lần chạy, tổng thời gian, tổng số dòng."""
+        groups = {}
+        for q in self.queries:
+            item = groups.setdefault(
+                q["fingerprint"],
+                {"fingerprint": q["fingerprint"], "count": 0, "total_ms": 0.0, "rows": 0},
+            )
+            item["count"] += 1
+            item["total_ms"] = round(item["total_ms"] + q["duration_ms"], 3)
+            item["rows"] += q["rows"] or 0
+        return sorted(groups.values(), key=lambda x: x["total_ms"], reverse=True)
+
+    def summary(self, max_queries, max_repeats):
+        """Tạo bản tóm tắt (dict) của request, kèm các cờ cảnh báo."""
+        groups = self.grouped()
+        repeated = [grp for grp in groups if grp["count"] >= max_repeats]
+        return {
+            "endpoint": self.endpoint,
+            "path": self.path,
+            "method": self.method,
+            "thoi_gian": datetime.datetime.now().isoformat(timespec="seconds"),
+            "request_ms": round((time.perf_counter() - self.started_at) * 1000, 3),
+            "query_count": self.count,
+            "query_ms": self.total_ms,
+            "retries": self.retries,
+            "too_many_queries": self.count > max_queries,
+            "n_plus_one": [grp["fingerprint"] for grp in repeated],
+            "queries": groups,
+        }
+
+
+def current_collector():
+    """Trả về bộ thu thập của request hiện tại (hoặc None nếu ngoài request/đã tắt)."""
+    if not has_request_context():
+        return None
+    return g.get("query_stats")
+
+
+def record_retry(endpoint, outcome):
+    """
+    Ghi nhận một lần retry transaction của `endpoint`.
+    `outcome`: 'retry' (chạy lại) hoặc 'exhausted' (hết lượt thử, lỗi được trả về người dùng).
+    """
+    with _history_lock:
+        _retry_totals[(endpoint, outcome)] += 1
+    collector = current_collector()
+    if collector is not None and outcome == "retry":
+        collector.record_retry()
+
+
+def retry_counts():
+    """Số lần retry / hết lượt thử theo endpoint: {endpoint: {'retry': n, 'exhausted': m}}."""
+    with _history_lock:
+        items = list(_retry_totals.items())
+    result = {}
+    for (endpoint, outcome), total in items:
+        result.setdefault(endpoint, {"retry": 0, "exhausted": 0})[outcome] = total
+    return result
+
+
+def recent_requests(flagged_only=False):
+    """Danh sách tóm tắt các request gần nhất (mới nhất trước)."""
+    with _history_lock:
+        items = list(_history)
+    items.reverse()
+    if flagged_only:
+        items = [i for i in items if i["too_many_queries"] or i["n_plus_one"]]
+    return items
+
+
+# =========================================================
+# ĐĂNG KÝ VỚI ỨNG DỤNG FLASK
+# =========================================================
+def init_query_stats(app):
+    """
+    Đăng ký các hook before/after request để đo truy vấn.
+    Cấu hình (app.config):
+    - QUERY_STATS_ENABLED: Bật/tắt đo lường.
+    - QUERY_COUNT_THRESHOLD: Cảnh báo khi số truy vấn của request vượt ngưỡng này.
+    - QUERY_REPEAT_THRESHOLD: Cảnh báo N+1 khi cùng một fingerprint lặp lại từ ngần này lần.
+    """
+    if not app.config.get("QUERY_STATS_ENABLED", True):
+        return
+
+    @app.before_request
+    def _start_query_stats():
+        g.query_stats = RequestQueryStats(request.endpoint, request.path, request.method)
+
+    @app.after_request
+    def _finish_query_stats(response):
+        stats = g.pop("query_stats", None)
+        if stats is None or request.endpoint == "static":
+            return response
+        summary = stats.summary(
+            app.config.get("QUERY_COUNT_THRESHOLD", 6),
+            app.config.get("QUERY_REPEAT_THRESHOLD", 3),
+        )
+        # Header Server-Timing hiển thị trong tab Network/Timing của DevTools
+        response.headers.add(
+            "Server-Timing",
+            f'db;dur={summary["query_ms"]};desc="{summary["query_count"]} queries"',
+        )
+        if summary["retries"]:
+            response.headers.add("Server-Timing", f'db-retry;desc="{summary["retries"]} retries"')
+        if summary["too_many_queries"] or summary["n_plus_one"]:
+            print(
+                f"!!! CẢNH BÁO TRUY VẤN: {summary['endpoint']} chạy {summary['query_count']} truy vấn "
+                f"({summary['query_ms']} ms), lặp: {summary['n_plus_one']}"
+            )
+        with _history_lock:
+            _history.append(summary)
+        return response
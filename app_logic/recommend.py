@@ -0,0 +1,329 @@
+# app_logic/recommend.py
+# =========================================================
+# FILE RECOMMEND (Gợi ý sách theo lượt mượn chung - item-item)
+# "Người mượn sách A cũng mượn sách B": từ lịch sử tương tác của mọi
+# thành viên, tính độ tương đồng cosine giữa từng cặp sách và lưu N sách
+# gần nhất của mỗi sách vào bảng SachGoiY (migration 0004).
+#
+# Tín hiệu (mỗi cặp thành viên-sách lấy trọng số lớn nhất):
+#   - Mượn ('Đang mượn', 'Đã trả'): 1.0
+#   - Yêu thích: 0.6
+#   - Đánh giá 3/4/5 sao: 0.2/0.4/0.6 (dưới 3 sao bị bỏ qua)
+#
+# - Xây mô hình (chạy định kỳ, ngoài giờ cao điểm):
+#     python manage.py build-recommendations
+#   Đọc dữ liệu theo từng nhóm RECOMMEND_CHUNK_USERS thành viên nên bộ nhớ
+#   chỉ phụ thuộc số sách, không phụ thuộc độ dài lịch sử. Ma trận đồng
+#   xuất hiện được cộng dồn bằng phép nhân ma trận thưa (X^T X) của
+#   numpy + scipy (có trong requirements.txt). Cách tính bằng dict thuần
+#   Python chỉ là phương án dự phòng khi thiếu hai thư viện này: O(k²) cho
+#   mỗi thành viên có k tương tác, quá chậm với toàn bộ lịch sử.
+# - Phục vụ: bảng SachGoiY được nạp vào bộ nhớ (làm mới sau
+#   RECOMMEND_MODEL_TTL giây) và chấm điểm lịch sử của người dùng tại chỗ.
+#   Khi hết hạn, mô hình cũ vẫn được dùng trong lúc MỘT thread nền nạp lại;
+#   lần nạp đầu tiên cũng chỉ do một request thực hiện, các request khác chờ.
+# =========================================================
+
+import heapq  # Lấy top-N mà không sắp xếp toàn bộ
+import math  # Căn bậc hai (chuẩn hóa cosine)
+import os  # Đọc biến môi trường
+import threading  # Khóa bảo vệ mô hình dùng chung
+import time  # Thời điểm nạp mô hình
+from collections import defaultdict  # Cộng dồn điểm
+import mysql.connector  # Để xử lý lỗi CSDL MySQL
+from mysql.connector import errorcode  # Mã lỗi MySQL (bảng chưa tồn tại)
+from app_logic.db import get_pooled_connection  # Kết nối riêng cho việc nạp lại ở nền
+
+try:  # numpy/scipy (requirements.txt); thiếu thì dùng cách tính Python thuần (chậm)
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # pragma: no cover - tùy môi trường cài đặt
+    np = None
+    sparse = None
+
+NEIGHBOURS = int(os.getenv("RECOMMEND_NEIGHBOURS", "20"))  # Số sách gần nhất lưu cho mỗi sách
+CHUNK_USERS = int(os.getenv("RECOMMEND_CHUNK_USERS", "2000"))  # Số thành viên mỗi lần đọc
+MODEL_TTL = float(os.getenv("RECOMMEND_MODEL_TTL", "3600"))  # Số giây giữa hai lần nạp lại SachGoiY
+_INSERT_BATCH = 1000  # Số dòng mỗi lệnh INSERT khi lưu mô hình
+
+# Tương tác có trọng số của các thành viên có id trong [%s, %s]
+_SIGNALS_SQL = """
+    SELECT id_thanh_vien, id_sach, 1.0 AS trong_so FROM MuonTra
+    WHERE id_thanh_vien BETWEEN %s AND %s AND trang_thai IN ('Đang mượn', 'Đã trả')
+    UNION ALL
+    SELECT id_thanh_vien, id_sach, 0.6 FROM YeuThich
+    WHERE id_thanh_vien BETWEEN %s AND %s
+    UNION ALL
+    SELECT id_thanh_vien, id_sach, 0.2 * diem_so - 0.4 FROM DanhGia
+    WHERE id_thanh_vien BETWEEN %s AND %s AND diem_so >= 3
+"""
+
+# Sách của người dùng không được gợi ý lại (mọi lượt mượn/đặt, kể cả đã hủy)
+_BORROWED_SQL = "SELECT DISTINCT id_sach FROM MuonTra WHERE id_thanh_vien = %s"
+
+_lock = threading.Lock()  # Bảo vệ _state (giữ rất ngắn, không giữ khi đọc CSDL)
+_load_lock = threading.Lock()  # Chỉ một thread nạp mô hình lần đầu tại một thời điểm
+_state = {"neighbours": None, "loaded_at": 0.0, "refreshing": False}
+
+
+# =========================================================
+# ĐỌC DỮ LIỆU THEO NHÓM THÀNH VIÊN
+# =========================================================
+def _user_ranges(cursor, chunk_size):
+    """Sinh các khoảng (id đầu, id cuối) gồm tối đa `chunk_size` thành viên."""
+    last_id = 0
+    while True:
+        cursor.execute(
+            "SELECT id_thanh_vien FROM ThanhVien WHERE id_thanh_vien > %s ORDER BY id_thanh_vien LIMIT %s",
+            (last_id, chunk_size),
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            return
+        yield ids[0], ids[-1]
+        last_id = ids[-1]
+
+
+def _interactions(cursor, lo, hi):
+    """Trả về dict {id_thanh_vien: {id_sach: trọng số lớn nhất}} của một nhóm."""
+    cursor.execute(_SIGNALS_SQL, (lo, hi, lo, hi, lo, hi))
+    users = defaultdict(dict)
+    for id_thanh_vien, id_sach, trong_so in cursor.fetchall():
+        items = users[id_thanh_vien]
+        items[id_sach] = max(items.get(id_sach, 0.0), float(trong_so))
+    return users
+
+
+def _chunks(cursor, chunk_size):
+    for lo, hi in _user_ranges(cursor, chunk_size):
+        yield _interactions(cursor, lo, hi)
+
+
+# =========================================================
+# TÍNH ĐỘ TƯƠNG ĐỒNG (2 CÁCH, CÙNG KẾT QUẢ)
+# Trả về dict {id_sach: [(id_sach_goi_y, diem), ...]} (diem giảm dần).
+# =========================================================
+def _neighbours_sparse(chunks, item_ids, top_n):
+    """Cộng dồn C = sum(X^T X) trên từng nhóm bằng ma trận thưa, rồi chuẩn hóa cosine."""
+    index = {id_sach: i for i, id_sach in enumerate(item_ids)}
+    n = len(item_ids)
+    co = sparse.csr_matrix((n, n), dtype=np.float64)
+    for users in chunks:
+        rows, cols, vals = [], [], []
+        for row, items in enumerate(users.values()):
+            for id_sach, trong_so in items.items():
+                if id_sach in index:
+                    rows.append(row)
+                    cols.append(index[id_sach])
+                    vals.append(trong_so)
+        if not vals:
+            continue
+        x = sparse.csr_matrix((vals, (rows, cols)), shape=(len(users), n))
+        co = co + (x.T @ x).tocsr()
+
+    norms = np.sqrt(co.diagonal())
+    inv = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    sim = (sparse.diags(inv) @ co @ sparse.diags(inv)).tocsr()
+    sim.setdiag(0)
+    sim.eliminate_zeros()
+
+    result = {}
+    for row in range(n):
+        start, end = sim.indptr[row], sim.indptr[row + 1]
+        if start == end:
+            continue
+        data = sim.data[start:end]
+        cols = sim.indices[start:end]
+        top = np.argpartition(-data, top_n)[:top_n] if len(data) > top_n else np.arange(len(data))
+        top = top[np.argsort(-data[top], kind="stable")]
+        result[item_ids[row]] = [(item_ids[cols[k]], float(data[k])) for k in top]
+    return result
+
+
+def _neighbours_python(chunks, item_ids, top_n):
+    """Cùng phép tính nhưng bằng dict (khi không có numpy/scipy)."""
+    known = set(item_ids)
+    diag = defaultdict(float)
+    co = defaultdict(lambda: defaultdict(float))
+    for users in chunks:
+        for items in users.values():
+            items = [(i, w) for i, w in items.items() if i in known]
+            for i, wi in items:
+                diag[i] += wi * wi
+                for j, wj in items:
+                    if i != j:
+                        co[i][j] += wi * wj
+
+    result = {}
+    for i, row in co.items():
+        scored = (
+            (j, value / math.sqrt(diag[i] * diag[j]))
+            for j, value in row.items()
+            if value and diag[i] and diag[j]
+        )
+        top = heapq.nlargest(top_n, scored, key=lambda item: item[1])
+        if top:
+            result[i] = top
+    return result
+
+
+# =========================================================
+# XÂY VÀ LƯU MÔ HÌNH
+# =========================================================
+def build_recommendations(conn, top_n=NEIGHBOURS, chunk_size=CHUNK_USERS):
+    """
+    Tính lại N sách gần nhất của mỗi sách và thay toàn bộ bảng SachGoiY
+    trong một transaction. Trả về dict: so_sach, so_cap, backend.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT id_sach FROM Sach ORDER BY id_sach")
+        item_ids = [row[0] for row in cursor.fetchall()]
+        chunks = _chunks(cursor, chunk_size)
+        if sparse is not None:
+            backend = "scipy"
+            neighbours = _neighbours_sparse(chunks, item_ids, top_n)
+        else:
+            print(
+                "!!! CẢNH BÁO: Chưa cài numpy + scipy, mô hình gợi ý được tính bằng Python thuần "
+                "(rất chậm với toàn bộ lịch sử mượn). Hãy chạy 'pip install -r requirements.txt'."
+            )
+            backend = "python"
+            neighbours = _neighbours_python(chunks, item_ids, top_n)
+
+        rows = [
+            (id_sach, id_goi_y, round(diem, 6))
+            for id_sach, items in neighbours.items()
+            for id_goi_y, diem in items
+        ]
+        conn.commit()  # Kết thúc transaction đọc trước khi ghi
+        conn.start_transaction()
+        cursor.execute("DELETE FROM SachGoiY")
+        for start in range(0, len(rows), _INSERT_BATCH):
+            cursor.executemany(
+                "INSERT INTO SachGoiY (id_sach, id_sach_goi_y, diem) VALUES (%s, %s, %s)",
+                rows[start : start + _INSERT_BATCH],
+            )
+        conn.commit()
+        return {"so_sach": len(neighbours), "so_cap": len(rows), "backend": backend}
+    except mysql.connector.Error:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+# =========================================================
+# PHỤC VỤ GỢI Ý
+# =========================================================
+def _read_neighbours(cursor):
+    """Đọc bảng SachGoiY (cursor dạng dictionary); dict rỗng nếu chưa có bảng."""
+    neighbours = defaultdict(list)
+    try:
+        cursor.execute("SELECT id_sach, id_sach_goi_y, diem FROM SachGoiY ORDER BY id_sach, diem DESC")
+        for row in cursor.fetchall():
+            neighbours[row["id_sach"]].append((row["id_sach_goi_y"], float(row["diem"])))
+    except mysql.connector.Error as err:
+        if err.errno != errorcode.ER_NO_SUCH_TABLE:
+            raise
+        print(f"!!! CẢNH BÁO: Chưa có bảng SachGoiY ({err.msg}). Hãy chạy 'python manage.py migrate'.")
+    return dict(neighbours)
+
+
+def _store_neighbours(neighbours):
+    with _lock:
+        _state["neighbours"] = neighbours
+        _state["loaded_at"] = time.monotonic()
+
+
+def _refresh_in_background():
+    """Nạp lại SachGoiY trên kết nối riêng; lỗi thì giữ mô hình cũ đến lần hết hạn sau."""
+    conn = None
+    cursor = None
+    try:
+        conn = get_pooled_connection()
+        cursor = conn.cursor(dictionary=True)
+        _store_neighbours(_read_neighbours(cursor))
+    except mysql.connector.Error as err:
+        print(f"!!! Lỗi DB khi nạp lại mô hình gợi ý: {err}")
+        with _lock:
+            _state["loaded_at"] = time.monotonic()  # Thử lại sau MODEL_TTL, không dồn dập
+    finally:
+        with _lock:
+            _state["refreshing"] = False
+        if cursor:
+            cursor.close()
+        if conn and conn.is_connected():
+            conn.close()
+
+
+def _load_neighbours(cursor):
+    """
+    Trả về mô hình (cache trong tiến trình) từ bảng SachGoiY; dict rỗng nếu chưa có bảng.
+    Hết hạn thì trả mô hình cũ và nạp lại một lần ở thread nền; chưa có mô hình thì
+    chỉ một thread đọc CSDL (bằng `cursor` của nó), các thread khác chờ kết quả.
+    """
+    with _lock:
+        neighbours = _state["neighbours"]
+        if neighbours is not None:
+            if time.monotonic() - _state["loaded_at"] >= MODEL_TTL and not _state["refreshing"]:
+                _state["refreshing"] = True
+                threading.Thread(target=_refresh_in_background, daemon=True).start()
+            return neighbours
+
+    with _load_lock:
+        with _lock:
+            neighbours = _state["neighbours"]
+        if neighbours is None:  # Chưa thread nào nạp xong trong lúc chờ khóa
+            neighbours = _read_neighbours(cursor)
+            _store_neighbours(neighbours)
+    return neighbours
+
+
+def invalidate_model():
+    """Bỏ mô hình đã nạp để lần gọi sau đọc lại SachGoiY."""
+    with _lock:
+        _state["neighbours"] = None
+
+
+def recommend_for_user(cursor, user_id, limit=10):
+    """
+    Gợi ý tối đa `limit` sách cho `user_id` (cursor dạng dictionary):
+    điểm của sách j = tổng (trọng số tương tác với sách i * độ tương đồng(i, j)).
+    Bỏ các sách người dùng đã mượn/đặt/yêu thích/đánh giá và sách đang ẩn.
+    Trả về list dict: id_sach, tieu_de, anh_bia, ten_tac_gia (rỗng nếu chưa có mô hình).
+    """
+    neighbours = _load_neighbours(cursor)
+    if not neighbours:
+        return []
+
+    cursor.execute(_SIGNALS_SQL, (user_id,) * 6)
+    history = {}
+    for row in cursor.fetchall():
+        history[row["id_sach"]] = max(history.get(row["id_sach"], 0.0), float(row["trong_so"]))
+    if not history:
+        return []
+    cursor.execute(_BORROWED_SQL, (user_id,))
+    seen = set(history) | {row["id_sach"] for row in cursor.fetchall()}
+
+    scores = defaultdict(float)
+    for id_sach, trong_so in history.items():
+        for id_goi_y, diem in neighbours.get(id_sach, ()):
+            if id_goi_y not in seen:
+                scores[id_goi_y] += trong_so * diem
+    # Lấy dư để bù các sách đang ẩn bị loại ở bước sau
+    top = heapq.nlargest(limit * 2, scores.items(), key=lambda item: item[1])
+    if not top:
+        return []
+
+    ids = [id_sach for id_sach, _ in top]
+    placeholders = ", ".join(["%s"] * len(ids))
+    cursor.execute(
+        f""" SELECT s.id_sach, s.tieu_de, s.anh_bia, tg.ten_tac_gia
+             FROM Sach s LEFT JOIN TacGia tg ON s.id_tac_gia = tg.id_tac_gia
+             WHERE s.id_sach IN ({placeholders}) AND s.trang_thai = 'hoat_dong' """,
+        tuple(ids),
+    )
+    books = {row["id_sach"]: row for row in cursor.fetchall()}
+    return [books[i] for i in ids if i in books][:limit]
@@ -0,0 +1,117 @@
+# app_logic/reference.py
+# =========================================================
+# FILE REFERENCE (Dữ liệu danh mục: Tác giả, Thể loại)
+# Danh sách TacGia/TheLoai được dùng ở mọi trang tra cứu/lọc và form sách,
+# nhưng hiếm khi thay đổi. Thay vì SELECT lại toàn bộ bảng ở mỗi request,
+# danh sách được cache (REFERENCE_CACHE_TTL giây) kèm khóa tìm kiếm đã bỏ dấu.
+#
+# - Thể loại (ít dòng): vẫn được render sẵn trong dropdown, đọc từ cache.
+# - Tác giả (hàng trăm/nghìn dòng): không nhúng vào HTML nữa; dropdown chỉ
+#   render tác giả đang chọn và gọi API gợi ý (/api/tac-gia?q=...) khi gõ.
+# - Cache được xóa sau khi commit transaction có `utils.get_or_create` thêm
+#   tác giả/thể loại mới (nơi gọi truyền `created_tables` rồi gọi
+#   `invalidate_reference` cho từng bảng sau commit).
+# =========================================================
+
+import os  # Đọc biến môi trường
+from app_logic.cache import get_cache  # Cache danh sách danh mục
+from app_logic.search_index import tokenize  # Token hóa bỏ dấu (giống tìm kiếm sách)
+
+REFERENCE_TTL = float(os.getenv("REFERENCE_CACHE_TTL", "3600"))
+SUGGEST_LIMIT = 20  # Số gợi ý mặc định mỗi lần gõ
+SUGGEST_MAX_LIMIT = 50  # Giới hạn trên của tham số limit
+
+_reference_cache = get_cache("reference", maxsize=8, ttl=REFERENCE_TTL)
+
+# Loại danh mục -> (bảng, cột id, cột tên)
+TABLES = {
+    "tac_gia": ("TacGia", "id_tac_gia", "ten_tac_gia"),
+    "the_loai": ("TheLoai", "id_the_loai", "ten_the_loai"),
+}
+# Tên bảng -> loại danh mục (dùng khi xóa cache theo tên bảng)
+_KIND_BY_TABLE = {table: kind for kind, (table, _, _) in TABLES.items()}
+
+
+def _load(cursor, kind):
+    """
+    Trả về dict {rows, by_id, tokens} của một danh mục (cursor dạng dictionary):
+    - rows: list dict (cột id, cột tên) sắp theo tên, giống truy vấn cũ
+    - by_id: id -> dòng tương ứng
+    - tokens: list token bỏ dấu của từng dòng (cùng thứ tự với rows)
+    """
+    data = _reference_cache.get(kind)
+    if data is None:
+        table, id_column, name_column = TABLES[kind]
+        cursor.execute(
+            f"SELECT {id_column}, {name_column} FROM {table} ORDER BY {name_column}"
+        )
+        rows = cursor.fetchall()
+        data = {
+            "rows": rows,
+            "by_id": {row[id_column]: row for row in rows},
+            "tokens": [tokenize(row[name_column]) for row in rows],
+        }
+        _reference_cache.set(kind, data)
+    return data
+
+
+# =========================================================
+# ĐỌC DANH MỤC
+# =========================================================
+def get_authors(cursor):
+    """Danh sách tác giả (id_tac_gia, ten_tac_gia) sắp theo tên."""
+    return _load(cursor, "tac_gia")["rows"]
+
+
+def get_genres(cursor):
+    """Danh sách thể loại (id_the_loai, ten_the_loai) sắp theo tên."""
+    return _load(cursor, "the_loai")["rows"]
+
+
+def find_by_id(cursor, kind, value):
+    """
+    Tìm một dòng danh mục theo id (vd: tác giả đang được chọn trong bộ lọc).
+    `value` có thể là chuỗi lấy từ query string. Trả về dict hoặc None.
+    """
+    try:
+        key = int(value)
+    except (TypeError, ValueError):
+        return None
+    return _load(cursor, kind)["by_id"].get(key)
+
+
+def suggest(cursor, kind, query, limit=SUGGEST_LIMIT):
+    """
+    Gợi ý cho ô chọn (typeahead): mọi từ trong `query` phải là tiền tố của
+    một từ trong tên (không dấu, không phân biệt hoa thường). Tên bắt đầu
+    bằng từ khóa được xếp trước, sau đó theo thứ tự tên.
+    Trả về list dict {id, ten}. Từ khóa rỗng -> `limit` dòng đầu tiên.
+    """
+    _, id_column, name_column = TABLES[kind]
+    data = _load(cursor, kind)
+    query_tokens = tokenize(query)
+
+    # rows đã sắp theo tên: chỉ cần tách nhóm "bắt đầu bằng từ khóa" lên trước
+    first, rest = [], []
+    for row, tokens in zip(data["rows"], data["tokens"]):
+        if all(any(t.startswith(q) for t in tokens) for q in query_tokens):
+            starts = bool(query_tokens) and bool(tokens) and tokens[0].startswith(query_tokens[0])
+            (first if starts else rest).append(row)
+    return [
+        {"id": row[id_column], "ten": row[name_column]}
+        for row in (first + rest)[:limit]
+    ]
+
+
+# =========================================================
+# XÓA CACHE
+# =========================================================
+def invalidate_reference(table=None):
+    """Xóa cache của một bảng danh mục (vd: 'TacGia'), hoặc mọi danh mục nếu không truyền."""
+    if table is None:
+        for kind in TABLES:
+            _reference_cache.delete(kind)
+        return
+    kind = _KIND_BY_TABLE.get(table)
+    if kind:
+        _reference_cache.delete(kind)
@@ -0,0 +1,153 @@
+# app_logic/related.py
+# =========================================================
+# FILE RELATED (Sách liên quan)
+# Thay cho truy vấn `... WHERE id_tac_gia = ? OR id_the_loai = ?
+# ORDER BY RAND() LIMIT 10` ở trang chi tiết sách (phải đọc và sắp xếp
+# toàn bộ sách cùng thể loại ở mỗi lượt xem).
+#
+# - Giữ trong bộ nhớ danh sách id sách đang hoạt động theo từng tác giả
+#   và từng thể loại; lấy mẫu ngẫu nhiên k sách trong O(k) (hoán vị
+#   Fisher-Yates thưa, không tạo/sắp xếp cả danh sách ứng viên).
+# - Được cập nhật từng sách khi admin thêm/sửa (đổi tác giả/thể loại)/
+#   ẩn/khôi phục sách, và xây lại toàn bộ định kỳ
+#   (RELATED_INDEX_REBUILD_INTERVAL giây) để nhận thay đổi từ worker khác.
+# =========================================================
+
+import os  # Đọc biến môi trường
+import random  # Lấy mẫu ngẫu nhiên
+from app_logic.memory_index import InMemoryBookIndex  # Xây/xây lại/cập nhật từng sách (dùng chung)
+
+# Số giây tối đa giữa hai lần xây lại toàn bộ chỉ mục
+REBUILD_INTERVAL = float(os.getenv("RELATED_INDEX_REBUILD_INTERVAL", "600"))
+
+# Dữ liệu sách cho khối "sách liên quan" (chỉ sách đang hoạt động)
+_BOOK_QUERY = """
+    SELECT s.id_sach, s.tieu_de, s.anh_bia, s.id_tac_gia, s.id_the_loai, tg.ten_tac_gia
+    FROM Sach s LEFT JOIN TacGia tg ON s.id_tac_gia = tg.id_tac_gia
+    WHERE s.trang_thai = 'hoat_dong'
+"""
+
+
+def _random_positions(n):
+    """
+    Sinh các số 0..n-1 theo thứ tự ngẫu nhiên, không lặp. Mỗi bước O(1):
+    Fisher-Yates trên một dict hoán đổi thay vì tạo danh sách n phần tử.
+    """
+    swapped = {}
+    for i in range(n):
+        j = random.randrange(i, n)
+        yield swapped.get(j, j)
+        swapped[j] = swapped.get(i, i)
+
+
+# =========================================================
+# CLASS: RelatedBooksIndex
+# =========================================================
+class RelatedBooksIndex(InMemoryBookIndex):
+    """
+    Danh sách id sách theo tác giả và theo thể loại. Xóa một sách trong O(1)
+    (đổi chỗ với phần tử cuối). Mọi thao tác đều thread-safe.
+    """
+
+    BOOK_QUERY = _BOOK_QUERY
+    REBUILD_INTERVAL = REBUILD_INTERVAL
+    LABEL = "chỉ mục sách liên quan"
+
+    def __init__(self):
+        super().__init__()
+        self._books = {}  # id_sach -> dict dữ liệu hiển thị
+        self._groups = {}  # ("tg"|"tl", id) -> list id_sach
+        self._positions = {}  # (nhóm, id_sach) -> vị trí trong list của nhóm
+
+    # -----------------------------------------------------
+    # Thêm / xóa một sách (giữ lock khi gọi)
+    # -----------------------------------------------------
+    @staticmethod
+    def _group_keys(book):
+        keys = []
+        if book.get("id_tac_gia"):
+            keys.append(("tg", book["id_tac_gia"]))
+        if book.get("id_the_loai"):
+            keys.append(("tl", book["id_the_loai"]))
+        return keys
+
+    def _add(self, book):
+        id_sach = book["id_sach"]
+        self._discard(id_sach)
+        self._books[id_sach] = book
+        for group in self._group_keys(book):
+            ids = self._groups.setdefault(group, [])
+            self._positions[(group, id_sach)] = len(ids)
+            ids.append(id_sach)
+
+    def _discard(self, id_sach):
+        book = self._books.pop(id_sach, None)
+        if book is None:
+            return
+        for group in self._group_keys(book):
+            ids = self._groups[group]
+            pos = self._positions.pop((group, id_sach))
+            last = ids.pop()
+            if last != id_sach:  # Đưa phần tử cuối vào chỗ trống
+                ids[pos] = last
+                self._positions[(group, last)] = pos
+            if not ids:
+                del self._groups[group]
+
+    @staticmethod
+    def _to_book(row):
+        return {
+            "id_sach": row["id_sach"],
+            "tieu_de": row["tieu_de"],
+            "anh_bia": row.get("anh_bia"),
+            "ten_tac_gia": row.get("ten_tac_gia"),
+            "id_tac_gia": row.get("id_tac_gia"),
+            "id_the_loai": row.get("id_the_loai"),
+        }
+
+    def _adopt(self, fresh):
+        self._books = fresh._books
+        self._groups = fresh._groups
+        self._positions = fresh._positions
+
+    # -----------------------------------------------------
+    # Lấy mẫu sách liên quan
+    # -----------------------------------------------------
+    def sample(self, id_sach, id_tac_gia, id_the_loai, limit=10):
+        """
+        Trả về tối đa `limit` sách ngẫu nhiên cùng tác giả hoặc cùng thể loại
+        với sách `id_sach` (không gồm chính nó), mỗi sách có xác suất như nhau.
+        List dict: id_sach, tieu_de, anh_bia, ten_tac_gia (chưa có is_favorite).
+        """
+        self.ensure_built()
+        with self._lock:
+            by_author = self._groups.get(("tg", id_tac_gia), []) if id_tac_gia else []
+            by_genre = self._groups.get(("tl", id_the_loai), []) if id_the_loai else []
+            # Xem hai danh sách như một dãy nối tiếp; sách cùng tác giả VÀ cùng thể loại
+            # chỉ được tính ở phần tác giả để không bị chọn với xác suất gấp đôi.
+            result = []
+            for pos in _random_positions(len(by_author) + len(by_genre)):
+                if pos < len(by_author):
+                    candidate = by_author[pos]
+                else:
+                    candidate = by_genre[pos - len(by_author)]
+                    if id_tac_gia and self._books[candidate].get("id_tac_gia") == id_tac_gia:
+                        continue
+                if candidate == id_sach:
+                    continue
+                book = self._books[candidate]
+                result.append(
+                    {
+                        "id_sach": book["id_sach"],
+                        "tieu_de": book["tieu_de"],
+                        "anh_bia": book["anh_bia"],
+                        "ten_tac_gia": book["ten_tac_gia"],
+                    }
+                )
+                if len(result) >= limit:
+                    break
+            return result
+
+
+# Chỉ mục dùng chung cho cả tiến trình
+related_index = RelatedBooksIndex()
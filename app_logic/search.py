@@ -0,0 +1,110 @@
+# app_logic/search.py
+# =========================================================
+# FILE SEARCH (Tìm kiếm sách)
+# Xây dựng phần SQL tìm kiếm sách theo từ khóa (tiêu đề, tác giả,
+# mô tả) dùng chung cho các trang tra cứu và trang quản lý sách.
+#
+# - Mặc định dùng chỉ mục FULLTEXT (parser ngram, hỗ trợ tiếng Việt)
+#   được tạo bởi migrations/0001_fulltext_search.up.sql, có xếp hạng
+#   theo độ liên quan.
+# - Dùng LIKE '%...%' (cách cũ) khi từ khóa quá ngắn so với kích thước
+#   ngram hoặc khi tắt FULLTEXT bằng biến môi trường SEARCH_FULLTEXT=0.
+#
+# Quy ước: câu truy vấn gọi tới phải đặt bí danh `s` cho bảng Sach và
+# `tg` cho bảng TacGia (LEFT JOIN).
+# =========================================================
+
+import os  # Đọc biến môi trường
+import re  # Làm sạch từ khóa
+
+# --- Cấu hình tìm kiếm ---
+# - SEARCH_FULLTEXT: "1" dùng FULLTEXT, "0" dùng LIKE.
+# - SEARCH_MIN_TERM_LEN: Độ dài tối thiểu của từ khóa để dùng FULLTEXT
+#   (nên bằng `ngram_token_size` của MySQL, mặc định 2).
+search_config = {
+    "fulltext": os.getenv("SEARCH_FULLTEXT", "1") == "1",
+    "min_term_len": int(os.getenv("SEARCH_MIN_TERM_LEN", "2")),
+}
+
+# Các ký tự toán tử của BOOLEAN MODE cần loại bỏ khỏi từ khóa người dùng
+_RE_BOOLEAN_OPERATORS = re.compile(r'[+\-<>()~*"@]')
+_RE_SPACE = re.compile(r"\s+")
+
+# Bảng tạm (derived table) chứa id sách khớp và điểm liên quan.
+# Mỗi nhánh UNION được MySQL thực hiện bằng chỉ mục FULLTEXT tương ứng,
+# nên thời gian không tăng theo tổng số sách.
+_FULLTEXT_JOIN = """
+    JOIN (
+        SELECT kq.id_sach, SUM(kq.diem) AS relevance FROM (
+            SELECT id_sach, MATCH(tieu_de, mo_ta) AGAINST (%s IN BOOLEAN MODE) AS diem
+            FROM Sach WHERE MATCH(tieu_de, mo_ta) AGAINST (%s IN BOOLEAN MODE)
+            UNION ALL
+            SELECT s_tg.id_sach, MATCH(tg_ft.ten_tac_gia) AGAINST (%s IN BOOLEAN MODE) AS diem
+            FROM TacGia tg_ft JOIN Sach s_tg ON s_tg.id_tac_gia = tg_ft.id_tac_gia
+            WHERE MATCH(tg_ft.ten_tac_gia) AGAINST (%s IN BOOLEAN MODE)
+        ) kq GROUP BY kq.id_sach
+    ) kq_tim ON kq_tim.id_sach = s.id_sach
+"""
+
+
+# =========================================================
+# CLASS: SearchClause
+# Các mảnh SQL (kèm tham số) để ghép vào câu truy vấn danh sách sách.
+# =========================================================
+class SearchClause:
+    """
+    - `join` / `join_params`: Đặt sau các JOIN khác trong phần FROM (rỗng khi dùng LIKE).
+    - `where` / `where_params`: Điều kiện thêm vào mệnh đề WHERE (None khi dùng FULLTEXT).
+    - `order`: Biểu thức ORDER BY theo độ liên quan (None khi dùng LIKE).
+    """
+
+    def __init__(self, join="", join_params=(), where=None, where_params=(), order=None):
+        self.join = join
+        self.join_params = list(join_params)
+        self.where = where
+        self.where_params = list(where_params)
+        self.order = order
+
+    @property
+    def is_fulltext(self):
+        return bool(self.join)
+
+
+def _clean_term(search_query):
+    """Bỏ toán tử BOOLEAN MODE và khoảng trắng thừa khỏi từ khóa."""
+    term = _RE_BOOLEAN_OPERATORS.sub(" ", search_query or "")
+    return _RE_SPACE.sub(" ", term).strip()
+
+
+# =========================================================
+# HÀM: BUILD_BOOK_SEARCH
+# Trả về SearchClause cho từ khóa, hoặc None nếu không có từ khóa.
+# =========================================================
+def build_book_search(search_query):
+    """
+    Tạo các mảnh SQL tìm sách theo từ khóa `search_query`.
+    Ví dụ dùng:
+        clause = build_book_search(q)
+        sql = f"SELECT ... FROM Sach s LEFT JOIN TacGia tg ... {clause.join} WHERE ..."
+    """
+    search_query = (search_query or "").strip()
+    if not search_query:
+        return None
+
+    term = _clean_term(search_query)
+    if search_config["fulltext"] and len(term) >= search_config["min_term_len"]:
+        # Tìm theo cụm từ ("...") để kết quả tương đương LIKE '%từ khóa%'
+        # nhưng dùng chỉ mục ngram thay vì quét toàn bảng.
+        phrase = f'"{term}"'
+        return SearchClause(
+            join=_FULLTEXT_JOIN,
+            join_params=[phrase, phrase, phrase, phrase],
+            order="kq_tim.relevance DESC",
+        )
+
+    # Dự phòng: LIKE (collation utf8mb4_unicode_ci đã không phân biệt hoa thường)
+    like_term = f"%{search_query}%"
+    return SearchClause(
+        where="(s.tieu_de LIKE %s OR tg.ten_tac_gia LIKE %s)",
+        where_params=[like_term, like_term],
+    )
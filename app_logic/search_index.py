@@ -0,0 +1,151 @@
+# app_logic/search_index.py
+# =========================================================
+# FILE SEARCH INDEX (Chỉ mục tìm kiếm trong bộ nhớ)
+# Chỉ mục đảo ngược (inverted index) trên tiêu đề sách và tên tác giả,
+# phục vụ gợi ý tìm kiếm nhanh (/api/live-search-sach) mà không cần
+# truy vấn CSDL ở mỗi lần gõ phím.
+#
+# - Token hóa bằng đúng quy tắc của `utils.slugify` (bỏ dấu tiếng Việt,
+#   chữ thường), nên "mat biec", "Mắt Biếc", "MẮT" đều khớp "Mắt Biếc".
+# - Hỗ trợ tìm theo tiền tố: mọi từ trong câu tìm kiếm phải là tiền tố
+#   của một từ trong tiêu đề/tên tác giả.
+# - Kết quả xếp hạng theo lượt mượn (được cache khi xây chỉ mục), sau
+#   đó theo tiêu đề.
+# - Được cập nhật từng sách khi admin thêm/sửa/ẩn/khôi phục sách, và
+#   xây lại toàn bộ định kỳ (SEARCH_INDEX_REBUILD_INTERVAL giây) để nhận
+#   thay đổi từ các worker khác và cập nhật lượt mượn.
+# =========================================================
+
+import bisect  # Tìm kiếm nhị phân trên danh sách token đã sắp xếp (tra tiền tố)
+import heapq  # Lấy top-N kết quả mà không cần sắp xếp toàn bộ
+import os  # Đọc biến môi trường
+from app_logic.memory_index import InMemoryBookIndex  # Xây/xây lại/cập nhật từng sách (dùng chung)
+from app_logic.utils import slugify  # Quy tắc bỏ dấu/chuẩn hóa dùng chung
+
+# Số giây tối đa giữa hai lần xây lại toàn bộ chỉ mục
+REBUILD_INTERVAL = float(os.getenv("SEARCH_INDEX_REBUILD_INTERVAL", "600"))
+
+# Câu truy vấn lấy dữ liệu sách cho chỉ mục (chỉ sách đang hoạt động)
+_BOOK_QUERY = """
+    SELECT s.id_sach, s.tieu_de, s.anh_bia, tg.ten_tac_gia,
+           (SELECT COUNT(*) FROM MuonTra mt WHERE mt.id_sach = s.id_sach) AS luot_muon
+    FROM Sach s LEFT JOIN TacGia tg ON s.id_tac_gia = tg.id_tac_gia
+    WHERE s.trang_thai = 'hoat_dong'
+"""
+
+
+def tokenize(text):
+    """Tách văn bản thành các token đã bỏ dấu, ví dụ "Mắt Biếc" -> ["mat", "biec"]."""
+    return [t for t in slugify(text).split("-") if t]
+
+
+# =========================================================
+# CLASS: BookSearchIndex
+# =========================================================
+class BookSearchIndex(InMemoryBookIndex):
+    """
+    Chỉ mục đảo ngược token -> tập id_sach, kèm danh sách token đã sắp xếp
+    để tra tiền tố bằng bisect. Mọi thao tác đều thread-safe.
+    """
+
+    BOOK_QUERY = _BOOK_QUERY
+    REBUILD_INTERVAL = REBUILD_INTERVAL
+    LABEL = "chỉ mục tìm kiếm"
+
+    def __init__(self):
+        super().__init__()
+        self._books = {}  # id_sach -> dict dữ liệu trả về cho API
+        self._book_tokens = {}  # id_sach -> tập token của sách đó
+        self._postings = {}  # token -> set(id_sach)
+        self._sorted_tokens = []  # Các token đã sắp xếp (tra tiền tố)
+
+    # -----------------------------------------------------
+    # Thêm / xóa một sách (giữ lock khi gọi)
+    # -----------------------------------------------------
+    def _add(self, book, keep_sorted=True):
+        id_sach = book["id_sach"]
+        self._discard(id_sach)
+        tokens = set(tokenize(book["tieu_de"])) | set(tokenize(book.get("ten_tac_gia")))
+        self._books[id_sach] = book
+        self._book_tokens[id_sach] = tokens
+        for token in tokens:
+            ids = self._postings.get(token)
+            if ids is None:
+                self._postings[token] = ids = set()
+                if keep_sorted:
+                    bisect.insort(self._sorted_tokens, token)
+            ids.add(id_sach)
+
+    def _discard(self, id_sach):
+        self._books.pop(id_sach, None)
+        for token in self._book_tokens.pop(id_sach, ()):
+            ids = self._postings.get(token)
+            if ids is None:
+                continue
+            ids.discard(id_sach)
+            if not ids:
+                del self._postings[token]
+                pos = bisect.bisect_left(self._sorted_tokens, token)
+                if pos < len(self._sorted_tokens) and self._sorted_tokens[pos] == token:
+                    del self._sorted_tokens[pos]
+
+    @staticmethod
+    def _to_book(row):
+        return {
+            "id_sach": row["id_sach"],
+            "tieu_de": row["tieu_de"],
+            "anh_bia": row.get("anh_bia"),
+            "ten_tac_gia": row.get("ten_tac_gia"),
+            "luot_muon": int(row.get("luot_muon") or 0),
+            "slug": slugify(row["tieu_de"]),
+        }
+
+    def _adopt(self, fresh):
+        self._books = fresh._books
+        self._book_tokens = fresh._book_tokens
+        self._postings = fresh._postings
+        self._sorted_tokens = fresh._sorted_tokens
+
+    def _load(self, rows):
+        # Nạp hàng loạt: sắp xếp token một lần ở cuối thay vì insort từng token (O(T²))
+        for row in rows:
+            self._add(self._to_book(row), keep_sorted=False)
+        self._sorted_tokens = sorted(self._postings)
+
+    # -----------------------------------------------------
+    # Tìm kiếm
+    # -----------------------------------------------------
+    def _ids_with_prefix(self, prefix):
+        ids = set()
+        pos = bisect.bisect_left(self._sorted_tokens, prefix)
+        while pos < len(self._sorted_tokens) and self._sorted_tokens[pos].startswith(prefix):
+            ids |= self._postings[self._sorted_tokens[pos]]
+            pos += 1
+        return ids
+
+    def search(self, query, limit=7):
+        """
+        Trả về tối đa `limit` sách khớp `query` (list dict: id_sach, tieu_de,
+        anh_bia, ten_tac_gia, luot_muon, slug), mượn nhiều nhất lên trước.
+        """
+        self.ensure_built()
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        with self._lock:
+            # Xét token dài nhất trước (thường khớp ít sách nhất) để tập ứng viên thu hẹp nhanh
+            candidates = None
+            for token in sorted(set(tokens), key=len, reverse=True):
+                ids = self._ids_with_prefix(token)
+                candidates = ids if candidates is None else candidates & ids
+                if not candidates:
+                    return []
+            books = [self._books[i] for i in candidates]
+        top = heapq.nsmallest(
+            limit, books, key=lambda b: (-b["luot_muon"], b["tieu_de"].lower())
+        )
+        return [dict(b) for b in top]
+
+
+# Chỉ mục dùng chung cho cả tiến trình
+book_index = BookSearchIndex()
@@ -0,0 +1,202 @@
+# app_logic/settings.py
+# =========================================================
+# FILE SETTINGS (Cài đặt hệ thống)
+# Đọc bảng `CaiDat` một lần, giữ trong bộ nhớ và cung cấp các hàm
+# truy cập có kiểu (int/float) cho các route, để các transaction
+# mượn/trả sách không phải truy vấn CaiDat mỗi lần.
+#
+# Cơ chế làm mới: mỗi lần admin lưu cài đặt, khóa `settings_version`
+# trong CaiDat được tăng lên. Mỗi tiến trình kiểm tra lại phiên bản
+# này định kỳ (SETTINGS_CHECK_INTERVAL giây) và tải lại toàn bộ bảng
+# khi phiên bản thay đổi.
+# =========================================================
+
+import os  # Đọc biến môi trường
+import threading  # Khóa bảo vệ bộ nhớ đệm dùng chung
+import time  # Tính thời điểm kiểm tra phiên bản
+import mysql.connector  # Để xử lý lỗi CSDL MySQL
+from flask import has_app_context  # Biết đang chạy trong Flask (có kết nối của request) hay không
+from app_logic.db import get_db_connection, get_pooled_connection  # Kết nối của request / kết nối riêng
+
+# Khóa đặc biệt trong CaiDat lưu phiên bản cài đặt (không hiển thị trên trang cài đặt)
+VERSION_KEY = "settings_version"
+
+# Số giây giữa hai lần kiểm tra phiên bản cài đặt trong CSDL
+CHECK_INTERVAL = float(os.getenv("SETTINGS_CHECK_INTERVAL", "30"))
+
+# Trạng thái bộ nhớ đệm của tiến trình
+_state = {
+    "values": None,  # dict {setting_key: setting_value} (chuỗi, như trong CSDL)
+    "version": None,  # Phiên bản đã tải
+    "checked_at": 0.0,  # Thời điểm (monotonic) kiểm tra phiên bản gần nhất
+}
+_lock = threading.Lock()  # Bảo vệ _state (chỉ giữ trong lúc đọc/ghi, không giữ khi truy vấn)
+_load_lock = threading.Lock()  # Chỉ một thread đọc CaiDat tại một thời điểm (single-flight)
+
+
+# =========================================================
+# HÀM NỘI BỘ: ĐỌC CSDL
+# =========================================================
+def _connection():
+    """
+    Kết nối để đọc CaiDat. Ưu tiên một kết nối riêng nếu pool còn chỗ ngay
+    (`wait=False`); khi pool đã đầy thì đọc trên kết nối của request đang gọi
+    thay vì chờ: request đó đang giữ một chỗ trong pool, chờ thêm chỗ thứ hai
+    có thể treo tới hết timeout (hoặc kẹt hẳn khi mọi request cùng chờ).
+    Ngoài Flask (script) không có kết nối của request nên chờ như bình thường.
+    """
+    conn = get_pooled_connection(wait=False)
+    if conn is not None:
+        return conn
+    if has_app_context():
+        return get_db_connection()  # Chỉ đọc (SELECT); close() không trả kết nối của request về pool
+    return get_pooled_connection()
+
+
+def _read_version(cursor):
+    cursor.execute(
+        "SELECT setting_value FROM CaiDat WHERE setting_key = %s", (VERSION_KEY,)
+    )
+    row = cursor.fetchone()
+    return row["setting_value"] if row else None
+
+
+def _load(previous_version):
+    """
+    Đọc phiên bản cài đặt và (nếu khác `previous_version`) toàn bộ bảng CaiDat
+    (kết nối lấy từ `_connection()`). Trả về (version, values) — values là None
+    nếu phiên bản không đổi. Lỗi CSDL được ném ra cho nơi gọi.
+    """
+    conn = None
+    cursor = None
+    try:
+        conn = _connection()
+        cursor = conn.cursor(dictionary=True)
+        version = _read_version(cursor)
+        if previous_version is not None and version == previous_version:
+            return version, None
+        cursor.execute("SELECT setting_key, setting_value FROM CaiDat")
+        values = {
+            row["setting_key"]: row["setting_value"]
+            for row in cursor.fetchall()
+            if row["setting_key"] != VERSION_KEY
+        }
+        return version, values
+    finally:
+        if cursor:
+            cursor.close()
+        if conn and conn.is_connected():
+            conn.close()
+
+
+def _refresh(force=False):
+    """
+    Trả về dict cài đặt hiện hành, tải lại khi cần:
+    - Chưa tải lần nào (hoặc vừa invalidate): chờ một thread duy nhất tải; nếu
+      lỗi CSDL thì NÉM lỗi (không dùng giá trị mặc định để transaction mượn/trả
+      thất bại thay vì ghi sai tiền phạt/giới hạn).
+    - Đã quá CHECK_INTERVAL: chỉ một thread kiểm tra phiên bản, các thread khác
+      dùng tạm giá trị cũ (không chờ). Lỗi CSDL -> giữ giá trị cũ.
+    - `force`: kiểm tra phiên bản ngay (chờ nếu đang có thread khác kiểm tra).
+    """
+    values = _state["values"]
+    if (
+        not force
+        and values is not None
+        and time.monotonic() - _state["checked_at"] < CHECK_INTERVAL
+    ):
+        return values
+
+    # Single-flight: chỉ một thread đọc CSDL. Khi đã có giá trị cũ và không
+    # `force`, các thread khác trả về giá trị cũ ngay thay vì xếp hàng chờ.
+    if not _load_lock.acquire(blocking=force or values is None):
+        return values
+    try:
+        with _lock:
+            values, version, checked_at = _state["values"], _state["version"], _state["checked_at"]
+        # Thread khác vừa tải xong trong lúc chờ khóa
+        if values is not None and not force and time.monotonic() - checked_at < CHECK_INTERVAL:
+            return values
+        try:
+            new_version, new_values = _load(version if values is not None else None)
+        except mysql.connector.Error as err:
+            print(f"!!! Lỗi DB khi tải cài đặt hệ thống: {err}")
+            if values is None:
+                raise  # Chưa có giá trị nào để dùng -> nơi gọi rollback và báo lỗi
+            with _lock:
+                _state["checked_at"] = time.monotonic()  # Thử lại sau CHECK_INTERVAL
+            return values
+        with _lock:
+            if new_values is not None:
+                _state["values"] = new_values
+                _state["version"] = new_version
+            _state["checked_at"] = time.monotonic()
+            return _state["values"] if _state["values"] is not None else values
+    finally:
+        _load_lock.release()
+
+
+# =========================================================
+# HÀM: TRUY CẬP CÀI ĐẶT
+# =========================================================
+def all_settings(force_check=False):
+    """
+    Trả về bản sao dict {setting_key: setting_value} của tất cả cài đặt.
+    `force_check=True`: kiểm tra phiên bản trong CSDL ngay (dùng cho trang cài đặt).
+    """
+    return dict(_refresh(force=force_check))
+
+
+def get_setting(key, default=None):
+    """Trả về giá trị (chuỗi) của một cài đặt, hoặc `default` nếu chưa có."""
+    return _refresh().get(key, default)
+
+
+def max_sach_muon_moi_user():
+    """Số sách tối đa một thành viên được mượn/đặt cùng lúc (mặc định 5)."""
+    value = get_setting("max_sach_muon_moi_user", "")
+    return int(value) if str(value).isdigit() else 5
+
+
+def muc_phat_tre_hen():
+    """Mức phạt mỗi ngày trả trễ (mặc định 0.0)."""
+    value = get_setting("muc_phat_tre_hen")
+    if value is None:
+        return 0.0
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        print(f"!!! CẢNH BÁO: Giá trị 'muc_phat_tre_hen' không hợp lệ: '{value}'")
+        return 0.0
+
+
+def thoi_han_gia_han():
+    """Số ngày được gia hạn thêm mỗi lần (mặc định 7, luôn > 0)."""
+    value = get_setting("thoi_han_gia_han", "")
+    so_ngay = int(value) if str(value).isdigit() else 7
+    return so_ngay if so_ngay > 0 else 7
+
+
+# =========================================================
+# HÀM: ĐÁNH DẤU CÀI ĐẶT ĐÃ THAY ĐỔI
+# =========================================================
+def bump_settings_version(cursor):
+    """
+    Tăng phiên bản cài đặt trong CSDL (gọi trong cùng transaction với việc
+    lưu cài đặt, trước khi commit) để các tiến trình khác tải lại.
+    """
+    cursor.execute(
+        """
+        INSERT INTO CaiDat (setting_key, setting_value) VALUES (%s, '1')
+        ON DUPLICATE KEY UPDATE setting_value = CAST(setting_value AS UNSIGNED) + 1
+        """,
+        (VERSION_KEY,),
+    )
+
+
+def invalidate_settings():
+    """Bỏ cache cài đặt của tiến trình hiện tại (gọi sau khi commit)."""
+    with _lock:
+        _state["values"] = None
+        _state["version"] = None
+        _state["checked_at"] = 0.0
@@ -0,0 +1,149 @@
+# app_logic/shelves.py
+# =========================================================
+# FILE SHELVES (Các kệ sách của trang chủ)
+# Trang chủ (không tìm kiếm) hiển thị 3 kệ: Mới nhất, Phổ biến, Gợi ý.
+# Thay vì chạy lại các truy vấn nặng (JOIN MuonTra ... GROUP BY) ở mỗi
+# lượt xem, các kệ được tính sẵn và cache:
+#
+# - Kệ chung (mới nhất, phổ biến): giống nhau cho mọi người dùng, cache
+#   HOME_SHELF_TTL giây và được xóa khi admin thêm/sửa/ẩn/khôi phục sách.
+# - Kệ gợi ý: theo từng người dùng (mô hình mượn chung trong
+#   app_logic/recommend.py; nếu chưa có thì theo thể loại mượn nhiều nhất),
+#   cache RECOMMEND_CACHE_TTL giây và được xóa khi người dùng đó mượn/đặt sách.
+# - Cờ `is_favorite` KHÔNG được cache: được gắn ở mỗi request bằng một
+#   truy vấn YeuThich duy nhất cho mọi sách trên các kệ.
+#
+# Khi cache còn hạn, trang chủ không truy vấn bảng MuonTra.
+# =========================================================
+
+import os  # Đọc biến môi trường
+from app_logic.cache import get_cache  # Cache kệ sách
+from app_logic.recommend import recommend_for_user  # Gợi ý theo lượt mượn chung
+
+SHELF_SIZE = 10  # Số sách trên mỗi kệ
+SHELF_TTL = float(os.getenv("HOME_SHELF_TTL", "300"))
+RECOMMEND_TTL = float(os.getenv("RECOMMEND_CACHE_TTL", "900"))
+
+_shelf_cache = get_cache("home_shelves", maxsize=4, ttl=SHELF_TTL)
+_recommend_cache = get_cache("recommend", maxsize=4096, ttl=RECOMMEND_TTL)
+_GLOBAL_KEY = "global"
+
+# Lấy sách mới nhất
+_NEWEST_SQL = f"""
+    SELECT s.id_sach, s.tieu_de, s.anh_bia, tg.ten_tac_gia
+    FROM Sach s LEFT JOIN TacGia tg ON s.id_tac_gia = tg.id_tac_gia
+    WHERE s.trang_thai = 'hoat_dong' ORDER BY s.id_sach DESC LIMIT {SHELF_SIZE}
+"""
+
+# Lấy sách phổ biến nhất (mượn nhiều nhất)
+_POPULAR_SQL = f"""
+    SELECT s.id_sach, s.tieu_de, s.anh_bia, tg.ten_tac_gia, COUNT(mt.id_muon_tra) AS luot_muon
+    FROM Sach s JOIN MuonTra mt ON s.id_sach = mt.id_sach LEFT JOIN TacGia tg ON s.id_tac_gia = tg.id_tac_gia
+    WHERE s.trang_thai = 'hoat_dong' GROUP BY s.id_sach, s.tieu_de, s.anh_bia, tg.ten_tac_gia
+    ORDER BY luot_muon DESC LIMIT {SHELF_SIZE}
+"""
+
+# Thể loại ưa thích của người dùng (dựa trên lịch sử mượn)
+_FAVORITE_GENRE_SQL = """
+    SELECT s.id_the_loai, COUNT(*) AS so_luong FROM MuonTra mt JOIN Sach s ON mt.id_sach = s.id_sach
+    WHERE mt.id_thanh_vien = %s GROUP BY s.id_the_loai ORDER BY so_luong DESC LIMIT 1
+"""
+
+# Sách thuộc thể loại ưa thích mà người dùng chưa từng mượn
+_GENRE_SUGGEST_SQL = f"""
+    SELECT s.id_sach, s.tieu_de, s.anh_bia, tg.ten_tac_gia
+    FROM Sach s LEFT JOIN TacGia tg ON s.id_tac_gia = tg.id_tac_gia
+    WHERE s.id_the_loai = %s AND s.trang_thai = 'hoat_dong'
+      AND s.id_sach NOT IN (SELECT DISTINCT id_sach FROM MuonTra WHERE id_thanh_vien = %s)
+    LIMIT {SHELF_SIZE}
+"""
+
+
+# =========================================================
+# KỆ CHUNG (MỚI NHẤT, PHỔ BIẾN)
+# =========================================================
+def _load_global_shelves(cursor):
+    cursor.execute(_NEWEST_SQL)
+    moi_nhat = cursor.fetchall()
+    cursor.execute(_POPULAR_SQL)
+    pho_bien = cursor.fetchall()
+    return {"moi_nhat": moi_nhat, "pho_bien": pho_bien}
+
+
+def global_shelves(cursor):
+    """Trả về dict {moi_nhat, pho_bien} (chưa có is_favorite), tính lại khi cache hết hạn."""
+    shelves = _shelf_cache.get(_GLOBAL_KEY)
+    if shelves is None:
+        shelves = _load_global_shelves(cursor)
+        _shelf_cache.set(_GLOBAL_KEY, shelves)
+    return shelves
+
+
+def invalidate_shelves():
+    """Xóa kệ chung (gọi sau khi commit thay đổi sách)."""
+    _shelf_cache.delete(_GLOBAL_KEY)
+
+
+# =========================================================
+# KỆ GỢI Ý THEO NGƯỜI DÙNG
+# =========================================================
+def _load_recommendations(cursor, user_id):
+    goi_y = recommend_for_user(cursor, user_id, limit=SHELF_SIZE)
+    if goi_y:
+        return goi_y
+    # Chưa có mô hình/lịch sử: gợi ý theo thể loại ưa thích
+    cursor.execute(_FAVORITE_GENRE_SQL, (user_id,))
+    the_loai_ua_thich = cursor.fetchone()
+    cursor.fetchall()
+    if not the_loai_ua_thich:
+        return []
+    cursor.execute(_GENRE_SUGGEST_SQL, (the_loai_ua_thich["id_the_loai"], user_id))
+    return cursor.fetchall()
+
+
+def recommendations(cursor, user_id):
+    """
+    Sách gợi ý cho `user_id` (chưa có is_favorite). Danh sách rỗng nghĩa là
+    không có gợi ý theo thể loại -> trang chủ dùng kệ phổ biến thay thế.
+    """
+    key = str(user_id)
+    goi_y = _recommend_cache.get(key)
+    if goi_y is None:
+        goi_y = _load_recommendations(cursor, user_id)
+        _recommend_cache.set(key, goi_y)
+    return goi_y
+
+
+def invalidate_recommendations(user_id):
+    """Xóa gợi ý đã cache của người dùng (gọi sau khi người dùng mượn/đặt sách)."""
+    _recommend_cache.delete(str(user_id))
+
+
+# =========================================================
+# GẮN CỜ YÊU THÍCH VÀ TRẢ VỀ CÁC KỆ
+# =========================================================
+def overlay_favorites(cursor, user_id, *shelves):
+    """
+    Trả về bản sao của từng kệ với cột `is_favorite` của `user_id`,
+    dùng một truy vấn YeuThich cho toàn bộ sách trên các kệ.
+    """
+    ids = {book["id_sach"] for shelf in shelves for book in shelf}
+    favorites = set()
+    if ids:
+        placeholders = ", ".join(["%s"] * len(ids))
+        cursor.execute(
+            f"SELECT id_sach FROM YeuThich WHERE id_thanh_vien = %s AND id_sach IN ({placeholders})",
+            (user_id, *ids),
+        )
+        favorites = {row["id_sach"] for row in cursor.fetchall()}
+    return tuple(
+        [dict(book, is_favorite=book["id_sach"] in favorites) for book in shelf]
+        for shelf in shelves
+    )
+
+
+def home_shelves(cursor, user_id):
+    """Trả về (sach_moi_nhat, sach_goi_y, sach_pho_bien) cho trang chủ của `user_id`."""
+    shelves = global_shelves(cursor)
+    goi_y = recommendations(cursor, user_id) or shelves["pho_bien"]
+    return overlay_favorites(cursor, user_id, shelves["moi_nhat"], goi_y, shelves["pho_bien"])
@@ -0,0 +1,220 @@
+# app_logic/stats.py
+# =========================================================
+# FILE STATS (Thống kê tổng hợp cho dashboard)
+# Duy trì các bảng thống kê tổng hợp sẵn (rollup) để trang dashboard
+# chỉ đọc vài dòng thay vì GROUP BY toàn bộ lịch sử MuonTra:
+#
+# - ThongKeNgay(ngay): số cuốn được mượn (theo ngay_muon), đã trả, đã hủy
+#   và tiền phạt phát sinh trong ngày. Biểu đồ theo tháng cộng dồn từ đây.
+# - ThongKeSach(id_sach), ThongKeThanhVien(id_thanh_vien): tổng số cuốn
+#   đã mượn của từng sách/thành viên (top 5 sách, độc giả, thể loại).
+#
+# "Lượt mượn" giữ đúng định nghĩa cũ của dashboard: SUM(so_luong) của các
+# lượt ở trạng thái 'Đang mượn' hoặc 'Đã trả'. Lượt đặt ('Đang chờ') chỉ
+# được tính khi admin xác nhận lấy sách.
+#
+# Các hàm record_* được gọi trong cùng transaction với thay đổi MuonTra
+# (trước commit). Dữ liệu cũ/bị lệch được tính lại bằng:
+#   python manage.py rebuild-stats
+# =========================================================
+
+import mysql.connector  # Để xử lý lỗi CSDL MySQL
+from mysql.connector import errorcode  # Mã lỗi MySQL (bảng chưa tồn tại)
+
+# Trạng thái được tính là một lượt mượn
+_TRANG_THAI_MUON = "('Đang mượn', 'Đã trả')"
+
+
+def _execute(cursor, sql, params):
+    """
+    Chạy một lệnh cập nhật thống kê. Nếu bảng thống kê chưa được tạo
+    (chưa chạy migration) thì chỉ cảnh báo, không làm hỏng thao tác mượn/trả.
+    """
+    try:
+        cursor.execute(sql, params)
+    except mysql.connector.Error as err:
+        if err.errno != errorcode.ER_NO_SUCH_TABLE:
+            raise
+        print(f"!!! CẢNH BÁO: Chưa có bảng thống kê ({err.msg}). Hãy chạy 'python manage.py migrate'.")
+
+
+def _add_to_day(cursor, ngay, column, value):
+    if ngay is None:
+        return  # Giống truy vấn cũ: lượt mượn không có ngày không được đưa lên biểu đồ
+    _execute(
+        cursor,
+        f"""INSERT INTO ThongKeNgay (ngay, {column}) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE {column} = {column} + %s""",
+        (ngay, value, value),
+    )
+
+
+# =========================================================
+# CẬP NHẬT TĂNG DẦN (gọi trong transaction mượn/trả/hủy)
+# =========================================================
+def record_borrow(cursor, id_sach, id_thanh_vien, so_luong, ngay_muon):
+    """Một lượt chuyển sang 'Đang mượn' (admin ghi nhận mượn hoặc xác nhận lấy sách)."""
+    record_borrows(cursor, [(id_sach, id_thanh_vien, so_luong, ngay_muon)])
+
+
+def _add_many(cursor, table, key_column, totals):
+    """Cộng dồn luot_muon cho nhiều khóa bằng một câu INSERT nhiều dòng."""
+    if not totals:
+        return
+    _execute(
+        cursor,
+        f"""INSERT INTO {table} ({key_column}, luot_muon)
+            VALUES {", ".join(["(%s, %s)"] * len(totals))} AS moi
+            ON DUPLICATE KEY UPDATE luot_muon = {table}.luot_muon + moi.luot_muon""",
+        tuple(value for item in sorted(totals.items()) for value in item),
+    )
+
+
+def record_borrows(cursor, items):
+    """
+    Nhiều lượt chuyển sang 'Đang mượn' cùng lúc (vd: mượn nhiều sách tại quầy).
+    `items`: list (id_sach, id_thanh_vien, so_luong, ngay_muon). Số liệu được
+    gộp theo ngày/sách/thành viên trước, mỗi bảng chỉ tốn một câu lệnh.
+    """
+    by_day, by_book, by_member = {}, {}, {}
+    for id_sach, id_thanh_vien, so_luong, ngay_muon in items:
+        if ngay_muon is not None:
+            by_day[ngay_muon] = by_day.get(ngay_muon, 0) + so_luong
+        by_book[id_sach] = by_book.get(id_sach, 0) + so_luong
+        by_member[id_thanh_vien] = by_member.get(id_thanh_vien, 0) + so_luong
+    for ngay, so_luong in by_day.items():
+        _add_to_day(cursor, ngay, "luot_muon", so_luong)
+    _add_many(cursor, "ThongKeSach", "id_sach", by_book)
+    _add_many(cursor, "ThongKeThanhVien", "id_thanh_vien", by_member)
+
+
+def record_return(cursor, so_luong, tien_phat, ngay_tra):
+    """Một lượt 'Đang mượn' -> 'Đã trả' (không đổi tổng lượt mượn)."""
+    _add_to_day(cursor, ngay_tra, "luot_tra", so_luong)
+    if tien_phat:
+        _add_to_day(cursor, ngay_tra, "tien_phat", tien_phat)
+
+
+def record_cancel(cursor, so_luong, ngay_huy):
+    """Một lượt đặt 'Đang chờ' -> 'Đã hủy'."""
+    _add_to_day(cursor, ngay_huy, "luot_huy", so_luong)
+
+
+# =========================================================
+# TÍNH LẠI TOÀN BỘ (backfill / sửa lệch)
+# =========================================================
+def rebuild_stats(conn):
+    """
+    Tính lại toàn bộ bảng thống kê từ MuonTra trong một transaction.
+    Các thao tác mượn/trả chạy cùng lúc sẽ phải chờ tới khi xong,
+    nên nên chạy ngoài giờ cao điểm. Trả về dict số dòng của mỗi bảng.
+    """
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        cursor.execute("DELETE FROM ThongKeNgay")
+        cursor.execute("DELETE FROM ThongKeSach")
+        cursor.execute("DELETE FROM ThongKeThanhVien")
+
+        cursor.execute(
+            f"""INSERT INTO ThongKeNgay (ngay, luot_muon)
+                SELECT ngay_muon, SUM(so_luong) FROM MuonTra
+                WHERE trang_thai IN {_TRANG_THAI_MUON} AND ngay_muon IS NOT NULL
+                GROUP BY ngay_muon"""
+        )
+        cursor.execute(
+            """INSERT INTO ThongKeNgay (ngay, luot_tra, tien_phat)
+               SELECT * FROM (
+                   SELECT DATE(ngay_tra_thuc) AS ngay, SUM(so_luong) AS so_cuon, SUM(tien_phat) AS phat
+                   FROM MuonTra WHERE trang_thai = 'Đã trả' AND ngay_tra_thuc IS NOT NULL
+                   GROUP BY DATE(ngay_tra_thuc)
+               ) AS tra
+               ON DUPLICATE KEY UPDATE luot_tra = tra.so_cuon, tien_phat = tra.phat"""
+        )
+        cursor.execute(
+            """INSERT INTO ThongKeNgay (ngay, luot_huy)
+               SELECT * FROM (
+                   SELECT DATE(ngay_tra_thuc) AS ngay, SUM(so_luong) AS so_cuon
+                   FROM MuonTra WHERE trang_thai = 'Đã hủy' AND ngay_tra_thuc IS NOT NULL
+                   GROUP BY DATE(ngay_tra_thuc)
+               ) AS huy
+               ON DUPLICATE KEY UPDATE luot_huy = huy.so_cuon"""
+        )
+        cursor.execute(
+            f"""INSERT INTO ThongKeSach (id_sach, luot_muon)
+                SELECT id_sach, SUM(so_luong) FROM MuonTra
+                WHERE trang_thai IN {_TRANG_THAI_MUON} GROUP BY id_sach"""
+        )
+        cursor.execute(
+            f"""INSERT INTO ThongKeThanhVien (id_thanh_vien, luot_muon)
+                SELECT id_thanh_vien, SUM(so_luong) FROM MuonTra
+                WHERE trang_thai IN {_TRANG_THAI_MUON} GROUP BY id_thanh_vien"""
+        )
+        conn.commit()
+
+        counts = {}
+        for table in ("ThongKeNgay", "ThongKeSach", "ThongKeThanhVien"):
+            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            counts[table] = cursor.fetchone()[0]
+        return counts
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+# =========================================================
+# ĐỌC THỐNG KÊ CHO DASHBOARD
+# =========================================================
+def dashboard_rollups(cursor):
+    """
+    Đọc các số liệu tổng hợp cho dashboard (cursor dạng dictionary).
+    Trả về dict: total_phat, top_books, top_users, top_genres, chart_labels, chart_values.
+    """
+    cursor.execute("SELECT SUM(tien_phat) AS total FROM ThongKeNgay")
+    total_phat = (result := cursor.fetchone()) and result.get("total") or 0.0
+
+    # Top 5 sách mượn nhiều nhất
+    cursor.execute(
+        """ SELECT s.tieu_de, tk.luot_muon AS total_borrows
+            FROM ThongKeSach tk JOIN Sach s ON tk.id_sach = s.id_sach
+            WHERE tk.luot_muon > 0 ORDER BY tk.luot_muon DESC LIMIT 5 """
+    )
+    top_books = cursor.fetchall()
+
+    # Top 5 độc giả mượn nhiều nhất
+    cursor.execute(
+        """ SELECT tv.ho_ten, tk.luot_muon AS total_borrows
+            FROM ThongKeThanhVien tk JOIN ThanhVien tv ON tk.id_thanh_vien = tv.id_thanh_vien
+            WHERE tk.luot_muon > 0 ORDER BY tk.luot_muon DESC LIMIT 5 """
+    )
+    top_users = cursor.fetchall()
+
+    # Top 5 thể loại: cộng dồn ThongKeSach theo thể loại, không quét MuonTra
+    cursor.execute(
+        """ SELECT tl.ten_the_loai, SUM(tk.luot_muon) AS total_borrows
+            FROM ThongKeSach tk JOIN Sach s ON tk.id_sach = s.id_sach
+            JOIN TheLoai tl ON s.id_the_loai = tl.id_the_loai
+            GROUP BY tl.id_the_loai, tl.ten_the_loai
+            HAVING total_borrows > 0 ORDER BY total_borrows DESC LIMIT 5 """
+    )
+    top_genres = cursor.fetchall()
+
+    # Lượt mượn 6 tháng gần nhất (tối đa ~186 dòng ThongKeNgay)
+    cursor.execute(
+        """ SELECT DATE_FORMAT(ngay, '%Y-%m') AS month, SUM(luot_muon) AS total_borrows
+            FROM ThongKeNgay
+            WHERE ngay >= DATE_SUB(CURDATE(), INTERVAL 6 MONTH) AND ngay <= CURDATE()
+            GROUP BY month HAVING total_borrows > 0 ORDER BY month ASC """
+    )
+    borrow_data = cursor.fetchall()
+
+    return {
+        "total_phat": total_phat,
+        "top_books": top_books,
+        "top_users": top_users,
+        "top_genres": top_genres,
+        "chart_labels": [row["month"] for row in borrow_data],
+        "chart_values": [int(row["total_borrows"]) for row in borrow_data],
+    }
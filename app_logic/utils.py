@@ -80,36 +80,89 @@ def admin_required(f):
 
 
 # =========================================================
-# HÀM: GET_OR_CREATE
-# Lấy ID của một bản ghi dựa trên giá trị cột tên (vd: tên tác giả),
-# hoặc tạo mới bản ghi nếu chưa tồn tại và trả về ID mới.
+# HÀM: GET_OR_CREATE / GET_OR_CREATE_MANY
+# Lấy ID của các bản ghi dựa trên giá trị cột tên (vd: tên tác giả),
+# tạo mới các bản ghi chưa tồn tại và trả về ID.
 # =========================================================
-def get_or_create(cursor, table, id_column, name_column, value):
+GET_OR_CREATE_BATCH = 500  # Số tên tối đa trong một câu IN (...) / INSERT nhiều dòng
+
+
+def _lookup_ids(cursor, table, id_column, name_column, names, lock=False):
+    """
+    Tìm ID của các tên trong `names` bằng `WHERE name IN (...)` (dùng chỉ mục UNIQUE
+    của cột tên; so sánh theo collation của cột, không phân biệt hoa thường/dấu).
+    FIELD(...) cho biết dòng tìm được khớp với tên đầu vào nào (tên khớp đầu tiên).
+    `lock=True`: đọc bản mới nhất đã commit (FOR SHARE) thay vì snapshot của transaction.
+    Trả về dict {tên đầu vào: id} (chỉ các tên đã tồn tại).
+    """
+    placeholders = ", ".join(["%s"] * len(names))
+    cursor.execute(
+        f"""SELECT {id_column} AS id, FIELD({name_column}, {placeholders}) AS vi_tri
+            FROM {table} WHERE {name_column} IN ({placeholders})"""
+        + (" FOR SHARE" if lock else ""),
+        tuple(names) * 2,
+    )
+    return {names[row["vi_tri"] - 1]: row["id"] for row in cursor.fetchall() if row["vi_tri"]}
+
+
+def get_or_create_many(cursor, table, id_column, name_column, values, created_tables=None):
+    """
+    Phiên bản hàng loạt của get_or_create (dùng khi nhập danh mục sách).
+    Với mỗi lô tối đa GET_OR_CREATE_BATCH tên:
+    1. Một truy vấn IN (...) lấy ID các tên đã có.
+    2. Một lệnh `INSERT ... VALUES (...), (...) ON DUPLICATE KEY UPDATE` thêm các tên
+       còn thiếu; tên vừa được transaction khác thêm sẽ không gây lỗi trùng khóa.
+    3. Đọc lại ID các tên vừa thêm (FOR SHARE: thấy cả dòng do transaction khác commit).
+    `cursor` phải là cursor dạng dictionary. Tên rỗng bị bỏ qua.
+    `created_tables`: set; nếu có dòng mới, tên bảng được thêm vào để nơi gọi
+    xóa cache danh mục (reference.invalidate_reference) SAU KHI commit.
+    Trả về dict {tên (đã strip): id}.
+    """
+    names = list(dict.fromkeys(v.strip() for v in values if v and v.strip()))
+    result = {}
+    for start in range(0, len(names), GET_OR_CREATE_BATCH):
+        batch = names[start : start + GET_OR_CREATE_BATCH]
+        found = _lookup_ids(cursor, table, id_column, name_column, batch)
+        missing = [name for name in batch if name not in found]
+        if missing:
+            cursor.execute(
+                f"INSERT INTO {table} ({name_column}) VALUES "
+                + ", ".join(["(%s)"] * len(missing))
+                + f" ON DUPLICATE KEY UPDATE {name_column} = {name_column}",
+                tuple(missing),
+            )
+            if created_tables is not None:
+                created_tables.add(table)
+            # Các cách viết khác nhau của cùng một tên (vd: "Mới" và "mới") chỉ tạo
+            # một dòng và FIELD chỉ khớp tên đầu tiên -> tra lại cho tới khi đủ
+            pending = missing
+            while pending:
+                matched = _lookup_ids(cursor, table, id_column, name_column, pending, lock=True)
+                if not matched:
+                    break
+                found.update(matched)
+                pending = [name for name in pending if name not in found]
+        result.update(found)
+    return result
+
+
+def get_or_create(cursor, table, id_column, name_column, value, created_tables=None):
     """
     Kiểm tra nếu một giá trị (`value`) đã tồn tại trong cột `name_column` của bảng `table`.
     - Nếu tồn tại, trả về giá trị của cột `id_column`.
     - Nếu không tồn tại, tạo một bản ghi mới với giá trị `value` trong cột `name_column`
-      và trả về ID của bản ghi mới được tạo (lastrowid).
+      và trả về ID của bản ghi mới được tạo.
     Hữu ích khi thêm sách để xử lý Tác giả/Thể loại mới hoặc đã có.
-    So sánh tên không phân biệt hoa thường.
+    So sánh tên theo collation của cột (không phân biệt hoa thường), an toàn khi
+    nhiều admin cùng thêm một tên mới (xem get_or_create_many).
+    `created_tables`: xem get_or_create_many.
     """
     clean_value = value.strip()  # Loại bỏ khoảng trắng thừa ở đầu/cuối
     if not clean_value:
         return None  # Trả về None nếu giá trị rỗng
-
-    # Truy vấn tìm ID dựa trên tên (không phân biệt hoa thường)
-    query = f"SELECT {id_column} FROM {table} WHERE LOWER({name_column}) = LOWER(%s)"  # Sửa: Thêm LOWER()
-    cursor.execute(query, (clean_value,))  # Bỏ .lower() ở đây vì đã có trong query
-    result = cursor.fetchone()
-
-    if result:
-        # Nếu tìm thấy, trả về ID (lấy theo tên cột id_column)
-        return result[id_column]
-    else:
-        # Nếu không tìm thấy, tạo bản ghi mới
-        insert_query = f"INSERT INTO {table} ({name_column}) VALUES (%s)"
-        cursor.execute(insert_query, (clean_value,))
-        return cursor.lastrowid  # Trả về ID của bản ghi vừa được thêm
+    return get_or_create_many(
+        cursor, table, id_column, name_column, [clean_value], created_tables
+    ).get(clean_value)
 
 
 # =========================================================
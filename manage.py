@@ -0,0 +1,141 @@
+# manage.py
+# =========================================================
+# SCRIPT QUẢN TRỊ (DÒNG LỆNH)
+# Các tác vụ chạy khi triển khai/bảo trì, ngoài ứng dụng web:
+#   python manage.py migrate [--target 0002]   # Áp dụng migration còn thiếu
+#   python manage.py rollback [--steps 1]      # Gỡ migration gần nhất
+#   python manage.py status                    # Xem trạng thái migration
+#   python manage.py rebuild-stats             # Tính lại bảng thống kê dashboard
+#   python manage.py build-recommendations     # Tính lại bảng sách gợi ý (SachGoiY)
+#   python manage.py import-books FILE [--dry-run]  # Nhập danh mục sách (CSV/JSON Lines)
+#   python manage.py reconcile-quota           # Tính lại bộ đếm sách đang giữ (ThanhVienQuota)
+# Cấu hình CSDL được đọc từ file .env (xem app_logic/db.py).
+# =========================================================
+
+import argparse  # Phân tích tham số dòng lệnh
+import sys  # Mã thoát của script
+import mysql.connector  # Thư viện kết nối MySQL
+from app_logic.db import db_config  # Cấu hình CSDL dùng chung với ứng dụng
+from app_logic import migrate as schema_migrate  # Chạy migration lược đồ
+from app_logic import stats as loan_stats  # Bảng thống kê tổng hợp cho dashboard
+from app_logic import recommend  # Mô hình gợi ý sách theo lượt mượn chung
+from app_logic import importer  # Nhập danh mục sách hàng loạt
+from app_logic import circulation  # Bộ đếm sách đang mượn/chờ của thành viên
+
+
+# =========================================================
+# CÁC LỆNH
+# =========================================================
+def cmd_migrate(conn, args):
+    done = schema_migrate.migrate(conn, target=args.target)
+    print(f"✅ Đã áp dụng {len(done)} migration." if done else "✅ CSDL đã ở phiên bản mới nhất.")
+
+
+def cmd_rollback(conn, args):
+    done = schema_migrate.rollback(conn, steps=args.steps)
+    print(f"✅ Đã gỡ {len(done)} migration.")
+
+
+def cmd_status(conn, args):
+    for version, name, applied in schema_migrate.status(conn):
+        print(f"  [{'x' if applied else ' '}] {version}_{name}")
+
+
+def cmd_rebuild_stats(conn, args):
+    counts = loan_stats.rebuild_stats(conn)
+    for table, total in counts.items():
+        print(f"  {table}: {total} dòng")
+    print("✅ Đã tính lại bảng thống kê.")
+
+
+def cmd_build_recommendations(conn, args):
+    result = recommend.build_recommendations(conn, top_n=args.top, chunk_size=args.chunk)
+    print(f"  {result['so_sach']} sách, {result['so_cap']} cặp gợi ý (tính bằng {result['backend']})")
+    print("✅ Đã tính lại bảng sách gợi ý.")
+
+
+def cmd_import_books(conn, args):
+    fmt = args.format or importer.detect_format(args.file)
+
+    def progress(stats):
+        print(f"  ... {stats['dong']} dòng: {stats['them_moi']} mới, "
+              f"{stats['cong_don']} cộng dồn, {stats['loi']} lỗi", flush=True)
+
+    # utf-8-sig: bỏ qua BOM của file CSV xuất từ Excel
+    with open(args.file, encoding="utf-8-sig", newline="") as f:
+        stats = importer.import_books(
+            conn, f, fmt, progress=progress, chunk_size=args.chunk,
+            dry_run=args.dry_run, id_admin=args.admin_id,
+        )
+    for line_no, error in stats["chi_tiet_loi"]:
+        print(f"  ! Dòng {line_no}: {error}")
+    if stats["loi"] > len(stats["chi_tiet_loi"]):
+        print(f"  ! ... và {stats['loi'] - len(stats['chi_tiet_loi'])} dòng lỗi khác")
+    print(f"  {stats['dong']} dòng: {stats['them_moi']} sách mới, {stats['cong_don']} sách cộng dồn, {stats['loi']} dòng lỗi")
+    print("✅ Chạy thử xong, không có thay đổi nào được lưu." if args.dry_run else "✅ Đã nhập danh mục sách.")
+
+
+def cmd_reconcile_quota(conn, args):
+    mismatched = circulation.reconcile_quota(conn)
+    print(f"  {mismatched} thành viên có bộ đếm bị lệch đã được sửa")
+    print("✅ Đã tính lại bộ đếm sách đang mượn/chờ.")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Tác vụ quản trị hệ thống thư viện.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("migrate", help="Áp dụng các migration chưa chạy")
+    p.add_argument("--target", help="Chỉ áp dụng tới phiên bản này (vd: 0002)")
+    p.set_defaults(func=cmd_migrate)
+
+    p = sub.add_parser("rollback", help="Gỡ các migration gần nhất")
+    p.add_argument("--steps", type=int, default=1, help="Số migration cần gỡ (mặc định 1)")
+    p.set_defaults(func=cmd_rollback)
+
+    p = sub.add_parser("status", help="Liệt kê migration và trạng thái áp dụng")
+    p.set_defaults(func=cmd_status)
+
+    p = sub.add_parser("rebuild-stats", help="Tính lại bảng thống kê dashboard từ MuonTra")
+    p.set_defaults(func=cmd_rebuild_stats)
+
+    p = sub.add_parser("build-recommendations", help="Tính lại bảng sách gợi ý từ lịch sử mượn")
+    p.add_argument("--top", type=int, default=recommend.NEIGHBOURS, help="Số sách gợi ý lưu cho mỗi sách")
+    p.add_argument("--chunk", type=int, default=recommend.CHUNK_USERS, help="Số thành viên mỗi lần đọc")
+    p.set_defaults(func=cmd_build_recommendations)
+
+    p = sub.add_parser("import-books", help="Nhập danh mục sách từ file CSV/JSON Lines")
+    p.add_argument("file", help="Đường dẫn file (.csv, .jsonl)")
+    p.add_argument("--format", choices=sorted(set(importer.FORMATS.values())), help="Bỏ qua việc đoán theo đuôi file")
+    p.add_argument("--chunk", type=int, default=importer.CHUNK_SIZE, help="Số dòng mỗi transaction")
+    p.add_argument("--dry-run", action="store_true", help="Chạy thử: kiểm tra và đếm, không lưu thay đổi")
+    p.add_argument("--admin-id", type=int, help="Ghi nhật ký AdminLog dưới tên admin này")
+    p.set_defaults(func=cmd_import_books)
+
+    p = sub.add_parser("reconcile-quota", help="Tính lại bộ đếm sách đang mượn/chờ (ThanhVienQuota) từ MuonTra")
+    p.set_defaults(func=cmd_reconcile_quota)
+    return parser
+
+
+# =========================================================
+# ĐIỂM BẮT ĐẦU THỰC THI SCRIPT
+# =========================================================
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    conn = None
+    try:
+        conn = mysql.connector.connect(**db_config)  # Kết nối riêng, không qua pool
+        args.func(conn, args)
+        return 0
+    except (mysql.connector.Error, RuntimeError, ValueError, OSError) as err:
+        print(f"❌ Lỗi: {err}")
+        if conn:
+            conn.rollback()
+        return 1
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,9 @@
+-- migrations/0001_fulltext_search.down.sql
+-- =========================================================
+-- Gỡ các chỉ mục FULLTEXT tạo bởi 0001_fulltext_search.up.sql.
+-- Sau khi gỡ, đặt SEARCH_FULLTEXT=0 để tìm kiếm quay về LIKE.
+-- =========================================================
+
+ALTER TABLE Sach DROP INDEX ft_sach_noi_dung;
+
+ALTER TABLE TacGia DROP INDEX ft_tacgia_ten;
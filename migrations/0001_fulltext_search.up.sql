@@ -0,0 +1,13 @@
+-- migrations/0001_fulltext_search.up.sql
+-- =========================================================
+-- Tạo chỉ mục FULLTEXT (parser ngram cho tiếng Việt) phục vụ
+-- tìm kiếm sách theo tiêu đề, mô tả và tên tác giả
+-- (xem app_logic/search.py).
+-- Độ dài token do biến server `ngram_token_size` quyết định (mặc định 2).
+-- =========================================================
+
+ALTER TABLE Sach
+    ADD FULLTEXT INDEX ft_sach_noi_dung (tieu_de, mo_ta) WITH PARSER ngram;
+
+ALTER TABLE TacGia
+    ADD FULLTEXT INDEX ft_tacgia_ten (ten_tac_gia) WITH PARSER ngram;
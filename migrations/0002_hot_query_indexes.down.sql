@@ -0,0 +1,23 @@
+-- migrations/0002_hot_query_indexes.down.sql
+-- =========================================================
+-- Gỡ các chỉ mục tạo bởi 0002_hot_query_indexes.up.sql.
+-- Các chỉ mục khóa ngoại gốc (id_sach, id_thanh_vien, ...) vẫn được giữ.
+-- =========================================================
+
+ALTER TABLE MuonTra DROP INDEX idx_muontra_trangthai_hentra;
+
+ALTER TABLE MuonTra DROP INDEX idx_muontra_trangthai_ngaymuon;
+
+ALTER TABLE MuonTra DROP INDEX idx_muontra_thanhvien_trangthai;
+
+ALTER TABLE MuonTra DROP INDEX idx_muontra_sach_trangthai;
+
+ALTER TABLE Sach DROP INDEX idx_sach_trangthai_id;
+
+ALTER TABLE Sach DROP INDEX idx_sach_tieu_de;
+
+ALTER TABLE BinhLuan DROP INDEX idx_binhluan_sach_ngaydang;
+
+ALTER TABLE AdminLog DROP INDEX idx_adminlog_admin_thoigian;
+
+ALTER TABLE YeuThich DROP INDEX idx_yeuthich_thanhvien_ngaythem;
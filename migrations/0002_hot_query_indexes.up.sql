@@ -0,0 +1,52 @@
+-- migrations/0002_hot_query_indexes.up.sql
+-- =========================================================
+-- Chỉ mục ghép (composite) cho các cột lọc/sắp xếp dùng nhiều.
+-- Mỗi chỉ mục ghi kèm truy vấn mà nó phục vụ. InnoDB tự thêm khóa
+-- chính vào cuối mọi chỉ mục phụ, nên (trang_thai, ...) cũng dùng được
+-- cho phân trang theo khóa có id ở cuối.
+-- =========================================================
+
+-- MuonTra:
+-- - Dashboard: SUM(so_luong) WHERE trang_thai = 'Đang mượn' [AND ngay_hen_tra < CURDATE()]
+--   (so_luong nằm trong chỉ mục -> đọc chỉ mục, không cần đọc bảng)
+-- - Sách quá hạn và tab "Đang mượn": WHERE trang_thai = ... ORDER BY ngay_hen_tra
+ALTER TABLE MuonTra
+    ADD INDEX idx_muontra_trangthai_hentra (trang_thai, ngay_hen_tra, so_luong);
+
+-- - Tab "Đang chờ": WHERE trang_thai = 'Đang chờ' ORDER BY ngay_muon, id_muon_tra
+ALTER TABLE MuonTra
+    ADD INDEX idx_muontra_trangthai_ngaymuon (trang_thai, ngay_muon);
+
+-- - Trang cá nhân: WHERE id_thanh_vien = ? AND trang_thai IN (...) ORDER BY ngay_muon
+-- - Lịch sử đã trả (trang cá nhân): WHERE id_thanh_vien = ? AND trang_thai = 'Đã trả'
+-- (Giới hạn mượn không đọc MuonTra: UPDATE có điều kiện trên bộ đếm ThanhVienQuota, migration 0005)
+ALTER TABLE MuonTra
+    ADD INDEX idx_muontra_thanhvien_trangthai (id_thanh_vien, trang_thai, ngay_muon);
+
+-- - Chi tiết sách (admin): SUM/COUNT WHERE id_sach = ? AND trang_thai = ...
+ALTER TABLE MuonTra
+    ADD INDEX idx_muontra_sach_trangthai (id_sach, trang_thai, so_luong);
+
+-- Sach:
+-- - Danh sách sách mới/quản lý sách: WHERE trang_thai = 'hoat_dong' ORDER BY id_sach DESC
+ALTER TABLE Sach
+    ADD INDEX idx_sach_trangthai_id (trang_thai, id_sach);
+
+-- - Danh sách chọn sách (ghi nhận mượn thủ công): ORDER BY tieu_de
+ALTER TABLE Sach
+    ADD INDEX idx_sach_tieu_de (tieu_de);
+
+-- BinhLuan:
+-- - Chi tiết sách: WHERE id_sach = ? ORDER BY ngay_dang DESC
+ALTER TABLE BinhLuan
+    ADD INDEX idx_binhluan_sach_ngaydang (id_sach, ngay_dang);
+
+-- AdminLog:
+-- - Trang cá nhân admin: WHERE id_admin = ? ORDER BY thoi_gian DESC LIMIT 20
+ALTER TABLE AdminLog
+    ADD INDEX idx_adminlog_admin_thoigian (id_admin, thoi_gian);
+
+-- YeuThich:
+-- - Trang cá nhân: WHERE id_thanh_vien = ? ORDER BY ngay_them DESC
+ALTER TABLE YeuThich
+    ADD INDEX idx_yeuthich_thanhvien_ngaythem (id_thanh_vien, ngay_them);
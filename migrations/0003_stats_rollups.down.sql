@@ -0,0 +1,10 @@
+-- migrations/0003_stats_rollups.down.sql
+-- =========================================================
+-- Gỡ các bảng thống kê tạo bởi 0003_stats_rollups.up.sql.
+-- =========================================================
+
+DROP TABLE IF EXISTS ThongKeThanhVien;
+
+DROP TABLE IF EXISTS ThongKeSach;
+
+DROP TABLE IF EXISTS ThongKeNgay;
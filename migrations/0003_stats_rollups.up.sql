@@ -0,0 +1,29 @@
+-- migrations/0003_stats_rollups.up.sql
+-- =========================================================
+-- Bảng thống kê tổng hợp cho dashboard admin (xem app_logic/stats.py).
+-- Sau khi áp dụng, chạy `python manage.py rebuild-stats` một lần để
+-- tính dữ liệu từ lịch sử MuonTra hiện có.
+-- =========================================================
+
+CREATE TABLE IF NOT EXISTS ThongKeNgay (
+    ngay DATE NOT NULL,
+    luot_muon INT NOT NULL DEFAULT 0 COMMENT 'Số cuốn được mượn (theo ngày mượn)',
+    luot_tra INT NOT NULL DEFAULT 0 COMMENT 'Số cuốn được trả trong ngày',
+    luot_huy INT NOT NULL DEFAULT 0 COMMENT 'Số cuốn bị hủy đặt trong ngày',
+    tien_phat DECIMAL(12,2) NOT NULL DEFAULT '0.00' COMMENT 'Tiền phạt phát sinh trong ngày',
+    PRIMARY KEY (ngay)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS ThongKeSach (
+    id_sach INT NOT NULL,
+    luot_muon INT NOT NULL DEFAULT 0 COMMENT 'Tổng số cuốn đã được mượn',
+    PRIMARY KEY (id_sach),
+    KEY idx_thongkesach_luot_muon (luot_muon)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS ThongKeThanhVien (
+    id_thanh_vien INT NOT NULL,
+    luot_muon INT NOT NULL DEFAULT 0 COMMENT 'Tổng số cuốn thành viên đã mượn',
+    PRIMARY KEY (id_thanh_vien),
+    KEY idx_thongkethanhvien_luot_muon (luot_muon)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,6 @@
+-- migrations/0004_item_recommendations.down.sql
+-- =========================================================
+-- Gỡ bảng tạo bởi 0004_item_recommendations.up.sql.
+-- =========================================================
+
+DROP TABLE IF EXISTS SachGoiY;
@@ -0,0 +1,14 @@
+-- migrations/0004_item_recommendations.up.sql
+-- =========================================================
+-- Bảng sách gợi ý theo lượt mượn chung (xem app_logic/recommend.py).
+-- Sau khi áp dụng, chạy `python manage.py build-recommendations`
+-- (và chạy định kỳ, vd: hằng đêm) để tính dữ liệu.
+-- =========================================================
+
+CREATE TABLE IF NOT EXISTS SachGoiY (
+    id_sach INT NOT NULL,
+    id_sach_goi_y INT NOT NULL,
+    diem DOUBLE NOT NULL COMMENT 'Độ tương đồng cosine (0-1)',
+    PRIMARY KEY (id_sach, id_sach_goi_y),
+    KEY idx_sachgoiy_diem (id_sach, diem)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
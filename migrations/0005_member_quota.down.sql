@@ -0,0 +1,6 @@
+-- migrations/0005_member_quota.down.sql
+-- =========================================================
+-- Gỡ bảng bộ đếm tạo bởi 0005_member_quota.up.sql.
+-- =========================================================
+
+DROP TABLE IF EXISTS ThanhVienQuota;
@@ -0,0 +1,21 @@
+-- migrations/0005_member_quota.up.sql
+-- =========================================================
+-- Bộ đếm số sách đang mượn + đang chờ của mỗi thành viên (xem
+-- app_logic/circulation.py). Giới hạn max_sach_muon_moi_user được kiểm tra
+-- bằng một câu UPDATE có điều kiện trên bảng này thay vì SUM(...) FOR UPDATE
+-- trên MuonTra. Dữ liệu ban đầu được tính từ MuonTra bên dưới; nếu nghi ngờ
+-- bộ đếm bị lệch, chạy `python manage.py reconcile-quota`.
+-- =========================================================
+
+CREATE TABLE IF NOT EXISTS ThanhVienQuota (
+    id_thanh_vien INT NOT NULL,
+    so_dang_giu INT NOT NULL DEFAULT 0 COMMENT 'Số cuốn đang mượn + đang chờ lấy',
+    PRIMARY KEY (id_thanh_vien)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+INSERT INTO ThanhVienQuota (id_thanh_vien, so_dang_giu)
+SELECT * FROM (
+    SELECT id_thanh_vien, SUM(so_luong) AS tong FROM MuonTra
+    WHERE trang_thai IN ('Đang mượn', 'Đang chờ') GROUP BY id_thanh_vien
+) AS m
+ON DUPLICATE KEY UPDATE so_dang_giu = m.tong;
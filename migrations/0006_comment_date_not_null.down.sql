@@ -0,0 +1,8 @@
+-- migrations/0006_comment_date_not_null.down.sql
+-- =========================================================
+-- Cho phép lại NULL ở BinhLuan.ngay_dang (các dòng đã được gán ngày ở bản
+-- up giữ nguyên giá trị FROM_UNIXTIME(1)).
+-- =========================================================
+
+ALTER TABLE BinhLuan
+    MODIFY ngay_dang TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP;
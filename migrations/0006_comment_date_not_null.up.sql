@@ -0,0 +1,14 @@
+-- migrations/0006_comment_date_not_null.up.sql
+-- =========================================================
+-- BinhLuan.ngay_dang: NOT NULL (cột đã có DEFAULT CURRENT_TIMESTAMP).
+-- Bình luận được phân trang theo khóa (ngay_dang, id_binh_luan) trên đúng
+-- các cột gốc (app_logic/book_detail.py) để MySQL dùng được chỉ mục
+-- idx_binhluan_sach_ngaydang (0002) thay vì sắp xếp theo biểu thức COALESCE.
+-- Bình luận cũ chưa có ngày được gán thời điểm nhỏ nhất của TIMESTAMP
+-- (FROM_UNIXTIME(1), hợp lệ ở mọi time_zone) nên vẫn nằm cuối danh sách như trước.
+-- =========================================================
+
+UPDATE BinhLuan SET ngay_dang = FROM_UNIXTIME(1) WHERE ngay_dang IS NULL;
+
+ALTER TABLE BinhLuan
+    MODIFY ngay_dang TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP;
@@ -0,0 +1,6 @@
+-- migrations/0007_loan_history_index.down.sql
+-- =========================================================
+-- Gỡ chỉ mục tạo bởi 0007_loan_history_index.up.sql.
+-- =========================================================
+
+ALTER TABLE MuonTra DROP INDEX idx_muontra_sach_ngaymuon;
@@ -0,0 +1,14 @@
+-- migrations/0007_loan_history_index.up.sql
+-- =========================================================
+-- Lịch sử mượn của một sách (trang chi tiết sách admin và
+-- /admin/sach/chitiet/<id>/lichsu, xem _tai_lich_su_muon_sach):
+--   WHERE id_sach = ? AND ngay_muon IS NOT NULL [AND (ngay_muon, id) < con trỏ]
+--   ORDER BY ngay_muon DESC, id_muon_tra DESC LIMIT n
+--   WHERE id_sach = ? AND ngay_muon IS NULL [AND id_muon_tra < ?]
+--   ORDER BY id_muon_tra DESC LIMIT n
+-- Cả hai nhánh đọc thẳng n dòng trên chỉ mục, không sắp xếp toàn bộ lượt
+-- mượn của các đầu sách lâu năm.
+-- =========================================================
+
+ALTER TABLE MuonTra
+    ADD INDEX idx_muontra_sach_ngaymuon (id_sach, ngay_muon, id_muon_tra);
@@ -0,0 +1,21 @@
+# tests/conftest.py
+# =========================================================
+# CẤU HÌNH PYTEST
+# - Test thuần Python (không cần MySQL) luôn chạy: python -m pytest -q
+# - Test cần CSDL chỉ chạy khi có biến môi trường TEST_DB_NAME: tên một
+#   database THỬ NGHIỆM đã nạp database.sql và chạy 'python manage.py migrate'.
+#   DB_HOST / DB_USER / DB_PASSWORD dùng như khi chạy ứng dụng.
+#   KHÔNG trỏ TEST_DB_NAME vào database thật: test ghi và xóa dữ liệu.
+# =========================================================
+
+import os  # Đọc biến môi trường
+import sys  # Thêm thư mục gốc dự án vào sys.path
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)  # Để import được app_logic khi chạy 'pytest' trực tiếp
+
+TEST_DB_NAME = os.getenv("TEST_DB_NAME")
+if TEST_DB_NAME:
+    # Phải đặt trước khi app_logic.db được import (db_config đọc DB_NAME lúc import)
+    os.environ["DB_NAME"] = TEST_DB_NAME
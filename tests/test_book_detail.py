@@ -0,0 +1,51 @@
+# tests/test_book_detail.py
+# =========================================================
+# TEST BÌNH LUẬN TRANG CHI TIẾT SÁCH (app_logic/book_detail.py)
+# Phân trang theo khóa trên cột gốc (ngay_dang, id_binh_luan). Không cần MySQL.
+# =========================================================
+
+import datetime  # Ngày đăng bình luận
+
+from app_logic import book_detail
+
+
+class RecordingCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.executed = []
+
+    def execute(self, sql, params=None):
+        self.executed.append((" ".join(sql.split()), params))
+
+    def fetchall(self):
+        return self.rows
+
+
+def _comments(n, start):
+    return [
+        {
+            "id_binh_luan": start - i, "noi_dung": f"Bình luận {start - i}",
+            "ngay_dang": datetime.datetime(2024, 1, 1, 12, 0) - datetime.timedelta(minutes=i),
+            "ho_ten": "Độc giả", "id_thanh_vien": 7,
+        }
+        for i in range(n)
+    ]
+
+
+def test_comment_pages_seek_on_raw_columns():
+    per_page = book_detail.COMMENTS_PER_PAGE
+    cursor = RecordingCursor(_comments(per_page + 1, start=500))
+    rows, pager = book_detail.load_comments(cursor, 3)
+    sql, params = cursor.executed[0]
+    assert "COALESCE" not in sql
+    assert sql.endswith(f"ORDER BY bl.ngay_dang DESC, bl.id_binh_luan DESC LIMIT {per_page + 1}")
+    assert params == (3,)
+    assert len(rows) == per_page and pager.next_cursor
+
+    last = rows[-1]
+    cursor = RecordingCursor([])
+    book_detail.load_comments(cursor, 3, {"after": pager.next_cursor})
+    sql, params = cursor.executed[0]
+    assert "COALESCE" not in sql
+    assert "(bl.ngay_dang < %s) OR (bl.ngay_dang = %s AND bl.id_binh_luan < %s)" in sql
+    assert params == (3, last["ngay_dang"], last["ngay_dang"], last["id_binh_luan"])
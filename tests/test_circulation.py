@@ -0,0 +1,241 @@
+# tests/test_circulation.py
+# =========================================================
+# TEST NGHIỆP VỤ MƯỢN SÁCH (app_logic/circulation.py)
+# - Cursor giả: kiểm tra cách các hàm xử lý rowcount của câu UPDATE có điều kiện.
+# - CSDL thật (cần TEST_DB_NAME): nhiều thread cùng mượn một đầu sách.
+# =========================================================
+
+import datetime  # Ngày mượn / hẹn trả
+import os  # Đọc biến môi trường
+import threading  # Chạy checkout đồng thời
+import mysql.connector  # Để xử lý lỗi CSDL MySQL
+import pytest
+
+from app_logic import circulation
+from app_logic.db import get_pooled_connection
+
+requires_db = pytest.mark.skipif(
+    not os.getenv("TEST_DB_NAME"), reason="Cần TEST_DB_NAME (database thử nghiệm) để chạy test CSDL"
+)
+
+NGAY_MUON = datetime.date(2024, 1, 10)
+NGAY_HEN_TRA = datetime.date(2024, 1, 24)
+
+
+class ScriptedCursor:
+    """Cursor giả: mỗi lần execute lấy (rows, rowcount) kế tiếp trong `responses`."""
+
+    def __init__(self, responses=()):
+        self.responses = list(responses)
+        self.executed = []
+        self.rowcount = 0
+        self._rows = []
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+        rows, self.rowcount = self.responses.pop(0) if self.responses else ([], 0)
+        self._rows = list(rows)
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def ran(self, fragment):
+        return any(fragment in sql for sql, _ in self.executed)
+
+
+@pytest.fixture
+def max_borrow(monkeypatch):
+    """Giới hạn mượn cố định, không đọc bảng CaiDat."""
+    monkeypatch.setattr(circulation.system_settings, "max_sach_muon_moi_user", lambda: 100)
+
+
+# =========================================================
+# CURSOR GIẢ
+# =========================================================
+def _checkout_responses(rowcount_tru_kho):
+    return [
+        ([{"trang_thai": "hoat_dong"}], 1),  # SELECT ThanhVien
+        ([], 1),  # UPDATE ThanhVienQuota (chưa vượt giới hạn)
+        (
+            [
+                {"id_sach": 1, "tieu_de": "Sách A", "so_luong": 5, "trang_thai": "hoat_dong"},
+                {"id_sach": 2, "tieu_de": "Sách B", "so_luong": 5, "trang_thai": "hoat_dong"},
+            ],
+            2,
+        ),  # SELECT Sach
+        ([], rowcount_tru_kho),  # UPDATE Sach (trừ kho có điều kiện)
+    ]
+
+
+def test_checkout_short_rowcount_raises(max_borrow):
+    # Một trong hai sách vừa bị người khác mượn hết giữa lần đọc kho và câu UPDATE
+    cursor = ScriptedCursor(_checkout_responses(rowcount_tru_kho=1))
+    with pytest.raises(ValueError):
+        circulation.checkout(cursor, 7, [(1, 1), (2, 1)], NGAY_MUON, NGAY_HEN_TRA)
+    assert not cursor.ran("INSERT INTO MuonTra")
+
+
+def test_checkout_inserts_all_lines_in_one_statement(max_borrow):
+    cursor = ScriptedCursor(_checkout_responses(rowcount_tru_kho=2))
+    result = circulation.checkout(
+        cursor, 7, [(2, 1), (1, 2), (2, 1)], NGAY_MUON, NGAY_HEN_TRA, trang_thai="Đang chờ"
+    )
+    assert result == [
+        {"id_sach": 1, "tieu_de": "Sách A", "so_luong": 2},
+        {"id_sach": 2, "tieu_de": "Sách B", "so_luong": 2},
+    ]
+    inserts = [params for sql, params in cursor.executed if sql.startswith("INSERT INTO MuonTra")]
+    assert len(inserts) == 1 and len(inserts[0]) == 2 * 6
+
+
+def test_checkout_over_limit_raises(max_borrow):
+    cursor = ScriptedCursor([
+        ([{"trang_thai": "hoat_dong"}], 1),  # SELECT ThanhVien
+        ([], 0),  # UPDATE ThanhVienQuota: vượt giới hạn
+        ([], 0),  # INSERT IGNORE: dòng bộ đếm đã có
+        ([{"so_dang_giu": 100}], 1),  # SELECT so_dang_giu
+    ])
+    with pytest.raises(ValueError, match="giới hạn"):
+        circulation.checkout(cursor, 7, [(1, 1)], NGAY_MUON, NGAY_HEN_TRA)
+    assert not cursor.ran("UPDATE Sach")
+
+
+def test_confirm_pickup_returns_none_when_not_waiting():
+    cursor = ScriptedCursor([([], 0)])
+    assert circulation.confirm_pickup(cursor, 42) is None
+    assert len(cursor.executed) == 1
+
+
+def test_cancel_reservation_returns_none_when_not_waiting():
+    cursor = ScriptedCursor([([], 0)])
+    assert circulation.cancel_reservation(cursor, 42, id_thanh_vien=7) is None
+    sql, params = cursor.executed[0]
+    assert "id_thanh_vien = %s" in sql and params[-2:] == (42, 7)
+    assert not cursor.ran("UPDATE Sach")
+
+
+def test_cancel_reservation_restores_stock():
+    cursor = ScriptedCursor([
+        ([], 1),  # UPDATE MuonTra -> 'Đã hủy'
+        ([{"id_sach": 3, "id_thanh_vien": 7, "so_luong": 2}], 1),  # SELECT lượt đặt
+    ])
+    loan = circulation.cancel_reservation(cursor, 42, thoi_gian_huy=datetime.datetime(2024, 1, 11, 9, 0))
+    assert loan == {"id_sach": 3, "id_thanh_vien": 7, "so_luong": 2}
+    restock = [params for sql, params in cursor.executed if sql.startswith("UPDATE Sach")]
+    assert restock == [(2, 3)]
+
+
+# =========================================================
+# CSDL THẬT: NHIỀU THREAD CÙNG MƯỢN MỘT ĐẦU SÁCH
+# =========================================================
+THREADS = 8
+STOCK = 3
+
+
+def _create_hot_book():
+    conn = get_pooled_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "INSERT INTO Sach (tieu_de, so_luong, trang_thai) VALUES (%s, %s, 'hoat_dong')",
+            ("pytest: sách mượn đồng thời", STOCK),
+        )
+        id_sach = cursor.lastrowid
+        members = []
+        for i in range(THREADS):
+            cursor.execute(
+                "INSERT INTO ThanhVien (ho_ten, email, mat_khau) VALUES (%s, %s, %s)",
+                (f"pytest {i}", f"pytest-{id_sach}-{i}@example.invalid", "x"),
+            )
+            members.append(cursor.lastrowid)
+        # Tạo sẵn dòng bộ đếm: test đo tranh chấp trên dòng Sach, không phải lúc tạo bộ đếm
+        cursor.executemany(
+            "INSERT INTO ThanhVienQuota (id_thanh_vien, so_dang_giu) VALUES (%s, 0)",
+            [(id_thanh_vien,) for id_thanh_vien in members],
+        )
+        conn.commit()
+        return id_sach, members
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _drop_hot_book(id_sach, members):
+    conn = get_pooled_connection()
+    cursor = conn.cursor()
+    try:
+        placeholders = ", ".join(["%s"] * len(members))
+        cursor.execute("DELETE FROM MuonTra WHERE id_sach = %s", (id_sach,))
+        cursor.execute(f"DELETE FROM ThanhVienQuota WHERE id_thanh_vien IN ({placeholders})", tuple(members))
+        cursor.execute(f"DELETE FROM ThanhVien WHERE id_thanh_vien IN ({placeholders})", tuple(members))
+        cursor.execute("DELETE FROM Sach WHERE id_sach = %s", (id_sach,))
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+@pytest.fixture
+def hot_book(max_borrow):
+    id_sach, members = _create_hot_book()
+    yield id_sach, members
+    _drop_hot_book(id_sach, members)
+
+
+def _borrow(id_sach, id_thanh_vien, start, outcomes):
+    conn = get_pooled_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        start.wait()
+        conn.start_transaction()
+        circulation.checkout(
+            cursor, id_thanh_vien, [(id_sach, 1)], NGAY_MUON, NGAY_HEN_TRA, trang_thai="Đang chờ"
+        )
+        conn.commit()
+        outcomes.append("ok")
+    except ValueError:
+        conn.rollback()
+        outcomes.append("het_sach")
+    except (mysql.connector.Error, threading.BrokenBarrierError) as err:
+        if conn.in_transaction:
+            conn.rollback()
+        outcomes.append(err)
+    finally:
+        cursor.close()
+        conn.close()
+
+
+@requires_db
+def test_concurrent_checkout_never_oversells(hot_book):
+    id_sach, members = hot_book
+    outcomes = []
+    start = threading.Barrier(THREADS, timeout=10)
+    threads = [
+        threading.Thread(target=_borrow, args=(id_sach, id_thanh_vien, start, outcomes))
+        for id_thanh_vien in members
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    conn = get_pooled_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT so_luong FROM Sach WHERE id_sach = %s", (id_sach,))
+        so_luong_con = cursor.fetchone()[0]
+        cursor.execute("SELECT COALESCE(SUM(so_luong), 0) FROM MuonTra WHERE id_sach = %s", (id_sach,))
+        da_muon = int(cursor.fetchone()[0])
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+    assert [o for o in outcomes if not isinstance(o, str)] == []
+    assert so_luong_con >= 0
+    assert da_muon == STOCK - so_luong_con
+    assert outcomes.count("ok") == da_muon == min(THREADS, STOCK)
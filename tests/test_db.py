@@ -0,0 +1,68 @@
+# tests/test_db.py
+# =========================================================
+# TEST POOL KẾT NỐI (app_logic/db.py)
+# Kết nối vật lý giả: kiểm tra chỗ trong pool luôn được trả lại (không cần MySQL).
+# =========================================================
+
+import mysql.connector  # Để xử lý lỗi CSDL MySQL
+import pytest
+
+from app_logic.db import ConnectionPool, PooledConnection, PoolTimeoutError
+
+
+class FakeRawConnection:
+    """Kết nối mysql.connector giả; `alive=False` giống kết nối bị MySQL đóng."""
+
+    def __init__(self):
+        self.alive = True
+        self.closed = False
+        self.in_transaction = False
+
+    def is_connected(self):
+        return self.alive
+
+    def ping(self, reconnect=False):
+        if not self.alive:
+            raise mysql.connector.errors.InterfaceError("MySQL server has gone away")
+
+    def rollback(self):
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = ConnectionPool(size=2, timeout=0.05, ping_interval=0)
+    monkeypatch.setattr(pool, "_connect", FakeRawConnection)
+    return pool
+
+
+def _borrow(pool):
+    conn = PooledConnection(pool, pool.acquire())
+    conn._users = 1
+    return conn
+
+
+def test_dropped_connection_still_returns_its_slot(pool):
+    for _ in range(pool.size * 3):
+        conn = _borrow(pool)
+        conn._conn.alive = False  # MySQL đóng kết nối (wait_timeout, khởi động lại...)
+        if conn and conn.is_connected():  # Mẫu dọn dẹp dùng trong các khối finally
+            conn.close()
+        assert not conn.is_connected()
+    # Mọi chỗ đã được trả lại; kết nối hỏng bị bỏ, lần mượn sau mở kết nối mới
+    held = [pool.acquire(wait=False) for _ in range(pool.size)]
+    assert all(raw is not None and raw.alive for raw in held)
+
+
+def test_close_is_idempotent(pool):
+    conn = _borrow(pool)
+    conn.close()
+    conn.close()
+    held = [pool.acquire(wait=False) for _ in range(pool.size)]
+    assert None not in held
+    assert pool.acquire(wait=False) is None
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
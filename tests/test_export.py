@@ -0,0 +1,98 @@
+# tests/test_export.py
+# =========================================================
+# TEST XUẤT DỮ LIỆU (app_logic/export.py)
+# Stream bị ngắt giữa chừng (client đóng tab, lỗi CSDL) vẫn phải trả kết nối
+# về pool. Kết nối vật lý giả, không cần MySQL.
+# =========================================================
+
+import mysql.connector  # Để xử lý lỗi CSDL MySQL
+import pytest
+
+from app_logic import export
+from app_logic.db import ConnectionPool, PooledConnection
+
+COLUMNS = [("id_sach", "ID"), ("tieu_de", "Tiêu đề")]
+
+
+class UnbufferedCursor:
+    """Cursor không buffer giả: đóng khi còn dòng chưa đọc thì lỗi như mysql.connector."""
+
+    def __init__(self, conn, fail_after=None):
+        self.conn = conn
+        self.fail_after = fail_after  # Số lần fetchmany thành công trước khi mất kết nối
+        self.fetches = 0
+        self.description = [("id_sach",), ("tieu_de",)]
+        self.rowcount = -1
+
+    def execute(self, sql, params=None):
+        self.conn.unread = True
+
+    def fetchmany(self, size=1):
+        if self.fail_after is not None and self.fetches >= self.fail_after:
+            raise mysql.connector.errors.OperationalError("Lost connection to MySQL server during query")
+        self.fetches += 1
+        return [{"id_sach": i, "tieu_de": f"Sách {i}"} for i in range(size)]  # Bảng "vô tận"
+
+    def close(self):
+        if self.conn.unread:
+            raise mysql.connector.errors.InternalError("Unread result found")
+
+
+class FakeRawConnection:
+    fail_after = None
+
+    def __init__(self):
+        self.unread = False
+        self.in_transaction = False
+
+    def cursor(self, dictionary=False, buffered=None):
+        return UnbufferedCursor(self, self.fail_after)
+
+    def is_connected(self):
+        return not self.unread  # Ping lỗi "Unread result found" -> False
+
+    def ping(self, reconnect=False):
+        if self.unread:
+            raise mysql.connector.errors.InternalError("Unread result found")
+
+    def close(self):
+        if self.unread:
+            raise mysql.connector.errors.InternalError("Unread result found")
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = ConnectionPool(size=2, timeout=0.05, ping_interval=0)
+    monkeypatch.setattr(pool, "_connect", FakeRawConnection)
+
+    def borrow():
+        conn = PooledConnection(pool, pool.acquire())
+        conn._users = 1
+        return conn
+
+    monkeypatch.setattr(export, "get_pooled_connection", borrow)
+    return pool
+
+
+def _assert_all_slots_free(pool):
+    held = [pool.acquire(wait=False) for _ in range(pool.size)]
+    assert None not in held
+
+
+def test_client_disconnect_returns_connection(pool):
+    for _ in range(pool.size * 3):
+        stream = export.iter_export("SELECT id_sach, tieu_de FROM Sach", (), COLUMNS, "csv", batch_size=10)
+        assert next(stream).startswith("\ufeff")  # BOM UTF-8 + dòng tiêu đề
+        assert next(stream).count("\n") == 10
+        stream.close()  # Client đóng tab giữa chừng: Werkzeug đóng generator
+    _assert_all_slots_free(pool)
+
+
+def test_database_error_mid_stream_raises_and_returns_connection(pool, monkeypatch):
+    monkeypatch.setattr(FakeRawConnection, "fail_after", 1)
+    for _ in range(pool.size * 3):
+        stream = export.iter_export("SELECT id_sach, tieu_de FROM Sach", (), COLUMNS, "ndjson", batch_size=5)
+        assert next(stream).count("\n") == 5
+        with pytest.raises(mysql.connector.Error):
+            next(stream)
+    _assert_all_slots_free(pool)
@@ -0,0 +1,170 @@
+# tests/test_importer.py
+# =========================================================
+# TEST NHẬP DANH MỤC SÁCH (app_logic/importer.py)
+# Đọc file, chuẩn hóa bản ghi, chia lô và gộp sách trùng (không cần MySQL).
+# =========================================================
+
+import io  # File văn bản trong bộ nhớ
+import unicodedata  # Tạo chuỗi Unicode dạng tổ hợp (NFD)
+import pytest
+
+from app_logic import importer
+
+
+def _record(**overrides):
+    record = {
+        "tieu_de": "Dế Mèn phiêu lưu ký",
+        "ten_tac_gia": "Tô Hoài",
+        "ten_the_loai": "Thiếu nhi",
+        "nam_xuat_ban": "1941",
+        "so_luong": "3",
+    }
+    record.update(overrides)
+    return record
+
+
+# =========================================================
+# CHUẨN HÓA BẢN GHI
+# =========================================================
+def test_normalize_record_cleans_text_and_numbers():
+    sach = importer.normalize_record(_record(
+        tieu_de=unicodedata.normalize("NFD", "  Dế Mèn \t phiêu   lưu ký "),
+        ten_tac_gia=" Tô Hoài ",
+        so_trang="-5",
+    ))
+    assert sach == {
+        "tieu_de": "Dế Mèn phiêu lưu ký",  # NFC, gộp khoảng trắng
+        "ten_tac_gia": "Tô Hoài",
+        "ten_the_loai": "Thiếu nhi",
+        "nam_xuat_ban": 1941,
+        "so_luong": 3,
+        "so_trang": 0,
+        "mo_ta": "",
+    }
+
+
+def test_normalize_record_accepts_json_types():
+    sach = importer.normalize_record(_record(nam_xuat_ban=1941, so_luong=2, so_trang=120, mo_ta=None))
+    assert (sach["nam_xuat_ban"], sach["so_luong"], sach["so_trang"], sach["mo_ta"]) == (1941, 2, 120, "")
+
+
+@pytest.mark.parametrize("overrides", [
+    {"tieu_de": "   "},
+    {"ten_tac_gia": None},
+    {"ten_the_loai": ""},
+    {"nam_xuat_ban": ""},
+    {"so_luong": "0"},
+    {"so_luong": "-1"},
+])
+def test_normalize_record_rejects_missing_fields(overrides):
+    with pytest.raises(ValueError, match="Thiếu thông tin"):
+        importer.normalize_record(_record(**overrides))
+
+
+@pytest.mark.parametrize("overrides", [{"so_luong": "ba"}, {"nam_xuat_ban": "1941.5"}, {"so_trang": "x"}])
+def test_normalize_record_rejects_bad_numbers(overrides):
+    with pytest.raises(ValueError, match="số nguyên"):
+        importer.normalize_record(_record(**overrides))
+
+
+# =========================================================
+# ĐỌC FILE
+# =========================================================
+def test_read_records_csv_reports_physical_line_numbers():
+    data = io.StringIO(
+        "tieu_de,ten_tac_gia,so_luong\n"
+        "Sách A,Tác giả A,1\n"
+        "\"Sách B\nnhiều dòng\",Tác giả B,2\n"
+        "Sách C,Tác giả C,3\n"
+    )
+    rows = list(importer.read_records(data, "csv"))
+    assert [(line_no, row["tieu_de"], error) for line_no, row, error in rows] == [
+        (2, "Sách A", None),
+        (4, "Sách B\nnhiều dòng", None),
+        (5, "Sách C", None),
+    ]
+
+
+def test_read_records_jsonl_reports_bad_lines():
+    lines = [
+        '{"tieu_de": "Sách A"}\n',
+        "\n",
+        "{không phải json}\n",
+        "[1, 2]\n",
+        '{"tieu_de": "Sách B"}',
+    ]
+    rows = list(importer.read_records(lines, "jsonl"))
+    assert [(line_no, data) for line_no, data, _ in rows] == [
+        (1, {"tieu_de": "Sách A"}),
+        (3, None),
+        (4, None),
+        (5, {"tieu_de": "Sách B"}),
+    ]
+    assert rows[1][2].startswith("JSON không hợp lệ")
+    assert rows[2][2] == "Mỗi dòng phải là một object JSON."
+
+
+def test_read_records_rejects_json_array_file():
+    with pytest.raises(ValueError, match="JSON Lines"):
+        list(importer.read_records(['[{"tieu_de": "Sách A"}]'], "jsonl"))
+
+
+@pytest.mark.parametrize("filename, fmt", [
+    ("catalog.csv", "csv"), ("CATALOG.CSV", "csv"), ("a.jsonl", "jsonl"), ("a.ndjson", "jsonl"), ("a.json", "jsonl"),
+])
+def test_detect_format(filename, fmt):
+    assert importer.detect_format(filename) == fmt
+
+
+def test_detect_format_rejects_unknown_extension():
+    with pytest.raises(ValueError):
+        importer.detect_format("catalog.xlsx")
+
+
+# =========================================================
+# CHIA LÔ
+# =========================================================
+@pytest.mark.parametrize("count, size, sizes", [(0, 3, []), (3, 3, [3]), (7, 3, [3, 3, 1]), (2, 5, [2])])
+def test_chunks(count, size, sizes):
+    chunks = list(importer._chunks(iter(range(count)), size))
+    assert [len(chunk) for chunk in chunks] == sizes
+    assert [item for chunk in chunks for item in chunk] == list(range(count))
+
+
+# =========================================================
+# GỘP SÁCH TRÙNG TRONG MỘT LÔ
+# =========================================================
+class FakeCursor:
+    def __init__(self, existing_rows):
+        self.existing_rows = existing_rows
+        self.many = {}
+
+    def execute(self, sql, params=None):
+        self.params = params
+
+    def fetchall(self):
+        return self.existing_rows
+
+    def executemany(self, sql, rows):
+        self.many["INSERT" if "INSERT" in sql else "UPDATE"] = list(rows)
+
+
+def test_import_chunk_merges_duplicates(monkeypatch):
+    ids = {"TacGia": {"Tô Hoài": 1}, "TheLoai": {"Thiếu nhi": 2, "Truyện": 3}}
+    monkeypatch.setattr(
+        importer, "get_or_create_many",
+        lambda cursor, table, id_col, name_col, values, created_tables=None: ids[table],
+    )
+    records = [
+        importer.normalize_record(_record(so_luong="1")),
+        importer.normalize_record(_record(tieu_de="DẾ MÈN PHIÊU LƯU KÝ", so_luong="2", so_trang="150")),
+        importer.normalize_record(_record(ten_the_loai="Truyện", so_luong="4")),
+    ]
+    # Sách "Dế Mèn..." / Thiếu nhi / 1941 đã có (id 10), tiêu đề đứng thứ 1 trong FIELD(...)
+    cursor = FakeCursor([{"id_sach": 10, "id_tac_gia": 1, "id_the_loai": 2, "nam_xuat_ban": 1941, "vi_tri": 1}])
+
+    them_moi, cong_don, merged = importer._import_chunk(cursor, records)
+
+    assert (them_moi, cong_don, merged) == (1, 1, [10])
+    assert cursor.many["UPDATE"] == [(3, 150, 150, "", "", 10)]
+    assert [row[:5] for row in cursor.many["INSERT"]] == [("Dế Mèn phiêu lưu ký", 1, 3, 1941, 4)]
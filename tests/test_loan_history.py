@@ -0,0 +1,108 @@
+# tests/test_loan_history.py
+# =========================================================
+# TEST LỊCH SỬ MƯỢN CỦA SÁCH (admin_routes._tai_lich_su_muon_sach)
+# Phân trang theo khóa (ngay_muon, id_muon_tra) với nhánh riêng cho các lượt
+# ngay_muon NULL. Chạy câu SQL thật của ứng dụng trên SQLite trong bộ nhớ.
+# =========================================================
+
+import datetime  # Ngày mượn
+import sqlite3  # CSDL trong bộ nhớ cho test
+import pytest
+
+from app_logic.admin_routes import _tai_lich_su_muon_sach
+
+ID_SACH = 1
+PER_PAGE = 4
+
+
+class SqliteCursor:
+    """Cursor dạng dictionary trên SQLite, nhận placeholder %s như mysql.connector."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.statements = []
+
+    def execute(self, sql, params=()):
+        self.statements.append(sql)
+        self._cursor = self.conn.execute(sql.replace("%s", "?"), params)
+
+    def fetchall(self):
+        return [dict(row) for row in self._cursor.fetchall()]
+
+
+@pytest.fixture
+def cursor():
+    sqlite3.register_adapter(datetime.date, lambda d: d.isoformat())
+    sqlite3.register_converter("DATE", lambda raw: datetime.date.fromisoformat(raw.decode()))
+    conn = sqlite3.connect(":memory:", detect_types=sqlite3.PARSE_DECLTYPES)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(
+        """
+        CREATE TABLE ThanhVien (id_thanh_vien INTEGER PRIMARY KEY, ho_ten TEXT);
+        CREATE TABLE MuonTra (
+            id_muon_tra INTEGER PRIMARY KEY, id_sach INTEGER, id_thanh_vien INTEGER,
+            ngay_muon DATE, ngay_hen_tra DATE, ngay_tra_thuc DATE, trang_thai TEXT, so_luong INTEGER
+        );
+        INSERT INTO ThanhVien VALUES (7, 'Độc giả');
+        """
+    )
+    base = datetime.date(2024, 1, 1)
+    loans = []
+    for id_muon_tra in range(1, 24):
+        # Nhiều lượt trùng ngày, một số lượt không có ngày mượn, một lượt của sách khác
+        ngay_muon = None if id_muon_tra % 5 == 0 else base + datetime.timedelta(days=id_muon_tra % 4)
+        id_sach = 2 if id_muon_tra == 11 else ID_SACH
+        trang_thai = "Đã trả" if id_muon_tra % 2 else "Đang mượn"
+        loans.append((id_muon_tra, id_sach, 7, ngay_muon, base, None, trang_thai, 1))
+    conn.executemany("INSERT INTO MuonTra VALUES (?, ?, ?, ?, ?, ?, ?, ?)", loans)
+    yield SqliteCursor(conn)
+    conn.close()
+
+
+def _expected(cursor, trang_thai=None):
+    rows = [
+        row for row in cursor.conn.execute("SELECT * FROM MuonTra WHERE id_sach = ?", (ID_SACH,))
+        if trang_thai is None or row["trang_thai"] == trang_thai
+    ]
+    dated = sorted((r for r in rows if r["ngay_muon"]), key=lambda r: (r["ngay_muon"], r["id_muon_tra"]), reverse=True)
+    undated = sorted((r for r in rows if not r["ngay_muon"]), key=lambda r: r["id_muon_tra"], reverse=True)
+    return [r["id_muon_tra"] for r in dated + undated]
+
+
+def _walk(cursor, args=None):
+    """Đi hết các trang bằng con trỏ 'after', rồi lùi lại bằng 'before'."""
+    args = dict(args or {})
+    pages = []
+    while True:
+        rows, pager, _ = _tai_lich_su_muon_sach(cursor, ID_SACH, args, per_page=PER_PAGE)
+        pages.append([row["id_muon_tra"] for row in rows])
+        if not pager.next_cursor:
+            break
+        args = dict(args, after=pager.next_cursor)
+        args.pop("before", None)
+    back = [pages[-1]]
+    while pager.prev_cursor:
+        args = dict(args, before=pager.prev_cursor)
+        args.pop("after", None)
+        rows, pager, _ = _tai_lich_su_muon_sach(cursor, ID_SACH, args, per_page=PER_PAGE)
+        back.append([row["id_muon_tra"] for row in rows])
+    return pages, back[::-1]
+
+
+def test_pages_follow_date_then_null_order(cursor):
+    pages, back = _walk(cursor)
+    assert [i for page in pages for i in page] == _expected(cursor)
+    assert all(len(page) == PER_PAGE for page in pages[:-1])
+    assert back == pages
+
+
+def test_pages_with_status_filter(cursor):
+    pages, back = _walk(cursor, {"trang_thai": "Đã trả"})
+    assert [i for page in pages for i in page] == _expected(cursor, "Đã trả")
+    assert back == pages
+
+
+def test_queries_use_raw_columns(cursor):
+    _walk(cursor)
+    assert cursor.statements
+    assert not any("COALESCE" in sql for sql in cursor.statements)
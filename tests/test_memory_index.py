@@ -0,0 +1,26 @@
+# tests/test_memory_index.py
+# =========================================================
+# TEST KHUNG CHỈ MỤC TRONG BỘ NHỚ (app_logic/memory_index.py)
+# Lớp con phải cài đặt đủ _to_book / _add / _discard / _adopt.
+# =========================================================
+
+import pytest
+
+from app_logic.memory_index import InMemoryBookIndex
+from app_logic.related import RelatedBooksIndex
+from app_logic.search_index import BookSearchIndex
+
+
+def test_incomplete_subclass_fails_at_instantiation():
+    class HalfIndex(InMemoryBookIndex):
+        def _add(self, book):
+            pass
+
+    with pytest.raises(TypeError, match="_adopt"):
+        HalfIndex()
+
+
+def test_shipped_indexes_are_complete():
+    for cls in (BookSearchIndex, RelatedBooksIndex):
+        assert not cls.__abstractmethods__
+        cls()
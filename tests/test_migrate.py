@@ -0,0 +1,242 @@
+# tests/test_migrate.py
+# =========================================================
+# TEST MIGRATION (app_logic/migrate.py, migrations/)
+# - Thuần Python: tách câu lệnh, ghép cặp up/down, cảnh báo checksum.
+# - CSDL thật (cần TEST_DB_NAME, đã chạy migrate): EXPLAIN các truy vấn
+#   nóng phải dùng đúng chỉ mục của các migration 0002, 0007.
+# =========================================================
+
+import datetime  # Ngày đăng bình luận giả để lấy con trỏ trang sau
+import os  # Đọc biến môi trường
+import re  # Lấy tên chỉ mục trong file migration
+import pytest
+
+from app_logic import book_detail, migrate
+from app_logic.admin_routes import _tai_lich_su_muon_sach
+from app_logic.db import get_pooled_connection
+
+requires_db = pytest.mark.skipif(
+    not os.getenv("TEST_DB_NAME"), reason="Cần TEST_DB_NAME (database thử nghiệm) để chạy test CSDL"
+)
+
+
+def _write(directory, files):
+    for name, content in files.items():
+        (directory / name).write_text(content, encoding="utf-8")
+
+
+# =========================================================
+# TÁCH CÂU LỆNH / ĐỌC FILE MIGRATION
+# =========================================================
+def test_split_statements_skips_comments_and_blanks():
+    sql = """
+    -- chú thích đầu file
+    ALTER TABLE Sach
+        ADD INDEX idx_a (tieu_de);
+      -- chú thích thụt lề
+    ALTER TABLE MuonTra ADD INDEX idx_b (trang_thai);
+
+    ;
+    """
+    assert migrate.split_statements(sql) == [
+        "ALTER TABLE Sach\n        ADD INDEX idx_a (tieu_de)",
+        "ALTER TABLE MuonTra ADD INDEX idx_b (trang_thai)",
+    ]
+
+
+def test_split_statements_empty_file():
+    assert migrate.split_statements("-- chỉ có chú thích\n\n") == []
+
+
+def test_list_migrations_orders_and_pairs_files(tmp_path):
+    _write(tmp_path, {
+        "0002_second.up.sql": "SELECT 2;",
+        "0002_second.down.sql": "SELECT -2;",
+        "0001_first.up.sql": "SELECT 1;",
+        "0003_orphan.down.sql": "SELECT -3;",  # Không có file up: bỏ qua
+        "README.txt": "không phải migration",
+        "12_bad_name.up.sql": "SELECT 0;",
+    })
+    result = migrate.list_migrations(str(tmp_path))
+    assert [(m["version"], m["name"]) for m in result] == [("0001", "first"), ("0002", "second")]
+    assert result[0]["down"] is None
+    assert result[1]["up"] == str(tmp_path / "0002_second.up.sql")
+    assert result[1]["down"] == str(tmp_path / "0002_second.down.sql")
+
+
+def test_shipped_migrations_have_down_files():
+    shipped = migrate.list_migrations()
+    versions = [m["version"] for m in shipped]
+    assert versions == sorted(set(versions))
+    assert all(m["down"] for m in shipped)
+
+
+# =========================================================
+# MIGRATE VỚI CSDL GIẢ
+# =========================================================
+class FakeCursor:
+    def __init__(self, applied):
+        self.applied = applied
+        self.executed = []
+        self._rows = []
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+        self._rows = list(self.applied.items()) if sql.startswith("SELECT phien_ban") else []
+
+    def fetchall(self):
+        return self._rows
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self, applied):
+        self.cursor_obj = FakeCursor(applied)
+        self.commits = 0
+
+    def cursor(self):
+        return self.cursor_obj
+
+    def commit(self):
+        self.commits += 1
+
+
+@pytest.fixture
+def migrations_dir(tmp_path, monkeypatch):
+    _write(tmp_path, {
+        "0001_first.up.sql": "ALTER TABLE Sach ADD INDEX idx_a (tieu_de);",
+        "0002_second.up.sql": "-- chỉ mục thứ hai\nALTER TABLE MuonTra ADD INDEX idx_b (trang_thai);",
+    })
+    real_list = migrate.list_migrations
+    monkeypatch.setattr(migrate, "list_migrations", lambda: real_list(str(tmp_path)))
+    return tmp_path
+
+
+def test_migrate_warns_on_checksum_mismatch(migrations_dir, capsys):
+    conn = FakeConn({"0001": "0" * 40, "0002": migrate._checksum(str(migrations_dir / "0002_second.up.sql"))})
+    assert migrate.migrate(conn) == []
+    out = capsys.readouterr().out
+    assert "0001_first đã bị sửa" in out
+    assert "0002_second" not in out
+    assert not any(sql.startswith("ALTER") for sql, _ in conn.cursor_obj.executed)
+
+
+def test_migrate_applies_only_pending_versions(migrations_dir):
+    conn = FakeConn({"0001": migrate._checksum(str(migrations_dir / "0001_first.up.sql"))})
+    assert migrate.migrate(conn) == ["0002"]
+    executed = [sql for sql, _ in conn.cursor_obj.executed]
+    assert "ALTER TABLE MuonTra ADD INDEX idx_b (trang_thai)" in executed
+    assert "ALTER TABLE Sach ADD INDEX idx_a (tieu_de)" not in executed
+    assert conn.commits == 1
+
+
+# =========================================================
+# EXPLAIN: TRUY VẤN NÓNG DÙNG ĐÚNG CHỈ MỤC (migration 0002, 0007)
+# =========================================================
+HOT_QUERIES = [
+    (
+        "SELECT SUM(so_luong) FROM MuonTra WHERE trang_thai = 'Đang mượn' AND ngay_hen_tra < CURDATE()",
+        "idx_muontra_trangthai_hentra",
+    ),
+    (
+        "SELECT id_muon_tra FROM MuonTra WHERE trang_thai = 'Đang chờ' ORDER BY ngay_muon, id_muon_tra LIMIT 20",
+        "idx_muontra_trangthai_ngaymuon",
+    ),
+    (
+        "SELECT * FROM MuonTra WHERE id_thanh_vien = 1 AND trang_thai IN ('Đang mượn', 'Đang chờ') ORDER BY ngay_muon",
+        "idx_muontra_thanhvien_trangthai",
+    ),
+    (
+        "SELECT SUM(so_luong) FROM MuonTra WHERE id_sach = 1 AND trang_thai = 'Đang mượn'",
+        "idx_muontra_sach_trangthai",
+    ),
+    (
+        "SELECT id_sach, tieu_de FROM Sach WHERE trang_thai = 'hoat_dong' ORDER BY id_sach DESC LIMIT 12",
+        "idx_sach_trangthai_id",
+    ),
+    ("SELECT id_sach, tieu_de FROM Sach ORDER BY tieu_de", "idx_sach_tieu_de"),
+    (
+        "SELECT * FROM AdminLog WHERE id_admin = 1 ORDER BY thoi_gian DESC LIMIT 20",
+        "idx_adminlog_admin_thoigian",
+    ),
+    (
+        "SELECT * FROM YeuThich WHERE id_thanh_vien = 1 ORDER BY ngay_them DESC",
+        "idx_yeuthich_thanhvien_ngaythem",
+    ),
+]
+
+
+class CaptureCursor:
+    """Cursor giả: ghi lại câu SQL (kèm tham số) mà hàm của ứng dụng thực thi."""
+
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.executed = []
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, tuple(params or ())))
+
+    def fetchall(self):
+        return self.rows
+
+
+def _app_queries():
+    """Các truy vấn phân trang lấy thẳng từ code ứng dụng, không chép lại SQL."""
+    cases = []
+
+    # Bình luận (book_detail.load_comments): trang đầu và trang sau (có điều kiện seek)
+    per_page = book_detail.COMMENTS_PER_PAGE
+    rows = [
+        {"id_binh_luan": 500 - i, "ngay_dang": datetime.datetime(2024, 1, 1) - datetime.timedelta(minutes=i)}
+        for i in range(per_page + 1)
+    ]
+    first = CaptureCursor(rows)
+    _, pager = book_detail.load_comments(first, 1)
+    after = CaptureCursor()
+    book_detail.load_comments(after, 1, {"after": pager.next_cursor})
+    for sql, params in first.executed + after.executed:
+        cases.append((sql, params, "idx_binhluan_sach_ngaydang"))
+
+    # Lịch sử mượn của sách (admin): nhánh có ngày mượn và nhánh ngay_muon NULL
+    history = CaptureCursor()
+    _tai_lich_su_muon_sach(history, 1, {})
+    for sql, params in history.executed:
+        cases.append((sql, params, "idx_muontra_sach_ngaymuon"))
+    return cases
+
+
+EXPLAIN_CASES = [(query, (), key) for query, key in HOT_QUERIES] + _app_queries()
+
+
+def test_every_index_has_an_explain_case():
+    indexes = set()
+    for migration in migrate.list_migrations():
+        with open(migration["up"], encoding="utf-8") as f:
+            indexes.update(re.findall(r"ADD INDEX (\w+)", f.read()))
+    assert indexes == {key for _, _, key in EXPLAIN_CASES}
+
+
+def test_app_queries_are_captured():
+    keys = [key for _, _, key in _app_queries()]
+    assert keys.count("idx_binhluan_sach_ngaydang") == 2  # Trang đầu + trang sau
+    assert keys.count("idx_muontra_sach_ngaymuon") == 2  # Nhánh có ngày + nhánh NULL
+
+
+@requires_db
+@pytest.mark.parametrize(
+    "query, params, expected_key", EXPLAIN_CASES, ids=[key for _, _, key in EXPLAIN_CASES]
+)
+def test_hot_query_uses_index(query, params, expected_key):
+    conn = get_pooled_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("EXPLAIN " + query, params)
+        plan = cursor.fetchall()
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+    # Truy vấn có JOIN: chỉ mục phải xuất hiện ở bảng chính, không nhất thiết ở dòng đầu
+    assert expected_key in {row["key"] for row in plan}, plan
@@ -0,0 +1,276 @@
+# tests/test_recommend.py
+# =========================================================
+# TEST GỢI Ý SÁCH (app_logic/recommend.py)
+# Độ tương đồng cosine, cắt top-N và chấm điểm lịch sử người dùng (không cần MySQL).
+# =========================================================
+
+import threading  # Gọi _load_neighbours đồng thời
+import time  # Giả lập truy vấn chậm
+import pytest
+
+from app_logic import recommend
+
+# Ba thành viên, chia làm hai nhóm đọc (kiểm tra cộng dồn qua các nhóm):
+#   diag = {1: 2, 2: 2, 3: 2}; đồng xuất hiện (1,2) = 2, (1,3) = 1, (2,3) = 1
+CHUNKS = [
+    {101: {1: 1.0, 2: 1.0}},
+    {102: {1: 1.0, 2: 1.0, 3: 1.0}, 103: {3: 1.0, 99: 1.0}},  # Sách 99 không có trong item_ids
+]
+ITEM_IDS = [1, 2, 3]
+EXPECTED = {
+    1: {2: 1.0, 3: 0.5},
+    2: {1: 1.0, 3: 0.5},
+    3: {1: 0.5, 2: 0.5},
+}
+
+
+def _as_dict(neighbours):
+    return {i: dict(items) for i, items in neighbours.items()}
+
+
+def test_python_cosine():
+    result = recommend._neighbours_python(iter(CHUNKS), ITEM_IDS, top_n=5)
+    assert result.keys() == EXPECTED.keys()
+    for i, items in result.items():
+        assert dict(items) == pytest.approx(EXPECTED[i])
+        scores = [diem for _, diem in items]
+        assert scores == sorted(scores, reverse=True)
+
+
+def test_python_top_n():
+    result = recommend._neighbours_python(iter(CHUNKS), ITEM_IDS, top_n=1)
+    assert result[1] == [(2, pytest.approx(1.0))]
+    assert all(len(items) == 1 for items in result.values())
+
+
+def test_python_ignores_unknown_items():
+    result = recommend._neighbours_python(iter(CHUNKS), ITEM_IDS, top_n=5)
+    assert 99 not in result
+    assert all(99 not in dict(items) for items in result.values())
+
+
+@pytest.mark.skipif(recommend.sparse is None, reason="Cần numpy + scipy")
+def test_sparse_matches_python():
+    python = _as_dict(recommend._neighbours_python(iter(CHUNKS), ITEM_IDS, top_n=5))
+    sparse = _as_dict(recommend._neighbours_sparse(iter(CHUNKS), ITEM_IDS, top_n=5))
+    assert sparse.keys() == python.keys()
+    for i, items in python.items():
+        assert sparse[i] == pytest.approx(items)
+
+
+def test_interactions_keeps_strongest_signal():
+    class Cursor:
+        def execute(self, sql, params):
+            self.params = params
+
+        def fetchall(self):
+            # Cùng một cặp thành viên-sách: mượn (1.0), yêu thích (0.6), đánh giá 5 sao (0.6)
+            return [(7, 1, 0.6), (7, 1, 1.0), (7, 1, 0.6), (7, 2, 0.2)]
+
+    cursor = Cursor()
+    assert recommend._interactions(cursor, 1, 10) == {7: {1: 1.0, 2: 0.2}}
+    assert cursor.params == (1, 10, 1, 10, 1, 10)
+
+
+# =========================================================
+# CHẤM ĐIỂM LỊCH SỬ NGƯỜI DÙNG
+# =========================================================
+class QueuedCursor:
+    """Cursor giả: mỗi lần execute trả về danh sách dòng kế tiếp trong `results`."""
+
+    def __init__(self, results):
+        self.results = list(results)
+        self.executed = []
+        self._rows = []
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+        self._rows = self.results.pop(0) if self.results else []
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+
+NEIGHBOURS = {
+    1: [(2, 0.9), (4, 0.5)],
+    3: [(4, 0.8), (1, 0.7)],
+}
+
+
+def _book(id_sach):
+    return {"id_sach": id_sach, "tieu_de": f"Sách {id_sach}", "anh_bia": None, "ten_tac_gia": None}
+
+
+@pytest.fixture
+def model(monkeypatch):
+    monkeypatch.setattr(recommend, "_load_neighbours", lambda cursor: NEIGHBOURS)
+
+
+def test_recommend_scores_history(model):
+    cursor = QueuedCursor([
+        [{"id_sach": 1, "trong_so": 1.0}, {"id_sach": 3, "trong_so": 0.6}],  # Lịch sử
+        [{"id_sach": 5}],  # Sách đã mượn/đặt
+        [_book(2), _book(4)],  # Thông tin sách (thứ tự bất kỳ)
+    ])
+    # Sách 4: 1.0 * 0.5 + 0.6 * 0.8 = 0.98; sách 2: 1.0 * 0.9 = 0.9; sách 1 đã có trong lịch sử
+    result = recommend.recommend_for_user(cursor, 7, limit=10)
+    assert [book["id_sach"] for book in result] == [4, 2]
+    assert cursor.executed[-1][1] == (4, 2)  # Thứ tự theo điểm
+
+
+def test_recommend_limit_and_hidden_books(model):
+    cursor = QueuedCursor([
+        [{"id_sach": 1, "trong_so": 1.0}, {"id_sach": 3, "trong_so": 0.6}],
+        [],
+        [_book(2)],  # Sách 4 đang ẩn: không có trong kết quả truy vấn
+    ])
+    assert [book["id_sach"] for book in recommend.recommend_for_user(cursor, 7, limit=1)] == [2]
+
+
+def test_recommend_without_history(model):
+    cursor = QueuedCursor([[]])
+    assert recommend.recommend_for_user(cursor, 7) == []
+    assert len(cursor.executed) == 1
+
+
+def test_recommend_without_model(monkeypatch):
+    monkeypatch.setattr(recommend, "_load_neighbours", lambda cursor: {})
+    cursor = QueuedCursor([])
+    assert recommend.recommend_for_user(cursor, 7) == []
+    assert cursor.executed == []
+
+
+# =========================================================
+# NẠP MÔ HÌNH (cache trong tiến trình)
+# =========================================================
+@pytest.fixture
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(recommend, "_state", {"neighbours": None, "loaded_at": 0.0, "refreshing": False})
+
+
+def test_cold_load_is_single_flight(fresh_state, monkeypatch):
+    calls = []
+
+    def slow_read(cursor):
+        calls.append(cursor)
+        time.sleep(0.05)
+        return NEIGHBOURS
+
+    monkeypatch.setattr(recommend, "_read_neighbours", slow_read)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(recommend._load_neighbours(object())))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == [NEIGHBOURS] * 8
+
+
+def test_stale_model_served_while_reloading(fresh_state, monkeypatch):
+    class Conn:
+        def cursor(self, dictionary=False):
+            return self
+
+        def is_connected(self):
+            return True
+
+        def close(self):
+            pass
+
+    reloaded = threading.Event()
+    calls = []
+
+    def read(cursor):
+        calls.append(cursor)
+        reloaded.wait(5)  # Chỉ trả kết quả mới sau khi request đã nhận mô hình cũ
+        return {1: [(9, 1.0)]}
+
+    monkeypatch.setattr(recommend, "get_pooled_connection", Conn)
+    monkeypatch.setattr(recommend, "_read_neighbours", read)
+    recommend._store_neighbours(NEIGHBOURS)
+    recommend._state["loaded_at"] -= recommend.MODEL_TTL + 1
+
+    assert recommend._load_neighbours(None) is NEIGHBOURS
+    assert recommend._state["refreshing"]
+    assert recommend._load_neighbours(None) is NEIGHBOURS  # Không khởi động lần nạp thứ hai
+    reloaded.set()
+    for _ in range(100):
+        if not recommend._state["refreshing"]:
+            break
+        time.sleep(0.01)
+    assert recommend._load_neighbours(None) == {1: [(9, 1.0)]}
+    assert len(calls) == 1
+
+
+# =========================================================
+# XÂY MÔ HÌNH (CSDL giả)
+# =========================================================
+class BuildConn:
+    """Kết nối giả cho build_recommendations: trả dữ liệu theo câu SQL, ghi lại các dòng được lưu."""
+
+    def __init__(self):
+        self.saved = []
+        self.in_transaction = False
+
+    def cursor(self):
+        return self
+
+    # --- cursor ---
+    def execute(self, sql, params=None):
+        if "FROM Sach" in sql:
+            self._rows = [(i,) for i in ITEM_IDS]
+        elif "FROM ThanhVien" in sql:
+            self._rows = [(101,), (102,), (103,)] if params[0] == 0 else []
+        elif "UNION ALL" in sql:
+            self._rows = [
+                (id_thanh_vien, id_sach, trong_so)
+                for users in CHUNKS
+                for id_thanh_vien, items in users.items()
+                for id_sach, trong_so in items.items()
+            ]
+        else:
+            self._rows = []
+
+    def executemany(self, sql, rows):
+        self.saved.extend(rows)
+
+    def fetchall(self):
+        return self._rows
+
+    def close(self):
+        pass
+
+    # --- kết nối ---
+    def start_transaction(self):
+        self.in_transaction = True
+
+    def commit(self):
+        self.in_transaction = False
+
+
+def _build(monkeypatch, sparse):
+    if sparse is None:
+        monkeypatch.setattr(recommend, "sparse", None)
+    conn = BuildConn()
+    result = recommend.build_recommendations(conn, top_n=5, chunk_size=2)
+    return result, {(i, j): diem for i, j, diem in conn.saved}
+
+
+def test_build_without_scipy_warns(monkeypatch, capsys):
+    result, saved = _build(monkeypatch, sparse=None)
+    assert result["backend"] == "python"
+    assert "CẢNH BÁO: Chưa cài numpy + scipy" in capsys.readouterr().out
+    assert saved == {(i, j): pytest.approx(diem) for i, items in EXPECTED.items() for j, diem in items.items()}
+
+
+@pytest.mark.skipif(recommend.sparse is None, reason="Cần numpy + scipy")
+def test_build_with_scipy_matches_python(monkeypatch, capsys):
+    result, saved = _build(monkeypatch, sparse=recommend.sparse)
+    assert result["backend"] == "scipy"
+    assert "CẢNH BÁO" not in capsys.readouterr().out
+    assert saved == {(i, j): pytest.approx(diem) for i, items in EXPECTED.items() for j, diem in items.items()}
@@ -0,0 +1,80 @@
+# tests/test_settings.py
+# =========================================================
+# TEST CÀI ĐẶT HỆ THỐNG (app_logic/settings.py)
+# Tải CaiDat khi pool đã đầy: đọc trên kết nối của request thay vì chờ
+# thêm một chỗ trong pool. Kết nối vật lý giả, không cần MySQL.
+# =========================================================
+
+import pytest
+from flask import Flask, g
+
+from app_logic import db, settings
+from app_logic.db import ConnectionPool, get_db_connection
+
+ROWS = [
+    {"setting_key": settings.VERSION_KEY, "setting_value": "3"},
+    {"setting_key": "max_sach_muon_moi_user", "setting_value": "8"},
+]
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        self.conn.queries += 1
+        if params:
+            self._rows = [row for row in ROWS if row["setting_key"] == params[0]]
+        else:
+            self._rows = list(ROWS)
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return self._rows
+
+    def close(self):
+        pass
+
+
+class FakeRawConnection:
+    def __init__(self):
+        self.queries = 0
+        self.in_transaction = False
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self)
+
+    def is_connected(self):
+        return True
+
+    def ping(self, reconnect=False):
+        pass
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = ConnectionPool(size=1, timeout=0.5, ping_interval=0)
+    monkeypatch.setattr(pool, "_connect", FakeRawConnection)
+    monkeypatch.setattr(db, "_pool", pool)
+    settings.invalidate_settings()
+    yield pool
+    settings.invalidate_settings()
+
+
+def test_load_on_request_connection_when_pool_is_full(pool):
+    with Flask(__name__).app_context():
+        conn = get_db_connection()  # Request đang giữ chỗ duy nhất của pool
+        assert settings.max_sach_muon_moi_user() == 8  # Không chờ hết timeout của pool
+        assert g.db_conn is conn and conn._users == 1  # Kết nối của request vẫn được giữ
+        assert conn._conn.queries == 2
+        conn.close()
+        db.close_request_connection()
+    assert pool.acquire(wait=False) is not None
+
+
+def test_load_on_separate_connection_when_pool_has_room(pool):
+    assert settings.max_sach_muon_moi_user() == 8
+    raw = pool.acquire(wait=False)  # Kết nối riêng đã được trả về pool
+    assert raw is not None and raw.queries == 2